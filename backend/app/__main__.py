@@ -0,0 +1,74 @@
+"""Command line entry point of the BrewLog backend.
+
+``python -m app serve`` runs the API in production with pre-forked worker
+processes, one per CPU by default::
+
+    python -m app serve --host 0.0.0.0 --port 8000 --max-requests 10000
+
+``python -m app maintain`` makes one maintenance pass over the databases,
+for deployments that schedule it outside the API processes.
+"""
+
+import argparse
+import logging
+import sys
+from typing import List, Optional
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Parse the command line and run the requested command.
+
+    :param argv: Command line arguments, by default those of the process
+    :type argv: Optional[List[str]]
+    :return: Process exit status
+    :rtype: int
+    """
+    parser = argparse.ArgumentParser(prog="python -m app", description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="Serve the API with worker processes")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8000)
+    serve.add_argument(
+        "--workers", type=int, help="Worker processes, by default one per CPU"
+    )
+    serve.add_argument(
+        "--max-requests",
+        type=int,
+        default=0,
+        help="Recycle a worker after serving this many requests; 0 never does",
+    )
+    serve.add_argument(
+        "--max-requests-jitter",
+        type=int,
+        default=0,
+        help="Add up to this many requests to each worker's limit",
+    )
+    serve.add_argument("--graceful-timeout", type=float, default=30.0)
+    serve.add_argument("--log-level", default="info")
+    commands.add_parser(
+        "maintain", help="Purge, archive and compact the databases once"
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "maintain":
+        from app.core import maintenance
+
+        logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+        maintenance.run_maintenance()
+        return 0
+
+    from app.core import server
+
+    return server.serve(
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        max_requests=args.max_requests,
+        max_requests_jitter=args.max_requests_jitter,
+        graceful_timeout=args.graceful_timeout,
+        log_level=args.log_level,
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
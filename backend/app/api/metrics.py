@@ -0,0 +1,23 @@
+"""Prometheus metrics endpoint.
+
+Serves the request metrics of this process at ``/metrics``, outside the
+versioned API and the OpenAPI schema.
+"""
+
+from fastapi import APIRouter, Response
+
+from app.core import metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+def read_metrics() -> Response:
+    """Render the request metrics in the Prometheus text format.
+
+    :return: Metrics document
+    :rtype: Response
+    """
+    return Response(
+        metrics.registry.render(), media_type=metrics.PROMETHEUS_CONTENT_TYPE
+    )
@@ -5,104 +5,1225 @@ This module provides REST API endpoints for CRUD operations on brew records,
 with support for pagination and error handling.
 """
 
-from typing import List
+import asyncio
+import functools
+import json
+import math
+from typing import (
+    Annotated,
+    Any,
+    AsyncContextManager,
+    AsyncIterator,
+    Callable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+import orjson
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import Field, TypeAdapter, ValidationError
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db
+from app.core import blobs, cache, changes, export, images, ingest, similarity
+from app.core.cache import etag_matches
+from app.core.config import settings
+from app.core.database import get_db, get_session_opener, shard_for
+from app.core.pagination import InvalidCursorError
+from app.core.users import get_user_id
 from app.crud import brew as crud
-from app.schemas.brew import Brew, BrewCreate
+from app.crud import stats as crud_stats
+from app.schemas.brew import (
+    Brew,
+    BrewChange,
+    BrewCreate,
+    BrewFilter,
+    BrewPatch,
+    BrewStats,
+    BrewUpsert,
+    BulkItemError,
+    BulkResult,
+    IngestStatus,
+    brew_fields_schema,
+)
 
 router = APIRouter()
 
+#: Media type of newline-delimited JSON request bodies
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+#: Media type of server-sent event streams
+EVENT_STREAM_MEDIA_TYPE = "text/event-stream"
+
+#: Changes read from the log at a time by change streams
+CHANGES_BATCH_SIZE = 500
+
+#: Milliseconds change stream clients wait before reconnecting
+CHANGES_RETRY_MS = 1000
+
+#: Pattern of the columns brew listings can be sorted by
+SORT_PATTERN = "^(%s)$" % "|".join(crud.SORT_COLUMNS)
+
+#: Allowed values of the ``size`` query parameter of the image endpoint
+IMAGE_SIZE_PATTERN = "^(%s)$" % "|".join(images.VARIANT_SIZES)
+
+M = TypeVar("M")
+C = TypeVar("C")
+
+#: Validator and serializer of brew list responses
+BREW_LIST = TypeAdapter(List[Brew])
+
+#: Serializer of brew statistics responses
+BREW_STATS = TypeAdapter(List[BrewStats])
+
+
+def _serialize_brews(brews: Sequence[Any]) -> bytes:
+    """Serialize brew records to a JSON list body.
+
+    :param brews: Brew ORM records
+    :type brews: Sequence[Any]
+    :return: JSON body, as it would be produced by ``response_model``
+    :rtype: bytes
+    """
+    return BREW_LIST.dump_json(BREW_LIST.validate_python(brews, from_attributes=True))
+
+
+def _serialize_brew_rows(
+    rows: Sequence[Sequence[Any]], fields: Sequence[str] = crud.RESPONSE_FIELDS
+) -> bytes:
+    """Serialize rows of brew response columns to a JSON list body.
+
+    The rows are encoded directly with orjson, skipping the validation and
+    dump of a ``Brew`` model per row. The database returns every column as
+    the type the schema declares, so the body is the same as
+    :func:`_serialize_brews` would produce.
+
+    :param rows: Rows starting with the columns of ``fields``, as selected
+        by :func:`app.crud.brew.response_columns`; further columns are left
+        out
+    :type rows: Sequence[Sequence[Any]]
+    :param fields: Names of the fields in the rows
+    :type fields: Sequence[str]
+    :return: JSON body, as it would be produced by ``response_model``
+    :rtype: bytes
+    """
+    return orjson.dumps([dict(zip(fields, row)) for row in rows])
+
+
+def _parse_fields(
+    fields: Optional[str] = Query(
+        None, description="Comma-separated brew fields to return, e.g. id,bean_type"
+    )
+) -> Tuple[str, ...]:
+    """Parse the sparse fieldset requested for brew responses.
+
+    :param fields: Comma-separated field names, or None for every field
+    :type fields: Optional[str]
+    :return: Requested fields, in schema order
+    :rtype: Tuple[str, ...]
+    :raises HTTPException: If a field is unknown or none is named (400)
+    """
+    if fields is None:
+        return crud.RESPONSE_FIELDS
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested.difference(crud.RESPONSE_FIELDS)
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+        )
+    if not requested:
+        raise HTTPException(status_code=400, detail="No fields requested")
+    return tuple(field for field in crud.RESPONSE_FIELDS if field in requested)
+
+
+def _parse_cursor(cursor: Optional[str], decode: Callable[[str], C]) -> Optional[C]:
+    """Decode an optional pagination cursor from a query parameter.
+
+    :param cursor: Opaque cursor, if the client sent one
+    :type cursor: Optional[str]
+    :param decode: Decoder for the cursor kind
+    :type decode: Callable[[str], C]
+    :return: Decoded cursor position, or None
+    :rtype: Optional[C]
+    :raises HTTPException: If the cursor is invalid (400)
+    """
+    if cursor is None:
+        return None
+    try:
+        return decode(cursor)
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _bulk_body(item_schema: dict) -> dict:
+    """Describe a bulk request body in OpenAPI as a JSON array or NDJSON.
+
+    :param item_schema: OpenAPI schema of a single item
+    :type item_schema: dict
+    :return: ``openapi_extra`` mapping for the route
+    :rtype: dict
+    """
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": {"type": "array", "items": item_schema}},
+                NDJSON_MEDIA_TYPE: {"schema": item_schema},
+            },
+        }
+    }
+
+
+async def _read_bulk_items(request: Request) -> List[Tuple[int, Any]]:
+    """Parse a bulk request body sent as a JSON array or as NDJSON.
+
+    NDJSON lines that are not valid JSON are returned as
+    :class:`BulkItemError` instances so they can be reported per item.
+
+    :param request: Incoming request
+    :type request: Request
+    :return: Pairs of item position and decoded item
+    :rtype: List[Tuple[int, Any]]
+    :raises HTTPException: If a JSON body is not a valid JSON array (400)
+    """
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+    if content_type.split(";")[0].strip() == NDJSON_MEDIA_TYPE:
+        items = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            index = len(items)
+            try:
+                items.append((index, json.loads(line)))
+            except ValueError:
+                items.append((index, BulkItemError(index=index, detail="Invalid JSON")))
+        return items
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    if not isinstance(payload, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array")
+    return list(enumerate(payload))
+
+
+def _validate_bulk_items(
+    items: List[Tuple[int, Any]], schema: Type[M]
+) -> Tuple[List[Tuple[int, M]], List[BulkItemError]]:
+    """Validate decoded bulk items against a schema, one item at a time.
+
+    :param items: Pairs of item position and decoded item
+    :type items: List[Tuple[int, Any]]
+    :param schema: Pydantic model or type to validate each item against
+    :type schema: Type[M]
+    :return: Valid items with their position, and per-item errors
+    :rtype: Tuple[List[Tuple[int, M]], List[BulkItemError]]
+    """
+    adapter = TypeAdapter(schema)
+    valid, errors = [], []
+    for index, item in items:
+        if isinstance(item, BulkItemError):
+            errors.append(item)
+            continue
+        try:
+            valid.append((index, adapter.validate_python(item)))
+        except ValidationError as exc:
+            errors.append(
+                BulkItemError(
+                    index=index,
+                    detail=exc.errors(include_url=False, include_context=False),
+                )
+            )
+    return valid, errors
+
+
+def _merge_errors(result: BulkResult, errors: List[BulkItemError]) -> BulkResult:
+    """Add validation errors to a bulk result, ordered by item position.
+
+    :param result: Result of the bulk write
+    :type result: BulkResult
+    :param errors: Validation errors found before writing
+    :type errors: List[BulkItemError]
+    :return: The updated result
+    :rtype: BulkResult
+    """
+    result.errors = sorted(result.errors + errors, key=lambda error: error.index)
+    return result
+
 
 @router.get("/brews/", response_model=List[Brew])
 def read_brews(
+    request: Request,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1),
+    cursor: Optional[str] = Query(None),
+    filters: BrewFilter = Depends(),
+    sort: str = Query("created_at", pattern=SORT_PATTERN),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    fields: Tuple[str, ...] = Depends(_parse_fields),
+    user_id: int = Depends(get_user_id),
     db: Session = Depends(get_db),
 ):
     """Retrieve a paginated list of brew records.
 
+    Supports offset pagination through ``skip`` and keyset pagination through
+    ``cursor``. When a full page is returned, the opaque cursor for the next
+    page is sent in the ``X-Next-Cursor`` response header. With ``fields``,
+    only the requested columns are selected and returned. Pages are served
+    from the response cache until a write invalidates them, and a matching
+    ``If-None-Match`` is answered with 304.
+
+    :param request: Incoming request, used for caching
+    :type request: Request
     :param skip: Number of records to skip (offset)
     :type skip: int
     :param limit: Maximum number of records to return
     :type limit: int
+    :param cursor: Opaque cursor from a previous ``X-Next-Cursor`` header
+    :type cursor: Optional[str]
+    :param filters: Brew type, creation date and metric range filters
+    :type filters: BrewFilter
+    :param sort: Column to sort by: ``created_at``, ``brew_seconds``,
+        ``water_temp`` or ``ratio``
+    :type sort: str
+    :param order: Sort direction, ``asc`` or ``desc``
+    :type order: str
+    :param fields: Fields to return, from the ``fields`` query parameter
+    :type fields: Tuple[str, ...]
+    :param user_id: ID of the requesting user
+    :type user_id: int
     :param db: Database session dependency
     :type db: Session
     :return: List of brew records
     :rtype: List[Brew]
+    :raises HTTPException: If the cursor is invalid or combined with skip (400)
+    """
+    if cursor is not None and skip:
+        raise HTTPException(
+            status_code=400, detail="skip cannot be combined with cursor"
+        )
+    after = _parse_cursor(cursor, functools.partial(crud.decode_brew_cursor, sort=sort))
+    key = cache.response_cache.key(crud.list_cache_namespace(user_id), request)
+    cached = cache.response_cache.get(key)
+    if cached is None:
+        brews = crud.get_brews(
+            db,
+            skip=skip,
+            limit=limit,
+            after=after,
+            filters=filters,
+            sort=sort,
+            descending=order == "desc",
+            columns=crud.response_columns(fields, crud.CURSOR_COLUMNS[sort]),
+            user_id=user_id,
+        )
+        headers = {}
+        if len(brews) == limit:
+            headers["X-Next-Cursor"] = crud.encode_brew_cursor(brews[-1], sort)
+        body = _serialize_brew_rows(brews, fields)
+        cached = cache.response_cache.put(key, body, headers)
+    return cached.to_response(request)
+
+
+@router.get("/brews/search", response_model=List[Brew])
+def search_brews(
+    request: Request,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(100, ge=1),
+    cursor: Optional[str] = Query(None),
+    user_id: int = Depends(get_user_id),
+    db: Session = Depends(get_db),
+):
+    """Search brew records by bean type, brew type and details.
+
+    Every word of the query must match the start of a word in one of the
+    searched fields. Results are ranked by relevance and paginated and
+    cached as for ``/brews/``.
+
+    :param request: Incoming request, used for caching
+    :type request: Request
+    :param q: Free-text search query
+    :type q: str
+    :param limit: Maximum number of records to return
+    :type limit: int
+    :param cursor: Opaque cursor from a previous ``X-Next-Cursor`` header
+    :type cursor: Optional[str]
+    :param user_id: ID of the requesting user
+    :type user_id: int
+    :param db: Database session dependency
+    :type db: Session
+    :return: Matching brew records, most relevant first
+    :rtype: List[Brew]
+    :raises HTTPException: If the cursor is invalid (400)
+    """
+    after = _parse_cursor(cursor, crud.decode_search_cursor)
+    key = cache.response_cache.key(crud.list_cache_namespace(user_id), request)
+    cached = cache.response_cache.get(key)
+    if cached is None:
+        results = crud.search_brews(
+            db, query=q, limit=limit, after=after, user_id=user_id
+        )
+        headers = {}
+        if len(results) == limit:
+            last_brew, last_rank = results[-1]
+            headers["X-Next-Cursor"] = crud.encode_search_cursor(
+                last_rank, last_brew.id
+            )
+        body = _serialize_brews([brew for brew, _ in results])
+        cached = cache.response_cache.put(key, body, headers)
+    return cached.to_response(request)
+
+
+@router.get(
+    "/brews/export",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "description": "All matching brews, oldest first",
+            "content": {media_type: {} for _, media_type, _ in export.FORMATS.values()},
+        }
+    },
+)
+def export_brews(
+    format: str = Query("ndjson", pattern="^(ndjson|csv|parquet)$"),
+    filters: BrewFilter = Depends(),
+    exclude_heavy: bool = Query(False),
+    user_id: int = Depends(get_user_id),
+    db: Session = Depends(get_db),
+):
+    """Export the brew journal as NDJSON, CSV or Parquet.
+
+    Rows are streamed from a server-side cursor and encoded one batch at a
+    time, so memory use stays constant however many brews are exported.
+
+    :param format: Export format: ``ndjson``, ``csv`` or ``parquet``
+    :type format: str
+    :param filters: Brew type, creation date and metric range filters
+    :type filters: BrewFilter
+    :param exclude_heavy: Leave out the ``details`` and ``image_url`` fields
+    :type exclude_heavy: bool
+    :param user_id: ID of the requesting user
+    :type user_id: int
+    :param db: Database session dependency
+    :type db: Session
+    :return: Streamed export file
+    :rtype: StreamingResponse
+    :raises HTTPException: If the format's optional dependency is missing (501)
+    """
+    try:
+        export.check_available(format)
+    except export.ExportUnavailableError as exc:
+        raise HTTPException(status_code=501, detail=str(exc))
+    encode, media_type, extension = export.FORMATS[format]
+    columns = [
+        col
+        for col in crud.EXPORT_COLUMNS
+        if not (exclude_heavy and col.key in crud.HEAVY_EXPORT_COLUMNS)
+    ]
+    batches = crud.export_brews(
+        db,
+        columns=columns,
+        filters=filters,
+        batch_size=settings.EXPORT_BATCH_SIZE,
+        user_id=user_id,
+    )
+    return StreamingResponse(
+        encode([col.expression for col in columns], batches),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="brews.{extension}"'},
+    )
+
+
+@router.get("/brews/stats", response_model=List[BrewStats])
+def read_brew_stats(
+    request: Request,
+    group_by: str = Query("brew_type", pattern="^(brew_type|bean_type|day)$"),
+    percentiles: List[Annotated[int, Field(ge=0, le=100)]] = Query([]),
+    user_id: int = Depends(get_user_id),
+    db: Session = Depends(get_db),
+):
+    """Summarize brews per brew type, bean type or day.
+
+    Each group reports its brew count and the mean of the water temperature,
+    brew ratio, bloom time and brew duration, read from rollups maintained on
+    write. Percentiles are computed on request and cost a scan of the brews.
+
+    :param request: Incoming request, used for caching
+    :type request: Request
+    :param group_by: Grouping dimension: ``brew_type``, ``bean_type`` or ``day``
+    :type group_by: str
+    :param percentiles: Percentiles to compute for each metric, 0 to 100
+    :type percentiles: List[int]
+    :param user_id: ID of the requesting user
+    :type user_id: int
+    :param db: Database session dependency
+    :type db: Session
+    :return: Statistics per group, ordered by group key
+    :rtype: List[BrewStats]
+    """
+    key = cache.response_cache.key(crud.list_cache_namespace(user_id), request)
+    cached = cache.response_cache.get(key)
+    if cached is None:
+        stats = crud_stats.get_brew_stats(
+            db,
+            group_by=group_by,
+            percentiles=sorted(set(percentiles)),
+            user_id=user_id,
+        )
+        body = BREW_STATS.dump_json(BREW_STATS.validate_python(stats))
+        cached = cache.response_cache.put(key, body)
+    return cached.to_response(request)
+
+
+def _change_event(change: Any) -> bytes:
+    """Encode a change log entry as a server-sent event.
+
+    :param change: Row of :data:`app.crud.brew.CHANGE_COLUMNS`
+    :type change: Any
+    :return: Event whose ID is the change ID, for clients to resume from
+    :rtype: bytes
+    """
+    return b"id: %d\ndata: %s\n\n" % (change.id, orjson.dumps(change._asdict()))
+
+
+async def _stream_changes(
+    open_session: Callable[..., AsyncContextManager[Session]],
+    since: Optional[int],
+    user_id: int,
+) -> AsyncIterator[bytes]:
+    """Stream the changes logged after a given one as server-sent events.
+
+    The log is read again whenever a write is published, and at least every
+    ``CHANGES_POLL_SECONDS``, when a comment keeps the connection alive. A
+    short session is opened for each read, so idle streams hold no database
+    connection. The stream ends after ``CHANGES_STREAM_SECONDS``.
+
+    :param open_session: Opener of admitted database sessions
+    :type open_session: Callable[..., AsyncContextManager[Session]]
+    :param since: ID of the last change already seen, or None to stream only
+        the changes logged from now on
+    :type since: Optional[int]
+    :param user_id: ID of the user whose changes to stream
+    :type user_id: int
+    :yield: Encoded events
+    :rtype: AsyncIterator[bytes]
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.CHANGES_STREAM_SECONDS
+    shard = shard_for(user_id)
+    # Subscribe before reading the log, so no write falls in between
+    with changes.change_feed.subscribe() as written:
+        if since is None:
+            async with open_session(read_only=True, shard=shard) as db:
+                since = await run_in_threadpool(crud.last_change_id, db)
+        yield b"retry: %d\n\n" % CHANGES_RETRY_MS
+        while True:
+            written.clear()
+            async with open_session(read_only=True, shard=shard) as db:
+                rows = await run_in_threadpool(
+                    crud.get_changes, db, since, CHANGES_BATCH_SIZE, user_id
+                )
+            for row in rows:
+                yield _change_event(row)
+                since = row.id
+            if len(rows) == CHANGES_BATCH_SIZE:
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(
+                    written.wait(), min(settings.CHANGES_POLL_SECONDS, remaining)
+                )
+            except asyncio.TimeoutError:
+                yield b": keep-alive\n\n"
+
+
+@router.get("/brews/archive", response_model=List[Brew])
+def read_archived_brews(
+    limit: int = Query(100, ge=1),
+    cursor: Optional[str] = Query(None),
+    user_id: int = Depends(get_user_id),
+    db: Session = Depends(get_db),
+):
+    """Retrieve a page of archived brew records, newest first.
+
+    Brews older than ``ARCHIVE_AFTER_MONTHS`` are moved to a compressed
+    archive by the maintenance task, and no longer appear in listings. When
+    a full page is returned, the opaque cursor for the next page is sent in
+    the ``X-Next-Cursor`` response header.
+
+    :param limit: Maximum number of records to return
+    :type limit: int
+    :param cursor: Opaque cursor from a previous ``X-Next-Cursor`` header
+    :type cursor: Optional[str]
+    :param user_id: ID of the requesting user
+    :type user_id: int
+    :param db: Database session dependency
+    :type db: Session
+    :return: List of archived brew records
+    :rtype: List[Brew]
+    :raises HTTPException: If the cursor is invalid (400)
+    """
+    after = _parse_cursor(cursor, crud.decode_brew_cursor)
+    rows = crud.get_archived_brews(db, limit=limit, after=after, user_id=user_id)
+    headers = {}
+    if len(rows) == limit:
+        headers["X-Next-Cursor"] = crud.encode_brew_cursor(rows[-1])
+    archived = [crud.decode_archived_brew(row.data) for row in rows]
+    body = _serialize_brew_rows(
+        [[values[field] for field in crud.RESPONSE_FIELDS] for values in archived]
+    )
+    return Response(body, media_type="application/json", headers=headers)
+
+
+@router.get("/brews/changes", response_model=List[BrewChange])
+async def read_brew_changes(
+    request: Request,
+    since: Optional[int] = Query(None, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    last_event_id: Optional[str] = Header(None),
+    user_id: int = Depends(get_user_id),
+    open_session: Callable[..., AsyncContextManager[Session]] = Depends(
+        get_session_opener
+    ),
+):
+    """List or stream the changes made to a user's brews, in the order made.
+
+    Requests accepting ``text/event-stream`` get a server-sent event stream
+    of changes as they are made, starting after ``since`` or the
+    ``Last-Event-ID`` of a reconnecting client, or from now. Other requests
+    get the changes logged after ``since`` as a JSON list, for clients to
+    catch up incrementally by passing back the last ID they received.
+
+    :param request: Incoming request, used to negotiate the response
+    :type request: Request
+    :param since: ID of the last change already seen
+    :type since: Optional[int]
+    :param limit: Maximum number of changes listed
+    :type limit: int
+    :param last_event_id: Last event ID received by a reconnecting stream
+    :type last_event_id: Optional[str]
+    :param user_id: ID of the requesting user
+    :type user_id: int
+    :param open_session: Opener of admitted database sessions
+    :type open_session: Callable[..., AsyncContextManager[Session]]
+    :return: Change stream, or list of changes
+    :rtype: Response
+    """
+    if EVENT_STREAM_MEDIA_TYPE in request.headers.get("accept", ""):
+        if last_event_id is not None and last_event_id.isdigit():
+            since = int(last_event_id)
+        return StreamingResponse(
+            _stream_changes(open_session, since, user_id),
+            media_type=EVENT_STREAM_MEDIA_TYPE,
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    async with open_session(read_only=True, shard=shard_for(user_id)) as db:
+        rows = await run_in_threadpool(crud.get_changes, db, since or 0, limit, user_id)
+    return Response(
+        orjson.dumps([row._asdict() for row in rows]), media_type="application/json"
+    )
+
+
+@router.post(
+    "/brews/bulk",
+    response_model=BulkResult,
+    openapi_extra=_bulk_body(BrewCreate.model_json_schema()),
+)
+async def create_brews_bulk(
+    request: Request,
+    user_id: int = Depends(get_user_id),
+    db: Session = Depends(get_db),
+):
+    """Create many brew records in one request and one transaction.
+
+    The body is a JSON array of brews, or one brew per line when sent as
+    ``application/x-ndjson``. Invalid items are reported by position in
+    ``errors`` and the valid ones are still created.
+
+    :param request: Incoming request carrying the items
+    :type request: Request
+    :param user_id: ID of the requesting user
+    :type user_id: int
+    :param db: Database session dependency
+    :type db: Session
+    :return: IDs of the created brews and per-item errors
+    :rtype: BulkResult
+    :raises HTTPException: If the body is not a JSON array or NDJSON (400)
+    """
+    items, errors = _validate_bulk_items(await _read_bulk_items(request), BrewCreate)
+    result = await run_in_threadpool(crud.bulk_create_brews, db, items, user_id)
+    return _merge_errors(result, errors)
+
+
+@router.put(
+    "/brews/bulk",
+    response_model=BulkResult,
+    openapi_extra=_bulk_body(BrewUpsert.model_json_schema()),
+)
+async def upsert_brews_bulk(
+    request: Request,
+    user_id: int = Depends(get_user_id),
+    db: Session = Depends(get_db),
+):
+    """Create or replace many brew records in one request and one transaction.
+
+    Items with an ``id`` replace the brew with that ID, or create it if it
+    does not exist; items without one are created.
+
+    :param request: Incoming request carrying the items
+    :type request: Request
+    :param user_id: ID of the requesting user
+    :type user_id: int
+    :param db: Database session dependency
+    :type db: Session
+    :return: IDs of the written brews and per-item errors
+    :rtype: BulkResult
+    :raises HTTPException: If the body is not a JSON array or NDJSON (400)
     """
-    brews = crud.get_brews(db, skip=skip, limit=limit)
-    return brews
+    items, errors = _validate_bulk_items(await _read_bulk_items(request), BrewUpsert)
+    result = await run_in_threadpool(crud.bulk_upsert_brews, db, items, user_id)
+    return _merge_errors(result, errors)
 
 
-@router.post("/brews/", response_model=Brew)
-def create_brew(brew: BrewCreate, db: Session = Depends(get_db)):
+@router.delete(
+    "/brews/bulk",
+    response_model=BulkResult,
+    openapi_extra=_bulk_body({"type": "integer"}),
+)
+async def delete_brews_bulk(
+    request: Request,
+    user_id: int = Depends(get_user_id),
+    db: Session = Depends(get_db),
+):
+    """Delete many brew records in one request and one transaction.
+
+    The body is a JSON array of brew IDs, or one ID per line when sent as
+    ``application/x-ndjson``. IDs that do not exist are reported in
+    ``errors``. Deleted brews can be restored with ``POST /brews/undelete``
+    until they are purged.
+
+    :param request: Incoming request carrying the IDs
+    :type request: Request
+    :param user_id: ID of the requesting user
+    :type user_id: int
+    :param db: Database session dependency
+    :type db: Session
+    :return: IDs of the deleted brews and per-item errors
+    :rtype: BulkResult
+    :raises HTTPException: If the body is not a JSON array or NDJSON (400)
+    """
+    items, errors = _validate_bulk_items(await _read_bulk_items(request), int)
+    result = await run_in_threadpool(crud.bulk_delete_brews, db, items, user_id)
+    return _merge_errors(result, errors)
+
+
+@router.post(
+    "/brews/undelete",
+    response_model=BulkResult,
+    openapi_extra=_bulk_body({"type": "integer"}),
+)
+async def undelete_brews_bulk(
+    request: Request,
+    user_id: int = Depends(get_user_id),
+    db: Session = Depends(get_db),
+):
+    """Restore many deleted brew records in one request and one transaction.
+
+    The body is a JSON array of brew IDs, or one ID per line when sent as
+    ``application/x-ndjson``. IDs of brews that are not deleted, or were
+    already purged, are reported in ``errors``.
+
+    :param request: Incoming request carrying the IDs
+    :type request: Request
+    :param user_id: ID of the requesting user
+    :type user_id: int
+    :param db: Database session dependency
+    :type db: Session
+    :return: IDs of the restored brews and per-item errors
+    :rtype: BulkResult
+    :raises HTTPException: If the body is not a JSON array or NDJSON (400)
+    """
+    items, errors = _validate_bulk_items(await _read_bulk_items(request), int)
+    result = await run_in_threadpool(crud.bulk_undelete_brews, db, items, user_id)
+    return _merge_errors(result, errors)
+
+
+def _wants_queueing(prefer: Optional[str]) -> bool:
+    """Check whether a brew should be queued rather than created at once.
+
+    :param prefer: Value of the ``Prefer`` request header
+    :type prefer: Optional[str]
+    :return: True if ingestion is enabled and the client prefers an
+        asynchronous response
+    :rtype: bool
+    """
+    return settings.INGEST_ENABLED and prefer is not None and "respond-async" in prefer
+
+
+def _queue_brew(brew: BrewCreate, user_id: int) -> Response:
+    """Append a brew to the ingestion queue and answer with 202 Accepted.
+
+    :param brew: Validated brew data
+    :type brew: BrewCreate
+    :param user_id: ID of the user recording the brew
+    :type user_id: int
+    :return: Pending status, with the status URL as ``Location``
+    :rtype: Response
+    :raises InvalidImageError: If an inline image cannot be decoded
+    :raises HTTPException: If the queue is full (503)
+    """
+    if blobs.is_data_url(brew.image_url):
+        blobs.parse_data_url(brew.image_url)
+    try:
+        token = ingest.ingest_queue.put(ingest.encode_entry(brew, user_id))
+    except ingest.QueueFullError:
+        raise HTTPException(
+            status_code=503,
+            detail="Ingestion queue is full",
+            headers={"Retry-After": str(math.ceil(settings.INGEST_FLUSH_SECONDS))},
+        )
+    status = IngestStatus(provisional_id=token, status="pending")
+    return Response(
+        status.model_dump_json(exclude_none=True),
+        status_code=202,
+        media_type="application/json",
+        headers={
+            "Location": f"{settings.API_V1_STR}/brews/ingest/{token}",
+            "Preference-Applied": "respond-async",
+        },
+    )
+
+
+@router.post("/brews/", response_model=Brew, responses={202: {"model": IngestStatus}})
+def create_brew(
+    brew: BrewCreate,
+    prefer: Optional[str] = Header(None),
+    user_id: int = Depends(get_user_id),
+    db: Session = Depends(get_db),
+):
     """Create a new brew record.
 
+    When ingestion is enabled, requests sent with ``Prefer: respond-async``
+    are queued instead and answered with 202 and a provisional ID, whose
+    status is served at the ``Location`` of the response.
+
     :param brew: Brew data to create
     :type brew: BrewCreate
+    :param prefer: Value of the ``Prefer`` request header
+    :type prefer: Optional[str]
+    :param user_id: ID of the requesting user
+    :type user_id: int
     :param db: Database session dependency
     :type db: Session
-    :return: Created brew record
+    :return: Created brew record, or pending status
     :rtype: Brew
+    :raises HTTPException: If the inline image cannot be decoded (422) or
+        the ingestion queue is full (503)
     """
-    return crud.create_brew(db=db, brew=brew)
+    try:
+        if _wants_queueing(prefer):
+            return _queue_brew(brew, user_id)
+        return crud.create_brew(db=db, brew=brew, user_id=user_id)
+    except blobs.InvalidImageError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+
+
+@router.get("/brews/ingest/{provisional_id}", response_model=IngestStatus)
+def read_ingest_status(provisional_id: str):
+    """Report whether a queued brew has been created.
+
+    :param provisional_id: Provisional ID returned when the brew was queued
+    :type provisional_id: str
+    :return: Status of the queued brew, with its ID once created
+    :rtype: IngestStatus
+    :raises HTTPException: If ingestion is disabled or the provisional ID
+        is unknown or expired (404)
+    """
+    if not settings.INGEST_ENABLED:
+        raise HTTPException(status_code=404, detail="Ingestion is disabled")
+    entry = ingest.ingest_queue.status(provisional_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Provisional ID not found")
+    brew_id, error, done = entry
+    if not done:
+        return IngestStatus(provisional_id=provisional_id, status="pending")
+    if brew_id is None:
+        return IngestStatus(
+            provisional_id=provisional_id, status="failed", detail=error
+        )
+    return IngestStatus(
+        provisional_id=provisional_id, status="created", brew_id=brew_id
+    )
 
 
 @router.get("/brews/{brew_id}", response_model=Brew)
-def read_brew(brew_id: int, db: Session = Depends(get_db)):
+def read_brew(
+    brew_id: int,
+    request: Request,
+    fields: Tuple[str, ...] = Depends(_parse_fields),
+    user_id: int = Depends(get_user_id),
+    db: Session = Depends(get_db),
+):
     """Retrieve a specific brew record by ID.
 
+    Served from the response cache until the brew is updated or deleted.
+    With ``fields``, only the requested columns are selected and returned.
+    The entity tag is the version of the brew, for use in ``If-Match``.
+
     :param brew_id: ID of the brew to retrieve
     :type brew_id: int
+    :param request: Incoming request, used for caching
+    :type request: Request
+    :param fields: Fields to return, from the ``fields`` query parameter
+    :type fields: Tuple[str, ...]
+    :param user_id: ID of the requesting user
+    :type user_id: int
     :param db: Database session dependency
     :type db: Session
     :return: Requested brew record
     :rtype: Brew
     :raises HTTPException: If brew is not found (404)
     """
-    db_brew = crud.get_brew(db, brew_id=brew_id)
-    if db_brew is None:
+    namespace = crud.item_cache_namespace(user_id, brew_id)
+    key = cache.response_cache.key(namespace, request)
+    cached = cache.response_cache.get(key)
+    if cached is None:
+        db_brew = crud.get_brew(
+            db,
+            brew_id=brew_id,
+            columns=crud.response_columns(fields, crud.ITEM_COLUMNS),
+            user_id=user_id,
+        )
+        if db_brew is None:
+            raise HTTPException(status_code=404, detail="Brew not found")
+        schema = brew_fields_schema(fields)
+        body = schema.model_validate(db_brew).model_dump_json().encode()
+        headers = {"ETag": cache.version_etag(db_brew.version)}
+        cached = cache.response_cache.put(key, body, headers)
+    return cached.to_response(request)
+
+
+def _write_brew(
+    db: Session,
+    brew_id: int,
+    brew: Union[BrewCreate, BrewPatch],
+    if_match: Optional[str],
+    response: Response,
+    user_id: int,
+) -> Any:
+    """Run a full or partial update and map its outcome to HTTP.
+
+    :param db: Database session
+    :type db: Session
+    :param brew_id: ID of the brew to update
+    :type brew_id: int
+    :param brew: Updated brew data
+    :type brew: Union[BrewCreate, BrewPatch]
+    :param if_match: Value of the ``If-Match`` request header
+    :type if_match: Optional[str]
+    :param response: Response whose ``ETag`` header is set
+    :type response: Response
+    :param user_id: ID of the user the brew must belong to
+    :type user_id: int
+    :return: Row of the updated brew
+    :rtype: Any
+    :raises HTTPException: If brew is not found (404), is at another version
+        than ``If-Match`` (412) or the inline image cannot be decoded (422)
+    """
+    try:
+        row = crud.update_brew(
+            db,
+            brew_id=brew_id,
+            brew=brew,
+            versions=cache.if_match_versions(if_match),
+            user_id=user_id,
+        )
+    except blobs.InvalidImageError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    except crud.VersionConflictError:
+        raise HTTPException(status_code=412, detail="Brew has been modified")
+    if row is None:
         raise HTTPException(status_code=404, detail="Brew not found")
-    return db_brew
+    response.headers["ETag"] = cache.version_etag(row.version)
+    return row
 
 
 @router.put("/brews/{brew_id}", response_model=Brew)
-def update_brew(brew_id: int, brew: BrewCreate, db: Session = Depends(get_db)):
-    """Update an existing brew record.
+def update_brew(
+    brew_id: int,
+    brew: BrewCreate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    user_id: int = Depends(get_user_id),
+    db: Session = Depends(get_db),
+):
+    """Replace an existing brew record.
+
+    The brew is written with a single ``UPDATE ... RETURNING`` statement.
+    With ``If-Match``, it is only written if still at one of the listed
+    versions.
 
     :param brew_id: ID of the brew to update
     :type brew_id: int
     :param brew: Updated brew data
     :type brew: BrewCreate
+    :param response: Response, given the new entity tag
+    :type response: Response
+    :param if_match: Entity tags of the versions the brew must be at
+    :type if_match: Optional[str]
+    :param user_id: ID of the requesting user
+    :type user_id: int
     :param db: Database session dependency
     :type db: Session
     :return: Updated brew record
     :rtype: Brew
-    :raises HTTPException: If brew is not found (404)
+    :raises HTTPException: If brew is not found (404), has been modified
+        (412) or the inline image cannot be decoded (422)
     """
-    db_brew = crud.update_brew(db, brew_id=brew_id, brew=brew)
-    if db_brew is None:
-        raise HTTPException(status_code=404, detail="Brew not found")
-    return db_brew
+    return _write_brew(db, brew_id, brew, if_match, response, user_id)
+
+
+@router.patch("/brews/{brew_id}", response_model=Brew)
+def patch_brew(
+    brew_id: int,
+    brew: BrewPatch,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    user_id: int = Depends(get_user_id),
+    db: Session = Depends(get_db),
+):
+    """Update some fields of an existing brew record.
+
+    Only the fields present in the body are written.
+
+    :param brew_id: ID of the brew to update
+    :type brew_id: int
+    :param brew: Fields to update
+    :type brew: BrewPatch
+    :param response: Response, given the new entity tag
+    :type response: Response
+    :param if_match: Entity tags of the versions the brew must be at
+    :type if_match: Optional[str]
+    :param user_id: ID of the requesting user
+    :type user_id: int
+    :param db: Database session dependency
+    :type db: Session
+    :return: Updated brew record
+    :rtype: Brew
+    :raises HTTPException: If brew is not found (404), has been modified
+        (412) or the inline image cannot be decoded (422)
+    """
+    return _write_brew(db, brew_id, brew, if_match, response, user_id)
 
 
 @router.delete("/brews/{brew_id}")
-def delete_brew(brew_id: int, db: Session = Depends(get_db)):
+def delete_brew(
+    brew_id: int,
+    if_match: Optional[str] = Header(None),
+    user_id: int = Depends(get_user_id),
+    db: Session = Depends(get_db),
+):
     """Delete a brew record.
 
     :param brew_id: ID of the brew to delete
     :type brew_id: int
+    :param if_match: Entity tags of the versions the brew must be at
+    :type if_match: Optional[str]
+    :param user_id: ID of the requesting user
+    :type user_id: int
     :param db: Database session dependency
     :type db: Session
     :return: Success message
     :rtype: dict
-    :raises HTTPException: If brew is not found (404)
+    :raises HTTPException: If brew is not found (404) or has been modified
+        (412)
     """
-    success = crud.delete_brew(db, brew_id=brew_id)
+    try:
+        success = crud.delete_brew(
+            db,
+            brew_id=brew_id,
+            versions=cache.if_match_versions(if_match),
+            user_id=user_id,
+        )
+    except crud.VersionConflictError:
+        raise HTTPException(status_code=412, detail="Brew has been modified")
     if not success:
         raise HTTPException(status_code=404, detail="Brew not found")
     return {"message": "Brew deleted successfully"}
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range ``Range`` header into inclusive byte offsets.
+
+    Multi-range requests are not supported and yield None, which makes the
+    caller fall back to serving the whole body as allowed by RFC 9110.
+
+    :param header: Value of the ``Range`` request header
+    :type header: str
+    :param size: Total size of the representation in bytes
+    :type size: int
+    :return: First and last byte offsets, or None to serve the whole body
+    :rtype: Optional[Tuple[int, int]]
+    :raises ValueError: If the range cannot be satisfied
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length <= 0:
+            raise ValueError("Unsatisfiable range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError("Unsatisfiable range")
+    return start, end
+
+
+@router.get("/brews/{brew_id}/similar", response_model=List[Brew])
+def read_similar_brews(
+    brew_id: int,
+    k: int = Query(10, ge=1, le=100),
+    filters: BrewFilter = Depends(),
+    fields: Tuple[str, ...] = Depends(_parse_fields),
+    user_id: int = Depends(get_user_id),
+    db: Session = Depends(get_db),
+):
+    """Retrieve the brews with the parameters closest to a brew's.
+
+    Brews are compared on water temperature, ratio, brew time, bloom time
+    and brew type; see :mod:`app.core.similarity`.
+
+    :param brew_id: ID of the brew to compare with
+    :type brew_id: int
+    :param k: Maximum number of brews to return
+    :type k: int
+    :param filters: Filter the returned brews must match
+    :type filters: BrewFilter
+    :param fields: Fields to return, from the ``fields`` query parameter
+    :type fields: Tuple[str, ...]
+    :param user_id: ID of the requesting user
+    :type user_id: int
+    :param db: Database session dependency
+    :type db: Session
+    :return: Closest brews, closest first, without the brew itself
+    :rtype: List[Brew]
+    :raises HTTPException: If brew is not found (404) or NumPy is not
+        installed (501)
+    """
+    try:
+        index = similarity.get_similarity_index(shard_for(user_id))
+    except similarity.SimilarityUnavailableError as exc:
+        raise HTTPException(status_code=501, detail=str(exc))
+    brew_ids = index.similar(db, brew_id, k, filters, user_id)
+    if brew_ids is None:
+        raise HTTPException(status_code=404, detail="Brew not found")
+    rows = crud.get_brews_by_ids(
+        db, brew_ids, crud.response_columns(fields), user_id=user_id
+    )
+    return Response(
+        content=_serialize_brew_rows(rows, fields), media_type="application/json"
+    )
+
+
+@router.get("/brews/{brew_id}/image")
+def read_brew_image(
+    brew_id: int,
+    request: Request,
+    size: Optional[str] = Query(None, pattern=IMAGE_SIZE_PATTERN),
+    v: Optional[int] = Query(None),
+    user_id: int = Depends(get_user_id),
+    db: Session = Depends(get_db),
+):
+    """Stream the stored image of a brew, or a resized variant of it.
+
+    The entity tag is the content digest of the image, so conditional
+    requests with ``If-None-Match`` are answered with 304 without reading the
+    blob. Single byte ranges are served with 206 Partial Content.
+
+    With ``size``, the pre-rendered variant of that size is served in the
+    best format the ``Accept`` header allows. Until it has been rendered,
+    its rendering is scheduled and the original is served. Variants
+    requested with the current brew version as ``v`` never change at that
+    URL, so browsers cache them for a year. They are marked private, as
+    the URL is the same for every user.
+
+    :param brew_id: ID of the brew whose image to retrieve
+    :type brew_id: int
+    :param request: Incoming request, used for conditional and range headers
+    :type request: Request
+    :param size: Variant size, such as "thumb", or None for the original
+    :type size: Optional[str]
+    :param v: Brew version the URL was built for
+    :type v: Optional[int]
+    :param user_id: ID of the requesting user
+    :type user_id: int
+    :param db: Database session dependency
+    :type db: Session
+    :return: Image content
+    :rtype: Response
+    :raises HTTPException: If the brew or its stored image is not found (404)
+    """
+    image = crud.get_brew_image(db, brew_id=brew_id, user_id=user_id)
+    if image is None or not blobs.blob_store.exists(image[0]):
+        raise HTTPException(status_code=404, detail="Image not found")
+    digest, content_type, version = image
+    variant = None
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Accept-Ranges": "bytes", "Cache-Control": "no-cache"}
+    if size is not None:
+        headers["Vary"] = "Accept"
+        variant = images.negotiate_variant(digest, size, request.headers.get("accept"))
+        if variant is None:
+            images.schedule_variants(digest)
+        else:
+            content_type = f"image/{variant.rsplit('.', 1)[1]}"
+            etag = headers["ETag"] = f'"{digest}.{variant}"'
+            if v == version:
+                headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    length = blobs.blob_store.size(digest, variant)
+    start, end, status_code = 0, length - 1, 200
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range == etag):
+        try:
+            byte_range = _parse_range(range_header, length)
+        except ValueError:
+            return Response(
+                status_code=416,
+                headers={**headers, "Content-Range": f"bytes */{length}"},
+            )
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        blobs.blob_store.iter_range(digest, start, end, variant),
+        status_code=status_code,
+        media_type=content_type,
+        headers=headers,
+    )
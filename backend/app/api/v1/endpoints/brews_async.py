@@ -0,0 +1,370 @@
+"""
+Async brew API endpoints, used when ``USE_ASYNC_DB`` is enabled.
+
+This module serves the core brew endpoints as ``async def`` handlers on an
+``AsyncSession``, so requests wait on the database without holding a
+threadpool worker. The router is mounted ahead of :mod:`brews`, whose
+routes keep serving everything not defined here. Brew IDs use the ``int``
+path convertor so that sibling routes such as ``/brews/bulk`` still fall
+through to the sync router. The request and response contract is the same
+as the sync handlers, which document it in the OpenAPI schema.
+"""
+
+import functools
+from typing import Any, List, Optional, Tuple, Union
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.v1.endpoints.brews import (
+    SORT_PATTERN,
+    _parse_cursor,
+    _parse_fields,
+    _queue_brew,
+    _serialize_brew_rows,
+    _serialize_brews,
+    _wants_queueing,
+)
+from app.core import blobs, cache
+from app.core.database import get_async_db
+from app.core.users import get_user_id
+from app.crud import brew as crud
+from app.crud import brew_async as crud_async
+from app.schemas.brew import (
+    Brew,
+    BrewCreate,
+    BrewFilter,
+    BrewPatch,
+    brew_fields_schema,
+)
+
+router = APIRouter(include_in_schema=False)
+
+
+@router.get("/brews/", response_model=List[Brew])
+async def read_brews(
+    request: Request,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1),
+    cursor: Optional[str] = Query(None),
+    filters: BrewFilter = Depends(),
+    sort: str = Query("created_at", pattern=SORT_PATTERN),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    fields: Tuple[str, ...] = Depends(_parse_fields),
+    user_id: int = Depends(get_user_id),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Retrieve a paginated list of brew records.
+
+    :param request: Incoming request, used for caching
+    :type request: Request
+    :param skip: Number of records to skip (offset)
+    :type skip: int
+    :param limit: Maximum number of records to return
+    :type limit: int
+    :param cursor: Opaque cursor from a previous ``X-Next-Cursor`` header
+    :type cursor: Optional[str]
+    :param filters: Brew type, creation date and metric range filters
+    :type filters: BrewFilter
+    :param sort: Column to sort by: ``created_at``, ``brew_seconds``,
+        ``water_temp`` or ``ratio``
+    :type sort: str
+    :param order: Sort direction, ``asc`` or ``desc``
+    :type order: str
+    :param fields: Fields to return, from the ``fields`` query parameter
+    :type fields: Tuple[str, ...]
+    :param user_id: ID of the requesting user
+    :type user_id: int
+    :param db: Async database session dependency
+    :type db: AsyncSession
+    :return: List of brew records
+    :rtype: List[Brew]
+    :raises HTTPException: If the cursor is invalid or combined with skip (400)
+    """
+    if cursor is not None and skip:
+        raise HTTPException(
+            status_code=400, detail="skip cannot be combined with cursor"
+        )
+    after = _parse_cursor(cursor, functools.partial(crud.decode_brew_cursor, sort=sort))
+    key = cache.response_cache.key(crud.list_cache_namespace(user_id), request)
+    cached = cache.response_cache.get(key)
+    if cached is None:
+        brews = await crud_async.get_brews(
+            db,
+            skip=skip,
+            limit=limit,
+            after=after,
+            filters=filters,
+            sort=sort,
+            descending=order == "desc",
+            columns=crud.response_columns(fields, crud.CURSOR_COLUMNS[sort]),
+            user_id=user_id,
+        )
+        headers = {}
+        if len(brews) == limit:
+            headers["X-Next-Cursor"] = crud.encode_brew_cursor(brews[-1], sort)
+        body = _serialize_brew_rows(brews, fields)
+        cached = cache.response_cache.put(key, body, headers)
+    return cached.to_response(request)
+
+
+@router.get("/brews/search", response_model=List[Brew])
+async def search_brews(
+    request: Request,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(100, ge=1),
+    cursor: Optional[str] = Query(None),
+    user_id: int = Depends(get_user_id),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Search brew records by bean type, brew type and details.
+
+    :param request: Incoming request, used for caching
+    :type request: Request
+    :param q: Free-text search query
+    :type q: str
+    :param limit: Maximum number of records to return
+    :type limit: int
+    :param cursor: Opaque cursor from a previous ``X-Next-Cursor`` header
+    :type cursor: Optional[str]
+    :param user_id: ID of the requesting user
+    :type user_id: int
+    :param db: Async database session dependency
+    :type db: AsyncSession
+    :return: Matching brew records, most relevant first
+    :rtype: List[Brew]
+    :raises HTTPException: If the cursor is invalid (400)
+    """
+    after = _parse_cursor(cursor, crud.decode_search_cursor)
+    key = cache.response_cache.key(crud.list_cache_namespace(user_id), request)
+    cached = cache.response_cache.get(key)
+    if cached is None:
+        results = await crud_async.search_brews(
+            db, query=q, limit=limit, after=after, user_id=user_id
+        )
+        headers = {}
+        if len(results) == limit:
+            last_brew, last_rank = results[-1]
+            headers["X-Next-Cursor"] = crud.encode_search_cursor(
+                last_rank, last_brew.id
+            )
+        body = _serialize_brews([brew for brew, _ in results])
+        cached = cache.response_cache.put(key, body, headers)
+    return cached.to_response(request)
+
+
+@router.post("/brews/", response_model=Brew)
+async def create_brew(
+    brew: BrewCreate,
+    prefer: Optional[str] = Header(None),
+    user_id: int = Depends(get_user_id),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Create a new brew record, or queue it.
+
+    :param brew: Brew data to create
+    :type brew: BrewCreate
+    :param prefer: Value of the ``Prefer`` request header
+    :type prefer: Optional[str]
+    :param user_id: ID of the requesting user
+    :type user_id: int
+    :param db: Async database session dependency
+    :type db: AsyncSession
+    :return: Created brew record, or pending status
+    :rtype: Brew
+    :raises HTTPException: If the inline image cannot be decoded (422) or
+        the ingestion queue is full (503)
+    """
+    try:
+        if _wants_queueing(prefer):
+            return await run_in_threadpool(_queue_brew, brew, user_id)
+        return await crud_async.create_brew(db=db, brew=brew, user_id=user_id)
+    except blobs.InvalidImageError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+
+
+@router.get("/brews/{brew_id:int}", response_model=Brew)
+async def read_brew(
+    brew_id: int,
+    request: Request,
+    fields: Tuple[str, ...] = Depends(_parse_fields),
+    user_id: int = Depends(get_user_id),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Retrieve a specific brew record by ID.
+
+    :param brew_id: ID of the brew to retrieve
+    :type brew_id: int
+    :param request: Incoming request, used for caching
+    :type request: Request
+    :param fields: Fields to return, from the ``fields`` query parameter
+    :type fields: Tuple[str, ...]
+    :param user_id: ID of the requesting user
+    :type user_id: int
+    :param db: Async database session dependency
+    :type db: AsyncSession
+    :return: Requested brew record
+    :rtype: Brew
+    :raises HTTPException: If brew is not found (404)
+    """
+    namespace = crud.item_cache_namespace(user_id, brew_id)
+    key = cache.response_cache.key(namespace, request)
+    cached = cache.response_cache.get(key)
+    if cached is None:
+        db_brew = await crud_async.get_brew(
+            db,
+            brew_id=brew_id,
+            columns=crud.response_columns(fields, crud.ITEM_COLUMNS),
+            user_id=user_id,
+        )
+        if db_brew is None:
+            raise HTTPException(status_code=404, detail="Brew not found")
+        schema = brew_fields_schema(fields)
+        body = schema.model_validate(db_brew).model_dump_json().encode()
+        headers = {"ETag": cache.version_etag(db_brew.version)}
+        cached = cache.response_cache.put(key, body, headers)
+    return cached.to_response(request)
+
+
+async def _write_brew(
+    db: AsyncSession,
+    brew_id: int,
+    brew: Union[BrewCreate, BrewPatch],
+    if_match: Optional[str],
+    response: Response,
+    user_id: int,
+) -> Any:
+    """Run a full or partial update and map its outcome to HTTP.
+
+    :param db: Async database session
+    :type db: AsyncSession
+    :param brew_id: ID of the brew to update
+    :type brew_id: int
+    :param brew: Updated brew data
+    :type brew: Union[BrewCreate, BrewPatch]
+    :param if_match: Value of the ``If-Match`` request header
+    :type if_match: Optional[str]
+    :param response: Response whose ``ETag`` header is set
+    :type response: Response
+    :param user_id: ID of the user the brew must belong to
+    :type user_id: int
+    :return: Row of the updated brew
+    :rtype: Any
+    :raises HTTPException: If brew is not found (404), is at another version
+        than ``If-Match`` (412) or the inline image cannot be decoded (422)
+    """
+    try:
+        row = await crud_async.update_brew(
+            db,
+            brew_id=brew_id,
+            brew=brew,
+            versions=cache.if_match_versions(if_match),
+            user_id=user_id,
+        )
+    except blobs.InvalidImageError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    except crud.VersionConflictError:
+        raise HTTPException(status_code=412, detail="Brew has been modified")
+    if row is None:
+        raise HTTPException(status_code=404, detail="Brew not found")
+    response.headers["ETag"] = cache.version_etag(row.version)
+    return row
+
+
+@router.put("/brews/{brew_id:int}", response_model=Brew)
+async def update_brew(
+    brew_id: int,
+    brew: BrewCreate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    user_id: int = Depends(get_user_id),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Replace an existing brew record.
+
+    :param brew_id: ID of the brew to update
+    :type brew_id: int
+    :param brew: Updated brew data
+    :type brew: BrewCreate
+    :param response: Response, given the new entity tag
+    :type response: Response
+    :param if_match: Entity tags of the versions the brew must be at
+    :type if_match: Optional[str]
+    :param user_id: ID of the requesting user
+    :type user_id: int
+    :param db: Async database session dependency
+    :type db: AsyncSession
+    :return: Updated brew record
+    :rtype: Brew
+    :raises HTTPException: If brew is not found (404), has been modified
+        (412) or the inline image cannot be decoded (422)
+    """
+    return await _write_brew(db, brew_id, brew, if_match, response, user_id)
+
+
+@router.patch("/brews/{brew_id:int}", response_model=Brew)
+async def patch_brew(
+    brew_id: int,
+    brew: BrewPatch,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    user_id: int = Depends(get_user_id),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Update some fields of an existing brew record.
+
+    :param brew_id: ID of the brew to update
+    :type brew_id: int
+    :param brew: Fields to update
+    :type brew: BrewPatch
+    :param response: Response, given the new entity tag
+    :type response: Response
+    :param if_match: Entity tags of the versions the brew must be at
+    :type if_match: Optional[str]
+    :param user_id: ID of the requesting user
+    :type user_id: int
+    :param db: Async database session dependency
+    :type db: AsyncSession
+    :return: Updated brew record
+    :rtype: Brew
+    :raises HTTPException: If brew is not found (404), has been modified
+        (412) or the inline image cannot be decoded (422)
+    """
+    return await _write_brew(db, brew_id, brew, if_match, response, user_id)
+
+
+@router.delete("/brews/{brew_id:int}")
+async def delete_brew(
+    brew_id: int,
+    if_match: Optional[str] = Header(None),
+    user_id: int = Depends(get_user_id),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Delete a brew record.
+
+    :param brew_id: ID of the brew to delete
+    :type brew_id: int
+    :param if_match: Entity tags of the versions the brew must be at
+    :type if_match: Optional[str]
+    :param user_id: ID of the requesting user
+    :type user_id: int
+    :param db: Async database session dependency
+    :type db: AsyncSession
+    :return: Success message
+    :rtype: dict
+    :raises HTTPException: If brew is not found (404) or has been modified
+        (412)
+    """
+    try:
+        success = await crud_async.delete_brew(
+            db,
+            brew_id=brew_id,
+            versions=cache.if_match_versions(if_match),
+            user_id=user_id,
+        )
+    except crud.VersionConflictError:
+        raise HTTPException(status_code=412, detail="Brew has been modified")
+    if not success:
+        raise HTTPException(status_code=404, detail="Brew not found")
+    return {"message": "Brew deleted successfully"}
@@ -0,0 +1,104 @@
+"""
+Delta sync endpoints for offline-first clients.
+
+Clients keep a local copy of their brews and the sync version it reflects.
+``GET /sync`` returns the brews written since that version, one entry per
+brew however often it changed, and ``POST /sync`` applies the writes
+queued while offline, reporting conflicts instead of overwriting newer
+brews.
+"""
+
+from typing import List
+
+import orjson
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from app.api.v1.endpoints.brews import (
+    _bulk_body,
+    _read_bulk_items,
+    _validate_bulk_items,
+)
+from app.core.database import get_db
+from app.core.users import get_user_id
+from app.crud import brew as crud
+from app.schemas.brew import SyncChanges, SyncWrite, SyncWriteResult
+
+router = APIRouter()
+
+
+@router.get("/sync", response_model=SyncChanges)
+def read_sync_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=5000),
+    user_id: int = Depends(get_user_id),
+    db: Session = Depends(get_db),
+):
+    """Retrieve the brews created, updated or deleted since a sync version.
+
+    Starting from version 0 returns every brew. Each brew written since
+    ``since`` is returned once, with its current data, or by ID in
+    ``deleted``. When ``has_more`` is set, the client requests again from
+    the returned ``version`` for the rest.
+
+    :param since: Sync version the client's copy reflects, or 0
+    :type since: int
+    :param limit: Maximum number of brews in the response
+    :type limit: int
+    :param user_id: ID of the requesting user
+    :type user_id: int
+    :param db: Database session dependency
+    :type db: Session
+    :return: Changed brews, deleted brew IDs and the version they bring the
+        client to
+    :rtype: SyncChanges
+    """
+    version, brews, deleted, has_more = crud.get_sync_changes(
+        db, since=since, limit=limit, user_id=user_id
+    )
+    body = {
+        "version": version,
+        "brews": [dict(zip(crud.RESPONSE_FIELDS, row)) for row in brews],
+        "deleted": deleted,
+        "has_more": has_more,
+    }
+    return Response(orjson.dumps(body), media_type="application/json")
+
+
+@router.post(
+    "/sync",
+    response_model=List[SyncWriteResult],
+    openapi_extra=_bulk_body(SyncWrite.model_json_schema()),
+)
+async def apply_sync_writes(
+    request: Request,
+    user_id: int = Depends(get_user_id),
+    db: Session = Depends(get_db),
+):
+    """Apply the writes a client queued while offline, in one transaction.
+
+    The body is a JSON array of writes, in the order they were made, or one
+    per line when sent as ``application/x-ndjson``. Updates and deletes
+    carrying the ``base_version`` they were made on are reported as
+    conflicts, with the current brew, if it has changed since. Invalid
+    writes are reported and the others still applied. The client then
+    fetches ``GET /sync`` to bring its copy up to date.
+
+    :param request: Incoming request carrying the writes
+    :type request: Request
+    :param user_id: ID of the requesting user
+    :type user_id: int
+    :param db: Database session dependency
+    :type db: Session
+    :return: Outcome of each write, in request order
+    :rtype: List[SyncWriteResult]
+    :raises HTTPException: If the body is not a JSON array or NDJSON (400)
+    """
+    items, errors = _validate_bulk_items(await _read_bulk_items(request), SyncWrite)
+    results = await run_in_threadpool(crud.apply_sync_writes, db, items, user_id)
+    results += [
+        SyncWriteResult(index=error.index, status="invalid", detail=error.detail)
+        for error in errors
+    ]
+    return sorted(results, key=lambda result: result.index)
@@ -0,0 +1,231 @@
+"""Content-addressed storage for uploaded brew images.
+
+Images are stored on disk under the SHA-256 digest of their bytes, so
+identical uploads are written once and shared by every brew that references
+them. Brew rows only keep the digest and a short URL to the image endpoint,
+which keeps list responses small. Variants derived from a blob, such as
+resized images, are stored next to it under the same digest.
+"""
+
+import base64
+import binascii
+import hashlib
+import os
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Iterator, Optional, Tuple
+from urllib.parse import unquote_to_bytes
+
+from app.core.config import settings
+
+#: Chunk size used when streaming blobs from disk
+CHUNK_SIZE = 64 * 1024
+
+
+class InvalidImageError(ValueError):
+    """Raised when an uploaded image data URL cannot be decoded."""
+
+
+def is_data_url(value: Optional[str]) -> bool:
+    """Check whether a value is an inline ``data:`` URL.
+
+    :param value: Image URL value
+    :type value: Optional[str]
+    :return: True if the value is a data URL
+    :rtype: bool
+    """
+    return value is not None and value.startswith("data:")
+
+
+def parse_data_url(value: str) -> Tuple[str, bytes]:
+    """Decode a ``data:`` URL into its media type and payload.
+
+    :param value: Data URL, as produced by ``FileReader.readAsDataURL``
+    :type value: str
+    :return: Media type and decoded bytes
+    :rtype: Tuple[str, bytes]
+    :raises InvalidImageError: If the data URL is malformed
+    """
+    header, sep, payload = value[len("data:") :].partition(",")
+    if not sep:
+        raise InvalidImageError("Malformed data URL")
+    params = header.split(";")
+    content_type = params[0] or "application/octet-stream"
+    if "base64" in params[1:]:
+        try:
+            data = base64.b64decode(payload, validate=True)
+        except (binascii.Error, ValueError) as exc:
+            raise InvalidImageError("Invalid base64 image data") from exc
+    else:
+        data = unquote_to_bytes(payload)
+    return content_type, data
+
+
+def digest_of(data: bytes) -> str:
+    """Compute the digest addressing a blob.
+
+    :param data: Blob contents
+    :type data: bytes
+    :return: Hex SHA-256 digest
+    :rtype: str
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def image_url_for(brew_id: int) -> str:
+    """Build the short URL serving a brew's stored image.
+
+    :param brew_id: ID of the brew
+    :type brew_id: int
+    :return: URL path of the image endpoint
+    :rtype: str
+    """
+    return f"{settings.API_V1_STR}/brews/{brew_id}/image"
+
+
+class BlobStore:
+    """A directory of immutable blobs addressed by their SHA-256 digest.
+
+    Blobs are sharded into two levels of subdirectories to keep directory
+    sizes bounded, and written through a temporary file so readers never
+    observe a partial blob.
+
+    :ivar root: Directory holding the blobs
+    :type root: Path
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def path(self, digest: str, variant: Optional[str] = None) -> Path:
+        """Return the on-disk location of a blob.
+
+        :param digest: Hex SHA-256 digest of the blob
+        :type digest: str
+        :param variant: Name of a variant derived from the blob, or None for
+            the blob itself
+        :type variant: Optional[str]
+        :return: Path of the blob file
+        :rtype: Path
+        """
+        name = f"{digest}.{variant}" if variant else digest
+        return self.root / digest[:2] / digest[2:4] / name
+
+    def exists(self, digest: str, variant: Optional[str] = None) -> bool:
+        """Check whether a blob is stored.
+
+        :param digest: Hex SHA-256 digest of the blob
+        :type digest: str
+        :param variant: Name of a variant derived from the blob
+        :type variant: Optional[str]
+        :return: True if the blob exists
+        :rtype: bool
+        """
+        return self.path(digest, variant).is_file()
+
+    def _write(self, target: Path, data: bytes) -> None:
+        """Write a file atomically through a temporary file.
+
+        :param target: Path of the file
+        :type target: Path
+        :param data: File contents
+        :type data: bytes
+        """
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=target.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, target)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def put(self, data: bytes) -> str:
+        """Store a blob, skipping the write if identical bytes already exist.
+
+        :param data: Blob contents
+        :type data: bytes
+        :return: Hex SHA-256 digest addressing the blob
+        :rtype: str
+        """
+        digest = digest_of(data)
+        target = self.path(digest)
+        if not target.is_file():
+            self._write(target, data)
+        return digest
+
+    def put_variant(self, digest: str, variant: str, data: bytes) -> None:
+        """Store a variant derived from a blob, replacing any previous one.
+
+        :param digest: Hex SHA-256 digest of the blob
+        :type digest: str
+        :param variant: Name of the variant
+        :type variant: str
+        :param data: Variant contents
+        :type data: bytes
+        """
+        self._write(self.path(digest, variant), data)
+
+    def size(self, digest: str, variant: Optional[str] = None) -> int:
+        """Return the size of a stored blob in bytes.
+
+        :param digest: Hex SHA-256 digest of the blob
+        :type digest: str
+        :param variant: Name of a variant derived from the blob
+        :type variant: Optional[str]
+        :return: Blob size
+        :rtype: int
+        """
+        return self.path(digest, variant).stat().st_size
+
+    def iter_range(
+        self, digest: str, start: int, end: int, variant: Optional[str] = None
+    ) -> Iterator[bytes]:
+        """Stream an inclusive byte range of a blob in chunks.
+
+        :param digest: Hex SHA-256 digest of the blob
+        :type digest: str
+        :param start: First byte offset
+        :type start: int
+        :param end: Last byte offset (inclusive)
+        :type end: int
+        :param variant: Name of a variant derived from the blob
+        :type variant: Optional[str]
+        :yield: Chunks of blob data
+        :rtype: Iterator[bytes]
+        """
+        remaining = end - start + 1
+        with open(self.path(digest, variant), "rb") as blob:
+            blob.seek(start)
+            while remaining > 0:
+                chunk = blob.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+@lru_cache()
+def get_blob_store() -> BlobStore:
+    """Create the blob store configured with application settings.
+
+    :return: Application blob store
+    :rtype: BlobStore
+    """
+    return BlobStore(settings.BLOB_STORE_DIR)
+
+
+def __getattr__(name: str) -> Any:
+    """Resolve ``blob_store`` lazily, so importing reads no settings.
+
+    :param name: Module attribute name
+    :type name: str
+    :return: Attribute value
+    :rtype: Any
+    :raises AttributeError: If the attribute does not exist
+    """
+    if name == "blob_store":
+        return get_blob_store()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,421 @@
+"""Response caching for read endpoints.
+
+Serialized JSON responses are cached under keys built from a namespace,
+the namespace's current version, the request path and its query
+parameters. Writes invalidate a namespace by bumping its version, so every
+entry cached before the write becomes unreachable at once, without having
+to enumerate keys; stale entries simply age out of the backend.
+
+Two backends are provided: an in-process LRU with TTL, which is only
+coherent within a single process, and a Redis-compatible backend shared by
+all workers. The Redis client is optional and only imported when
+configured.
+"""
+
+import functools
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import Request, Response
+
+from app.core import compression
+from app.core.config import settings
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Check an ``If-None-Match`` header against an entity tag.
+
+    :param header: Value of the ``If-None-Match`` request header
+    :type header: Optional[str]
+    :param etag: Quoted entity tag of the current representation
+    :type etag: str
+    :return: True if the client already holds the representation
+    :rtype: bool
+    """
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def version_etag(version: int) -> str:
+    """Build the entity tag of a record version.
+
+    :param version: Version counter of the record
+    :type version: int
+    :return: Quoted strong entity tag
+    :rtype: str
+    """
+    return f'"{version}"'
+
+
+def if_match_versions(header: Optional[str]) -> Optional[List[int]]:
+    """Parse an ``If-Match`` header into the record versions it accepts.
+
+    Only tags built by :func:`version_etag` can match; weak tags never do,
+    as ``If-Match`` uses strong comparison.
+
+    :param header: Value of the ``If-Match`` request header
+    :type header: Optional[str]
+    :return: Accepted versions, or None if any version is accepted
+    :rtype: Optional[List[int]]
+    """
+    if header is None:
+        return None
+    tags = [tag.strip() for tag in header.split(",")]
+    if "*" in tags:
+        return None
+    return [int(tag[1:-1]) for tag in tags if re.fullmatch(r'"[0-9]+"', tag)]
+
+
+class CacheBackend:
+    """Interface of a byte-string cache with TTL and atomic counters."""
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the value stored under a key, or None if absent or expired."""
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: Optional[int] = None) -> None:
+        """Store a value, expiring after ``ttl`` seconds if given."""
+        raise NotImplementedError
+
+    def incr(self, key: str) -> int:
+        """Atomically increment a counter, starting from 0, and return it."""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        raise NotImplementedError
+
+
+class NullCache(CacheBackend):
+    """Backend that stores nothing, disabling response caching."""
+
+    def get(self, key: str) -> Optional[bytes]:
+        return None
+
+    def set(self, key: str, value: bytes, ttl: Optional[int] = None) -> None:
+        pass
+
+    def incr(self, key: str) -> int:
+        return 0
+
+    def clear(self) -> None:
+        pass
+
+
+class MemoryCache(CacheBackend):
+    """In-process LRU cache with per-entry TTL.
+
+    Counters are kept apart from entries so they are never evicted, which
+    would otherwise resurrect entries of an older namespace version.
+
+    :ivar max_entries: Number of entries kept before evicting the least
+        recently used one
+    :type max_entries: int
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key in self._counters:
+                return str(self._counters[key]).encode()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: Optional[int] = None) -> None:
+        expires_at = time.monotonic() + ttl if ttl else float("inf")
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+
+
+class RedisCache(CacheBackend):
+    """Backend on a Redis-compatible server, shared by all workers.
+
+    :ivar client: Client exposing ``get``, ``set``, ``incr`` and ``delete``
+        like ``redis.Redis``
+    :ivar prefix: Prefix added to every key
+    :type prefix: str
+    """
+
+    def __init__(self, client, prefix: str = "brewlog:"):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisCache":
+        """Connect to a Redis server.
+
+        :param url: Redis connection URL
+        :type url: str
+        :return: Backend using a new client
+        :rtype: RedisCache
+        :raises RuntimeError: If the ``redis`` package is not installed
+        """
+        try:
+            import redis
+        except ImportError as exc:
+            raise RuntimeError(
+                "CACHE_BACKEND=redis requires the 'redis' package"
+            ) from exc
+        return cls(redis.Redis.from_url(url))
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: Optional[int] = None) -> None:
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def incr(self, key: str) -> int:
+        return self.client.incr(self.prefix + key)
+
+    def clear(self) -> None:
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+class CachedResponse:
+    """A serialized JSON response with its strong entity tag.
+
+    :ivar body: JSON response body
+    :type body: bytes
+    :ivar headers: Extra response headers, such as pagination cursors
+    :type headers: Dict[str, str]
+    :ivar etag: Quoted strong entity tag, from an ``ETag`` header if one was
+        given and otherwise derived from the body
+    :type etag: str
+    :ivar encoded: Returns the body compressed with a content coding,
+        reusing cached bytes; None to always send the body as is
+    :type encoded: Optional[Callable[[str], bytes]]
+    """
+
+    def __init__(
+        self,
+        body: bytes,
+        headers: Optional[Dict[str, str]] = None,
+        encoded: Optional[Callable[[str], bytes]] = None,
+    ):
+        self.body = body
+        self.headers = headers or {}
+        self.encoded = encoded
+        self.etag = (
+            self.headers.get("ETag") or '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+        )
+
+    def to_bytes(self) -> bytes:
+        """Encode for storage as a header line followed by the body."""
+        return json.dumps(self.headers).encode() + b"\n" + self.body
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CachedResponse":
+        """Decode a value produced by :meth:`to_bytes`."""
+        headers, _, body = data.partition(b"\n")
+        return cls(body, json.loads(headers))
+
+    def to_response(self, request: Request) -> Response:
+        """Build the HTTP response, answering 304 if the client is current.
+
+        The body is compressed with the content coding negotiated from
+        ``Accept-Encoding``. The entity tag stays the same whatever the
+        coding, so conditional requests keep naming the brew version.
+
+        :param request: Incoming request, checked for ``If-None-Match`` and
+            ``Accept-Encoding``
+        :type request: Request
+        :return: Full JSON response or 304 Not Modified
+        :rtype: Response
+        """
+        headers = {**self.headers, "ETag": self.etag, "Cache-Control": "no-cache"}
+        if self.encoded is not None and settings.COMPRESSION_ENABLED:
+            headers["Vary"] = "Accept-Encoding"
+        if etag_matches(request.headers.get("if-none-match"), self.etag):
+            return Response(status_code=304, headers=headers)
+        body = self.body
+        encoding = None
+        if self.encoded is not None:
+            encoding = compression.choose_encoding(
+                request.headers.get("accept-encoding"), len(body)
+            )
+        if encoding is not None:
+            body = self.encoded(encoding)
+            headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type="application/json", headers=headers)
+
+
+class ResponseCache:
+    """Versioned-namespace cache of serialized JSON responses.
+
+    :ivar backend: Storage backend
+    :type backend: CacheBackend
+    :ivar ttl: Seconds an entry stays valid
+    :type ttl: int
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: int = 60):
+        self.backend = backend
+        self.ttl = ttl
+
+    def _version(self, namespace: str) -> int:
+        value = self.backend.get(f"{namespace}:version")
+        return int(value) if value is not None else 0
+
+    def key(self, namespace: str, request: Request) -> str:
+        """Build the cache key of a request in a namespace.
+
+        :param namespace: Invalidation namespace the response depends on
+        :type namespace: str
+        :param request: Incoming request
+        :type request: Request
+        :return: Cache key covering the path and sorted query parameters
+        :rtype: str
+        """
+        query = "&".join(
+            f"{name}={value}"
+            for name, value in sorted(request.query_params.multi_items())
+        )
+        version = self._version(namespace)
+        return f"{namespace}:v{version}:{request.url.path}?{query}"
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """Look up a cached response.
+
+        :param key: Key from :meth:`key`
+        :type key: str
+        :return: Cached response, or None on a miss
+        :rtype: Optional[CachedResponse]
+        """
+        data = self.backend.get(key)
+        if data is None:
+            return None
+        cached = CachedResponse.from_bytes(data)
+        cached.encoded = functools.partial(self._encoded, key, cached.body)
+        return cached
+
+    def put(
+        self, key: str, body: bytes, headers: Optional[Dict[str, str]] = None
+    ) -> CachedResponse:
+        """Cache a serialized response.
+
+        :param key: Key from :meth:`key`
+        :type key: str
+        :param body: JSON response body
+        :type body: bytes
+        :param headers: Extra response headers to replay on hits
+        :type headers: Optional[Dict[str, str]]
+        :return: The cached response
+        :rtype: CachedResponse
+        """
+        encoded = functools.partial(self._encoded, key, body)
+        cached = CachedResponse(body, headers, encoded)
+        self.backend.set(key, cached.to_bytes(), ttl=self.ttl)
+        return cached
+
+    def _encoded(self, key: str, body: bytes, encoding: str) -> bytes:
+        """Compress the body of a cached response.
+
+        The compressed body is cached next to the uncompressed one, so each
+        cached page is compressed once per coding.
+
+        :param key: Key of the cached response
+        :type key: str
+        :param body: Uncompressed body of the cached response
+        :type body: bytes
+        :param encoding: Available content coding
+        :type encoding: str
+        :return: Compressed body
+        :rtype: bytes
+        """
+        encoded_key = f"{key}#{encoding}"
+        data = self.backend.get(encoded_key)
+        if data is None:
+            data = compression.compress(body, encoding)
+            self.backend.set(encoded_key, data, ttl=self.ttl)
+        return data
+
+    def invalidate(self, *namespaces: str) -> None:
+        """Invalidate every entry cached in the given namespaces.
+
+        :param namespaces: Namespaces affected by a write
+        :type namespaces: str
+        """
+        for namespace in namespaces:
+            self.backend.incr(f"{namespace}:version")
+
+
+def create_backend() -> CacheBackend:
+    """Create the cache backend selected by ``CACHE_BACKEND``.
+
+    Nothing is cached when GET requests read from ``READ_DATABASE_URL``:
+    a read during replication lag would cache rows older than the write
+    that bumped the namespace version, under the new version, for the whole
+    TTL. Sharded databases have no replicas, so they are cached as usual.
+
+    :return: Configured backend
+    :rtype: CacheBackend
+    :raises ValueError: If the backend name is unknown
+    """
+    if settings.READ_DATABASE_URL and not settings.DATABASE_SHARDS:
+        return NullCache()
+    if settings.CACHE_BACKEND == "memory":
+        return MemoryCache(max_entries=settings.CACHE_MAX_ENTRIES)
+    if settings.CACHE_BACKEND == "redis":
+        return RedisCache.from_url(settings.CACHE_REDIS_URL)
+    if settings.CACHE_BACKEND == "none":
+        return NullCache()
+    raise ValueError(f"Unknown CACHE_BACKEND: {settings.CACHE_BACKEND}")
+
+
+@lru_cache()
+def get_response_cache() -> ResponseCache:
+    """Create the response cache configured with application settings.
+
+    :return: Application response cache
+    :rtype: ResponseCache
+    """
+    return ResponseCache(create_backend(), ttl=settings.CACHE_TTL_SECONDS)
+
+
+def __getattr__(name: str) -> Any:
+    """Resolve ``response_cache`` lazily, so importing reads no settings.
+
+    :param name: Module attribute name
+    :type name: str
+    :return: Attribute value
+    :rtype: Any
+    :raises AttributeError: If the attribute does not exist
+    """
+    if name == "response_cache":
+        return get_response_cache()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,197 @@
+"""Notifications of writes to brews, for streaming change feeds.
+
+Every write to brews is recorded in the ``brew_changes`` log by the
+database itself. After committing a write, the CRUD layer publishes a
+notification through a broker, which wakes every change stream subscribed
+in every process, and each stream then reads the new entries from the log.
+Notifications carry no data: the log is the only source of changes, so a
+lost or duplicated notification delays a stream until its next poll, but
+never loses or repeats a change.
+
+Two brokers are provided: an in-process one, which only reaches the
+streams served by the publishing process, and a Redis pub/sub one shared
+by all workers. The Redis client is optional and only imported when
+configured.
+"""
+
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Callable, Iterator, Optional, Set, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Broker:
+    """Interface of a transport delivering notifications to subscribers."""
+
+    def publish(self) -> None:
+        """Notify the subscribers of every process."""
+        raise NotImplementedError
+
+    def start(self, deliver: Callable[[], None]) -> None:
+        """Start delivering the notifications received in this process.
+
+        :param deliver: Called, possibly from another thread, for every
+            notification received
+        :type deliver: Callable[[], None]
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Stop delivering notifications."""
+
+
+class LocalBroker(Broker):
+    """Broker delivering notifications within the publishing process."""
+
+    def __init__(self):
+        self._deliver: Optional[Callable[[], None]] = None
+
+    def publish(self) -> None:
+        if self._deliver is not None:
+            self._deliver()
+
+    def start(self, deliver: Callable[[], None]) -> None:
+        self._deliver = deliver
+
+    def close(self) -> None:
+        self._deliver = None
+
+
+class RedisBroker(Broker):
+    """Broker on Redis pub/sub, shared by all workers.
+
+    :ivar client: Client exposing ``publish`` and ``pubsub`` like
+        ``redis.Redis``
+    :ivar channel: Channel notifications are published on
+    :type channel: str
+    """
+
+    def __init__(self, client, channel: str = "brewlog:changes"):
+        self.client = client
+        self.channel = channel
+        self._thread = None
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBroker":
+        """Connect to a Redis server.
+
+        :param url: Redis connection URL
+        :type url: str
+        :return: Broker using a new client
+        :rtype: RedisBroker
+        :raises RuntimeError: If the ``redis`` package is not installed
+        """
+        try:
+            import redis
+        except ImportError as exc:
+            raise RuntimeError(
+                "CHANGES_BROKER=redis requires the 'redis' package"
+            ) from exc
+        return cls(redis.Redis.from_url(url))
+
+    def publish(self) -> None:
+        try:
+            self.client.publish(self.channel, b"")
+        except Exception:
+            # Streams still catch up on their next poll
+            logger.exception("Cannot publish change notification")
+
+    def start(self, deliver: Callable[[], None]) -> None:
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{self.channel: lambda message: deliver()})
+        self._thread = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._thread.stop()
+            self._thread = None
+
+
+class ChangeFeed:
+    """Fan-out of change notifications to the streams of this process.
+
+    :ivar broker: Transport of the notifications
+    :type broker: Broker
+    """
+
+    def __init__(self, broker: Broker):
+        self.broker = broker
+        self._subscribers: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+        self._lock = threading.Lock()
+        broker.start(self._wake)
+
+    def _wake(self) -> None:
+        """Wake every subscriber, from any thread."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, event in subscribers:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The subscriber's event loop has been closed
+                pass
+
+    def publish(self) -> None:
+        """Notify the streams of every process that brews were written."""
+        self.broker.publish()
+
+    @contextmanager
+    def subscribe(self) -> Iterator[asyncio.Event]:
+        """Subscribe the running event loop to notifications.
+
+        :yield: Event set by every notification, to be cleared by the
+            subscriber before it reads the log
+        :rtype: Iterator[asyncio.Event]
+        """
+        subscriber = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._subscribers.add(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
+
+
+def create_broker() -> Broker:
+    """Create the broker selected by ``CHANGES_BROKER``.
+
+    :return: Configured broker
+    :rtype: Broker
+    :raises ValueError: If the broker name is unknown
+    """
+    if settings.CHANGES_BROKER == "memory":
+        return LocalBroker()
+    if settings.CHANGES_BROKER == "redis":
+        return RedisBroker.from_url(settings.CHANGES_REDIS_URL)
+    raise ValueError(f"Unknown CHANGES_BROKER: {settings.CHANGES_BROKER}")
+
+
+@lru_cache()
+def get_change_feed() -> ChangeFeed:
+    """Create the change feed configured with application settings.
+
+    :return: Application change feed
+    :rtype: ChangeFeed
+    """
+    return ChangeFeed(create_broker())
+
+
+def __getattr__(name: str) -> Any:
+    """Resolve ``change_feed`` lazily, so importing reads no settings.
+
+    :param name: Module attribute name
+    :type name: str
+    :return: Attribute value
+    :rtype: Any
+    :raises AttributeError: If the attribute does not exist
+    """
+    if name == "change_feed":
+        return get_change_feed()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
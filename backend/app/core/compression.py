@@ -0,0 +1,244 @@
+"""Negotiated compression of response bodies.
+
+Brew listings repeat the same bean and brew type strings on every row and
+carry free-text details, so they shrink several times when compressed. The
+content coding is negotiated from ``Accept-Encoding`` among zstd, brotli
+and gzip, preferring them in that order when the client accepts several
+equally. gzip is always available; brotli and zstd need the optional
+``brotli`` and ``zstandard`` packages and are only offered when installed.
+
+:class:`CompressionMiddleware` compresses responses on the fly. Bodies
+under ``COMPRESSION_MIN_SIZE`` are sent as is, as are media types that are
+already compressed, such as images and Parquet exports, and event streams,
+whose events must reach the client as soon as they are sent. Cached
+responses are compressed by the response cache instead, which keeps the
+compressed bytes so a page is compressed once per coding rather than once
+per request.
+"""
+
+import gzip
+import zlib
+from typing import Any, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.core.config import settings
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - exercised without brotli installed
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - exercised without zstandard installed
+    zstandard = None
+
+#: Compression level of each content coding, tuned for compressing per
+#: request rather than for the smallest output
+LEVELS = {"zstd": 3, "br": 4, "gzip": 6}
+
+#: Media types outside ``text/*`` worth compressing
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+}
+
+
+def available_encodings() -> List[str]:
+    """List the content codings this installation can produce.
+
+    :return: Content codings, in order of preference
+    :rtype: List[str]
+    """
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the content coding of a response.
+
+    :param accept_encoding: Value of the ``Accept-Encoding`` request header
+    :type accept_encoding: Optional[str]
+    :return: Available coding with the highest quality value, ties going to
+        the preferred one, or None to send the body as is
+    :rtype: Optional[str]
+    """
+    if not accept_encoding:
+        return None
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().lower().partition(";")
+        quality = 1.0
+        name, _, value = params.strip().partition("=")
+        if name.strip() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip()] = quality
+    wildcard = qualities.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for coding in available_encodings():
+        quality = qualities.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def choose_encoding(accept_encoding: Optional[str], size: int) -> Optional[str]:
+    """Pick the content coding of a response body of a known size.
+
+    :param accept_encoding: Value of the ``Accept-Encoding`` request header
+    :type accept_encoding: Optional[str]
+    :param size: Length of the uncompressed body in bytes
+    :type size: int
+    :return: Content coding, or None if compression is disabled, the body
+        is too small or the client accepts no available coding
+    :rtype: Optional[str]
+    """
+    if not settings.COMPRESSION_ENABLED or size < settings.COMPRESSION_MIN_SIZE:
+        return None
+    return negotiate_encoding(accept_encoding)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Compress a whole body.
+
+    :param data: Uncompressed body
+    :type data: bytes
+    :param encoding: Available content coding
+    :type encoding: str
+    :return: Compressed body
+    :rtype: bytes
+    """
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=LEVELS["zstd"]).compress(data)
+    if encoding == "br":
+        return brotli.compress(data, quality=LEVELS["br"])
+    # A fixed timestamp keeps the output of equal bodies equal
+    return gzip.compress(data, compresslevel=LEVELS["gzip"], mtime=0)
+
+
+class _BrotliCompressor:
+    """Adapter giving ``brotli.Compressor`` the interface of zlib's."""
+
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=LEVELS["br"])
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+def compressor(encoding: str) -> Any:
+    """Create an incremental compressor for a streamed body.
+
+    :param encoding: Available content coding
+    :type encoding: str
+    :return: Object whose ``compress`` method takes each chunk and whose
+        ``flush`` method ends the stream, like ``zlib.compressobj``
+    :rtype: Any
+    """
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=LEVELS["zstd"]).compressobj()
+    if encoding == "br":
+        return _BrotliCompressor()
+    return zlib.compressobj(LEVELS["gzip"], zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def is_compressible(headers: Headers) -> bool:
+    """Check whether a response body is worth compressing.
+
+    :param headers: Response headers
+    :type headers: Headers
+    :return: True for uncompressed text and JSON bodies, other than event
+        streams, that allow transformation
+    :rtype: bool
+    """
+    if "content-encoding" in headers or "content-range" in headers:
+        return False
+    if "no-transform" in headers.get("cache-control", ""):
+        return False
+    media_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+    if media_type == "text/event-stream":
+        return False
+    return (
+        media_type.startswith("text/")
+        or media_type in COMPRESSIBLE_TYPES
+        or media_type.endswith("+json")
+    )
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing response bodies on the fly.
+
+    Single-message bodies are compressed whole once they reach
+    ``COMPRESSION_MIN_SIZE``. Streamed bodies, such as exports, are
+    compressed incrementally, without a ``Content-Length``.
+
+    :param app: ASGI application whose responses are compressed
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        start = None
+        stream = None
+
+        async def send_compressed(message):
+            nonlocal start, stream
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk tells how to send it
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                if start is not None:
+                    await send(start)
+                    start = None
+                await send(message)
+                return
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                headers = MutableHeaders(scope=start)
+                if start["status"] >= 200 and is_compressible(headers):
+                    headers.add_vary_header("Accept-Encoding")
+                    if encoding is not None and more_body:
+                        headers["Content-Encoding"] = encoding
+                        if "content-length" in headers:
+                            del headers["Content-Length"]
+                        stream = compressor(encoding)
+                    elif encoding is not None and (
+                        len(body) >= settings.COMPRESSION_MIN_SIZE
+                    ):
+                        body = compress(body, encoding)
+                        headers["Content-Encoding"] = encoding
+                        headers["Content-Length"] = str(len(body))
+                        message = {**message, "body": body}
+                await send(start)
+                start = None
+            if stream is not None:
+                data = stream.compress(body)
+                if not more_body:
+                    data += stream.flush()
+                    stream = None
+                message = {**message, "body": data}
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
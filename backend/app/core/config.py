@@ -1,10 +1,13 @@
 """Application configuration management.
 
 This module handles application settings using Pydantic's BaseSettings,
-supporting both environment variables and .env file configuration.
+supporting both environment variables and .env file configuration. The
+environment and ``.env`` file are only read when a setting is first used,
+not when this module is imported.
 """
 
 from functools import lru_cache
+from typing import Any, List, Optional, cast
 
 from pydantic_settings import BaseSettings
 
@@ -21,11 +24,179 @@ class Settings(BaseSettings):
     :type SQLALCHEMY_DATABASE_URL: str
     :ivar API_V1_STR: API version prefix for routes
     :type API_V1_STR: str
+    :ivar BLOB_STORE_DIR: Directory of the content-addressed image store
+    :type BLOB_STORE_DIR: str
+    :ivar IMAGE_WORKERS: Processes rendering image variants, or 0 to render
+        them inline in the request
+    :type IMAGE_WORKERS: int
+    :ivar IMAGE_QUEUE_SIZE: Images waiting for their variants at once; further
+        uploads get their variants when first requested
+    :type IMAGE_QUEUE_SIZE: int
+    :ivar INGEST_ENABLED: Queue brews posted with ``Prefer: respond-async`` and
+        create them in the background
+    :type INGEST_ENABLED: bool
+    :ivar INGEST_QUEUE_PATH: SQLite file of the ingestion queue
+    :type INGEST_QUEUE_PATH: str
+    :ivar INGEST_MAX_PENDING: Queued brews beyond which posts are refused
+    :type INGEST_MAX_PENDING: int
+    :ivar INGEST_BATCH_SIZE: Queued brews created per transaction
+    :type INGEST_BATCH_SIZE: int
+    :ivar INGEST_FLUSH_SECONDS: Longest delay before queued brews are created
+    :type INGEST_FLUSH_SECONDS: float
+    :ivar INGEST_RETENTION_SECONDS: Seconds provisional IDs stay resolvable
+    :type INGEST_RETENTION_SECONDS: int
+    :ivar SYNC_CLIENT_RETENTION_DAYS: Days the client IDs of brews created by
+        offline sync stay resolvable, so replayed creates are not duplicated
+    :type SYNC_CLIENT_RETENTION_DAYS: float
+    :ivar BULK_CHUNK_SIZE: Number of rows written per statement by bulk endpoints
+    :type BULK_CHUNK_SIZE: int
+    :ivar USE_ASYNC_DB: Serve the core brew endpoints with the async stack
+    :type USE_ASYNC_DB: bool
+    :ivar ASYNC_DATABASE_URL: Async driver URL, derived from
+        SQLALCHEMY_DATABASE_URL when unset
+    :type ASYNC_DATABASE_URL: str or None
+    :ivar READ_DATABASE_URL: Read-only or replica URL used by GET requests;
+        when set, responses are not cached
+    :type READ_DATABASE_URL: str or None
+    :ivar DATABASE_SHARDS: URLs of the databases users are spread across, by
+        user ID modulo their number; when empty, every user is stored in
+        SQLALCHEMY_DATABASE_URL
+    :type DATABASE_SHARDS: List[str]
+    :ivar DB_POOL_SIZE: Connections kept open in each engine pool
+    :type DB_POOL_SIZE: int
+    :ivar DB_MAX_OVERFLOW: Extra connections opened when the pool is exhausted
+    :type DB_MAX_OVERFLOW: int
+    :ivar DB_POOL_TIMEOUT: Seconds to wait for a pooled connection
+    :type DB_POOL_TIMEOUT: float
+    :ivar DB_POOL_PRE_PING: Test connections for liveness on checkout
+    :type DB_POOL_PRE_PING: bool
+    :ivar DB_POOL_RECYCLE: Seconds after which pooled connections are replaced
+    :type DB_POOL_RECYCLE: int
+    :ivar SQLITE_JOURNAL_MODE: SQLite journal mode
+    :type SQLITE_JOURNAL_MODE: str
+    :ivar SQLITE_SYNCHRONOUS: SQLite synchronous level
+    :type SQLITE_SYNCHRONOUS: str
+    :ivar SQLITE_MMAP_SIZE: Bytes of the SQLite file mapped into memory
+    :type SQLITE_MMAP_SIZE: int
+    :ivar SQLITE_CACHE_SIZE: SQLite page cache size (negative values are KiB)
+    :type SQLITE_CACHE_SIZE: int
+    :ivar SQLITE_BUSY_TIMEOUT_MS: Milliseconds SQLite waits on a locked database
+    :type SQLITE_BUSY_TIMEOUT_MS: int
+    :ivar CACHE_BACKEND: Response cache backend: "memory", "redis" or "none"
+    :type CACHE_BACKEND: str
+    :ivar CACHE_TTL_SECONDS: Seconds a cached response stays valid
+    :type CACHE_TTL_SECONDS: int
+    :ivar CACHE_MAX_ENTRIES: Entries kept by the in-process cache
+    :type CACHE_MAX_ENTRIES: int
+    :ivar CACHE_REDIS_URL: Redis URL used by the "redis" cache backend
+    :type CACHE_REDIS_URL: str
+    :ivar CHANGES_BROKER: Broker of change notifications: "memory" or "redis"
+    :type CHANGES_BROKER: str
+    :ivar CHANGES_REDIS_URL: Redis URL used by the "redis" change broker
+    :type CHANGES_REDIS_URL: str
+    :ivar CHANGES_POLL_SECONDS: Seconds between reads of the change log by
+        an idle change stream, which also sends a keep-alive
+    :type CHANGES_POLL_SECONDS: float
+    :ivar CHANGES_STREAM_SECONDS: Seconds after which a change stream ends,
+        for clients to reconnect where they left off
+    :type CHANGES_STREAM_SECONDS: float
+    :ivar SIMILARITY_REBUILD_CHANGES: Changes pending beyond which the
+        similarity index is rebuilt rather than updated
+    :type SIMILARITY_REBUILD_CHANGES: int
+    :ivar SIMILARITY_MAX_AGE_SECONDS: Seconds after which the similarity index
+        is rebuilt, refreshing its feature scaling
+    :type SIMILARITY_MAX_AGE_SECONDS: float
+    :ivar COMPRESSION_ENABLED: Compress responses with the best content coding
+        the client accepts
+    :type COMPRESSION_ENABLED: bool
+    :ivar COMPRESSION_MIN_SIZE: Bytes below which responses are sent as is
+    :type COMPRESSION_MIN_SIZE: int
+    :ivar MAINTENANCE_ENABLED: Purge, archive and compact the databases in
+        the background
+    :type MAINTENANCE_ENABLED: bool
+    :ivar MAINTENANCE_INTERVAL_SECONDS: Seconds between maintenance passes
+    :type MAINTENANCE_INTERVAL_SECONDS: float
+    :ivar MAINTENANCE_LOCK_PATH: File locked by the one process running
+        maintenance
+    :type MAINTENANCE_LOCK_PATH: str
+    :ivar MAINTENANCE_BATCH_SIZE: Brews purged or archived per transaction
+    :type MAINTENANCE_BATCH_SIZE: int
+    :ivar TOMBSTONE_RETENTION_DAYS: Days deleted brews can be restored before
+        they are purged
+    :type TOMBSTONE_RETENTION_DAYS: float
+    :ivar ARCHIVE_AFTER_MONTHS: Age in months after which brews are moved to
+        the archive, or 0 to never archive them
+    :type ARCHIVE_AFTER_MONTHS: int
+    :ivar VACUUM_PAGES: Free SQLite pages returned to the file system per
+        maintenance pass, or 0 for all of them
+    :type VACUUM_PAGES: int
+    :ivar EXPORT_BATCH_SIZE: Rows fetched and encoded at a time by exports
+    :type EXPORT_BATCH_SIZE: int
+    :ivar METRICS_ENABLED: Record request metrics and serve them at /metrics
+    :type METRICS_ENABLED: bool
+    :ivar SLOW_QUERY_MS: Log statements taking at least this many milliseconds
+    :type SLOW_QUERY_MS: float or None
+    :ivar PROFILING_ENABLED: Profile requests sent with an X-Profile header
+    :type PROFILING_ENABLED: bool
+    :ivar PROFILE_DIR: Directory request profiles are written to
+    :type PROFILE_DIR: str
+    :ivar PROFILE_INTERVAL_MS: Milliseconds between profiler samples
+    :type PROFILE_INTERVAL_MS: float
     """
 
     DATABASE_URL: str = "sqlite:///sql_app.db"
     SQLALCHEMY_DATABASE_URL: str = DATABASE_URL
     API_V1_STR: str = "/api/v1"
+    BLOB_STORE_DIR: str = "blobs"
+    IMAGE_WORKERS: int = 2
+    IMAGE_QUEUE_SIZE: int = 64
+    INGEST_ENABLED: bool = False
+    INGEST_QUEUE_PATH: str = "ingest.db"
+    INGEST_MAX_PENDING: int = 10000
+    INGEST_BATCH_SIZE: int = 500
+    INGEST_FLUSH_SECONDS: float = 1.0
+    INGEST_RETENTION_SECONDS: int = 3600
+    SYNC_CLIENT_RETENTION_DAYS: float = 180.0
+    BULK_CHUNK_SIZE: int = 500
+    USE_ASYNC_DB: bool = False
+    ASYNC_DATABASE_URL: Optional[str] = None
+    READ_DATABASE_URL: Optional[str] = None
+    DATABASE_SHARDS: List[str] = []
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE: int = 1800
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE: int = -64 * 1024
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    CACHE_BACKEND: str = "memory"
+    CACHE_TTL_SECONDS: int = 60
+    CACHE_MAX_ENTRIES: int = 1024
+    CACHE_REDIS_URL: str = "redis://localhost:6379/0"
+    CHANGES_BROKER: str = "memory"
+    CHANGES_REDIS_URL: str = "redis://localhost:6379/0"
+    CHANGES_POLL_SECONDS: float = 15.0
+    CHANGES_STREAM_SECONDS: float = 300.0
+    SIMILARITY_REBUILD_CHANGES: int = 10000
+    SIMILARITY_MAX_AGE_SECONDS: float = 3600.0
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024
+    MAINTENANCE_ENABLED: bool = False
+    MAINTENANCE_INTERVAL_SECONDS: float = 3600.0
+    MAINTENANCE_LOCK_PATH: str = "maintenance.lock"
+    MAINTENANCE_BATCH_SIZE: int = 1000
+    TOMBSTONE_RETENTION_DAYS: float = 30.0
+    ARCHIVE_AFTER_MONTHS: int = 0
+    VACUUM_PAGES: int = 4096
+    EXPORT_BATCH_SIZE: int = 1000
+    METRICS_ENABLED: bool = True
+    SLOW_QUERY_MS: Optional[float] = None
+    PROFILING_ENABLED: bool = False
+    PROFILE_DIR: str = "profiles"
+    PROFILE_INTERVAL_MS: float = 1.0
 
     model_config = {"env_file": ".env"}
 
@@ -43,5 +214,19 @@ def get_settings() -> Settings:
     return Settings()
 
 
-#: Cached instance of application settings
-settings = get_settings()
+class LazySettings:
+    """Proxy to the cached settings, which are only loaded on first access.
+
+    Attributes are read from the instance returned by :func:`get_settings`.
+    Assigning an attribute overrides it on the proxy, and deleting it again
+    restores the loaded value, which is what ``unittest.mock.patch`` and
+    pytest's ``monkeypatch`` expect.
+    """
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for attributes that are not overridden
+        return getattr(get_settings(), name)
+
+
+#: Application settings, loaded on first access
+settings = cast(Settings, LazySettings())
@@ -1,38 +1,396 @@
 """Database configuration and session management.
 
 This module provides SQLAlchemy database configuration, including:
-    - Database engine setup
+    - Database engine setup with pool tuning, SQLite pragmas and
+      query instrumentation
+    - Optional read-only engine for GET requests
+    - Optional sharding of users across several databases
     - Session management
     - Base class for models
     - Database dependency for FastAPI
+    - Optional async engine and session dependency
+
+Engines are created on first use rather than at import, so importing the
+application neither reads the settings nor opens the database.
+
+When ``DATABASE_SHARDS`` lists several database URLs, each user's brews live
+in exactly one of them, chosen by :func:`shard_for`, and every session is
+opened on the shard of the user making the request. Writers of users on
+different shards then never wait on each other's SQLite write lock. Shards
+have no read-only replicas: their read sessions use the shard itself.
 """
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+import asyncio
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import (
+    AsyncContextManager,
+    AsyncIterator,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+from fastapi import Depends, Request
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
 
 from app.core.config import settings
+from app.core.metrics import instrument_engine
+from app.core.users import get_user_id
 
 #: SQLAlchemy declarative base class for models
 Base = declarative_base()
 
-#: Database engine instance configured with application settings
-engine = create_engine(settings.SQLALCHEMY_DATABASE_URL)
+#: HTTP methods served by the read-only engine when one is configured
+READ_METHODS = frozenset({"GET", "HEAD"})
 
-#: Session factory for creating new database sessions
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def _is_memory_sqlite(url: str) -> bool:
+    """Check whether a URL points at an in-memory SQLite database.
 
-def get_db():
-    """Database dependency callable for FastAPI.
+    :param url: SQLAlchemy database URL
+    :type url: str
+    :return: True for in-memory SQLite databases
+    :rtype: bool
+    """
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and parsed.database in (
+        None,
+        "",
+        ":memory:",
+    )
 
-    Creates a new database session for each request and ensures
-    proper cleanup after the request is complete.
 
-    :yield: Database session
-    :rtype: Session
+def _engine_options(url: str) -> dict:
+    """Build ``create_engine`` keyword arguments from the pool settings.
+
+    In-memory SQLite databases keep SQLAlchemy's default pool, since every
+    new connection would otherwise open a different empty database.
+
+    :param url: SQLAlchemy database URL
+    :type url: str
+    :return: Engine keyword arguments
+    :rtype: dict
+    """
+    options = {}
+    if make_url(url).get_backend_name() == "sqlite":
+        options["connect_args"] = {"check_same_thread": False}
+    if not _is_memory_sqlite(url):
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+        )
+    return options
+
+
+def _apply_sqlite_pragmas(engine: Engine, read_only: bool = False) -> None:
+    """Configure every new SQLite connection of an engine.
+
+    WAL lets readers proceed while a writer commits, and
+    ``synchronous=NORMAL`` is durable in WAL mode except for the last
+    transactions before a power loss. Writers ask for incremental
+    auto-vacuum, which only applies to new databases, so that maintenance
+    can return free pages to the file system a few at a time. Read-only
+    engines additionally set ``query_only`` and leave the journal mode and
+    auto-vacuum to the writer.
+
+    :param engine: Engine to configure; ignored unless it uses SQLite
+    :type engine: Engine
+    :param read_only: Whether the engine only serves reads
+    :type read_only: bool
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    pragmas = [
+        f"busy_timeout = {settings.SQLITE_BUSY_TIMEOUT_MS}",
+        f"synchronous = {settings.SQLITE_SYNCHRONOUS}",
+        f"mmap_size = {settings.SQLITE_MMAP_SIZE}",
+        f"cache_size = {settings.SQLITE_CACHE_SIZE}",
+    ]
+    if read_only:
+        pragmas.append("query_only = ON")
+    else:
+        pragmas.insert(0, "auto_vacuum = INCREMENTAL")
+        if not _is_memory_sqlite(str(engine.url)):
+            pragmas.insert(1, f"journal_mode = {settings.SQLITE_JOURNAL_MODE}")
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+
+
+def create_database_engine(url: str, read_only: bool = False) -> Engine:
+    """Create an engine configured with the application pool settings.
+
+    :param url: SQLAlchemy database URL
+    :type url: str
+    :param read_only: Whether the engine only serves reads
+    :type read_only: bool
+    :return: Configured engine
+    :rtype: Engine
+    """
+    db_engine = create_engine(url, **_engine_options(url))
+    _apply_sqlite_pragmas(db_engine, read_only=read_only)
+    instrument_engine(db_engine)
+    return db_engine
+
+
+def shard_for(user_id: int) -> Optional[int]:
+    """Return the shard holding a user's brews.
+
+    :param user_id: ID of the user
+    :type user_id: int
+    :return: Position of the user's database in ``DATABASE_SHARDS``, or None
+        when users are not sharded
+    :rtype: Optional[int]
+    """
+    if not settings.DATABASE_SHARDS:
+        return None
+    return user_id % len(settings.DATABASE_SHARDS)
+
+
+def all_shards() -> List[Optional[int]]:
+    """List the shards of the application databases.
+
+    :return: Every shard, or ``[None]`` when users are not sharded
+    :rtype: List[Optional[int]]
+    """
+    return list(range(len(settings.DATABASE_SHARDS))) or [None]
+
+
+@lru_cache()
+def get_engine(read_only: bool = False, shard: Optional[int] = None) -> Engine:
+    """Create the engine configured with application settings on first use.
+
+    The read-only engine falls back to the primary one when no read URL is
+    configured, and always for shards.
+
+    :param read_only: Whether to return the engine serving GET requests
+    :type read_only: bool
+    :param shard: Shard of the database, from :func:`shard_for`
+    :type shard: Optional[int]
+    :return: Database engine
+    :rtype: Engine
     """
-    db = SessionLocal()
+    if shard is not None:
+        if read_only:
+            return get_engine(shard=shard)
+        return create_database_engine(settings.DATABASE_SHARDS[shard])
+    if read_only and not settings.READ_DATABASE_URL:
+        return get_engine()
+    if read_only:
+        return create_database_engine(settings.READ_DATABASE_URL, read_only=True)
+    return create_database_engine(settings.SQLALCHEMY_DATABASE_URL)
+
+
+def get_engines() -> List[Engine]:
+    """Return the primary engine of every application database.
+
+    :return: One engine per shard, or the single primary engine
+    :rtype: List[Engine]
+    """
+    return [get_engine(shard=shard) for shard in all_shards()]
+
+
+@lru_cache()
+def get_sessionmaker(
+    read_only: bool = False, shard: Optional[int] = None
+) -> sessionmaker:
+    """Create the session factory of an engine on first use.
+
+    :param read_only: Whether to use the read-only engine
+    :type read_only: bool
+    :param shard: Shard of the database, from :func:`shard_for`
+    :type shard: Optional[int]
+    :return: Factory for new database sessions
+    :rtype: sessionmaker
+    """
+    return sessionmaker(
+        autocommit=False,
+        autoflush=False,
+        bind=get_engine(read_only=read_only, shard=shard),
+    )
+
+
+#: Semaphores bounding the sessions open at once, by engine and event loop
+_session_slots: Dict[Tuple[Engine, asyncio.AbstractEventLoop], asyncio.Semaphore] = {}
+
+
+def _slots_for(db_engine: Engine) -> Optional[asyncio.Semaphore]:
+    """Return the semaphore admitting sessions on an engine's pool.
+
+    A semaphore only works on the event loop it was first used on, so each
+    running loop gets its own, created lazily. Those of closed loops are
+    dropped. In-memory SQLite engines, which are not pool-limited, are not
+    throttled.
+
+    :param db_engine: Engine the session will use
+    :type db_engine: Engine
+    :return: Semaphore sized to the pool, or None
+    :rtype: Optional[asyncio.Semaphore]
+    """
+    if _is_memory_sqlite(str(db_engine.url)):
+        return None
+    key = (db_engine, asyncio.get_running_loop())
+    if key not in _session_slots:
+        for stale in [key for key in _session_slots if key[1].is_closed()]:
+            del _session_slots[stale]
+        _session_slots[key] = asyncio.Semaphore(
+            settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+        )
+    return _session_slots[key]
+
+
+@asynccontextmanager
+async def admit_session(
+    read_only: bool = False, shard: Optional[int] = None
+) -> AsyncIterator[Session]:
+    """Open a database session once the engine's pool has room for it.
+
+    Sessions are admitted on the event loop, at most as many at once as
+    the pool holds connections. A session keeps its connection until it is
+    closed, which for sync handlers happens on a threadpool worker; if more
+    sessions than connections reached the threadpool, every worker could
+    end up blocked on pool checkout while the sessions holding connections
+    wait for a worker to finish.
+
+    :param read_only: Whether to use the read-only engine
+    :type read_only: bool
+    :param shard: Shard of the database, from :func:`shard_for`
+    :type shard: Optional[int]
+    :yield: Database session, closed on exit
+    :rtype: AsyncIterator[Session]
+    """
+    factory = get_sessionmaker(read_only=read_only, shard=shard)
+    slots = _slots_for(factory.kw["bind"])
+    if slots is not None:
+        await slots.acquire()
+    db = factory()
     try:
         yield db
     finally:
         db.close()
+        if slots is not None:
+            slots.release()
+
+
+async def get_db(request: Request, user_id: int = Depends(get_user_id)):
+    """Database dependency callable for FastAPI.
+
+    Creates a new database session for each request, admitted by
+    :func:`admit_session`, and ensures proper cleanup after the request is
+    complete. The session is opened on the shard of the requesting user,
+    and for GET and HEAD requests on the read-only engine when one is
+    configured. The session is held until the response has been serialized.
+
+    :param request: Incoming request, used to route reads
+    :type request: Request
+    :param user_id: ID of the requesting user, used to route to a shard
+    :type user_id: int
+    :yield: Database session
+    :rtype: Session
+    """
+    async with admit_session(
+        read_only=request.method in READ_METHODS, shard=shard_for(user_id)
+    ) as db:
+        yield db
+
+
+def get_session_opener() -> Callable[..., AsyncContextManager[Session]]:
+    """Dependency providing sessions to handlers that serve for long.
+
+    Handlers such as change streams, which would hold a request session
+    and its pool slot for minutes, open short sessions with it instead.
+
+    :return: :func:`admit_session`
+    :rtype: Callable[..., AsyncContextManager[Session]]
+    """
+    return admit_session
+
+
+#: Async drivers substituted for the default driver of each backend
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+def async_database_url(url: str) -> str:
+    """Derive the async driver URL for a synchronous database URL.
+
+    :param url: Synchronous SQLAlchemy database URL
+    :type url: str
+    :return: Equivalent URL using aiosqlite or asyncpg
+    :rtype: str
+    """
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        return url
+    driver = f"{backend}+{ASYNC_DRIVERS[backend]}"
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+@lru_cache()
+def get_async_sessionmaker(
+    read_only: bool = False, shard: Optional[int] = None
+) -> async_sessionmaker:
+    """Create an async engine and session factory on first use.
+
+    The async driver is only imported when the async stack is used. The
+    read-only factory falls back to the primary one when no read URL is
+    configured, and always for shards.
+
+    :param read_only: Whether to use the read-only database
+    :type read_only: bool
+    :param shard: Shard of the database, from :func:`shard_for`
+    :type shard: Optional[int]
+    :return: Factory for new async database sessions
+    :rtype: async_sessionmaker
+    """
+    if shard is not None and read_only:
+        return get_async_sessionmaker(shard=shard)
+    if read_only and not settings.READ_DATABASE_URL:
+        return get_async_sessionmaker()
+    if shard is not None:
+        url = async_database_url(settings.DATABASE_SHARDS[shard])
+    elif read_only:
+        url = async_database_url(settings.READ_DATABASE_URL)
+    else:
+        url = settings.ASYNC_DATABASE_URL or async_database_url(
+            settings.SQLALCHEMY_DATABASE_URL
+        )
+    async_engine = create_async_engine(url, **_engine_options(url))
+    _apply_sqlite_pragmas(async_engine.sync_engine, read_only=read_only)
+    instrument_engine(async_engine.sync_engine)
+    return async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+async def get_async_db(request: Request, user_id: int = Depends(get_user_id)):
+    """Async database dependency callable for FastAPI.
+
+    Creates a new async database session for each request and closes it
+    once the request is complete. The session is opened on the shard of the
+    requesting user, and GET and HEAD requests use the read-only database
+    when one is configured.
+
+    :param request: Incoming request, used to route reads
+    :type request: Request
+    :param user_id: ID of the requesting user, used to route to a shard
+    :type user_id: int
+    :yield: Async database session
+    :rtype: AsyncSession
+    """
+    factory = get_async_sessionmaker(
+        read_only=request.method in READ_METHODS, shard=shard_for(user_id)
+    )
+    async with factory() as db:
+        yield db
@@ -0,0 +1,189 @@
+"""Streaming encoders for data exports.
+
+Each encoder turns batches of result rows into chunks of bytes for a
+``StreamingResponse``. Only one batch is held in memory at a time, so the
+size of an export is bounded by the database rather than the server.
+
+Parquet export needs the optional ``pyarrow`` package, which is only
+imported when that format is requested.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, Sequence, Tuple
+
+from sqlalchemy import Column, DateTime, Float, Integer
+
+#: Batches of result rows, each row a tuple of column values
+Batches = Iterable[Sequence[Sequence[Any]]]
+
+#: Function encoding batches of rows of the given columns into chunks
+Encoder = Callable[[Sequence[Column], Batches], Iterator[bytes]]
+
+
+class ExportUnavailableError(RuntimeError):
+    """Raised when an export format's optional dependency is missing."""
+
+
+def _json_default(value: Any) -> Any:
+    """Encode values the ``json`` module does not handle natively.
+
+    :param value: Value to encode
+    :type value: Any
+    :return: JSON-compatible value
+    :rtype: Any
+    :raises TypeError: If the value cannot be encoded
+    """
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode_ndjson(columns: Sequence[Column], batches: Batches) -> Iterator[bytes]:
+    """Encode rows as newline-delimited JSON objects.
+
+    :param columns: Columns of the rows, in order
+    :type columns: Sequence[Column]
+    :param batches: Batches of result rows
+    :type batches: Batches
+    :yield: One chunk per batch
+    :rtype: Iterator[bytes]
+    """
+    names = [col.name for col in columns]
+    for batch in batches:
+        lines = [
+            json.dumps(dict(zip(names, row)), default=_json_default) for row in batch
+        ]
+        yield ("\n".join(lines) + "\n").encode()
+
+
+def encode_csv(columns: Sequence[Column], batches: Batches) -> Iterator[bytes]:
+    """Encode rows as CSV with a header line.
+
+    :param columns: Columns of the rows, in order
+    :type columns: Sequence[Column]
+    :param batches: Batches of result rows
+    :type batches: Batches
+    :yield: One chunk per batch, the first one starting with the header
+    :rtype: Iterator[bytes]
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([col.name for col in columns])
+    for batch in batches:
+        writer.writerows(
+            [
+                value.isoformat() if isinstance(value, datetime) else value
+                for value in row
+            ]
+            for row in batch
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _DrainableSink(io.RawIOBase):
+    """Write-only file that hands out written bytes as they accumulate.
+
+    Parquet footers record absolute offsets, so the position keeps counting
+    from the start of the file after the buffered bytes are drained.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        """Return and forget the bytes written since the last drain."""
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _import_pyarrow():
+    """Import ``pyarrow`` and its Parquet module.
+
+    :return: The ``pyarrow`` and ``pyarrow.parquet`` modules
+    :rtype: tuple
+    :raises ExportUnavailableError: If ``pyarrow`` is not installed
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as exc:
+        raise ExportUnavailableError("Parquet export requires 'pyarrow'") from exc
+    return pyarrow, pyarrow.parquet
+
+
+def encode_parquet(columns: Sequence[Column], batches: Batches) -> Iterator[bytes]:
+    """Encode rows as a Parquet file with one row group per batch.
+
+    :param columns: Columns of the rows, in order
+    :type columns: Sequence[Column]
+    :param batches: Batches of result rows
+    :type batches: Batches
+    :yield: Chunks of the file, one per row group, then the footer
+    :rtype: Iterator[bytes]
+    :raises ExportUnavailableError: If ``pyarrow`` is not installed
+    """
+    pa, pq = _import_pyarrow()
+
+    def arrow_type(col: Column):
+        if isinstance(col.type, Integer):
+            return pa.int64()
+        if isinstance(col.type, Float):
+            return pa.float64()
+        if isinstance(col.type, DateTime):
+            return pa.timestamp("us")
+        return pa.string()
+
+    schema = pa.schema([(col.name, arrow_type(col)) for col in columns])
+    sink = _DrainableSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for batch in batches:
+            writer.write_table(
+                pa.Table.from_pylist(
+                    [dict(zip(schema.names, row)) for row in batch], schema=schema
+                )
+            )
+            yield sink.drain()
+    yield sink.drain()
+
+
+#: Encoder, media type and file extension of each export format
+FORMATS: Dict[str, Tuple[Encoder, str, str]] = {
+    "ndjson": (encode_ndjson, "application/x-ndjson", "ndjson"),
+    "csv": (encode_csv, "text/csv", "csv"),
+    "parquet": (encode_parquet, "application/vnd.apache.parquet", "parquet"),
+}
+
+
+def check_available(fmt: str) -> None:
+    """Check that the optional dependency of an export format is installed.
+
+    Called before a response starts, since errors raised while streaming
+    can no longer change the status code.
+
+    :param fmt: Export format name
+    :type fmt: str
+    :raises ExportUnavailableError: If the format cannot be produced
+    """
+    if fmt == "parquet":
+        _import_pyarrow()
@@ -0,0 +1,220 @@
+"""Resized and re-encoded variants of uploaded brew images.
+
+Phone cameras upload photos of several megabytes, while a brew card shows
+a few hundred pixels. After an upload, each image is decoded, rotated
+upright, stripped of its EXIF and other metadata, downscaled to the sizes
+in :data:`VARIANT_SIZES` and re-encoded to AVIF and WebP. The variants are
+stored next to the original in the blob store, so they are shared by every
+brew with the same image like the original is.
+
+Decoding and encoding are CPU-bound, so they run in a bounded process
+pool rather than on the event loop or the request threadpool. Jobs that
+do not fit in the queue are dropped; the image endpoint serves the
+original until a variant exists, and schedules it again when requested.
+
+Pillow is optional. Without it no variants are made and the original is
+always served.
+"""
+
+import io
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache
+from typing import List, Optional
+
+from app.core import blobs
+from app.core.config import settings
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # pragma: no cover - exercised without Pillow installed
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+#: Longest edge in pixels of each variant size
+VARIANT_SIZES = {"thumb": 320, "medium": 960, "large": 1920}
+
+#: Encoder options of each variant format, in order of preference
+FORMAT_OPTIONS = {
+    "avif": {"quality": 60, "speed": 8},
+    "webp": {"quality": 80, "method": 4},
+}
+
+
+def variant_name(size: str, fmt: str) -> str:
+    """Build the blob store name of a variant.
+
+    :param size: Key of :data:`VARIANT_SIZES`
+    :type size: str
+    :param fmt: Key of :data:`FORMAT_OPTIONS`
+    :type fmt: str
+    :return: Variant name
+    :rtype: str
+    """
+    return f"{size}.{fmt}"
+
+
+@lru_cache()
+def supported_formats() -> List[str]:
+    """List the variant formats this Pillow build can encode.
+
+    :return: Keys of :data:`FORMAT_OPTIONS`, in order of preference
+    :rtype: List[str]
+    """
+    if Image is None:
+        return []
+    return [fmt for fmt in FORMAT_OPTIONS if features.check(fmt)]
+
+
+def render_variants(root: str, digest: str) -> List[str]:
+    """Render the missing variants of a stored image.
+
+    Runs in the worker processes of the pool. Blobs that Pillow cannot
+    decode are left without variants.
+
+    :param root: Directory of the blob store
+    :type root: str
+    :param digest: Hex SHA-256 digest of the original image
+    :type digest: str
+    :return: Names of the variants written
+    :rtype: List[str]
+    """
+    store = blobs.BlobStore(root)
+    missing = [
+        (size, fmt)
+        for size in VARIANT_SIZES
+        for fmt in supported_formats()
+        if not store.exists(digest, variant_name(size, fmt))
+    ]
+    if not missing:
+        return []
+    try:
+        with Image.open(store.path(digest)) as original:
+            image = ImageOps.exif_transpose(original)
+            image.load()
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.warning("Cannot decode image %s", digest)
+        return []
+    if image.mode not in ("RGB", "RGBA"):
+        has_alpha = "A" in image.getbands() or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    # Only the colour profile is kept; EXIF, XMP and comments are dropped
+    icc_profile = image.info.get("icc_profile")
+    written = []
+    for size, fmt in missing:
+        variant = image.copy()
+        variant.info = {}
+        variant.thumbnail((VARIANT_SIZES[size],) * 2, Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        options = dict(FORMAT_OPTIONS[fmt])
+        if icc_profile:
+            options["icc_profile"] = icc_profile
+        variant.save(output, format=fmt.upper(), exif=b"", **options)
+        name = variant_name(size, fmt)
+        store.put_variant(digest, name, output.getvalue())
+        written.append(name)
+    return written
+
+
+class VariantPool:
+    """Bounded process pool rendering image variants in the background.
+
+    :ivar workers: Number of worker processes, or 0 to render inline
+    :type workers: int
+    :ivar queue_size: Jobs pending at once; further jobs are dropped
+    :type queue_size: int
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Start the worker processes on first use."""
+        with self._lock:
+            if self._executor is None:
+                # Spawned rather than forked, as the server runs threads
+                self._executor = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def submit(self, digest: str) -> Optional[Future]:
+        """Schedule the rendering of the variants of an image.
+
+        :param digest: Hex SHA-256 digest of the original image
+        :type digest: str
+        :return: Future of the names of the variants written, or None if
+            there is nothing to render or the queue is full
+        :rtype: Optional[Future]
+        """
+        if not supported_formats():
+            return None
+        if not self._slots.acquire(blocking=False):
+            logger.warning("Image queue full, not rendering %s", digest)
+            return None
+        root = str(blobs.blob_store.root)
+        if not self.workers:
+            future: Future = Future()
+            try:
+                future.set_result(render_variants(root, digest))
+            finally:
+                self._slots.release()
+            return future
+        future = self._get_executor().submit(render_variants, root, digest)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def shutdown(self) -> None:
+        """Stop the worker processes, waiting for pending jobs."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+@lru_cache()
+def get_variant_pool() -> VariantPool:
+    """Create the variant pool configured with application settings.
+
+    :return: Application variant pool
+    :rtype: VariantPool
+    """
+    return VariantPool(settings.IMAGE_WORKERS, settings.IMAGE_QUEUE_SIZE)
+
+
+def schedule_variants(digest: str) -> Optional[Future]:
+    """Render the variants of a newly stored image in the background.
+
+    :param digest: Hex SHA-256 digest of the original image
+    :type digest: str
+    :return: Future of the names of the variants written, or None
+    :rtype: Optional[Future]
+    """
+    return get_variant_pool().submit(digest)
+
+
+def negotiate_variant(digest: str, size: str, accept: Optional[str]) -> Optional[str]:
+    """Pick the stored variant of an image to serve for a request.
+
+    :param digest: Hex SHA-256 digest of the original image
+    :type digest: str
+    :param size: Key of :data:`VARIANT_SIZES`
+    :type size: str
+    :param accept: Value of the ``Accept`` request header
+    :type accept: Optional[str]
+    :return: Name of the variant in the best format the client accepts, or
+        None if none is stored yet
+    :rtype: Optional[str]
+    """
+    for fmt in FORMAT_OPTIONS:
+        name = variant_name(size, fmt)
+        if f"image/{fmt}" in (accept or "") and blobs.blob_store.exists(digest, name):
+            return name
+    return None
@@ -0,0 +1,384 @@
+"""Write-behind ingestion of brews posted at a high rate.
+
+Automated brewers post a reading every few seconds. Creating each brew in
+its own transaction makes every request wait for the single SQLite writer.
+When ingestion is enabled, ``POST /brews/`` requests sent with
+``Prefer: respond-async`` are validated and appended to a durable queue,
+then answered with 202 and a provisional ID. A batch writer creates the
+queued brews in groups, one transaction per group.
+
+The queue is a separate SQLite file, so appending to it never waits on
+writers of the main database, and it is synced to disk before a request
+is acknowledged. Every worker process runs a writer, but only the one
+holding a lock on the queue flushes it. If that process dies, the lock is
+released and another writer takes over.
+
+Entries are marked as written only after the brews are committed. Each
+flush also records the provisional IDs it created in the main database,
+in the same transaction. Entries left unmarked by a crash are therefore
+recognized and never created twice. Once an entry is written, its
+provisional ID resolves to the brew ID for ``INGEST_RETENTION_SECONDS``.
+When users are sharded, each batch is written with one transaction per
+shard.
+"""
+
+import fcntl
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import orjson
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import get_sessionmaker, shard_for
+from app.core.users import DEFAULT_USER_ID
+from app.crud import brew as crud
+from app.schemas.brew import BrewCreate
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the ingestion queue holds as many entries as it may."""
+
+
+def encode_entry(brew: BrewCreate, user_id: int) -> bytes:
+    """Encode a queued brew and the user recording it.
+
+    :param brew: Validated brew data
+    :type brew: BrewCreate
+    :param user_id: ID of the user recording the brew
+    :type user_id: int
+    :return: Queue entry payload
+    :rtype: bytes
+    """
+    return orjson.dumps({**brew.model_dump(mode="json"), "user_id": user_id})
+
+
+def decode_entry(payload: bytes) -> Tuple[int, BrewCreate]:
+    """Decode a payload written by :func:`encode_entry`.
+
+    Entries queued before brews had owners belong to the default user.
+
+    :param payload: Queue entry payload
+    :type payload: bytes
+    :return: ID of the user recording the brew, and the brew data
+    :rtype: Tuple[int, BrewCreate]
+    """
+    data = orjson.loads(payload)
+    user_id = data.pop("user_id", DEFAULT_USER_ID)
+    return user_id, BrewCreate.model_validate(data)
+
+
+class IngestQueue:
+    """A durable FIFO queue of brew payloads in a SQLite file.
+
+    Each thread uses its own connection.
+
+    :ivar path: Path of the queue database
+    :type path: str
+    :ivar max_pending: Entries waiting to be written beyond which
+        :meth:`put` refuses new ones
+    :type max_pending: int
+    :ivar added: Set whenever an entry is added by this process
+    :type added: threading.Event
+    """
+
+    def __init__(self, path: str, max_pending: int = 10000):
+        self.path = path
+        self.max_pending = max_pending
+        self.added = threading.Event()
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "token TEXT NOT NULL UNIQUE, "
+                "payload BLOB NOT NULL, "
+                "enqueued_at REAL NOT NULL, "
+                "brew_id INTEGER, "
+                "error TEXT, "
+                "done_at REAL)"
+            )
+            # Keeps counting and claiming pending entries cheap
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_entries_pending "
+                "ON entries (seq) WHERE done_at IS NULL"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return the connection of the calling thread, opening it if needed.
+
+        :return: Connection in autocommit mode
+        :rtype: sqlite3.Connection
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Acknowledged entries must survive a power loss
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    def pending(self) -> int:
+        """Count the entries not written yet.
+
+        :return: Number of pending entries
+        :rtype: int
+        """
+        return (
+            self._connect()
+            .execute("SELECT count(*) FROM entries WHERE done_at IS NULL")
+            .fetchone()[0]
+        )
+
+    def put(self, payload: bytes) -> str:
+        """Append an entry to the queue.
+
+        :param payload: Serialized brew
+        :type payload: bytes
+        :return: Provisional ID of the entry
+        :rtype: str
+        :raises QueueFullError: If ``max_pending`` entries are waiting
+        """
+        token = uuid.uuid4().hex
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self.pending() >= self.max_pending:
+                raise QueueFullError(self.max_pending)
+            conn.execute(
+                "INSERT INTO entries (token, payload, enqueued_at) VALUES (?, ?, ?)",
+                (token, payload, time.time()),
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        self.added.set()
+        return token
+
+    def take(self, limit: int) -> List[Tuple[str, bytes]]:
+        """Return the oldest pending entries, leaving them in the queue.
+
+        :param limit: Maximum number of entries
+        :type limit: int
+        :return: Provisional IDs and payloads, oldest first
+        :rtype: List[Tuple[str, bytes]]
+        """
+        return (
+            self._connect()
+            .execute(
+                "SELECT token, payload FROM entries WHERE done_at IS NULL "
+                "ORDER BY seq LIMIT ?",
+                (limit,),
+            )
+            .fetchall()
+        )
+
+    def complete(
+        self, created: Dict[str, int], failed: Optional[Dict[str, str]] = None
+    ) -> None:
+        """Mark entries as written.
+
+        :param created: Brew IDs created, by provisional ID
+        :type created: Dict[str, int]
+        :param failed: Errors of the entries that could not be written, by
+            provisional ID
+        :type failed: Optional[Dict[str, str]]
+        """
+        now = time.time()
+        rows = [(brew_id, None, now, token) for token, brew_id in created.items()]
+        rows += [(None, error, now, token) for token, error in (failed or {}).items()]
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "UPDATE entries SET brew_id = ?, error = ?, done_at = ? WHERE token = ?",
+            rows,
+        )
+        conn.execute("COMMIT")
+
+    def status(self, token: str) -> Optional[Tuple[Optional[int], Optional[str], bool]]:
+        """Look up an entry by provisional ID.
+
+        :param token: Provisional ID
+        :type token: str
+        :return: Brew ID, error and whether the entry is done, or None if
+            the entry is unknown or was pruned
+        :rtype: Optional[Tuple[Optional[int], Optional[str], bool]]
+        """
+        row = (
+            self._connect()
+            .execute(
+                "SELECT brew_id, error, done_at FROM entries WHERE token = ?", (token,)
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        return row[0], row[1], row[2] is not None
+
+    def prune(self, older_than: float) -> None:
+        """Delete the entries written before a point in time.
+
+        :param older_than: UNIX timestamp
+        :type older_than: float
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM entries WHERE done_at < ?", (older_than,))
+        conn.execute("COMMIT")
+
+
+class IngestWriter(threading.Thread):
+    """Background thread flushing an ingestion queue in batches.
+
+    :ivar queue: Queue to flush
+    :type queue: IngestQueue
+    :ivar sessions: Factory of database sessions, given the shard to open
+        them on
+    :type sessions: Callable[[Optional[int]], Session]
+    :ivar batch_size: Entries written per transaction
+    :type batch_size: int
+    :ivar interval: Seconds between checks of the queue when idle
+    :type interval: float
+    """
+
+    def __init__(
+        self,
+        queue: IngestQueue,
+        sessions: Callable[[Optional[int]], Session],
+        batch_size: int = 500,
+        interval: float = 1.0,
+    ):
+        super().__init__(name="ingest-writer", daemon=True)
+        self.queue = queue
+        self.sessions = sessions
+        self.batch_size = batch_size
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._lock_file: Optional[Any] = None
+
+    def _acquire_lock(self) -> bool:
+        """Try to become the only writer flushing the queue.
+
+        :return: True if this writer holds the lock
+        :rtype: bool
+        """
+        if self._lock_file is None:
+            lock_file = open(self.queue.path + ".lock", "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self._lock_file = lock_file
+        return True
+
+    def flush(self) -> int:
+        """Write one batch of pending entries.
+
+        :return: Number of entries written or failed
+        :rtype: int
+        """
+        entries = self.queue.take(self.batch_size)
+        if not entries:
+            return 0
+        shards: Dict[Optional[int], List[Tuple[str, int, BrewCreate]]] = {}
+        for token, payload in entries:
+            user_id, brew = decode_entry(payload)
+            shards.setdefault(shard_for(user_id), []).append((token, user_id, brew))
+        for shard, items in shards.items():
+            with self.sessions(shard) as db:
+                created, failed = crud.ingest_brews(
+                    db, items, retention=settings.INGEST_RETENTION_SECONDS
+                )
+            self.queue.complete(created, failed)
+        return len(entries)
+
+    def run(self) -> None:
+        last_prune = 0.0
+        while not self._stopping.is_set():
+            self.queue.added.clear()
+            try:
+                if self._acquire_lock():
+                    while self.flush() == self.batch_size:
+                        pass
+                    if time.monotonic() - last_prune > self.interval * 60:
+                        self.queue.prune(
+                            time.time() - settings.INGEST_RETENTION_SECONDS
+                        )
+                        last_prune = time.monotonic()
+            except Exception:
+                # The entries stay queued and are retried
+                logger.exception("Ingestion flush failed")
+            self.queue.added.wait(self.interval)
+        if self._lock_file is not None:
+            try:
+                while self.flush():
+                    pass
+            except Exception:
+                logger.exception("Final ingestion flush failed")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the thread, after flushing the queue if it holds the lock.
+
+        :param timeout: Seconds to wait for the thread to finish
+        :type timeout: Optional[float]
+        """
+        self._stopping.set()
+        self.queue.added.set()
+        self.join(timeout)
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+@lru_cache()
+def get_ingest_queue() -> IngestQueue:
+    """Open the ingestion queue configured with application settings.
+
+    :return: Application ingestion queue
+    :rtype: IngestQueue
+    """
+    directory = os.path.dirname(settings.INGEST_QUEUE_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return IngestQueue(settings.INGEST_QUEUE_PATH, settings.INGEST_MAX_PENDING)
+
+
+def start_writer() -> IngestWriter:
+    """Start flushing the application ingestion queue in this process.
+
+    :return: Running writer
+    :rtype: IngestWriter
+    """
+    writer = IngestWriter(
+        get_ingest_queue(),
+        lambda shard: get_sessionmaker(shard=shard)(),
+        batch_size=settings.INGEST_BATCH_SIZE,
+        interval=settings.INGEST_FLUSH_SECONDS,
+    )
+    writer.start()
+    return writer
+
+
+def __getattr__(name: str) -> Any:
+    """Resolve ``ingest_queue`` lazily, so importing reads no settings.
+
+    :param name: Module attribute name
+    :type name: str
+    :return: Attribute value
+    :rtype: Any
+    :raises AttributeError: If the attribute does not exist
+    """
+    if name == "ingest_queue":
+        return get_ingest_queue()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,227 @@
+"""Background maintenance of the brew databases.
+
+Deleting a brew only sets its tombstone, so the request is a single short
+UPDATE and the brew can be restored. A maintenance pass, run on a schedule
+in the background, then:
+
+    - purges brews deleted more than ``TOMBSTONE_RETENTION_DAYS`` ago
+    - moves brews older than ``ARCHIVE_AFTER_MONTHS`` to the compressed
+      ``brew_archive`` table, where they stay readable
+    - returns up to ``VACUUM_PAGES`` free pages to the file system with an
+      incremental VACUUM, and refreshes the query planner statistics with
+      ANALYZE
+
+Brews are purged and archived in batches of ``MAINTENANCE_BATCH_SIZE``,
+one transaction each, so requests never wait on the write lock for more
+than one batch. SQLite only returns free pages incrementally once
+``auto_vacuum`` is incremental, which new databases are created with;
+older databases are converted by one full VACUUM on their first pass.
+
+Every worker process runs a maintenance thread, but only the one holding a
+lock on ``MAINTENANCE_LOCK_PATH`` makes passes. When users are sharded,
+each pass covers every shard.
+"""
+
+import calendar
+import fcntl
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Optional, Tuple
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import all_shards, get_engine, get_sessionmaker
+from app.crud import brew as crud
+
+logger = logging.getLogger(__name__)
+
+#: Value of ``PRAGMA auto_vacuum`` for incremental auto-vacuum
+INCREMENTAL_AUTO_VACUUM = 2
+
+
+def months_before(moment: datetime, months: int) -> datetime:
+    """Go back a number of calendar months, clamping the day to the month.
+
+    :param moment: Starting point
+    :type moment: datetime
+    :param months: Number of months to go back
+    :type months: int
+    :return: Same time of day, ``months`` months earlier
+    :rtype: datetime
+    """
+    position = moment.year * 12 + moment.month - 1 - months
+    year, month = divmod(position, 12)
+    day = min(moment.day, calendar.monthrange(year, month + 1)[1])
+    return moment.replace(year=year, month=month + 1, day=day)
+
+
+def _in_batches(
+    sessions: Callable[[], Session],
+    operation: Callable[[Session, datetime, int], int],
+    before: datetime,
+    batch_size: int,
+) -> int:
+    """Repeat a batched write, one session and transaction per batch.
+
+    :param sessions: Factory of database sessions
+    :type sessions: Callable[[], Session]
+    :param operation: Write taking a session, a cutoff time and a batch size,
+        and returning the number of brews written
+    :type operation: Callable[[Session, datetime, int], int]
+    :param before: Cutoff time passed to the operation
+    :type before: datetime
+    :param batch_size: Brews written per batch
+    :type batch_size: int
+    :return: Number of brews written
+    :rtype: int
+    """
+    total = 0
+    while True:
+        with sessions() as db:
+            written = operation(db, before, batch_size)
+        total += written
+        if written < batch_size:
+            return total
+
+
+def compact(engine: Engine, pages: int = 0) -> None:
+    """Return free pages to the file system and refresh planner statistics.
+
+    :param engine: Engine of the database
+    :type engine: Engine
+    :param pages: Free pages to return, or 0 for all of them
+    :type pages: int
+    """
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        if engine.dialect.name == "sqlite":
+            auto_vacuum = conn.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+            if auto_vacuum != INCREMENTAL_AUTO_VACUUM:
+                logger.info("Converting %s to incremental auto-vacuum", engine.url)
+                conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.exec_driver_sql("VACUUM")
+            # Run as a script, since the pragma frees one page per step
+            conn.connection.dbapi_connection.executescript(
+                f"PRAGMA incremental_vacuum({pages})"
+            )
+        conn.exec_driver_sql("ANALYZE")
+
+
+def maintain(
+    sessions: Callable[[], Session], engine: Engine, now: Optional[datetime] = None
+) -> Tuple[int, int]:
+    """Make a maintenance pass over one database.
+
+    :param sessions: Factory of sessions on the database
+    :type sessions: Callable[[], Session]
+    :param engine: Engine of the database
+    :type engine: Engine
+    :param now: Current UTC time, as a naive datetime
+    :type now: Optional[datetime]
+    :return: Numbers of brews purged and archived
+    :rtype: Tuple[int, int]
+    """
+    if now is None:
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+    batch_size = settings.MAINTENANCE_BATCH_SIZE
+    purged = _in_batches(
+        sessions,
+        crud.purge_brews,
+        now - timedelta(days=settings.TOMBSTONE_RETENTION_DAYS),
+        batch_size,
+    )
+    archived = 0
+    if settings.ARCHIVE_AFTER_MONTHS:
+        archived = _in_batches(
+            sessions,
+            crud.archive_brews,
+            months_before(now, settings.ARCHIVE_AFTER_MONTHS),
+            batch_size,
+        )
+    compact(engine, settings.VACUUM_PAGES)
+    return purged, archived
+
+
+def run_maintenance() -> Tuple[int, int]:
+    """Make a maintenance pass over every application database.
+
+    :return: Numbers of brews purged and archived
+    :rtype: Tuple[int, int]
+    """
+    purged = archived = 0
+    for shard in all_shards():
+        counts = maintain(get_sessionmaker(shard=shard), get_engine(shard=shard))
+        purged, archived = purged + counts[0], archived + counts[1]
+    logger.info("Maintenance purged %d and archived %d brews", purged, archived)
+    return purged, archived
+
+
+class MaintenanceWorker(threading.Thread):
+    """Background thread making maintenance passes on a schedule.
+
+    :ivar lock_path: File locked by the one worker making passes
+    :type lock_path: str
+    :ivar interval: Seconds between passes
+    :type interval: float
+    """
+
+    def __init__(self, lock_path: str, interval: float = 3600.0):
+        super().__init__(name="maintenance", daemon=True)
+        self.lock_path = lock_path
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._lock_file: Optional[Any] = None
+
+    def _acquire_lock(self) -> bool:
+        """Try to become the only worker making maintenance passes.
+
+        :return: True if this worker holds the lock
+        :rtype: bool
+        """
+        if self._lock_file is None:
+            lock_file = open(self.lock_path, "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self._lock_file = lock_file
+        return True
+
+    def run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                if self._acquire_lock():
+                    run_maintenance()
+            except Exception:
+                # Batches already committed are kept; the rest is retried
+                logger.exception("Maintenance pass failed")
+            self._stopping.wait(self.interval)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the thread, after the pass in progress if any.
+
+        :param timeout: Seconds to wait for the thread to finish
+        :type timeout: Optional[float]
+        """
+        self._stopping.set()
+        self.join(timeout)
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+def start_worker() -> MaintenanceWorker:
+    """Start making maintenance passes in this process.
+
+    :return: Running worker
+    :rtype: MaintenanceWorker
+    """
+    worker = MaintenanceWorker(
+        settings.MAINTENANCE_LOCK_PATH, settings.MAINTENANCE_INTERVAL_SECONDS
+    )
+    worker.start()
+    return worker
@@ -0,0 +1,376 @@
+"""Per-request performance instrumentation.
+
+:class:`MetricsMiddleware` times every request and counts the bytes of its
+response, while SQLAlchemy engine events count the queries it runs and the
+time spent in them. Each response reports these in a ``Server-Timing``
+header, and they are aggregated into per-route histograms that ``/metrics``
+renders in the Prometheus text format. Metrics are kept per process.
+
+Queries are attributed to a request through a context variable, which
+Starlette copies into the threadpool running sync handlers and SQLAlchemy
+into the greenlets of async sessions, so queries made on any of them are
+counted. The ``Server-Timing`` header is sent before the response body, so
+for streamed responses it only covers the queries run until then.
+
+Engine events also drive the opt-in slow query log, and the middleware
+runs the sampling profiler for requests that ask for it with an
+``X-Profile`` header, when profiling is enabled.
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.core.config import settings
+from app.core.profiling import SamplingProfiler
+
+#: Logger receiving the statements slower than ``SLOW_QUERY_MS``
+slow_query_logger = logging.getLogger("app.sql.slow")
+
+#: Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+#: Upper bounds of the response size histogram buckets, in bytes
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+#: Upper bounds of the queries per request histogram buckets
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+#: Histograms kept per route, with their help text and buckets
+HISTOGRAMS = {
+    "brewlog_http_request_duration_seconds": (
+        "Time to serve a request, in seconds.",
+        LATENCY_BUCKETS,
+    ),
+    "brewlog_http_response_size_bytes": (
+        "Size of response bodies, in bytes.",
+        SIZE_BUCKETS,
+    ),
+    "brewlog_db_queries_per_request": (
+        "Database queries run per request.",
+        QUERY_BUCKETS,
+    ),
+    "brewlog_db_duration_seconds": (
+        "Time spent in database queries per request, in seconds.",
+        LATENCY_BUCKETS,
+    ),
+}
+
+#: Label of requests that matched no route, bounding label cardinality
+UNMATCHED_ROUTE = "unmatched"
+
+#: Longest rendering of statement parameters in the slow query log
+MAX_LOGGED_PARAMETERS = 1000
+
+#: Content type of the Prometheus text exposition format
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class RequestStats:
+    """Database work attributed to one request.
+
+    :ivar queries: Number of statements executed
+    :ivar db_seconds: Time spent executing them, in seconds
+    """
+
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "request_stats", default=None
+)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+    threshold = settings.SLOW_QUERY_MS
+    if threshold is not None and elapsed * 1000 >= threshold:
+        slow_query_logger.warning(
+            "Slow query (%.1f ms): %s; parameters: %s",
+            elapsed * 1000,
+            statement,
+            repr(parameters)[:MAX_LOGGED_PARAMETERS],
+        )
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    conn = exception_context.connection
+    if conn is not None and exception_context.execution_context is not None:
+        started = conn.info.get("query_started")
+        if started:
+            started.pop()
+
+
+def instrument_engine(db_engine: Engine) -> None:
+    """Time the statements of an engine for request metrics and slow query logs.
+
+    Calling it again on the same engine has no effect.
+
+    :param db_engine: Engine to instrument
+    :type db_engine: Engine
+    """
+    if event.contains(db_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(db_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(db_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(db_engine, "handle_error", _handle_error)
+
+
+class Histogram:
+    """Histogram of observed values, in the bucket layout of Prometheus.
+
+    :param buckets: Ascending upper bounds of the buckets, excluding +Inf
+    :type buckets: Sequence[float]
+    """
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """Record a value.
+
+        :param value: Observed value
+        :type value: float
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """Return the cumulative count of values up to each bucket bound.
+
+        :return: Bound, rendered for Prometheus, and count for every bucket
+        :rtype: List[Tuple[str, int]]
+        """
+        bounds = [repr(float(bound)) for bound in self.buckets] + ["+Inf"]
+        total = 0
+        cumulative = []
+        for bound, count in zip(bounds, self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return cumulative
+
+
+def _escape(value: str) -> str:
+    """Escape a label value for the Prometheus text format.
+
+    :param value: Label value
+    :type value: str
+    :return: Escaped value
+    :rtype: str
+    """
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: str) -> str:
+    """Render Prometheus labels.
+
+    :return: Comma-separated labels in braces
+    :rtype: str
+    """
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+    return "{" + pairs + "}"
+
+
+class MetricsRegistry:
+    """Thread-safe aggregate of request metrics, per method and route."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests: Dict[Tuple[str, str, str], int] = {}
+        self._histograms: Dict[Tuple[str, str], Dict[str, Histogram]] = {}
+
+    def observe(
+        self,
+        method: str,
+        route: str,
+        status: int,
+        seconds: float,
+        size: int,
+        stats: RequestStats,
+    ) -> None:
+        """Record a served request.
+
+        :param method: HTTP method
+        :type method: str
+        :param route: Path template of the matched route
+        :type route: str
+        :param status: Response status code
+        :type status: int
+        :param seconds: Time to serve the request
+        :type seconds: float
+        :param size: Response body size in bytes
+        :type size: int
+        :param stats: Database work done for the request
+        :type stats: RequestStats
+        """
+        values = (seconds, size, stats.queries, stats.db_seconds)
+        with self._lock:
+            key = (method, route, str(status))
+            self._requests[key] = self._requests.get(key, 0) + 1
+            histograms = self._histograms.get((method, route))
+            if histograms is None:
+                histograms = self._histograms[(method, route)] = {
+                    name: Histogram(buckets)
+                    for name, (_, buckets) in HISTOGRAMS.items()
+                }
+            for histogram, value in zip(histograms.values(), values):
+                histogram.observe(value)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format.
+
+        :return: Metrics document
+        :rtype: str
+        """
+        lines = [
+            "# HELP brewlog_http_requests_total Requests served.",
+            "# TYPE brewlog_http_requests_total counter",
+        ]
+        with self._lock:
+            for (method, route, status), count in sorted(self._requests.items()):
+                labels = _labels(method=method, route=route, status=status)
+                lines.append(f"brewlog_http_requests_total{labels} {count}")
+            for name, (help_text, _) in HISTOGRAMS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for (method, route), histograms in sorted(self._histograms.items()):
+                    histogram = histograms[name]
+                    for bound, count in histogram.cumulative():
+                        labels = _labels(method=method, route=route, le=bound)
+                        lines.append(f"{name}_bucket{labels} {count}")
+                    labels = _labels(method=method, route=route)
+                    lines.append(f"{name}_sum{labels} {histogram.sum!r}")
+                    lines.append(f"{name}_count{labels} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def route_template(scope) -> str:
+    """Return the path template of the route that served a request.
+
+    Recent FastAPI versions keep the routes of an included router
+    unprefixed, so the prefix is recovered from the request path: it is
+    whatever precedes the part matched by the route.
+
+    :param scope: ASGI scope of a routed request
+    :return: Path template such as ``/api/v1/brews/{brew_id}``, or
+        ``UNMATCHED_ROUTE`` when no route matched
+    :rtype: str
+    """
+    route = scope.get("route")
+    path_regex = getattr(route, "path_regex", None)
+    if path_regex is None:
+        return UNMATCHED_ROUTE
+    path = scope["path"]
+    start = 0
+    while start != -1:
+        if path_regex.match(path[start:]):
+            return path[:start] + route.path
+        start = path.find("/", start + 1)
+    return route.path
+
+
+def server_timing(stats: RequestStats, seconds: float) -> str:
+    """Build a ``Server-Timing`` header value.
+
+    :param stats: Database work done for the request
+    :type stats: RequestStats
+    :param seconds: Time spent on the request so far
+    :type seconds: float
+    :return: Header value with the total and database durations in ms
+    :rtype: str
+    """
+    return (
+        f'db;dur={stats.db_seconds * 1000:.3f};desc="{stats.queries} queries", '
+        f"total;dur={seconds * 1000:.3f}"
+    )
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request metrics and ``Server-Timing`` headers.
+
+    When ``PROFILING_ENABLED`` is set, requests with an ``X-Profile`` header
+    are profiled; the profile is written to ``PROFILE_DIR`` under the ID
+    returned in the ``X-Profile-Id`` response header.
+
+    :param app: ASGI application to instrument
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        profiler = profile_id = None
+        if settings.PROFILING_ENABLED and "x-profile" in Headers(scope=scope):
+            profiler = SamplingProfiler(settings.PROFILE_INTERVAL_MS / 1000)
+            profile_id = uuid.uuid4().hex
+            profiler.start()
+        started = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_with_timing(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Server-Timing",
+                    server_timing(stats, time.perf_counter() - started),
+                )
+                if profile_id is not None:
+                    headers["X-Profile-Id"] = profile_id
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_stats.reset(token)
+            if profiler is not None:
+                profiler.stop()
+                profiler.write(
+                    os.path.join(settings.PROFILE_DIR, f"{profile_id}.folded")
+                )
+            registry.observe(
+                scope["method"], route_template(scope), status, elapsed, size, stats
+            )
+
+
+#: Process-wide registry of request metrics
+registry = MetricsRegistry()
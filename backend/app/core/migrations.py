@@ -0,0 +1,749 @@
+"""Versioned schema migrations.
+
+The first migration creates the tables of the current models that are
+missing. ``Base.metadata.create_all`` never alters a table that already
+exists, so the later migrations bring an existing database up to date with
+the current models. Each one is recorded in the ``schema_migrations`` table
+so it runs at most once, and each is written to be a no-op on a database
+freshly created by the first. Once the database is current, checking it
+takes a single read-only query.
+"""
+
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import MetaData, inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from app.core import blobs
+from app.core.database import Base
+from app.core.users import DEFAULT_USER_ID
+from app.models.brew import (
+    ArchivedBrew,
+    Brew,
+    BrewChange,
+    BrewIngest,
+    BrewRollup,
+    BrewSync,
+    BrewSyncCreate,
+    brew_time_seconds,
+)
+
+
+def _add_column(conn: Connection, table: str, column: str, ddl: str) -> None:
+    """Add a column to a table unless it already exists.
+
+    :param conn: Connection inside the migration transaction
+    :type conn: Connection
+    :param table: Table name
+    :type table: str
+    :param column: Column name
+    :type column: str
+    :param ddl: Column type and constraints
+    :type ddl: str
+    """
+    if not _has_column(conn, table, column):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def _has_column(conn: Connection, table: str, column: str) -> bool:
+    """Check whether a table has a column.
+
+    :param conn: Connection inside the migration transaction
+    :type conn: Connection
+    :param table: Table name
+    :type table: str
+    :param column: Column name
+    :type column: str
+    :return: True if the column exists
+    :rtype: bool
+    """
+    return column in {col["name"] for col in inspect(conn).get_columns(table)}
+
+
+def _owner_sql(conn: Connection) -> str:
+    """Return the SQL expression of the owner of a brew, over a ``{row}`` alias.
+
+    Brews recorded before brews had owners all belong to the default user,
+    so triggers created by earlier migrations use that ID instead.
+
+    :param conn: Connection inside the migration transaction
+    :type conn: Connection
+    :return: Expression template
+    :rtype: str
+    """
+    if _has_column(conn, "brews", "user_id"):
+        return "{row}.user_id"
+    return str(DEFAULT_USER_ID)
+
+
+def _live_sql(conn: Connection) -> str:
+    """Return the SQL condition of a brew not being deleted, over a ``{row}`` alias.
+
+    No brew was deleted softly before brews had tombstones, so triggers
+    created by earlier migrations treat every brew as live.
+
+    :param conn: Connection inside the migration transaction
+    :type conn: Connection
+    :return: Condition template
+    :rtype: str
+    """
+    if _has_column(conn, "brews", "deleted_at"):
+        return "{row}.deleted_at IS NULL"
+    return "1"
+
+
+def _archived_sql(conn: Connection) -> str:
+    """Return the SQL condition of a removed brew being archived, over ``{row}``.
+
+    Archiving copies a brew to ``brew_archive`` before removing it from
+    ``brews``. Brew IDs are never reused, so an archive entry with the ID of
+    the removed brew is its own. Triggers created by migrations before the
+    archive existed treat no removal as archival.
+
+    :param conn: Connection inside the migration transaction
+    :type conn: Connection
+    :return: Condition template
+    :rtype: str
+    """
+    if inspect(conn).has_table("brew_archive"):
+        return "EXISTS (SELECT 1 FROM brew_archive WHERE brew_id = {row}.id)"
+    return "0"
+
+
+def _create_tables(conn: Connection) -> None:
+    """Create the tables and indexes of the current models that are missing."""
+    Base.metadata.create_all(conn)
+
+
+def _add_created_at_id_index(conn: Connection) -> None:
+    """Add the composite index serving keyset pagination of brews.
+
+    On SQLite, also rewrite timestamps written by ``CURRENT_TIMESTAMP`` into
+    the microsecond format SQLAlchemy binds, so that cursor comparisons on
+    ``created_at`` order consistently with the stored values.
+    """
+    conn.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_brews_created_at_id "
+            "ON brews (created_at, id)"
+        )
+    )
+    if conn.dialect.name == "sqlite":
+        conn.execute(
+            text(
+                "UPDATE brews "
+                "SET created_at = strftime('%Y-%m-%d %H:%M:%f', created_at) || '000' "
+                "WHERE length(created_at) = 19"
+            )
+        )
+
+
+def _move_images_to_blob_store(conn: Connection) -> None:
+    """Move inline base64 images out of ``brews.image_url``.
+
+    Each ``data:`` URL is written to the blob store and the row is rewritten
+    in place to reference it by digest, with ``image_url`` replaced by the
+    short URL of the image endpoint. Rows are processed one at a time so
+    only a single image is held in memory.
+    """
+    _add_column(conn, "brews", "image_hash", "VARCHAR(64)")
+    _add_column(conn, "brews", "image_content_type", "VARCHAR")
+    brew_ids = conn.execute(
+        text("SELECT id FROM brews WHERE image_url LIKE 'data:%'")
+    ).scalars()
+    for brew_id in list(brew_ids):
+        image_url = conn.execute(
+            text("SELECT image_url FROM brews WHERE id = :id"), {"id": brew_id}
+        ).scalar_one()
+        try:
+            content_type, data = blobs.parse_data_url(image_url)
+        except blobs.InvalidImageError:
+            continue
+        conn.execute(
+            text(
+                "UPDATE brews SET image_hash = :hash, "
+                "image_content_type = :content_type, image_url = :url "
+                "WHERE id = :id"
+            ),
+            {
+                "hash": blobs.blob_store.put(data),
+                "content_type": content_type,
+                "url": blobs.image_url_for(brew_id),
+                "id": brew_id,
+            },
+        )
+
+
+def _add_search_index(conn: Connection) -> None:
+    """Add an FTS5 full-text index over the searchable brew columns.
+
+    ``brews_fts`` is an external-content table: it stores only the index and
+    reads column values from ``brews``. Triggers keep it in sync with every
+    insert, update and delete, and a final rebuild indexes existing rows.
+    Skipped on databases other than SQLite.
+    """
+    if conn.dialect.name != "sqlite":
+        return
+    conn.execute(
+        text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS brews_fts USING fts5("
+            "bean_type, brew_type, details, "
+            "content='brews', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+    )
+    _create_search_triggers(conn)
+    conn.execute(text("INSERT INTO brews_fts (brews_fts) VALUES ('rebuild')"))
+
+
+def _create_search_triggers(conn: Connection) -> None:
+    """Create the triggers keeping ``brews_fts`` in sync with ``brews``.
+
+    :param conn: Connection inside the migration transaction
+    :type conn: Connection
+    """
+    conn.execute(
+        text(
+            "CREATE TRIGGER IF NOT EXISTS brews_fts_ai AFTER INSERT ON brews BEGIN "
+            "INSERT INTO brews_fts (rowid, bean_type, brew_type, details) "
+            "VALUES (new.id, new.bean_type, new.brew_type, new.details); "
+            "END"
+        )
+    )
+    conn.execute(
+        text(
+            "CREATE TRIGGER IF NOT EXISTS brews_fts_ad AFTER DELETE ON brews BEGIN "
+            "INSERT INTO brews_fts (brews_fts, rowid, bean_type, brew_type, details) "
+            "VALUES ('delete', old.id, old.bean_type, old.brew_type, old.details); "
+            "END"
+        )
+    )
+    conn.execute(
+        text(
+            "CREATE TRIGGER IF NOT EXISTS brews_fts_au "
+            "AFTER UPDATE OF bean_type, brew_type, details ON brews BEGIN "
+            "INSERT INTO brews_fts (brews_fts, rowid, bean_type, brew_type, details) "
+            "VALUES ('delete', old.id, old.bean_type, old.brew_type, old.details); "
+            "INSERT INTO brews_fts (rowid, bean_type, brew_type, details) "
+            "VALUES (new.id, new.bean_type, new.brew_type, new.details); "
+            "END"
+        )
+    )
+
+
+#: SQL expressions of the rollup grouping keys, over a ``{row}`` alias
+ROLLUP_DIMENSIONS = {
+    "brew_type": "coalesce({row}.brew_type, '')",
+    "bean_type": "coalesce({row}.bean_type, '')",
+    "day": "coalesce(date({row}.created_at), '')",
+}
+
+#: SQL expression converting a ``"mm:ss"`` brew time to seconds
+BREW_TIME_SECONDS_SQL = (
+    "CAST(substr({row}.brew_time, 1, instr({row}.brew_time, ':') - 1) "
+    "AS INTEGER) * 60 + "
+    "CAST(substr({row}.brew_time, instr({row}.brew_time, ':') + 1) AS INTEGER)"
+)
+
+#: SQL expressions of the metrics summed by the rollups, over a ``{row}`` alias
+ROLLUP_METRICS = {
+    "water_temp": "{row}.water_temp",
+    "ratio": "{row}.weight_out / {row}.weight_in",
+    "bloom_time": "{row}.bloom_time",
+    "brew_seconds": "{row}.brew_seconds",
+}
+
+
+def _rollup_statements(
+    row: str, sign: str, metrics: Dict[str, str], owner: str, live: str
+) -> List[str]:
+    """Build the statements adding a brew to, or removing it from, the rollups.
+
+    The statements do nothing for deleted brews, which the rollups leave out.
+
+    :param row: Alias of the brew row, ``new`` or ``old``
+    :type row: str
+    :param sign: ``+`` to add the brew, ``-`` to remove it
+    :type sign: str
+    :param metrics: SQL expressions of the summed metrics
+    :type metrics: Dict[str, str]
+    :param owner: SQL expression of the owner of the brew
+    :type owner: str
+    :param live: SQL condition of the brew not being deleted
+    :type live: str
+    :return: One statement per dimension, plus cleanup of empty groups
+    :rtype: List[str]
+    """
+    statements = []
+    owner = owner.format(row=row)
+    live = live.format(row=row)
+    for dimension, key in ROLLUP_DIMENSIONS.items():
+        key = key.format(row=row)
+        expressions = {
+            name: expression.format(row=row) for name, expression in metrics.items()
+        }
+        if sign == "+":
+            columns = ["user_id", "dimension", "key", "count"]
+            values = [owner, f"'{dimension}'", key, "1"]
+            for name, expression in expressions.items():
+                columns += [f"{name}_sum", f"{name}_count"]
+                values += [
+                    f"coalesce({expression}, 0)",
+                    f"({expression}) IS NOT NULL",
+                ]
+            updates = ", ".join(
+                f"{column} = {column} + excluded.{column}" for column in columns[3:]
+            )
+            statements.append(
+                f"INSERT INTO brew_rollups ({', '.join(columns)}) "
+                f"SELECT {', '.join(values)} WHERE {live} "
+                f"ON CONFLICT (user_id, dimension, key) DO UPDATE SET {updates}"
+            )
+        else:
+            updates = ["count = count - 1"]
+            for name, expression in expressions.items():
+                updates += [
+                    f"{name}_sum = {name}_sum - coalesce({expression}, 0)",
+                    f"{name}_count = {name}_count - (({expression}) IS NOT NULL)",
+                ]
+            where = (
+                f"{live} AND user_id = {owner} "
+                f"AND dimension = '{dimension}' AND key = {key}"
+            )
+            statements.append(
+                f"UPDATE brew_rollups SET {', '.join(updates)} WHERE {where}"
+            )
+            statements.append(f"DELETE FROM brew_rollups WHERE {where} AND count <= 0")
+    return statements
+
+
+def _create_stats_rollups(conn: Connection, metrics: Dict[str, str]) -> None:
+    """(Re)create the rollup triggers and refill ``brew_rollups``.
+
+    The triggers add each inserted brew to its owner's group in every
+    dimension, remove each deleted brew, and move updated brews from their
+    old groups to their new ones, so the rollups stay exact however brews
+    are written. Brews with a tombstone count as deleted.
+    Skipped on databases other than SQLite, where statistics are computed
+    from the ``brews`` table directly.
+
+    :param conn: Connection inside the migration transaction
+    :type conn: Connection
+    :param metrics: SQL expressions of the summed metrics
+    :type metrics: Dict[str, str]
+    """
+    if conn.dialect.name != "sqlite":
+        return
+    BrewRollup.__table__.create(conn, checkfirst=True)
+    conn.execute(text("DROP TRIGGER IF EXISTS brew_rollups_ai"))
+    conn.execute(text("DROP TRIGGER IF EXISTS brew_rollups_ad"))
+    conn.execute(text("DROP TRIGGER IF EXISTS brew_rollups_au"))
+    owner, live = _owner_sql(conn), _live_sql(conn)
+    triggers = {
+        "brew_rollups_ai": (
+            "AFTER INSERT",
+            _rollup_statements("new", "+", metrics, owner, live),
+        ),
+        "brew_rollups_ad": (
+            "AFTER DELETE",
+            _rollup_statements("old", "-", metrics, owner, live),
+        ),
+        "brew_rollups_au": (
+            "AFTER UPDATE",
+            _rollup_statements("old", "-", metrics, owner, live)
+            + _rollup_statements("new", "+", metrics, owner, live),
+        ),
+    }
+    for name, (event, statements) in triggers.items():
+        body = "".join(f"{statement}; " for statement in statements)
+        conn.execute(text(f"CREATE TRIGGER {name} {event} ON brews BEGIN {body}END"))
+    conn.execute(text("DELETE FROM brew_rollups"))
+    owner, live = owner.format(row="brews"), live.format(row="brews")
+    for dimension, key in ROLLUP_DIMENSIONS.items():
+        key = key.format(row="brews")
+        columns = ["user_id", "dimension", "key", "count"]
+        values = [owner, f"'{dimension}'", key, "count(*)"]
+        for name, expression in metrics.items():
+            expression = expression.format(row="brews")
+            columns += [f"{name}_sum", f"{name}_count"]
+            values += [f"coalesce(sum({expression}), 0)", f"count({expression})"]
+        conn.execute(
+            text(
+                f"INSERT INTO brew_rollups ({', '.join(columns)}) "
+                f"SELECT {', '.join(values)} FROM brews WHERE {live} "
+                f"GROUP BY {owner}, {key}"
+            )
+        )
+
+
+def _add_stats_rollups(conn: Connection) -> None:
+    """Maintain ``brew_rollups``, parsing brew durations from ``brew_time``."""
+    _create_stats_rollups(
+        conn, {**ROLLUP_METRICS, "brew_seconds": BREW_TIME_SECONDS_SQL}
+    )
+
+
+#: Indexes on ``brews`` from before brews had owners, by name
+LEGACY_INDEXES = {
+    "ix_brews_created_at_id": "created_at, id",
+    "ix_brews_brew_seconds": "brew_seconds",
+    "ix_brews_water_temp": "water_temp",
+    "ix_brews_brew_type": "brew_type",
+    "ix_brews_ratio": "(weight_out / weight_in)",
+}
+
+
+#: Indexes on ``brews`` from before brews had tombstones, by name
+OWNER_INDEXES = {
+    "ix_brews_user_created_at_id": "user_id, created_at, id",
+    "ix_brews_user_brew_seconds": "user_id, brew_seconds",
+    "ix_brews_user_water_temp": "user_id, water_temp",
+    "ix_brews_user_brew_type": "user_id, brew_type",
+    "ix_brews_user_ratio": "user_id, (weight_out / weight_in)",
+}
+
+
+def _add_brew_seconds(conn: Connection) -> None:
+    """Add ``brews.brew_seconds`` and the indexes of listing filters.
+
+    Existing rows are backfilled in batches with the same parser the
+    application uses, then the rollup triggers are rebuilt to read the new
+    column instead of parsing ``brew_time``.
+    """
+    _add_column(conn, "brews", "brew_seconds", "INTEGER")
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            text(
+                "SELECT id, brew_time FROM brews "
+                "WHERE id > :last_id AND brew_seconds IS NULL ORDER BY id LIMIT 1000"
+            ),
+            {"last_id": last_id},
+        ).all()
+        if not rows:
+            break
+        updates = [
+            {"id": row.id, "seconds": brew_time_seconds(row.brew_time)} for row in rows
+        ]
+        conn.execute(
+            text("UPDATE brews SET brew_seconds = :seconds WHERE id = :id"), updates
+        )
+        last_id = rows[-1].id
+    for name, columns in LEGACY_INDEXES.items():
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON brews ({columns})"))
+    _create_stats_rollups(conn, ROLLUP_METRICS)
+
+
+def _add_brew_version(conn: Connection) -> None:
+    """Add ``brews.version``, the counter of updates checked by ``If-Match``."""
+    _add_column(conn, "brews", "version", "INTEGER NOT NULL DEFAULT 1")
+
+
+#: SQL expression of the current time, in the format SQLAlchemy binds
+NOW_SQL = "strftime('%Y-%m-%d %H:%M:%f', 'now') || '000'"
+
+
+def _create_change_triggers(conn: Connection) -> None:
+    """(Re)create the triggers appending writes to ``brew_changes``.
+
+    Giving a brew a tombstone is logged as its deletion, and removing the
+    tombstone as its creation. Purging a brew that already has a tombstone
+    is not logged again. Moving a brew to the archive is logged as an
+    ``archive``, not a deletion, since it stays readable there.
+
+    :param conn: Connection inside the migration transaction
+    :type conn: Connection
+    """
+    owner, live = _owner_sql(conn), _live_sql(conn)
+    archived = _archived_sql(conn).format(row="old")
+    insert = (
+        "INSERT INTO brew_changes (brew_id, user_id, op, version, changed_at) "
+        "VALUES "
+    )
+    new_owner, old_owner = owner.format(row="new"), owner.format(row="old")
+    new_live, old_live = live.format(row="new"), live.format(row="old")
+    update_op = (
+        f"CASE WHEN NOT ({new_live}) THEN 'delete' "
+        f"WHEN NOT ({old_live}) THEN 'create' ELSE 'update' END"
+    )
+    triggers = {
+        "brew_changes_ai": (
+            "AFTER INSERT ON brews",
+            f"(new.id, {new_owner}, 'create', new.version, {NOW_SQL})",
+        ),
+        "brew_changes_au": (
+            "AFTER UPDATE OF version ON brews WHEN new.version IS NOT old.version",
+            f"(new.id, {new_owner}, {update_op}, new.version, {NOW_SQL})",
+        ),
+        "brew_changes_ad": (
+            f"AFTER DELETE ON brews WHEN {old_live}",
+            f"(old.id, {old_owner}, "
+            f"CASE WHEN {archived} THEN 'archive' ELSE 'delete' END, "
+            f"old.version, {NOW_SQL})",
+        ),
+    }
+    for name, (event, values) in triggers.items():
+        body = f"BEGIN {insert}{values}; END"
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+        conn.execute(text(f"CREATE TRIGGER {name} {event} {body}"))
+
+
+def _add_change_log(conn: Connection) -> None:
+    """Log every write to ``brews`` in the append-only ``brew_changes``.
+
+    Triggers append a change for each inserted and deleted brew, and for
+    each update that changes the brew version, which excludes updates such
+    as linking a new brew to its stored image. Writes are logged however
+    they are made, in the same transaction. Skipped on databases other than
+    SQLite, where the change log stays empty.
+    """
+    BrewChange.__table__.create(conn, checkfirst=True)
+    if conn.dialect.name == "sqlite":
+        _create_change_triggers(conn)
+
+
+def _add_ingest_log(conn: Connection) -> None:
+    """Add ``brew_ingests``, the brews created from the ingestion queue."""
+    BrewIngest.__table__.create(conn, checkfirst=True)
+
+
+def _add_brew_owners(conn: Connection) -> None:
+    """Give brews an owner and index them per user.
+
+    Existing brews, and their logged changes, are given to the default user.
+    The listing indexes are replaced by ones leading with ``user_id``, so a
+    user's listings scan only their own brews, and the rollups are rebuilt
+    per user.
+    """
+    owner = f"INTEGER NOT NULL DEFAULT {DEFAULT_USER_ID}"
+    _add_column(conn, "brews", "user_id", owner)
+    _add_column(conn, "brew_changes", "user_id", owner)
+    for name in LEGACY_INDEXES:
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    for name, columns in OWNER_INDEXES.items():
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON brews ({columns})"))
+    for index in BrewChange.__table__.indexes:
+        conn.execute(CreateIndex(index, if_not_exists=True))
+    if conn.dialect.name != "sqlite":
+        return
+    # Rollups gain user_id in their primary key, so the table is recreated
+    conn.execute(text("DROP TABLE IF EXISTS brew_rollups"))
+    _create_stats_rollups(conn, ROLLUP_METRICS)
+    _create_change_triggers(conn)
+
+
+def _add_soft_delete(conn: Connection) -> None:
+    """Add ``brews.deleted_at``, the tombstone of deleted brews, and the archive.
+
+    The listing indexes are replaced by partial ones leaving deleted brews
+    out, and the rollup and change log triggers are rebuilt to treat brews
+    with a tombstone as deleted.
+    """
+    _add_column(conn, "brews", "deleted_at", "DATETIME")
+    for name in OWNER_INDEXES:
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    for index in Brew.__table__.indexes:
+        conn.execute(CreateIndex(index, if_not_exists=True))
+    ArchivedBrew.__table__.create(conn, checkfirst=True)
+    if conn.dialect.name != "sqlite":
+        return
+    _create_stats_rollups(conn, ROLLUP_METRICS)
+    _create_change_triggers(conn)
+
+
+def _create_sync_triggers(conn: Connection) -> None:
+    """(Re)create the triggers stamping writes in ``brew_sync``.
+
+    Each write upserts the brew's row with the next version, one above the
+    highest so far, which the triggers read under the write lock, so
+    versions increase in commit order. The same writes as in the change log
+    are stamped: purging a brew that already has a tombstone is not. Nor is
+    archiving a brew, so clients keep it rather than delete it.
+
+    :param conn: Connection inside the migration transaction
+    :type conn: Connection
+    """
+    owner, live = _owner_sql(conn), _live_sql(conn)
+    removed = f"{live} AND NOT ({_archived_sql(conn)})".format(row="old")
+    upsert = (
+        "INSERT INTO brew_sync (brew_id, user_id, version, deleted) VALUES "
+        "({row}.id, {owner}, "
+        "(SELECT coalesce(max(version), 0) + 1 FROM brew_sync), {deleted}) "
+        "ON CONFLICT (brew_id) DO UPDATE SET user_id = excluded.user_id, "
+        "version = excluded.version, deleted = excluded.deleted"
+    )
+    triggers = {
+        "brew_sync_ai": ("AFTER INSERT ON brews", "new"),
+        "brew_sync_au": (
+            "AFTER UPDATE OF version ON brews WHEN new.version IS NOT old.version",
+            "new",
+        ),
+        "brew_sync_ad": (f"AFTER DELETE ON brews WHEN {removed}", "old"),
+    }
+    for name, (event, row) in triggers.items():
+        deleted = "1" if row == "old" else f"NOT ({live.format(row=row)})"
+        values = upsert.format(row=row, owner=owner.format(row=row), deleted=deleted)
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+        conn.execute(text(f"CREATE TRIGGER {name} {event} BEGIN {values}; END"))
+
+
+def _add_sync_versions(conn: Connection) -> None:
+    """Add ``brew_sync``, the latest write to each brew by sync version.
+
+    Existing brews are stamped with their ID as version, which keeps
+    versions unique and below those of later writes. Skipped on databases
+    other than SQLite, where the table stays empty.
+    """
+    BrewSync.__table__.create(conn, checkfirst=True)
+    if conn.dialect.name != "sqlite":
+        return
+    conn.execute(
+        text(
+            "INSERT OR IGNORE INTO brew_sync (brew_id, user_id, version, deleted) "
+            "SELECT id, user_id, id, deleted_at IS NOT NULL FROM brews"
+        )
+    )
+    _create_sync_triggers(conn)
+
+
+def _add_brew_id_autoincrement(conn: Connection) -> None:
+    """Stop reusing the IDs of purged and archived brews.
+
+    SQLite gives a new row the highest ID in the table plus one, so the IDs
+    of the newest brews came back once they were purged or archived, with
+    the cached image URLs, archive entries and sync state of the old brews.
+    ``brews`` is rebuilt with ``AUTOINCREMENT``, keeping every row and its
+    ID, and its indexes and triggers are recreated. The ID sequence starts
+    above every ID in ``brews`` and the archive. Skipped on databases other
+    than SQLite, whose sequences never hand out an ID twice.
+    """
+    if conn.dialect.name != "sqlite":
+        return
+    ddl = conn.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'brews'")
+    ).scalar_one()
+    if "AUTOINCREMENT" not in ddl.upper():
+        columns = ", ".join(
+            column.name
+            for column in Brew.__table__.columns
+            if _has_column(conn, "brews", column.name)
+        )
+        rebuilt = Brew.__table__.to_metadata(MetaData(), name="brews_rebuilt")
+        conn.execute(CreateTable(rebuilt))
+        conn.execute(
+            text(f"INSERT INTO brews_rebuilt ({columns}) SELECT {columns} FROM brews")
+        )
+        # Dropping the table drops its indexes and triggers without firing
+        # them, and rows keep their IDs, so brews_fts stays valid
+        conn.execute(text("DROP TABLE brews"))
+        conn.execute(text("ALTER TABLE brews_rebuilt RENAME TO brews"))
+        for index in Brew.__table__.indexes:
+            conn.execute(CreateIndex(index, if_not_exists=True))
+        _create_search_triggers(conn)
+        _create_stats_rollups(conn, ROLLUP_METRICS)
+        _create_change_triggers(conn)
+        _create_sync_triggers(conn)
+    conn.execute(text("DELETE FROM sqlite_sequence WHERE name = 'brews'"))
+    conn.execute(
+        text(
+            "INSERT INTO sqlite_sequence (name, seq) "
+            "SELECT 'brews', seq FROM (SELECT max(id) AS seq FROM ("
+            "SELECT id FROM brews UNION ALL SELECT brew_id FROM brew_archive)) "
+            "WHERE seq IS NOT NULL"
+        )
+    )
+
+
+def _add_sync_creates(conn: Connection) -> None:
+    """Add ``brew_sync_creates``, the brews created by sync, per user and client ID.
+
+    Sync creates were recorded among the ingestion queue's provisional IDs,
+    across users and for an hour only. Those records are left to expire.
+    """
+    BrewSyncCreate.__table__.create(conn, checkfirst=True)
+
+
+def _log_archival(conn: Connection) -> None:
+    """Stop recording archived brews as deleted.
+
+    The change log gets an ``archive`` entry for them instead, and sync
+    versions are not stamped, so offline clients keep their copy. Skipped
+    on databases other than SQLite, which have no triggers.
+    """
+    if conn.dialect.name != "sqlite":
+        return
+    _create_change_triggers(conn)
+    _create_sync_triggers(conn)
+
+
+#: Ordered list of ``(version, migration)`` pairs
+MIGRATIONS: List[Tuple[int, Callable[[Connection], None]]] = [
+    (0, _create_tables),
+    (1, _add_created_at_id_index),
+    (2, _move_images_to_blob_store),
+    (3, _add_search_index),
+    (4, _add_stats_rollups),
+    (5, _add_brew_seconds),
+    (6, _add_brew_version),
+    (7, _add_change_log),
+    (8, _add_ingest_log),
+    (9, _add_brew_owners),
+    (10, _add_soft_delete),
+    (11, _add_sync_versions),
+    (12, _add_brew_id_autoincrement),
+    (13, _add_sync_creates),
+    (14, _log_archival),
+]
+
+
+def pending_migrations(conn: Connection) -> List[int]:
+    """List the versions of the migrations not yet applied to a database.
+
+    :param conn: Open connection
+    :type conn: Connection
+    :return: Pending versions, in order
+    :rtype: List[int]
+    """
+    if not inspect(conn).has_table("schema_migrations"):
+        return [version for version, _ in MIGRATIONS]
+    applied = set(conn.execute(text("SELECT version FROM schema_migrations")).scalars())
+    return [version for version, _ in MIGRATIONS if version not in applied]
+
+
+def apply_migrations(conn: Connection) -> None:
+    """Apply all pending migrations on an open connection.
+
+    :param conn: Connection inside a transaction
+    :type conn: Connection
+    """
+    conn.execute(
+        text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY)"
+        )
+    )
+    applied = set(conn.execute(text("SELECT version FROM schema_migrations")).scalars())
+    for version, migration in MIGRATIONS:
+        if version in applied:
+            continue
+        migration(conn)
+        conn.execute(
+            text("INSERT INTO schema_migrations (version) VALUES (:version)"),
+            {"version": version},
+        )
+
+
+def run_migrations(engine: Engine) -> None:
+    """Apply all pending migrations in a single transaction.
+
+    The write transaction is only opened if a read-only check finds
+    pending migrations.
+
+    :param engine: Engine bound to the database to migrate
+    :type engine: Engine
+    """
+    with engine.connect() as conn:
+        if not pending_migrations(conn):
+            return
+    with engine.begin() as conn:
+        apply_migrations(conn)
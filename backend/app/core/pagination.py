@@ -0,0 +1,47 @@
+"""Opaque cursors for keyset pagination.
+
+A cursor encodes the sort key of the last row a client has seen so the next
+page can be fetched with an indexed range scan instead of ``OFFSET``, which
+has to walk and discard every skipped row.
+"""
+
+import base64
+import binascii
+import json
+from typing import Any, List
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+def encode_cursor(*values: Any) -> str:
+    """Encode sort key values into an opaque, URL-safe cursor.
+
+    :param values: JSON-serializable sort key values of the last row
+    :return: Opaque cursor string
+    :rtype: str
+    """
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """Decode a cursor produced by :func:`encode_cursor`.
+
+    :param cursor: Opaque cursor string
+    :type cursor: str
+    :param size: Expected number of sort key values
+    :type size: int
+    :return: Decoded sort key values
+    :rtype: List[Any]
+    :raises InvalidCursorError: If the cursor is malformed
+    """
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise InvalidCursorError("Invalid cursor") from exc
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursorError("Invalid cursor")
+    return values
@@ -0,0 +1,107 @@
+"""Sampling profiler for individual requests.
+
+A background thread periodically reads the stack of every other thread
+through ``sys._current_frames()``. Unlike tracing profilers, nothing runs
+on the profiled threads, so the overhead depends on the sampling interval
+rather than on the amount of code profiled, and sync handlers running on
+threadpool workers are sampled as well as the event loop.
+
+Samples are aggregated in the collapsed stack format (``outer;inner count``
+per line) read by ``flamegraph.pl`` and speedscope. Threads idling in a
+lock, queue or selector wait are left out, so an idle event loop or
+threadpool does not drown out the work of the request. Samples are not
+attributed to requests: work done concurrently for other requests shows up
+in the profile too.
+"""
+
+import os
+import queue
+import selectors
+import sys
+import threading
+from collections import Counter
+from typing import Optional
+
+#: Source files whose frames mark a thread as idle when innermost
+IDLE_FILES = frozenset(
+    os.path.abspath(module.__file__) for module in (threading, queue, selectors)
+)
+
+
+def _frame_label(frame) -> str:
+    """Describe the function a frame is executing.
+
+    :param frame: Stack frame
+    :return: Function name with its source file and first line
+    :rtype: str
+    """
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Profiler sampling the stacks of all threads at a fixed interval.
+
+    :param interval: Seconds between samples
+    :type interval: float
+    """
+
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start sampling in a background thread."""
+        self._thread = threading.Thread(
+            target=self._run, name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling and wait for the background thread to exit."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        """Take samples until stopped."""
+        own_ident = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident != own_ident:
+                    self._sample(frame)
+
+    def _sample(self, frame) -> None:
+        """Record the stack ending at a frame, unless the thread is idle.
+
+        :param frame: Innermost frame of a thread
+        """
+        if os.path.abspath(frame.f_code.co_filename) in IDLE_FILES:
+            return
+        labels = []
+        while frame is not None:
+            labels.append(_frame_label(frame))
+            frame = frame.f_back
+        self.stacks[";".join(reversed(labels))] += 1
+
+    def collapsed(self) -> str:
+        """Render the samples in the collapsed stack format.
+
+        :return: One ``stack count`` line per distinct stack, most sampled first
+        :rtype: str
+        """
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+    def write(self, path: str) -> None:
+        """Write the samples to a file in the collapsed stack format.
+
+        :param path: Destination file; its directory is created if missing
+        :type path: str
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as profile:
+            profile.write(self.collapsed())
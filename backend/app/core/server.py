@@ -0,0 +1,303 @@
+"""Pre-fork multi-process server.
+
+The supervisor process imports and builds the application, migrates the
+database and binds the listening socket once, then forks the workers. The
+workers inherit the imported code and the built application, so starting
+one costs a fork rather than a fresh interpreter, and the pages they do
+not write stay shared with the supervisor.
+
+Each worker opens its database connections and creates its caches before
+it accepts its first connection, and may be recycled after serving a
+number of requests to bound memory growth. Workers that exit are
+replaced, except when a worker fails to start, which stops the server
+rather than forking failing workers in a loop. On SIGTERM or SIGINT,
+workers finish their in-flight requests and are killed if they have not
+exited within the graceful timeout.
+
+Request metrics are kept per worker, so ``/metrics`` reports the worker
+that happened to serve the scrape. The in-process response cache would
+also be per worker, and miss the writes served by the others, so with
+several workers responses are only cached by a shared Redis backend.
+"""
+
+import gc
+import logging
+import os
+import random
+import signal
+import socket
+import time
+from typing import List, Optional, Set
+
+import uvicorn
+from fastapi import FastAPI
+
+from app.core import blobs, cache
+from app.core.config import settings
+from app.core.database import all_shards, get_engine, get_engines, get_sessionmaker
+from app.crud import brew as crud
+
+logger = logging.getLogger(__name__)
+
+#: Seconds between checks of the supervisor for exited workers
+POLL_INTERVAL = 0.2
+
+#: Exit status of a worker that failed before serving
+WORKER_BOOT_ERROR = 3
+
+
+def default_workers() -> int:
+    """Size the worker pool to the CPUs this process may run on.
+
+    :return: Number of usable CPUs
+    :rtype: int
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def shared_cache_backend(workers: int) -> str:
+    """Choose a response cache backend coherent across worker processes.
+
+    :param workers: Number of worker processes
+    :type workers: int
+    :return: ``CACHE_BACKEND``, or "none" instead of "memory" when there are
+        several workers
+    :rtype: str
+    """
+    if workers > 1 and settings.CACHE_BACKEND == "memory":
+        logger.warning(
+            "Response caching disabled: the memory cache is not shared by "
+            "%d workers, set CACHE_BACKEND=redis to cache",
+            workers,
+        )
+        return "none"
+    return settings.CACHE_BACKEND
+
+
+def warm_worker() -> None:
+    """Prepare a worker to serve its first requests at full speed.
+
+    Opens as many connections as the pool keeps on every database, runs the
+    listing and item queries once so their compiled statements are cached,
+    and creates the response cache and blob store.
+    """
+    read_engines = (False, True) if settings.READ_DATABASE_URL else (False,)
+    for shard in all_shards():
+        for read_only in read_engines if shard is None else (False,):
+            engine = get_engine(read_only=read_only, shard=shard)
+            connections = [engine.connect() for _ in range(settings.DB_POOL_SIZE)]
+            for conn in connections:
+                conn.close()
+            with get_sessionmaker(read_only=read_only, shard=shard)() as db:
+                crud.get_brews(db, limit=1, columns=crud.RESPONSE_COLUMNS)
+                crud.get_brew(db, brew_id=0, columns=crud.RESPONSE_COLUMNS)
+    cache.get_response_cache()
+    blobs.get_blob_store()
+
+
+class Supervisor:
+    """Fork, watch and replace the worker processes of a server.
+
+    :ivar app: Application served by the workers
+    :type app: FastAPI
+    :ivar sock: Listening socket shared by the workers
+    :type sock: socket.socket
+    :ivar workers: Number of worker processes
+    :type workers: int
+    :ivar max_requests: Requests a worker serves before it is recycled, or 0
+        to never recycle
+    :type max_requests: int
+    :ivar max_requests_jitter: Upper bound of a random number of requests
+        added to ``max_requests`` per worker, so workers are not all
+        recycled at once
+    :type max_requests_jitter: int
+    :ivar graceful_timeout: Seconds workers get to finish in-flight
+        requests on shutdown
+    :type graceful_timeout: float
+    :ivar log_level: Log level of the workers
+    :type log_level: str
+    """
+
+    def __init__(
+        self,
+        app: FastAPI,
+        sock: socket.socket,
+        workers: int,
+        max_requests: int = 0,
+        max_requests_jitter: int = 0,
+        graceful_timeout: float = 30.0,
+        log_level: str = "info",
+    ):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.log_level = log_level
+        self.children: Set[int] = set()
+        self.should_exit = False
+        self.failed = False
+
+    def _boot(self) -> uvicorn.Server:
+        """Prepare a worker in a freshly forked child process.
+
+        :return: Server of the worker, ready to run
+        :rtype: uvicorn.Server
+        """
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        # Forked children share the random state of the supervisor
+        random.seed()
+        warm_worker()
+        limit = None
+        if self.max_requests:
+            limit = self.max_requests + random.randint(0, self.max_requests_jitter)
+        config = uvicorn.Config(
+            self.app,
+            lifespan="on",
+            log_level=self.log_level,
+            limit_max_requests=limit,
+            timeout_graceful_shutdown=self.graceful_timeout,
+        )
+        return uvicorn.Server(config)
+
+    def spawn(self) -> int:
+        """Fork a worker process.
+
+        :return: PID of the worker
+        :rtype: int
+        """
+        pid = os.fork()
+        if pid == 0:
+            status = WORKER_BOOT_ERROR
+            try:
+                server = self._boot()
+                status = 1
+                server.run(sockets=[self.sock])
+                status = 0
+            except BaseException:
+                logger.exception("Worker %d failed", os.getpid())
+            finally:
+                os._exit(status)
+        self.children.add(pid)
+        logger.info("Started worker %d", pid)
+        return pid
+
+    def reap(self) -> List[int]:
+        """Collect the workers that have exited.
+
+        A worker that failed to boot marks the server as failed and makes
+        it shut down.
+
+        :return: PIDs of the exited workers
+        :rtype: List[int]
+        """
+        exited = []
+        while self.children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0 or pid not in self.children:
+                break
+            self.children.remove(pid)
+            exited.append(pid)
+            code = os.waitstatus_to_exitcode(status)
+            logger.info("Worker %d exited with status %d", pid, code)
+            if code == WORKER_BOOT_ERROR:
+                self.failed = self.should_exit = True
+        return exited
+
+    def _handle_exit(self, signum: int, frame: Optional[object]) -> None:
+        self.should_exit = True
+
+    def run(self) -> None:
+        """Start the workers and replace them as they exit until signalled."""
+        signal.signal(signal.SIGTERM, self._handle_exit)
+        signal.signal(signal.SIGINT, self._handle_exit)
+        # Keep the objects built so far out of the collector, so that workers
+        # running it do not write to, and unshare, the pages holding them
+        gc.collect()
+        gc.freeze()
+        for _ in range(self.workers):
+            self.spawn()
+        while not self.should_exit:
+            time.sleep(POLL_INTERVAL)
+            for _ in self.reap():
+                if not self.should_exit:
+                    self.spawn()
+        self.stop()
+
+    def stop(self) -> None:
+        """Ask the workers to shut down, killing those that do not in time."""
+        for pid in self.children:
+            os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.children and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(POLL_INTERVAL / 4)
+        for pid in list(self.children):
+            logger.warning("Killing worker %d", pid)
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            self.children.remove(pid)
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    workers: Optional[int] = None,
+    max_requests: int = 0,
+    max_requests_jitter: int = 0,
+    graceful_timeout: float = 30.0,
+    log_level: str = "info",
+) -> int:
+    """Serve the application with pre-forked worker processes.
+
+    :param host: Interface to listen on
+    :type host: str
+    :param port: Port to listen on
+    :type port: int
+    :param workers: Number of worker processes, by default one per CPU
+    :type workers: Optional[int]
+    :param max_requests: Requests a worker serves before it is recycled, or
+        0 to never recycle
+    :type max_requests: int
+    :param max_requests_jitter: Upper bound of a random number of requests
+        added to ``max_requests`` per worker
+    :type max_requests_jitter: int
+    :param graceful_timeout: Seconds workers get to finish in-flight
+        requests on shutdown
+    :type graceful_timeout: float
+    :param log_level: Log level of the supervisor and workers
+    :type log_level: str
+    :return: Process exit status, 1 if a worker failed to boot
+    :rtype: int
+    """
+    from app.core.migrations import run_migrations
+    from app.main import create_app
+
+    logging.basicConfig(level=log_level.upper(), format="%(levelname)s: %(message)s")
+    workers = workers or default_workers()
+    settings.CACHE_BACKEND = shared_cache_backend(workers)
+    cache.get_response_cache.cache_clear()
+    # Migrate once, then close the connections so no worker inherits them
+    for engine in get_engines():
+        run_migrations(engine)
+        engine.dispose()
+    app = create_app(migrate=False)
+    sock = uvicorn.Config(app, host=host, port=port, log_level=log_level).bind_socket()
+    supervisor = Supervisor(
+        app,
+        sock,
+        workers,
+        max_requests=max_requests,
+        max_requests_jitter=max_requests_jitter,
+        graceful_timeout=graceful_timeout,
+        log_level=log_level,
+    )
+    try:
+        supervisor.run()
+    finally:
+        sock.close()
+    return 1 if supervisor.failed else 0
@@ -0,0 +1,344 @@
+"""In-memory index of brew parameters for "brews like this one" queries.
+
+Each brew is a point whose coordinates are its water temperature, ratio,
+brew time and bloom time, each standardized to zero mean and unit variance
+so that no unit dominates, with missing values at the mean. Brews of
+another brew type are :data:`BREW_TYPE_DISTANCE` standard deviations
+further apart. The nearest brews are found by a brute-force scan of a
+NumPy feature matrix: with a few dimensions, one matrix-vector product
+over a million rows takes milliseconds, and unlike a tree index it allows
+any filter without reducing the number of results. Brews are only compared
+with brews of the same user.
+
+The index is built from the database on its first query and kept up to
+date from the ``brew_changes`` log: before each query, the brews changed
+since the last one are read again, so every write path and every worker
+process is covered. It is rebuilt, which also refreshes the means and
+variances, once more than ``SIMILARITY_REBUILD_CHANGES`` changes are
+pending or it is older than ``SIMILARITY_MAX_AGE_SECONDS``. When users are
+sharded, each shard has its own index.
+
+NumPy is optional; without it similarity queries are unavailable.
+"""
+
+import threading
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.users import DEFAULT_USER_ID
+from app.crud import brew as crud
+from app.schemas.brew import BrewFilter
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised without NumPy installed
+    np = None
+
+#: Numeric features, in the order of :data:`app.crud.brew.SIMILARITY_COLUMNS`
+#: after the ID, owner and brew type
+FEATURES = ("water_temp", "ratio", "brew_seconds", "bloom_time")
+
+#: Distance, in standard deviations, between brews of different brew types
+BREW_TYPE_DISTANCE = 1.0
+
+#: Squared distance beyond which brews are left out of results
+EXCLUDED = np.float32(1e30) if np is not None else None
+
+#: One brew in this many is sampled to bound the distances of a query
+SAMPLE_STRIDE = 64
+
+
+class SimilarityUnavailableError(Exception):
+    """Raised when similarity queries need NumPy and it is not installed."""
+
+
+def _timestamp(value: datetime) -> float:
+    """Convert a naive UTC or aware datetime to a UNIX timestamp."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class SimilarityIndex:
+    """Standardized feature matrix of every brew, with incremental updates.
+
+    Arrays are indexed by position in their last dimension, so that each
+    feature is contiguous and a query reads the matrix column by column.
+    Deleted brews keep their position, with an infinite norm that puts
+    them out of reach of every query, until the index is rebuilt.
+
+    :ivar change_id: ID of the last logged change applied to the index
+    :type change_id: int
+    :ivar built_at: Monotonic time of the last rebuild, or None if never
+        built
+    :type built_at: Optional[float]
+    """
+
+    #: Per-brew arrays
+    _ARRAYS = ("_ids", "_users", "_types", "_created", "_raw", "_points", "_norms")
+
+    def __init__(self):
+        self.change_id = 0
+        self.built_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._size = 0
+        self._positions: Dict[int, int] = {}
+        self._type_codes: Dict[str, int] = {}
+        self._allocate(0)
+        self._mean = np.zeros((len(FEATURES), 1))
+        self._std = np.ones((len(FEATURES), 1))
+
+    def _allocate(self, capacity: int) -> None:
+        """Create empty arrays holding ``capacity`` brews."""
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._users = np.zeros(capacity, dtype=np.int64)
+        self._types = np.zeros(capacity, dtype=np.int16)
+        self._created = np.zeros(capacity, dtype=np.float64)
+        self._raw = np.full((len(FEATURES), capacity), np.nan)
+        self._points = np.zeros((len(FEATURES), capacity), dtype=np.float32)
+        self._norms = np.full(capacity, np.inf, dtype=np.float32)
+
+    def _grow(self, size: int) -> None:
+        """Make room for ``size`` brews, doubling the capacity as needed."""
+        capacity = len(self._ids)
+        if size <= capacity:
+            return
+        old = [getattr(self, name) for name in self._ARRAYS]
+        self._allocate(max(size, 2 * capacity, 1024))
+        for name, array in zip(self._ARRAYS, old):
+            getattr(self, name)[..., : self._size] = array[..., : self._size]
+
+    def _type_code(self, brew_type: str) -> int:
+        return self._type_codes.setdefault(brew_type, len(self._type_codes))
+
+    def _standardize(self, positions: slice) -> None:
+        """Compute the points and squared norms of some brews."""
+        points = (self._raw[:, positions] - self._mean) / self._std
+        points = np.nan_to_num(points, nan=0.0).astype(np.float32)
+        self._points[:, positions] = points
+        self._norms[positions] = (points * points).sum(axis=0)
+
+    def _write(self, rows: Iterable[Sequence[Any]]) -> None:
+        """Insert or overwrite the features of brews.
+
+        :param rows: Rows of :data:`app.crud.brew.SIMILARITY_COLUMNS`
+        :type rows: Iterable[Sequence[Any]]
+        """
+        for row in rows:
+            brew_id, user_id, brew_type, *features, created_at = row
+            position = self._positions.get(brew_id)
+            if position is None:
+                position = self._size
+                self._grow(position + 1)
+                self._size += 1
+                self._positions[brew_id] = position
+            self._ids[position] = brew_id
+            self._users[position] = user_id
+            self._types[position] = self._type_code(brew_type)
+            self._created[position] = _timestamp(created_at)
+            self._raw[:, position] = [np.nan if v is None else v for v in features]
+            self._standardize(slice(position, position + 1))
+
+    def rebuild(self, rows: Iterable[Sequence[Any]]) -> None:
+        """Replace the contents of the index.
+
+        :param rows: Rows of :data:`app.crud.brew.SIMILARITY_COLUMNS` of
+            every brew
+        :type rows: Iterable[Sequence[Any]]
+        """
+        rows = list(rows)
+        self._type_codes = {}
+        self._allocate(len(rows))
+        self._size = len(rows)
+        ids = [row[0] for row in rows]
+        self._positions = dict(zip(ids, range(len(rows))))
+        self._ids[:] = ids
+        self._users[:] = [row[1] for row in rows]
+        self._types[:] = [self._type_code(row[2]) for row in rows]
+        self._created[:] = [_timestamp(row[-1]) for row in rows]
+        if rows:
+            # Missing values become NaN, left out of the statistics
+            self._raw[:] = np.array([row[3:-1] for row in rows], dtype=np.float64).T
+            present = ~np.isnan(self._raw)
+            counts = np.maximum(present.sum(axis=1, keepdims=True), 1)
+            self._mean = np.nansum(self._raw, axis=1, keepdims=True) / counts
+            deviations = np.where(present, self._raw - self._mean, 0.0)
+            std = np.sqrt((deviations**2).sum(axis=1, keepdims=True) / counts)
+            self._std = np.where(std > 0, std, 1.0)
+            self._standardize(slice(0, self._size))
+        self.built_at = time.monotonic()
+
+    def remove(self, brew_ids: Iterable[int]) -> None:
+        """Drop brews from the index.
+
+        :param brew_ids: IDs of the brews; unknown IDs are ignored
+        :type brew_ids: Iterable[int]
+        """
+        for brew_id in brew_ids:
+            position = self._positions.pop(brew_id, None)
+            if position is not None:
+                self._norms[position] = np.inf
+
+    def refresh(self, db: Session) -> None:
+        """Bring the index up to date with the database.
+
+        :param db: Database session
+        :type db: Session
+        """
+        latest = crud.last_change_id(db)
+        if (
+            self.built_at is None
+            or latest < self.change_id
+            or time.monotonic() - self.built_at > settings.SIMILARITY_MAX_AGE_SECONDS
+            or latest - self.change_id > settings.SIMILARITY_REBUILD_CHANGES
+        ):
+            self.rebuild(
+                row
+                for batch in crud.export_brews(db, columns=crud.SIMILARITY_COLUMNS)
+                for row in batch
+            )
+        elif latest > self.change_id:
+            logged = crud.get_changes(db, self.change_id, limit=latest - self.change_id)
+            brew_ids = list({change.brew_id for change in logged})
+            rows = crud.get_brews_by_ids(db, brew_ids, crud.SIMILARITY_COLUMNS)
+            self._write(rows)
+            self.remove(set(brew_ids) - {row[0] for row in rows})
+        self.change_id = latest
+
+    def _filter_mask(self, filters: BrewFilter) -> Any:
+        """Select the brews matching filters.
+
+        Brews without a value never match a range on it, as in listings.
+
+        :param filters: Filter values
+        :type filters: BrewFilter
+        :return: Boolean array over the positions of the index
+        :rtype: numpy.ndarray
+        """
+        size = self._size
+        mask = np.ones(size, dtype=bool)
+        if filters.brew_type is not None:
+            code = self._type_codes.get(filters.brew_type, -1)
+            mask &= self._types[:size] == code
+        if filters.created_after is not None:
+            mask &= self._created[:size] >= _timestamp(filters.created_after)
+        if filters.created_before is not None:
+            mask &= self._created[:size] < _timestamp(filters.created_before)
+        for feature, name in enumerate(FEATURES):
+            if name == "bloom_time":
+                continue
+            low = getattr(filters, f"min_{name}")
+            high = getattr(filters, f"max_{name}")
+            if low is not None:
+                mask &= self._raw[feature, :size] >= low
+            if high is not None:
+                mask &= self._raw[feature, :size] <= high
+        return mask
+
+    def nearest(
+        self,
+        brew_id: int,
+        k: int,
+        filters: Optional[BrewFilter] = None,
+        user_id: int = DEFAULT_USER_ID,
+    ) -> Optional[List[int]]:
+        """Find the brews of a user closest to one of their brews.
+
+        :param brew_id: ID of the brew to compare with
+        :type brew_id: int
+        :param k: Maximum number of brews to return
+        :type k: int
+        :param filters: Filter the returned brews must match
+        :type filters: Optional[BrewFilter]
+        :param user_id: ID of the user owning the brews
+        :type user_id: int
+        :return: IDs of the closest brews, closest first, or None if the
+            brew is not indexed or belongs to another user
+        :rtype: Optional[List[int]]
+        """
+        position = self._positions.get(brew_id)
+        if position is None or self._users[position] != user_id:
+            return None
+        size = self._size
+        point = self._points[:, position]
+        # Squared distances as |p|^2 - 2 p.q + |q|^2, with one vector-matrix
+        # product. |q|^2 is the same for every brew, so it is left out of the
+        # ranking. Deleted brews have infinite norms.
+        distances = (-2 * point) @ self._points[:, :size]
+        distances += self._norms[:size]
+        distances += np.float32(BREW_TYPE_DISTANCE**2) * (
+            self._types[:size] != self._types[position]
+        )
+        distances[position] = np.inf
+        mask = self._users[:size] == user_id
+        if filters is not None:
+            mask &= self._filter_mask(filters)
+        # Adding a penalty is much faster than assigning through a mask
+        distances += ~mask * EXCLUDED
+        k = min(k, size)
+        if k == 0:
+            return []
+        # The k-th smallest distance of a sample bounds the k-th smallest of
+        # all, so only the brews within it need to be partitioned
+        sample = distances[:: max(1, min(SAMPLE_STRIDE, size // k))]
+        bound = np.partition(sample, k - 1)[k - 1]
+        if bound < EXCLUDED:
+            candidates = np.flatnonzero(distances <= bound)
+        else:
+            # Fewer than k brews in the sample pass the filter
+            candidates = np.flatnonzero(distances < EXCLUDED)
+        if len(candidates) > k:
+            nearest = np.argpartition(distances[candidates], k - 1)[:k]
+            candidates = candidates[nearest]
+        candidates = candidates[distances[candidates] < EXCLUDED]
+        order = candidates[np.lexsort((self._ids[candidates], distances[candidates]))]
+        return self._ids[order].tolist()
+
+    def similar(
+        self,
+        db: Session,
+        brew_id: int,
+        k: int,
+        filters: Optional[BrewFilter] = None,
+        user_id: int = DEFAULT_USER_ID,
+    ) -> Optional[List[int]]:
+        """Refresh the index, then find the brews of a user closest to a brew.
+
+        :param db: Database session
+        :type db: Session
+        :param brew_id: ID of the brew to compare with
+        :type brew_id: int
+        :param k: Maximum number of brews to return
+        :type k: int
+        :param filters: Filter the returned brews must match
+        :type filters: Optional[BrewFilter]
+        :param user_id: ID of the user owning the brews
+        :type user_id: int
+        :return: IDs of the closest brews, closest first, or None if the
+            brew does not exist or belongs to another user
+        :rtype: Optional[List[int]]
+        """
+        with self._lock:
+            self.refresh(db)
+            return self.nearest(brew_id, k, filters, user_id)
+
+
+@lru_cache()
+def get_similarity_index(shard: Optional[int] = None) -> SimilarityIndex:
+    """Create a similarity index of this process, empty until queried.
+
+    :param shard: Shard of the database indexed, from
+        :func:`app.core.database.shard_for`
+    :type shard: Optional[int]
+    :return: Similarity index of the brews of the shard
+    :rtype: SimilarityIndex
+    :raises SimilarityUnavailableError: If NumPy is not installed
+    """
+    if np is None:
+        raise SimilarityUnavailableError("Similarity queries require 'numpy'")
+    return SimilarityIndex()
@@ -0,0 +1,65 @@
+"""Identity of the user owning the brews a request reads and writes.
+
+The API does not authenticate users itself: it is meant to run behind an
+authenticating proxy, which passes the ID of the signed-in user in the
+``X-User-Id`` header. Requests without it act as :data:`DEFAULT_USER_ID`,
+the owner of every brew recorded before brews had owners, so single-user
+deployments keep working unchanged.
+
+Responses to requests resolving the user name the header in ``Vary``, so
+shared caches and proxies never serve one user's response, or confirm
+one user's entity tag, to another.
+"""
+
+from typing import Any, Callable, Optional
+
+from fastapi import Header, Request
+from starlette.datastructures import MutableHeaders
+
+#: Owner of brews created without a user, including every pre-existing brew
+DEFAULT_USER_ID = 1
+
+#: Request header carrying the ID of the user
+USER_HEADER = "X-User-Id"
+
+#: Key of the request state set once the request has resolved its user
+USER_SCOPED = "user_scoped"
+
+
+def get_user_id(request: Request, x_user_id: Optional[int] = Header(None, ge=1)) -> int:
+    """Dependency resolving the user a request acts as.
+
+    :param request: Incoming request, marked as depending on the user
+    :type request: Request
+    :param x_user_id: Value of the ``X-User-Id`` request header
+    :type x_user_id: Optional[int]
+    :return: ID of the user
+    :rtype: int
+    """
+    setattr(request.state, USER_SCOPED, True)
+    return DEFAULT_USER_ID if x_user_id is None else x_user_id
+
+
+class UserVaryMiddleware:
+    """Add ``X-User-Id`` to ``Vary`` on the responses that depend on the user.
+
+    :ivar app: Wrapped ASGI application
+    :type app: Callable
+    """
+
+    def __init__(self, app: Callable):
+        self.app = app
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_vary(message: Any) -> None:
+            if message["type"] == "http.response.start" and scope.get("state", {}).get(
+                USER_SCOPED
+            ):
+                MutableHeaders(scope=message).add_vary_header(USER_HEADER)
+            await send(message)
+
+        await self.app(scope, receive, send_with_vary)
@@ -4,31 +4,659 @@ This module provides database operations for creating, reading,
 updating, and deleting brew records using SQLAlchemy ORM.
 """
 
-from typing import List, Optional
+import re
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar, Union
 
+import orjson
+from sqlalchemy import and_, delete, func, insert, or_, select, text, update
 from sqlalchemy.orm import Session
 
-from app.models.brew import Brew
-from app.schemas.brew import BrewCreate
+from app.core import blobs, cache, changes, images
+from app.core.config import settings
+from app.core.pagination import InvalidCursorError, decode_cursor, encode_cursor
+from app.core.users import DEFAULT_USER_ID
+from app.models.brew import (
+    ArchivedBrew,
+    Brew,
+    BrewChange,
+    BrewIngest,
+    BrewSync,
+    BrewSyncCreate,
+    brew_ratio,
+    brew_time_seconds,
+    brews_fts,
+)
+from app.schemas.brew import Brew as BrewSchema
+from app.schemas.brew import (
+    BrewCreate,
+    BrewFilter,
+    BrewPatch,
+    BrewUpsert,
+    BulkItemError,
+    BulkResult,
+    SyncWrite,
+    SyncWriteResult,
+)
 
+T = TypeVar("T")
 
-def get_brew(db: Session, brew_id: int) -> Optional[Brew]:
+#: Position of a brew in a listing, as ``(sort value, id)``
+BrewCursor = Tuple[Any, int]
+
+
+class VersionConflictError(Exception):
+    """Raised when a conditional write finds a brew at another version."""
+
+
+def _sort_value(brew: Brew, sort: str) -> Any:
+    """Return the value a brew is sorted by in a listing.
+
+    :param brew: Brew record
+    :type brew: Brew
+    :param sort: Name of a column in :data:`SORT_COLUMNS`
+    :type sort: str
+    :return: Sort value of the brew
+    :rtype: Any
+    """
+    if sort == "ratio":
+        return brew.weight_out / brew.weight_in
+    return getattr(brew, sort)
+
+
+def encode_brew_cursor(brew: Brew, sort: str = "created_at") -> str:
+    """Build the opaque cursor pointing just past the given brew.
+
+    :param brew: Last brew record of a page
+    :type brew: Brew
+    :param sort: Name of the column the listing is sorted by
+    :type sort: str
+    :return: Opaque cursor string
+    :rtype: str
+    """
+    value = _sort_value(brew, sort)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return encode_cursor(value, brew.id)
+
+
+def decode_brew_cursor(cursor: str, sort: str = "created_at") -> BrewCursor:
+    """Decode a cursor produced by :func:`encode_brew_cursor`.
+
+    :param cursor: Opaque cursor string
+    :type cursor: str
+    :param sort: Name of the column the listing is sorted by
+    :type sort: str
+    :return: ``(sort value, id)`` of the last brew already seen
+    :rtype: BrewCursor
+    :raises InvalidCursorError: If the cursor is malformed
+    """
+    value, brew_id = decode_cursor(cursor, 2)
+    try:
+        if sort == "created_at":
+            return datetime.fromisoformat(value), int(brew_id)
+        if isinstance(value, str):
+            raise TypeError("Sort value must be a number")
+        return float(value), int(brew_id)
+    except (TypeError, ValueError) as exc:
+        raise InvalidCursorError("Invalid cursor") from exc
+
+
+#: Position of a brew in search results, as ``(rank, id)``
+SearchCursor = Tuple[float, int]
+
+
+def encode_search_cursor(rank: float, brew_id: int) -> str:
+    """Build the opaque cursor pointing just past a search result.
+
+    :param rank: FTS5 rank of the last result of a page
+    :type rank: float
+    :param brew_id: ID of the last result of a page
+    :type brew_id: int
+    :return: Opaque cursor string
+    :rtype: str
+    """
+    return encode_cursor(rank, brew_id)
+
+
+def decode_search_cursor(cursor: str) -> SearchCursor:
+    """Decode a cursor produced by :func:`encode_search_cursor`.
+
+    :param cursor: Opaque cursor string
+    :type cursor: str
+    :return: ``(rank, id)`` of the last result already seen
+    :rtype: SearchCursor
+    :raises InvalidCursorError: If the cursor is malformed
+    """
+    rank, brew_id = decode_cursor(cursor, 2)
+    try:
+        return float(rank), int(brew_id)
+    except (TypeError, ValueError) as exc:
+        raise InvalidCursorError("Invalid cursor") from exc
+
+
+def _match_expression(query: str) -> Optional[str]:
+    """Turn free text into an FTS5 query matching every word as a prefix.
+
+    Words are quoted so FTS5 operators and punctuation in user input are
+    treated as plain text.
+
+    :param query: Free-text search query
+    :type query: str
+    :return: FTS5 MATCH expression, or None if the query has no words
+    :rtype: Optional[str]
+    """
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+#: Fields of a brew response, in the order the schema serializes them
+RESPONSE_FIELDS = tuple(BrewSchema.model_fields)
+
+#: Columns holding the brew response fields, in the same order
+RESPONSE_COLUMNS = tuple(getattr(Brew, field) for field in RESPONSE_FIELDS)
+
+#: Columns item responses select besides their fields, for the entity tag
+ITEM_COLUMNS = (Brew.version,)
+
+#: Columns the features of brew similarity are computed from
+SIMILARITY_COLUMNS = (
+    Brew.id,
+    Brew.user_id,
+    Brew.brew_type,
+    Brew.water_temp,
+    brew_ratio,
+    Brew.brew_seconds,
+    Brew.bloom_time,
+    Brew.created_at,
+)
+
+#: Columns the cursor of a listing is built from, per sort column
+CURSOR_COLUMNS = {
+    "created_at": (Brew.created_at, Brew.id),
+    "brew_seconds": (Brew.brew_seconds, Brew.id),
+    "water_temp": (Brew.water_temp, Brew.id),
+    "ratio": (Brew.weight_out, Brew.weight_in, Brew.id),
+}
+
+
+def response_columns(fields: Sequence[str], extra: Sequence[Any] = ()) -> tuple:
+    """Select the columns of some response fields.
+
+    The columns of ``fields`` come first, in the same order, followed by the
+    columns of ``extra`` that are not among them. Rows can then be zipped
+    with ``fields`` and still carry what the endpoint needs besides, such
+    as the :data:`CURSOR_COLUMNS` of a listing or the :data:`ITEM_COLUMNS`.
+
+    :param fields: Names of fields in :data:`RESPONSE_FIELDS`
+    :type fields: Sequence[str]
+    :param extra: Further columns to select
+    :type extra: Sequence[Any]
+    :return: Columns to select
+    :rtype: tuple
+    """
+    columns = [getattr(Brew, field) for field in fields]
+    columns.extend(column for column in extra if column.key not in fields)
+    return tuple(columns)
+
+
+#: Columns brew listings can be sorted by. Each is indexed per user, together
+#: with the ID as a tie-breaker.
+SORT_COLUMNS = {
+    "created_at": Brew.created_at,
+    "brew_seconds": Brew.brew_seconds,
+    "water_temp": Brew.water_temp,
+    "ratio": brew_ratio,
+}
+
+
+def list_order(sort: str = "created_at", descending: bool = True) -> tuple:
+    """Build the ordering of a brew listing.
+
+    :param sort: Name of a column in :data:`SORT_COLUMNS`
+    :type sort: str
+    :param descending: Whether the largest values come first
+    :type descending: bool
+    :return: Order by clauses, with the ID as a tie-breaker
+    :rtype: tuple
+    """
+    column = SORT_COLUMNS[sort]
+    if descending:
+        return column.desc(), Brew.id.desc()
+    return column.asc(), Brew.id.asc()
+
+
+#: Ordering of brew listings, newest first; served by
+#: ix_brews_live_user_created_at_id
+LIST_ORDER = list_order()
+
+#: Ordering of search results, most relevant first
+SEARCH_ORDER = (brews_fts.c.rank, Brew.id)
+
+
+def _listed_after(
+    after: BrewCursor, sort: str = "created_at", descending: bool = True
+) -> tuple:
+    """Build the filter selecting brews listed after a cursor position.
+
+    :param after: ``(sort value, id)`` of the last brew already seen
+    :type after: BrewCursor
+    :param sort: Name of the column the listing is sorted by
+    :type sort: str
+    :param descending: Whether the listing is sorted largest first
+    :type descending: bool
+    :return: Filter clauses
+    :rtype: tuple
+    """
+    value, brew_id = after
+    column = SORT_COLUMNS[sort]
+    if descending:
+        return (
+            column <= value,
+            or_(column < value, and_(column == value, Brew.id < brew_id)),
+        )
+    return (
+        column >= value,
+        or_(column > value, and_(column == value, Brew.id > brew_id)),
+    )
+
+
+def _brew_filters(filters: Optional[BrewFilter] = None) -> tuple:
+    """Build filter clauses selecting brews by type, date and metric ranges.
+
+    :param filters: Filter values; None or unset fields do not filter
+    :type filters: Optional[BrewFilter]
+    :return: Filter clauses, empty to select every brew
+    :rtype: tuple
+    """
+    if filters is None:
+        return ()
+    clauses = ()
+    if filters.brew_type is not None:
+        clauses += (Brew.brew_type == filters.brew_type,)
+    if filters.created_after is not None:
+        clauses += (Brew.created_at >= filters.created_after,)
+    if filters.created_before is not None:
+        clauses += (Brew.created_at < filters.created_before,)
+    for name in ("brew_seconds", "water_temp", "ratio"):
+        low = getattr(filters, f"min_{name}")
+        high = getattr(filters, f"max_{name}")
+        if low is not None:
+            clauses += (SORT_COLUMNS[name] >= low,)
+        if high is not None:
+            clauses += (SORT_COLUMNS[name] <= high,)
+    return clauses
+
+
+def _listing_filter(
+    filters: Optional[BrewFilter],
+    after: Optional[BrewCursor],
+    sort: str = "created_at",
+    descending: bool = True,
+) -> tuple:
+    """Build the filter of a brew listing page.
+
+    Brews without a value for the sort column are left out of listings
+    sorted by it, since they have no position in the keyset order.
+
+    :param filters: Filter values
+    :type filters: Optional[BrewFilter]
+    :param after: ``(sort value, id)`` of the last brew already seen
+    :type after: Optional[BrewCursor]
+    :param sort: Name of the column the listing is sorted by
+    :type sort: str
+    :param descending: Whether the listing is sorted largest first
+    :type descending: bool
+    :return: Filter clauses, empty to select every brew
+    :rtype: tuple
+    """
+    clauses = _brew_filters(filters)
+    if sort != "created_at":
+        clauses += (SORT_COLUMNS[sort].isnot(None),)
+    if after is not None:
+        clauses += _listed_after(after, sort, descending)
+    return clauses
+
+
+def _search_filter(match: str, after: Optional[SearchCursor]) -> tuple:
+    """Build the filter of a full-text search page.
+
+    :param match: FTS5 MATCH expression
+    :type match: str
+    :param after: ``(rank, id)`` of the last result already seen
+    :type after: Optional[SearchCursor]
+    :return: Filter clauses
+    :rtype: tuple
+    """
+    clauses = (text("brews_fts MATCH :match").bindparams(match=match),)
+    if after is None:
+        return clauses
+    rank, brew_id = after
+    return clauses + (
+        or_(
+            brews_fts.c.rank > rank,
+            and_(brews_fts.c.rank == rank, Brew.id > brew_id),
+        ),
+    )
+
+
+def list_cache_namespace(user_id: int) -> str:
+    """Return the cache namespace of responses listing a user's brews.
+
+    Invalidated by every write to the user's brews.
+
+    :param user_id: ID of the user
+    :type user_id: int
+    :return: Cache namespace
+    :rtype: str
+    """
+    return f"users:{user_id}:brews"
+
+
+def item_cache_namespace(user_id: int, brew_id: int) -> str:
+    """Return the cache namespace of responses for a single brew.
+
+    :param user_id: ID of the user owning the brew
+    :type user_id: int
+    :param brew_id: ID of the brew
+    :type brew_id: int
+    :return: Cache namespace
+    :rtype: str
+    """
+    return f"users:{user_id}:brews:{brew_id}"
+
+
+def invalidate_cache(
+    brew_ids: Sequence[int] = (), user_id: int = DEFAULT_USER_ID
+) -> None:
+    """Invalidate cached responses after a committed write.
+
+    The user's listings are always invalidated, since any write can change
+    them; item responses only for the brews that were modified.
+
+    :param brew_ids: IDs of the brews updated or deleted
+    :type brew_ids: Sequence[int]
+    :param user_id: ID of the user owning the brews
+    :type user_id: int
+    """
+    cache.response_cache.invalidate(
+        list_cache_namespace(user_id),
+        *(item_cache_namespace(user_id, i) for i in brew_ids),
+    )
+
+
+def _store_images(uploads: Sequence[bytes]) -> None:
+    """Store uploaded images in the blob store and render their variants.
+
+    :param uploads: Decoded image bytes
+    :type uploads: Sequence[bytes]
+    """
+    for data in uploads:
+        images.schedule_variants(blobs.blob_store.put(data))
+
+
+def _brew_values(
+    brew: Union[BrewCreate, BrewPatch],
+    brew_id: Optional[int] = None,
+    uploads: Optional[List[bytes]] = None,
+) -> dict:
+    """Map validated brew data to column values.
+
+    Inline ``data:`` image URLs are moved into the blob store and replaced by
+    the short URL of the image endpoint. When updating, an image URL that
+    points at the brew's own stored image is left untouched. Partial
+    updates only map the fields they set.
+
+    :param brew: Validated brew data
+    :type brew: Union[BrewCreate, BrewPatch]
+    :param brew_id: ID of the brew being updated, if any
+    :type brew_id: Optional[int]
+    :param uploads: List collecting inline images for the caller to store
+        with :func:`_store_images` once the write matches a brew, or None to
+        store them right away
+    :type uploads: Optional[List[bytes]]
+    :return: Column values for the brew record
+    :rtype: dict
+    :raises InvalidImageError: If an inline image cannot be decoded
+    """
+    values = brew.model_dump(exclude_unset=isinstance(brew, BrewPatch))
+    if "brew_time" in values:
+        values["brew_seconds"] = brew_time_seconds(values["brew_time"])
+    if "image_url" not in values:
+        return values
+    image_url = values["image_url"]
+    if blobs.is_data_url(image_url):
+        content_type, data = blobs.parse_data_url(image_url)
+        values["image_hash"] = blobs.digest_of(data)
+        if uploads is None:
+            _store_images([data])
+        else:
+            uploads.append(data)
+        values["image_content_type"] = content_type
+        values["image_url"] = blobs.image_url_for(brew_id) if brew_id else None
+    elif brew_id is not None and image_url == blobs.image_url_for(brew_id):
+        del values["image_url"]
+    else:
+        values["image_hash"] = None
+        values["image_content_type"] = None
+    return values
+
+
+def _owned_by(user_id: Optional[int]) -> tuple:
+    """Build the filter selecting the brews of a user that are not deleted.
+
+    Filtering on ``deleted_at IS NULL`` also lets the database use the
+    partial listing indexes.
+
+    :param user_id: ID of the user, or None for every user
+    :type user_id: Optional[int]
+    :return: Filter clauses
+    :rtype: tuple
+    """
+    live = Brew.deleted_at.is_(None)
+    return (live,) if user_id is None else (Brew.user_id == user_id, live)
+
+
+def get_brew(
+    db: Session,
+    brew_id: int,
+    columns: Sequence[Any] = (),
+    user_id: int = DEFAULT_USER_ID,
+) -> Optional[Any]:
     """Retrieve a single brew record by ID.
 
     :param db: Database session
     :type db: Session
     :param brew_id: ID of the brew to retrieve
     :type brew_id: int
-    :return: Found brew record or None
-    :rtype: Optional[Brew]
+    :param columns: Columns to select instead of the whole record, such as
+        returned by :func:`response_columns`
+    :type columns: Sequence[Any]
+    :param user_id: ID of the user the brew must belong to
+    :type user_id: int
+    :return: Found brew record, or row when ``columns`` are given, or None
+    :rtype: Optional[Any]
+    """
+    query = db.query(*columns) if columns else db.query(Brew)
+    return query.filter(Brew.id == brew_id, *_owned_by(user_id)).first()
+
+
+def get_brews_by_ids(
+    db: Session,
+    brew_ids: Sequence[int],
+    columns: Sequence[Any] = RESPONSE_COLUMNS,
+    user_id: Optional[int] = None,
+) -> List[Any]:
+    """Retrieve brews by ID, in the order of the IDs.
+
+    :param db: Database session
+    :type db: Session
+    :param brew_ids: IDs of the brews; unknown IDs are skipped
+    :type brew_ids: Sequence[int]
+    :param columns: Columns to select
+    :type columns: Sequence[Any]
+    :param user_id: ID of the user the brews must belong to, or None for
+        any user
+    :type user_id: Optional[int]
+    :return: Rows of the brews found
+    :rtype: List[Any]
     """
-    return db.query(Brew).filter(Brew.id == brew_id).first()
+    found = {}
+    for chunk in _chunks(list(brew_ids), settings.BULK_CHUNK_SIZE):
+        rows = db.execute(
+            select(*columns, Brew.id.label("_id")).where(
+                Brew.id.in_(chunk), *_owned_by(user_id)
+            )
+        ).all()
+        found.update((row._id, row[: len(columns)]) for row in rows)
+    return [found[brew_id] for brew_id in brew_ids if brew_id in found]
 
 
-def get_brews(db: Session, skip: int = 0, limit: int = 100) -> List[Brew]:
-    """Retrieve a list of brew records with pagination.
+def get_brew_image(
+    db: Session, brew_id: int, user_id: int = DEFAULT_USER_ID
+) -> Optional[Tuple[str, str, int]]:
+    """Retrieve the blob digest and media type of a brew's stored image.
 
-    Results are ordered by creation date in descending order.
+    Only the image columns and version are loaded, not the whole brew row.
+    Images of archived brews stay available.
+
+    :param db: Database session
+    :type db: Session
+    :param brew_id: ID of the brew
+    :type brew_id: int
+    :param user_id: ID of the user the brew must belong to
+    :type user_id: int
+    :return: Digest, media type and brew version, or None if the brew has no
+        stored image
+    :rtype: Optional[Tuple[str, str, int]]
+    """
+    row = (
+        db.query(Brew.image_hash, Brew.image_content_type, Brew.version)
+        .filter(Brew.id == brew_id, *_owned_by(user_id))
+        .first()
+    )
+    if row is None:
+        data = db.scalar(
+            select(ArchivedBrew.data)
+            .where(ArchivedBrew.brew_id == brew_id, ArchivedBrew.user_id == user_id)
+            .order_by(ArchivedBrew.id.desc())
+            .limit(1)
+        )
+        if data is None:
+            return None
+        values = decode_archived_brew(data)
+        row = (values["image_hash"], values["image_content_type"], values["version"])
+    image_hash, content_type, version = row
+    if image_hash is None:
+        return None
+    return image_hash, content_type, version
+
+
+#: Columns of change log entries, in the order of the change schema fields
+CHANGE_COLUMNS = (
+    BrewChange.id,
+    BrewChange.brew_id,
+    BrewChange.op,
+    BrewChange.version,
+    BrewChange.changed_at,
+)
+
+
+def get_changes(
+    db: Session, since: int = 0, limit: int = 100, user_id: Optional[int] = None
+) -> List[Any]:
+    """Retrieve the changes logged after a given one, oldest first.
+
+    :param db: Database session
+    :type db: Session
+    :param since: ID of the last change already seen, or 0 for all
+    :type since: int
+    :param limit: Maximum number of changes to return
+    :type limit: int
+    :param user_id: ID of the user whose brews changed, or None for every
+        user
+    :type user_id: Optional[int]
+    :return: Rows of :data:`CHANGE_COLUMNS`
+    :rtype: List[Any]
+    """
+    owned = () if user_id is None else (BrewChange.user_id == user_id,)
+    return db.execute(
+        select(*CHANGE_COLUMNS)
+        .where(BrewChange.id > since, *owned)
+        .order_by(BrewChange.id)
+        .limit(limit)
+    ).all()
+
+
+def last_change_id(db: Session) -> int:
+    """Return the ID of the latest logged change.
+
+    :param db: Database session
+    :type db: Session
+    :return: Latest change ID, or 0 if no change was logged
+    :rtype: int
+    """
+    return db.scalar(select(func.max(BrewChange.id))) or 0
+
+
+def get_sync_changes(
+    db: Session, since: int = 0, limit: int = 500, user_id: int = DEFAULT_USER_ID
+) -> Tuple[int, List[Any], List[int], bool]:
+    """Retrieve the brews of a user written after a sync version.
+
+    One row of ``brew_sync`` is read per brew written, however many times,
+    so the cost follows the number of brews changed rather than the length
+    of the change log. Deletions are left out when starting from version 0,
+    since the client has nothing to remove yet.
+
+    :param db: Database session
+    :type db: Session
+    :param since: Last sync version already applied, or 0 for all brews
+    :type since: int
+    :param limit: Maximum number of brews created, updated or deleted to
+        return
+    :type limit: int
+    :param user_id: ID of the user whose brews to return
+    :type user_id: int
+    :return: Sync version reached, rows of :data:`RESPONSE_COLUMNS` of the
+        brews created or updated, IDs of the brews deleted, and whether
+        later changes remain
+    :rtype: Tuple[int, List[Any], List[int], bool]
+    """
+    rows = db.execute(
+        select(BrewSync.brew_id, BrewSync.version, BrewSync.deleted)
+        .where(BrewSync.user_id == user_id, BrewSync.version > since)
+        .order_by(BrewSync.version)
+        .limit(limit + 1)
+    ).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    written = [row.brew_id for row in rows if not row.deleted]
+    deleted = [row.brew_id for row in rows if row.deleted and since]
+    brews = get_brews_by_ids(db, written, RESPONSE_COLUMNS, user_id)
+    return (rows[-1].version if rows else since), brews, deleted, has_more
+
+
+def get_brews(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    after: Optional[BrewCursor] = None,
+    filters: Optional[BrewFilter] = None,
+    sort: str = "created_at",
+    descending: bool = True,
+    columns: Sequence[Any] = (),
+    user_id: int = DEFAULT_USER_ID,
+) -> List[Any]:
+    """Retrieve a list of a user's brew records with pagination.
+
+    By default, results are ordered by creation date in descending order,
+    with the ID as a tie-breaker. When ``after`` is given, the page starts
+    right after that position using a range scan on the user's index of the
+    sort column instead of an offset.
 
     :param db: Database session
     :type db: Session
@@ -36,66 +664,897 @@ def get_brews(db: Session, skip: int = 0, limit: int = 100) -> List[Brew]:
     :type skip: int
     :param limit: Maximum number of records to return
     :type limit: int
-    :return: List of brew records
-    :rtype: List[Brew]
+    :param after: ``(sort value, id)`` of the last brew already seen
+    :type after: Optional[BrewCursor]
+    :param filters: Filter values
+    :type filters: Optional[BrewFilter]
+    :param sort: Name of a column in :data:`SORT_COLUMNS`
+    :type sort: str
+    :param descending: Whether the largest values come first
+    :type descending: bool
+    :param columns: Columns to select instead of whole records, such as
+        :data:`RESPONSE_COLUMNS`
+    :type columns: Sequence[Any]
+    :param user_id: ID of the user whose brews to list
+    :type user_id: int
+    :return: List of brew records, or of rows when ``columns`` are given
+    :rtype: List[Any]
     """
-    return (
-        db.query(Brew).order_by(Brew.created_at.desc()).offset(skip).limit(limit).all()
+    query = db.query(*columns) if columns else db.query(Brew)
+    query = query.filter(
+        *_owned_by(user_id), *_listing_filter(filters, after, sort, descending)
     )
+    order = list_order(sort, descending)
+    return query.order_by(*order).offset(skip).limit(limit).all()
+
+
+def search_brews(
+    db: Session,
+    query: str,
+    limit: int = 100,
+    after: Optional[SearchCursor] = None,
+    user_id: int = DEFAULT_USER_ID,
+) -> List[Tuple[Brew, float]]:
+    """Full-text search over the bean type, brew type and details of a user's brews.
+
+    Results are ranked by BM25 relevance, best first, with the ID as a
+    tie-breaker. When ``after`` is given, the page starts right after that
+    position.
+
+    :param db: Database session
+    :type db: Session
+    :param query: Free-text search query
+    :type query: str
+    :param limit: Maximum number of records to return
+    :type limit: int
+    :param after: ``(rank, id)`` of the last result already seen
+    :type after: Optional[SearchCursor]
+    :param user_id: ID of the user whose brews to search
+    :type user_id: int
+    :return: Matching brew records paired with their rank
+    :rtype: List[Tuple[Brew, float]]
+    """
+    match = _match_expression(query)
+    if match is None:
+        return []
+    search = (
+        db.query(Brew, brews_fts.c.rank)
+        .join(brews_fts, brews_fts.c.rowid == Brew.id)
+        .filter(*_owned_by(user_id), *_search_filter(match, after))
+    )
+    return [tuple(row) for row in search.order_by(*SEARCH_ORDER).limit(limit)]
+
+
+#: Columns written by exports
+EXPORT_COLUMNS = (
+    Brew.id,
+    Brew.bean_type,
+    Brew.brew_type,
+    Brew.water_temp,
+    Brew.weight_in,
+    Brew.weight_out,
+    Brew.brew_time,
+    Brew.brew_seconds,
+    Brew.bloom_time,
+    Brew.details,
+    Brew.image_url,
+    Brew.created_at,
+    Brew.updated_at,
+    Brew.version,
+)
+
+#: Large free-form columns that exports can leave out
+HEAVY_EXPORT_COLUMNS = frozenset({"details", "image_url"})
+
 
+def export_brews(
+    db: Session,
+    columns: Sequence[Any] = EXPORT_COLUMNS,
+    filters: Optional[BrewFilter] = None,
+    batch_size: int = 1000,
+    user_id: Optional[int] = None,
+) -> Iterator[Sequence[Tuple]]:
+    """Stream brew rows in batches, oldest first.
 
-def create_brew(db: Session, brew: BrewCreate) -> Brew:
+    Plain column tuples are fetched from a server-side cursor, ``batch_size``
+    rows at a time, without building ORM objects, so memory use does not
+    grow with the number of rows. The session must stay open until the
+    iterator is exhausted.
+
+    :param db: Database session
+    :type db: Session
+    :param columns: Brew columns to fetch
+    :type columns: Sequence[Any]
+    :param filters: Filter values
+    :type filters: Optional[BrewFilter]
+    :param batch_size: Number of rows fetched at a time
+    :type batch_size: int
+    :param user_id: ID of the user whose brews to export, or None for every
+        user
+    :type user_id: Optional[int]
+    :yield: Batches of row tuples
+    :rtype: Iterator[Sequence[Tuple]]
+    """
+    statement = (
+        select(*columns)
+        .where(*_owned_by(user_id), *_brew_filters(filters))
+        .order_by(Brew.created_at, Brew.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for partition in db.execute(statement).partitions():
+        yield [tuple(row) for row in partition]
+
+
+def create_brew(db: Session, brew: BrewCreate, user_id: int = DEFAULT_USER_ID) -> Brew:
     """Create a new brew record.
 
     :param db: Database session
     :type db: Session
     :param brew: Brew data to create
     :type brew: BrewCreate
+    :param user_id: ID of the user recording the brew
+    :type user_id: int
     :return: Created brew record
     :rtype: Brew
+    :raises InvalidImageError: If an inline image cannot be decoded
     """
-    db_brew = Brew(**brew.model_dump())
+    db_brew = Brew(**_brew_values(brew), user_id=user_id)
     db.add(db_brew)
+    if db_brew.image_hash is not None:
+        # The image URL embeds the ID, which is only known after the INSERT
+        db.flush()
+        db_brew.image_url = blobs.image_url_for(db_brew.id)
     db.commit()
+    invalidate_cache(user_id=user_id)
+    changes.change_feed.publish()
     db.refresh(db_brew)
     return db_brew
 
 
-def delete_brew(db: Session, brew_id: int) -> bool:
-    """Delete a brew record by ID.
+def _target(
+    brew_id: int, user_id: int, versions: Optional[Sequence[int]] = None
+) -> tuple:
+    """Build the WHERE clauses of a write to one brew that is not deleted.
+
+    :param brew_id: ID of the brew
+    :type brew_id: int
+    :param user_id: ID of the user the brew must belong to
+    :type user_id: int
+    :param versions: Versions the brew must be at, or None for any
+    :type versions: Optional[Sequence[int]]
+    :return: Clauses selecting the brew
+    :rtype: tuple
+    """
+    if versions is None:
+        return (Brew.id == brew_id, *_owned_by(user_id))
+    return (Brew.id == brew_id, *_owned_by(user_id), Brew.version.in_(versions))
+
+
+def _check_version_conflict(
+    db: Session, brew_id: int, user_id: int, versions: Optional[Sequence[int]]
+) -> None:
+    """Tell a version conflict from a missing brew after a write matched no row.
+
+    Only runs a query for conditional writes, which are the only ones that
+    can miss an existing brew.
+
+    :param db: Database session
+    :type db: Session
+    :param brew_id: ID of the brew
+    :type brew_id: int
+    :param user_id: ID of the user the brew must belong to
+    :type user_id: int
+    :param versions: Versions the write required, or None for any
+    :type versions: Optional[Sequence[int]]
+    :raises VersionConflictError: If the brew exists at another version
+    """
+    if versions is not None and db.scalar(
+        select(Brew.id).where(*_target(brew_id, user_id))
+    ):
+        raise VersionConflictError(brew_id)
+
+
+def tombstone_values() -> dict:
+    """Return the column values marking brews as deleted.
+
+    Deleted brews keep their row until purged, with a tombstone that every
+    read filters out. Their version is incremented like by any other write,
+    so the deletion is logged and conditional writes see it.
+
+    :return: Column values for an UPDATE of the deleted brews
+    :rtype: dict
+    """
+    return {
+        "deleted_at": datetime.now(timezone.utc).replace(tzinfo=None),
+        "version": Brew.version + 1,
+    }
+
+
+def delete_brew(
+    db: Session,
+    brew_id: int,
+    versions: Optional[Sequence[int]] = None,
+    user_id: int = DEFAULT_USER_ID,
+) -> bool:
+    """Delete a brew record by ID with a single UPDATE setting its tombstone.
 
     :param db: Database session
     :type db: Session
     :param brew_id: ID of the brew to delete
     :type brew_id: int
+    :param versions: Versions the brew must be at, from ``If-Match``, or
+        None to delete any version
+    :type versions: Optional[Sequence[int]]
+    :param user_id: ID of the user the brew must belong to
+    :type user_id: int
     :return: True if brew was deleted, False if not found
     :rtype: bool
+    :raises VersionConflictError: If the brew is at another version
     """
-    brew = db.query(Brew).filter(Brew.id == brew_id).first()
-    if brew:
-        db.delete(brew)
-        db.commit()
-        return True
-    return False
+    result = db.execute(
+        update(Brew)
+        .where(*_target(brew_id, user_id, versions))
+        .values(tombstone_values())
+        .execution_options(synchronize_session=False)
+    )
+    if not result.rowcount:
+        _check_version_conflict(db, brew_id, user_id, versions)
+        return False
+    db.commit()
+    invalidate_cache([brew_id], user_id)
+    changes.change_feed.publish()
+    return True
+
 
+def update_brew(
+    db: Session,
+    brew_id: int,
+    brew: Union[BrewCreate, BrewPatch],
+    versions: Optional[Sequence[int]] = None,
+    user_id: int = DEFAULT_USER_ID,
+) -> Optional[Any]:
+    """Update an existing brew record with a single UPDATE ... RETURNING.
 
-def update_brew(db: Session, brew_id: int, brew: BrewCreate) -> Optional[Brew]:
-    """Update an existing brew record.
+    Full updates write every field; a :class:`BrewPatch` only writes the
+    fields it sets, so unchanged columns are not rewritten. Either way the
+    version is incremented. An inline image is only stored once the brew
+    is found at a matching version.
 
     :param db: Database session
     :type db: Session
     :param brew_id: ID of the brew to update
     :type brew_id: int
-    :param brew: Updated brew data
-    :type brew: BrewCreate
-    :return: Updated brew record or None if not found
-    :rtype: Optional[Brew]
-    """
-    db_brew = db.query(Brew).filter(Brew.id == brew_id).first()
-    if db_brew:
-        for key, value in brew.model_dump().items():
-            setattr(db_brew, key, value)
-        db.commit()
-        db.refresh(db_brew)
-        return db_brew
-    return None
+    :param brew: Updated brew data, complete or partial
+    :type brew: Union[BrewCreate, BrewPatch]
+    :param versions: Versions the brew must be at, from ``If-Match``, or
+        None to update any version
+    :type versions: Optional[Sequence[int]]
+    :param user_id: ID of the user the brew must belong to
+    :type user_id: int
+    :return: Row of :data:`RESPONSE_COLUMNS` of the updated brew, or None if
+        not found
+    :rtype: Optional[Any]
+    :raises InvalidImageError: If an inline image cannot be decoded
+    :raises VersionConflictError: If the brew is at another version
+    """
+    uploads: List[bytes] = []
+    values = {**_brew_values(brew, brew_id, uploads), "version": Brew.version + 1}
+    row = db.execute(
+        update(Brew)
+        .where(*_target(brew_id, user_id, versions))
+        .values(values)
+        .returning(*RESPONSE_COLUMNS)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if row is None:
+        _check_version_conflict(db, brew_id, user_id, versions)
+        return None
+    _store_images(uploads)
+    db.commit()
+    invalidate_cache([brew_id], user_id)
+    changes.change_feed.publish()
+    return row
+
+
+def _chunks(items: Sequence[T], size: int) -> Iterator[Sequence[T]]:
+    """Split a sequence into consecutive chunks of at most ``size`` items.
+
+    :param items: Items to split
+    :type items: Sequence[T]
+    :param size: Maximum chunk size
+    :type size: int
+    :yield: Consecutive chunks
+    :rtype: Iterator[Sequence[T]]
+    """
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def _bulk_values(
+    items: Sequence[Tuple[int, BrewCreate]], result: BulkResult, user_id: int
+) -> List[Tuple[int, dict]]:
+    """Map a chunk of bulk items to column values.
+
+    Items whose inline image cannot be decoded are reported in ``result``
+    and left out.
+
+    :param items: Pairs of request position and brew data
+    :type items: Sequence[Tuple[int, BrewCreate]]
+    :param result: Bulk result collecting per-item errors
+    :type result: BulkResult
+    :param user_id: ID of the user owning the brews
+    :type user_id: int
+    :return: Pairs of request position and column values
+    :rtype: List[Tuple[int, dict]]
+    """
+    rows = []
+    for index, brew in items:
+        brew_id = getattr(brew, "id", None)
+        try:
+            values = _brew_values(brew, brew_id)
+        except blobs.InvalidImageError as exc:
+            result.errors.append(BulkItemError(index=index, detail=str(exc)))
+            continue
+        if brew_id is None:
+            values.pop("id", None)
+        values["user_id"] = user_id
+        rows.append((index, values))
+    return rows
+
+
+def _link_images(db: Session, ids: Sequence[int], rows: Sequence[dict]) -> None:
+    """Point newly inserted brews with a stored image at the image endpoint.
+
+    :param db: Database session
+    :type db: Session
+    :param ids: IDs assigned to the inserted rows
+    :type ids: Sequence[int]
+    :param rows: Column values of the inserted rows, in the same order
+    :type rows: Sequence[dict]
+    """
+    links = [
+        {"id": brew_id, "image_url": blobs.image_url_for(brew_id)}
+        for brew_id, values in zip(ids, rows)
+        if values.get("image_hash") is not None and values.get("image_url") is None
+    ]
+    if links:
+        db.execute(update(Brew), links)
+
+
+def bulk_create_brews(
+    db: Session,
+    items: Sequence[Tuple[int, BrewCreate]],
+    user_id: int = DEFAULT_USER_ID,
+) -> BulkResult:
+    """Create many brew records in a single transaction.
+
+    Rows are written in chunks of ``BULK_CHUNK_SIZE`` with one multi-row
+    INSERT per chunk, and committed once at the end.
+
+    :param db: Database session
+    :type db: Session
+    :param items: Pairs of request position and brew data
+    :type items: Sequence[Tuple[int, BrewCreate]]
+    :param user_id: ID of the user recording the brews
+    :type user_id: int
+    :return: IDs of the created brews and per-item errors
+    :rtype: BulkResult
+    """
+    result = BulkResult()
+    statement = insert(Brew).returning(Brew.id, sort_by_parameter_order=True)
+    for chunk in _chunks(items, settings.BULK_CHUNK_SIZE):
+        rows = [values for _, values in _bulk_values(chunk, result, user_id)]
+        if not rows:
+            continue
+        ids = db.execute(statement, rows).scalars().all()
+        _link_images(db, ids, rows)
+        result.ids.extend(ids)
+    db.commit()
+    invalidate_cache(user_id=user_id)
+    changes.change_feed.publish()
+    return result
+
+
+def _prune_ingests(db: Session, retention: float) -> None:
+    """Delete the records of provisional IDs older than the retention period.
+
+    :param db: Database session
+    :type db: Session
+    :param retention: Seconds records of provisional IDs are kept
+    :type retention: float
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    cutoff = now - timedelta(seconds=retention)
+    db.execute(delete(BrewIngest).where(BrewIngest.ingested_at < cutoff))
+
+
+def ingest_brews(
+    db: Session, items: Sequence[Tuple[str, int, BrewCreate]], retention: float = 3600
+) -> Tuple[Dict[str, int], Dict[str, str]]:
+    """Create a batch of brews from the ingestion queue in one transaction.
+
+    The provisional ID of each created brew is recorded in the same
+    transaction, so a batch replayed after a crash only creates the brews
+    that were not committed. Records older than ``retention`` seconds are
+    pruned.
+
+    :param db: Database session
+    :type db: Session
+    :param items: Provisional ID, ID of the user recording the brew and brew
+        data of each queued brew
+    :type items: Sequence[Tuple[str, int, BrewCreate]]
+    :param retention: Seconds records of provisional IDs are kept
+    :type retention: float
+    :return: IDs of the created brews and errors of the brews that could
+        not be created, by provisional ID
+    :rtype: Tuple[Dict[str, int], Dict[str, str]]
+    """
+    tokens = [token for token, _, _ in items]
+    created = dict(
+        db.execute(
+            select(BrewIngest.token, BrewIngest.brew_id).where(
+                BrewIngest.token.in_(tokens)
+            )
+        ).all()
+    )
+    pending = [item for item in items if item[0] not in created]
+    result = BulkResult()
+    rows = []
+    for index, (_, user_id, brew) in enumerate(pending):
+        rows += _bulk_values([(index, brew)], result, user_id)
+    failed = {pending[error.index][0]: error.detail for error in result.errors}
+    if rows:
+        values = [values for _, values in rows]
+        ids = (
+            db.execute(
+                insert(Brew).returning(Brew.id, sort_by_parameter_order=True), values
+            )
+            .scalars()
+            .all()
+        )
+        _link_images(db, ids, values)
+        ingested = {
+            pending[index][0]: brew_id for (index, _), brew_id in zip(rows, ids)
+        }
+        db.execute(
+            insert(BrewIngest),
+            [{"token": token, "brew_id": i} for token, i in ingested.items()],
+        )
+        created.update(ingested)
+    _prune_ingests(db, retention)
+    db.commit()
+    for user_id in {values["user_id"] for _, values in rows}:
+        invalidate_cache(user_id=user_id)
+    if rows:
+        changes.change_feed.publish()
+    return created, failed
+
+
+def _foreign_ids(db: Session, brew_ids: Sequence[int], user_id: int) -> set:
+    """Find which of some brew IDs are taken by other users' brews.
+
+    :param db: Database session
+    :type db: Session
+    :param brew_ids: IDs of brews
+    :type brew_ids: Sequence[int]
+    :param user_id: ID of the user writing the brews
+    :type user_id: int
+    :return: IDs of brews belonging to another user
+    :rtype: set
+    """
+    if not brew_ids:
+        return set()
+    return set(
+        db.scalars(
+            select(Brew.id).where(Brew.id.in_(brew_ids), Brew.user_id != user_id)
+        )
+    )
+
+
+def bulk_upsert_brews(
+    db: Session,
+    items: Sequence[Tuple[int, BrewUpsert]],
+    user_id: int = DEFAULT_USER_ID,
+) -> BulkResult:
+    """Create or replace many brew records in a single transaction.
+
+    Items with an ``id`` overwrite the user's existing brew with that ID or
+    create it; items whose ID belongs to another user's brew are reported
+    as errors. Items without one are created. Rows are written in chunks
+    with one multi-row ``INSERT ... ON CONFLICT DO UPDATE`` per group of rows
+    setting the same columns.
+
+    :param db: Database session
+    :type db: Session
+    :param items: Pairs of request position and brew data
+    :type items: Sequence[Tuple[int, BrewUpsert]]
+    :param user_id: ID of the user writing the brews
+    :type user_id: int
+    :return: IDs of the written brews, in request order, and per-item errors
+    :rtype: BulkResult
+    """
+    # Imported here so that SQLite deployments never load the PostgreSQL dialect
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects import postgresql as dialect
+    else:
+        from sqlalchemy.dialects import sqlite as dialect
+    result = BulkResult()
+    written = []
+    for chunk in _chunks(items, settings.BULK_CHUNK_SIZE):
+        foreign = _foreign_ids(
+            db, [brew.id for _, brew in chunk if brew.id is not None], user_id
+        )
+        groups = {}
+        for index, values in _bulk_values(chunk, result, user_id):
+            if values.get("id") in foreign:
+                result.errors.append(
+                    BulkItemError(index=index, detail="Brew ID is not available")
+                )
+                continue
+            groups.setdefault(frozenset(values), []).append((index, values))
+        for columns, group in groups.items():
+            statement = dialect.insert(Brew)
+            statement = statement.on_conflict_do_update(
+                index_elements=[Brew.id],
+                set_={
+                    **{
+                        name: statement.excluded[name]
+                        for name in columns
+                        if name != "id"
+                    },
+                    "updated_at": datetime.now(timezone.utc).replace(tzinfo=None),
+                    "version": Brew.version + 1,
+                    # Replacing a deleted brew restores it
+                    "deleted_at": None,
+                },
+            ).returning(Brew.id, sort_by_parameter_order=True)
+            rows = [values for _, values in group]
+            ids = db.execute(statement, rows).scalars().all()
+            _link_images(db, ids, rows)
+            written.extend((index, brew_id) for (index, _), brew_id in zip(group, ids))
+    db.commit()
+    result.ids = [brew_id for _, brew_id in sorted(written)]
+    invalidate_cache(result.ids, user_id)
+    changes.change_feed.publish()
+    return result
+
+
+def bulk_delete_brews(
+    db: Session, items: Sequence[Tuple[int, int]], user_id: int = DEFAULT_USER_ID
+) -> BulkResult:
+    """Delete many brew records in a single transaction, setting tombstones.
+
+    :param db: Database session
+    :type db: Session
+    :param items: Pairs of request position and brew ID
+    :type items: Sequence[Tuple[int, int]]
+    :param user_id: ID of the user the brews must belong to
+    :type user_id: int
+    :return: IDs of the deleted brews and errors for IDs not found
+    :rtype: BulkResult
+    """
+    result = BulkResult()
+    for chunk in _chunks(items, settings.BULK_CHUNK_SIZE):
+        deleted = set(
+            db.execute(
+                update(Brew)
+                .where(
+                    Brew.id.in_([brew_id for _, brew_id in chunk]), *_owned_by(user_id)
+                )
+                .values(tombstone_values())
+                .returning(Brew.id)
+                .execution_options(synchronize_session=False)
+            ).scalars()
+        )
+        for index, brew_id in chunk:
+            if brew_id in deleted:
+                deleted.discard(brew_id)
+                result.ids.append(brew_id)
+            else:
+                result.errors.append(
+                    BulkItemError(index=index, detail="Brew not found")
+                )
+    db.commit()
+    invalidate_cache(result.ids, user_id)
+    changes.change_feed.publish()
+    return result
+
+
+def bulk_undelete_brews(
+    db: Session, items: Sequence[Tuple[int, int]], user_id: int = DEFAULT_USER_ID
+) -> BulkResult:
+    """Restore many deleted brew records in a single transaction.
+
+    Deleted brews can be restored until they are purged, with their version
+    incremented.
+
+    :param db: Database session
+    :type db: Session
+    :param items: Pairs of request position and brew ID
+    :type items: Sequence[Tuple[int, int]]
+    :param user_id: ID of the user the brews must belong to
+    :type user_id: int
+    :return: IDs of the restored brews and errors for IDs not found deleted
+    :rtype: BulkResult
+    """
+    result = BulkResult()
+    for chunk in _chunks(items, settings.BULK_CHUNK_SIZE):
+        restored = set(
+            db.execute(
+                update(Brew)
+                .where(
+                    Brew.id.in_([brew_id for _, brew_id in chunk]),
+                    Brew.user_id == user_id,
+                    Brew.deleted_at.isnot(None),
+                )
+                .values(deleted_at=None, version=Brew.version + 1)
+                .returning(Brew.id)
+                .execution_options(synchronize_session=False)
+            ).scalars()
+        )
+        for index, brew_id in chunk:
+            if brew_id in restored:
+                restored.discard(brew_id)
+                result.ids.append(brew_id)
+            else:
+                result.errors.append(
+                    BulkItemError(index=index, detail="Deleted brew not found")
+                )
+    db.commit()
+    invalidate_cache(result.ids, user_id)
+    changes.change_feed.publish()
+    return result
+
+
+def _apply_sync_write(
+    db: Session, index: int, write: SyncWrite, user_id: int
+) -> SyncWriteResult:
+    """Apply one write queued by an offline client, without committing.
+
+    :param db: Database session
+    :type db: Session
+    :param index: Position of the write in the request
+    :type index: int
+    :param write: Queued write
+    :type write: SyncWrite
+    :param user_id: ID of the user writing
+    :type user_id: int
+    :return: Outcome of the write
+    :rtype: SyncWriteResult
+    :raises InvalidImageError: If an inline image cannot be decoded
+    """
+    if write.op == "create":
+        if write.client_id is not None:
+            brew_id = db.scalar(
+                select(BrewSyncCreate.brew_id).where(
+                    BrewSyncCreate.user_id == user_id,
+                    BrewSyncCreate.client_id == write.client_id,
+                )
+            )
+            if brew_id is not None:
+                return SyncWriteResult(index=index, status="applied", id=brew_id)
+        values = {**_brew_values(write.brew), "user_id": user_id}
+        brew_id = db.scalar(insert(Brew).values(values).returning(Brew.id))
+        _link_images(db, [brew_id], [values])
+        if write.client_id is not None:
+            db.execute(
+                insert(BrewSyncCreate).values(
+                    user_id=user_id, client_id=write.client_id, brew_id=brew_id
+                )
+            )
+        return SyncWriteResult(index=index, status="applied", id=brew_id)
+    uploads: List[bytes] = []
+    if write.op == "update":
+        values = {
+            **_brew_values(write.brew, write.id, uploads),
+            "version": Brew.version + 1,
+        }
+    else:
+        values = tombstone_values()
+    versions = None if write.base_version is None else [write.base_version]
+    written = db.scalar(
+        update(Brew)
+        .where(*_target(write.id, user_id, versions))
+        .values(values)
+        .returning(Brew.id)
+        .execution_options(synchronize_session=False)
+    )
+    if written is not None:
+        _store_images(uploads)
+        return SyncWriteResult(index=index, status="applied", id=written)
+    current = get_brew(db, write.id, RESPONSE_COLUMNS, user_id)
+    if current is None:
+        return SyncWriteResult(index=index, status="not_found", id=write.id)
+    return SyncWriteResult(
+        index=index,
+        status="conflict",
+        id=write.id,
+        brew=BrewSchema.model_validate(current),
+    )
+
+
+def apply_sync_writes(
+    db: Session, items: Sequence[Tuple[int, SyncWrite]], user_id: int = DEFAULT_USER_ID
+) -> List[SyncWriteResult]:
+    """Apply the writes an offline client queued, in order, in one transaction.
+
+    Updates and deletes with a ``base_version`` only apply to a brew still
+    at that version; otherwise they are reported as conflicts along with
+    the current brew, for the client to reconcile. Creates with a
+    ``client_id`` record it for ``SYNC_CLIENT_RETENTION_DAYS``, so a batch
+    sent again after its response was lost creates each brew once.
+
+    :param db: Database session
+    :type db: Session
+    :param items: Pairs of request position and queued write
+    :type items: Sequence[Tuple[int, SyncWrite]]
+    :param user_id: ID of the user writing
+    :type user_id: int
+    :return: Outcome of each write, in request order
+    :rtype: List[SyncWriteResult]
+    """
+    results = []
+    for index, write in items:
+        try:
+            results.append(_apply_sync_write(db, index, write, user_id))
+        except blobs.InvalidImageError as exc:
+            results.append(
+                SyncWriteResult(index=index, status="invalid", detail=str(exc))
+            )
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(
+        days=settings.SYNC_CLIENT_RETENTION_DAYS
+    )
+    db.execute(delete(BrewSyncCreate).where(BrewSyncCreate.created_at < cutoff))
+    db.commit()
+    written = [r.id for r in results if r.status == "applied" and r.id is not None]
+    invalidate_cache(written, user_id)
+    if written:
+        changes.change_feed.publish()
+    return results
+
+
+def purge_brews(db: Session, before: datetime, limit: int = 1000) -> int:
+    """Remove up to ``limit`` brews deleted before a given time, for good.
+
+    Purging in batches keeps each write transaction short. The deletions
+    were logged when the tombstones were set, so purges are not.
+
+    :param db: Database session
+    :type db: Session
+    :param before: Brews deleted earlier are purged
+    :type before: datetime
+    :param limit: Maximum number of brews to purge
+    :type limit: int
+    :return: Number of brews purged
+    :rtype: int
+    """
+    purged = (
+        select(Brew.id).where(Brew.deleted_at < before).limit(limit).scalar_subquery()
+    )
+    result = db.execute(
+        delete(Brew)
+        .where(Brew.id.in_(purged))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+def encode_archived_brew(values: Dict[str, Any]) -> bytes:
+    """Compress the columns of a brew for the archive.
+
+    :param values: Column values of the brew, by name
+    :type values: Dict[str, Any]
+    :return: zlib-compressed JSON object
+    :rtype: bytes
+    """
+    return zlib.compress(orjson.dumps(values))
+
+
+def decode_archived_brew(data: bytes) -> Dict[str, Any]:
+    """Decompress the columns of an archived brew.
+
+    :param data: Value of :attr:`ArchivedBrew.data`
+    :type data: bytes
+    :return: Column values of the brew, by name, with timestamps as ISO 8601
+        strings
+    :rtype: Dict[str, Any]
+    """
+    return orjson.loads(zlib.decompress(data))
+
+
+def archive_brews(db: Session, before: datetime, limit: int = 1000) -> int:
+    """Move up to ``limit`` brews created before a given time to the archive.
+
+    The brews are copied to ``brew_archive`` and removed from ``brews`` in
+    one transaction. Their removal is logged as an archival, so they also
+    leave the rollups and the similarity index, but not as a deletion, so
+    sync clients keep them.
+
+    :param db: Database session
+    :type db: Session
+    :param before: Brews created earlier are archived
+    :type before: datetime
+    :param limit: Maximum number of brews to archive
+    :type limit: int
+    :return: Number of brews archived
+    :rtype: int
+    """
+    rows = (
+        db.execute(
+            select(Brew.__table__)
+            .where(Brew.deleted_at.is_(None), Brew.created_at < before)
+            .order_by(Brew.created_at)
+            .limit(limit)
+        )
+        .mappings()
+        .all()
+    )
+    if not rows:
+        return 0
+    db.execute(
+        insert(ArchivedBrew),
+        [
+            {
+                "brew_id": row["id"],
+                "user_id": row["user_id"],
+                "created_at": row["created_at"],
+                "data": encode_archived_brew(dict(row)),
+            }
+            for row in rows
+        ],
+    )
+    db.execute(
+        delete(Brew)
+        .where(Brew.id.in_([row["id"] for row in rows]))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    users: Dict[int, List[int]] = {}
+    for row in rows:
+        users.setdefault(row["user_id"], []).append(row["id"])
+    for user_id, brew_ids in users.items():
+        invalidate_cache(brew_ids, user_id)
+    changes.change_feed.publish()
+    return len(rows)
+
+
+def get_archived_brews(
+    db: Session,
+    limit: int = 100,
+    after: Optional[BrewCursor] = None,
+    user_id: int = DEFAULT_USER_ID,
+) -> List[Any]:
+    """Retrieve a page of a user's archived brews, newest first.
+
+    :param db: Database session
+    :type db: Session
+    :param limit: Maximum number of brews to return
+    :type limit: int
+    :param after: ``(created_at, id)`` of the last archived brew already
+        seen, as encoded by :func:`encode_brew_cursor`
+    :type after: Optional[BrewCursor]
+    :param user_id: ID of the user whose archived brews to list
+    :type user_id: int
+    :return: Rows of the archive ``id``, ``created_at`` and ``data``
+    :rtype: List[Any]
+    """
+    clauses = [ArchivedBrew.user_id == user_id]
+    if after is not None:
+        created_at, archive_id = after
+        clauses += [
+            ArchivedBrew.created_at <= created_at,
+            or_(
+                ArchivedBrew.created_at < created_at,
+                and_(
+                    ArchivedBrew.created_at == created_at,
+                    ArchivedBrew.id < archive_id,
+                ),
+            ),
+        ]
+    return db.execute(
+        select(ArchivedBrew.id, ArchivedBrew.created_at, ArchivedBrew.data)
+        .where(*clauses)
+        .order_by(ArchivedBrew.created_at.desc(), ArchivedBrew.id.desc())
+        .limit(limit)
+    ).all()
@@ -0,0 +1,301 @@
+"""Async database CRUD operations for brew records.
+
+This module mirrors the core operations of :mod:`app.crud.brew` on an
+``AsyncSession``, sharing its query building blocks so both stacks return
+the same results. Blob store writes for inline images run in a worker
+thread so they do not block the event loop.
+"""
+
+import asyncio
+from typing import Any, List, Optional, Sequence, Tuple, Union
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import blobs, changes
+from app.core.users import DEFAULT_USER_ID
+from app.crud.brew import (
+    RESPONSE_COLUMNS,
+    SEARCH_ORDER,
+    BrewCursor,
+    SearchCursor,
+    VersionConflictError,
+    _brew_values,
+    _listing_filter,
+    _match_expression,
+    _owned_by,
+    _search_filter,
+    _store_images,
+    _target,
+    invalidate_cache,
+    list_order,
+    tombstone_values,
+)
+from app.models.brew import Brew, brews_fts
+from app.schemas.brew import BrewCreate, BrewFilter, BrewPatch
+
+
+async def _brew_values_async(
+    brew: Union[BrewCreate, BrewPatch],
+    brew_id: Optional[int] = None,
+    uploads: Optional[List[bytes]] = None,
+) -> dict:
+    """Map validated brew data to column values without blocking the loop.
+
+    :param brew: Validated brew data
+    :type brew: Union[BrewCreate, BrewPatch]
+    :param brew_id: ID of the brew being updated, if any
+    :type brew_id: Optional[int]
+    :param uploads: List collecting inline images to store once the write
+        matches a brew, or None to store them right away
+    :type uploads: Optional[List[bytes]]
+    :return: Column values for the brew record
+    :rtype: dict
+    :raises InvalidImageError: If an inline image cannot be decoded
+    """
+    if blobs.is_data_url(brew.image_url):
+        return await asyncio.to_thread(_brew_values, brew, brew_id, uploads)
+    return _brew_values(brew, brew_id, uploads)
+
+
+async def get_brew(
+    db: AsyncSession,
+    brew_id: int,
+    columns: Sequence[Any] = (),
+    user_id: int = DEFAULT_USER_ID,
+) -> Optional[Any]:
+    """Retrieve a single brew record by ID.
+
+    :param db: Async database session
+    :type db: AsyncSession
+    :param brew_id: ID of the brew to retrieve
+    :type brew_id: int
+    :param columns: Columns to select instead of the whole record, such as
+        returned by :func:`app.crud.brew.response_columns`
+    :type columns: Sequence[Any]
+    :param user_id: ID of the user the brew must belong to
+    :type user_id: int
+    :return: Found brew record, or row when ``columns`` are given, or None
+    :rtype: Optional[Any]
+    """
+    statement = select(*columns or (Brew,)).where(*_target(brew_id, user_id))
+    if columns:
+        return (await db.execute(statement)).first()
+    return await db.scalar(statement)
+
+
+async def get_brews(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    after: Optional[BrewCursor] = None,
+    filters: Optional[BrewFilter] = None,
+    sort: str = "created_at",
+    descending: bool = True,
+    columns: Sequence[Any] = (),
+    user_id: int = DEFAULT_USER_ID,
+) -> List[Any]:
+    """Retrieve a list of a user's brew records with pagination.
+
+    :param db: Async database session
+    :type db: AsyncSession
+    :param skip: Number of records to skip
+    :type skip: int
+    :param limit: Maximum number of records to return
+    :type limit: int
+    :param after: ``(sort value, id)`` of the last brew already seen
+    :type after: Optional[BrewCursor]
+    :param filters: Filter values
+    :type filters: Optional[BrewFilter]
+    :param sort: Name of the column to sort by
+    :type sort: str
+    :param descending: Whether the largest values come first
+    :type descending: bool
+    :param columns: Columns to select instead of whole records, such as
+        :data:`app.crud.brew.RESPONSE_COLUMNS`
+    :type columns: Sequence[Any]
+    :param user_id: ID of the user whose brews to list
+    :type user_id: int
+    :return: List of brew records, or of rows when ``columns`` are given
+    :rtype: List[Any]
+    """
+    statement = (
+        select(*columns or (Brew,))
+        .where(
+            *_owned_by(user_id),
+            *_listing_filter(filters, after, sort, descending),
+        )
+        .order_by(*list_order(sort, descending))
+        .offset(skip)
+        .limit(limit)
+    )
+    if columns:
+        return list((await db.execute(statement)).all())
+    return list((await db.scalars(statement)).all())
+
+
+async def search_brews(
+    db: AsyncSession,
+    query: str,
+    limit: int = 100,
+    after: Optional[SearchCursor] = None,
+    user_id: int = DEFAULT_USER_ID,
+) -> List[Tuple[Brew, float]]:
+    """Full-text search over bean type, brew type and details of a user's brews.
+
+    :param db: Async database session
+    :type db: AsyncSession
+    :param query: Free-text search query
+    :type query: str
+    :param limit: Maximum number of records to return
+    :type limit: int
+    :param after: ``(rank, id)`` of the last result already seen
+    :type after: Optional[SearchCursor]
+    :param user_id: ID of the user whose brews to search
+    :type user_id: int
+    :return: Matching brew records paired with their rank
+    :rtype: List[Tuple[Brew, float]]
+    """
+    match = _match_expression(query)
+    if match is None:
+        return []
+    statement = (
+        select(Brew, brews_fts.c.rank)
+        .join(brews_fts, brews_fts.c.rowid == Brew.id)
+        .where(*_owned_by(user_id), *_search_filter(match, after))
+        .order_by(*SEARCH_ORDER)
+        .limit(limit)
+    )
+    return [tuple(row) for row in await db.execute(statement)]
+
+
+async def create_brew(
+    db: AsyncSession, brew: BrewCreate, user_id: int = DEFAULT_USER_ID
+) -> Brew:
+    """Create a new brew record.
+
+    :param db: Async database session
+    :type db: AsyncSession
+    :param brew: Brew data to create
+    :type brew: BrewCreate
+    :param user_id: ID of the user recording the brew
+    :type user_id: int
+    :return: Created brew record
+    :rtype: Brew
+    :raises InvalidImageError: If an inline image cannot be decoded
+    """
+    db_brew = Brew(**await _brew_values_async(brew), user_id=user_id)
+    db.add(db_brew)
+    if db_brew.image_hash is not None:
+        # The image URL embeds the ID, which is only known after the INSERT
+        await db.flush()
+        db_brew.image_url = blobs.image_url_for(db_brew.id)
+    await db.commit()
+    invalidate_cache(user_id=user_id)
+    changes.change_feed.publish()
+    await db.refresh(db_brew)
+    return db_brew
+
+
+async def _check_version_conflict(
+    db: AsyncSession, brew_id: int, user_id: int, versions: Optional[Sequence[int]]
+) -> None:
+    """Tell a version conflict from a missing brew after a write matched no row.
+
+    :param db: Async database session
+    :type db: AsyncSession
+    :param brew_id: ID of the brew
+    :type brew_id: int
+    :param user_id: ID of the user the brew must belong to
+    :type user_id: int
+    :param versions: Versions the write required, or None for any
+    :type versions: Optional[Sequence[int]]
+    :raises VersionConflictError: If the brew exists at another version
+    """
+    if versions is not None and await db.scalar(
+        select(Brew.id).where(*_target(brew_id, user_id))
+    ):
+        raise VersionConflictError(brew_id)
+
+
+async def delete_brew(
+    db: AsyncSession,
+    brew_id: int,
+    versions: Optional[Sequence[int]] = None,
+    user_id: int = DEFAULT_USER_ID,
+) -> bool:
+    """Delete a brew record by ID with a single UPDATE setting its tombstone.
+
+    :param db: Async database session
+    :type db: AsyncSession
+    :param brew_id: ID of the brew to delete
+    :type brew_id: int
+    :param versions: Versions the brew must be at, or None for any
+    :type versions: Optional[Sequence[int]]
+    :param user_id: ID of the user the brew must belong to
+    :type user_id: int
+    :return: True if brew was deleted, False if not found
+    :rtype: bool
+    :raises VersionConflictError: If the brew is at another version
+    """
+    result = await db.execute(
+        update(Brew)
+        .where(*_target(brew_id, user_id, versions))
+        .values(tombstone_values())
+        .execution_options(synchronize_session=False)
+    )
+    if not result.rowcount:
+        await _check_version_conflict(db, brew_id, user_id, versions)
+        return False
+    await db.commit()
+    invalidate_cache([brew_id], user_id)
+    changes.change_feed.publish()
+    return True
+
+
+async def update_brew(
+    db: AsyncSession,
+    brew_id: int,
+    brew: Union[BrewCreate, BrewPatch],
+    versions: Optional[Sequence[int]] = None,
+    user_id: int = DEFAULT_USER_ID,
+) -> Optional[Any]:
+    """Update an existing brew record with a single UPDATE ... RETURNING.
+
+    :param db: Async database session
+    :type db: AsyncSession
+    :param brew_id: ID of the brew to update
+    :type brew_id: int
+    :param brew: Updated brew data, complete or partial
+    :type brew: Union[BrewCreate, BrewPatch]
+    :param versions: Versions the brew must be at, or None for any
+    :type versions: Optional[Sequence[int]]
+    :param user_id: ID of the user the brew must belong to
+    :type user_id: int
+    :return: Row of :data:`~app.crud.brew.RESPONSE_COLUMNS` of the updated
+        brew, or None if not found
+    :rtype: Optional[Any]
+    :raises InvalidImageError: If an inline image cannot be decoded
+    :raises VersionConflictError: If the brew is at another version
+    """
+    uploads: List[bytes] = []
+    values = await _brew_values_async(brew, brew_id, uploads)
+    values["version"] = Brew.version + 1
+    row = (
+        await db.execute(
+            update(Brew)
+            .where(*_target(brew_id, user_id, versions))
+            .values(values)
+            .returning(*RESPONSE_COLUMNS)
+            .execution_options(synchronize_session=False)
+        )
+    ).first()
+    if row is None:
+        await _check_version_conflict(db, brew_id, user_id, versions)
+        return None
+    if uploads:
+        await asyncio.to_thread(_store_images, uploads)
+    await db.commit()
+    invalidate_cache([brew_id], user_id)
+    changes.change_feed.publish()
+    return row
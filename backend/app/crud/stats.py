@@ -0,0 +1,174 @@
+"""Aggregate statistics over brew records.
+
+Statistics cover the live brews of one user, neither deleted nor archived,
+and are computed by the database, never by loading brews into Python.
+Counts and means come from the ``brew_rollups`` table, which triggers keep
+up to date on every write, so reading them costs one row per group.
+Percentiles cannot be maintained incrementally; they are computed on
+request with window functions, returning one row per group and
+percentile. On databases without the rollup triggers, means are computed
+with a ``GROUP BY`` over ``brews``.
+"""
+
+from typing import Dict, List, Sequence
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from app.core.users import DEFAULT_USER_ID
+from app.models.brew import Brew, BrewRollup, brew_ratio
+
+#: Grouping key of each statistics dimension
+STATS_DIMENSIONS = {
+    "brew_type": func.coalesce(Brew.brew_type, ""),
+    "bean_type": func.coalesce(Brew.bean_type, ""),
+    "day": func.coalesce(func.date(Brew.created_at), ""),
+}
+
+#: Expression of each metric summarized by the statistics
+STATS_METRICS = {
+    "water_temp": Brew.water_temp,
+    "ratio": brew_ratio,
+    "bloom_time": Brew.bloom_time,
+    "brew_seconds": Brew.brew_seconds,
+}
+
+
+def _percentile_rank(size: int, percentile: int) -> int:
+    """Return the nearest-rank position of a percentile in a sorted group.
+
+    :param size: Number of values in the group
+    :type size: int
+    :param percentile: Percentile between 0 and 100
+    :type percentile: int
+    :return: 1-based position of the percentile value
+    :rtype: int
+    """
+    return max(1, (size * percentile + 99) // 100)
+
+
+def _means(db: Session, group_by: str, user_id: int) -> Dict[str, dict]:
+    """Count a user's brews and average each metric per group.
+
+    :param db: Database session
+    :type db: Session
+    :param group_by: Statistics dimension
+    :type group_by: str
+    :param user_id: ID of the user whose brews to summarize
+    :type user_id: int
+    :return: Count and metric means keyed by group
+    :rtype: Dict[str, dict]
+    """
+    groups = {}
+    if db.get_bind().dialect.name == "sqlite":
+        rollups = (
+            db.query(BrewRollup)
+            .filter(BrewRollup.user_id == user_id, BrewRollup.dimension == group_by)
+            .order_by(BrewRollup.key)
+        )
+        for rollup in rollups:
+            groups[rollup.key] = {"key": rollup.key, "count": rollup.count}
+            for name in STATS_METRICS:
+                known = getattr(rollup, f"{name}_count")
+                total = getattr(rollup, f"{name}_sum")
+                groups[rollup.key][name] = {
+                    "mean": total / known if known else None,
+                    "percentiles": {},
+                }
+        return groups
+    key = STATS_DIMENSIONS[group_by]
+    statement = (
+        select(
+            key,
+            func.count(),
+            *(func.avg(metric) for metric in STATS_METRICS.values()),
+        )
+        .where(Brew.user_id == user_id, Brew.deleted_at.is_(None))
+        .group_by(key)
+        .order_by(key)
+    )
+    for group, count, *means in db.execute(statement):
+        groups[group] = {"key": group, "count": count}
+        for name, mean in zip(STATS_METRICS, means):
+            groups[group][name] = {"mean": mean, "percentiles": {}}
+    return groups
+
+
+def _add_percentiles(
+    db: Session,
+    groups: Dict[str, dict],
+    group_by: str,
+    percentiles: Sequence[int],
+    user_id: int,
+) -> None:
+    """Compute metric percentiles per group and add them to the groups.
+
+    Values are ranked within each group by a window function and only the
+    rows at the requested nearest-rank positions are returned.
+
+    :param db: Database session
+    :type db: Session
+    :param groups: Statistics keyed by group, updated in place
+    :type groups: Dict[str, dict]
+    :param group_by: Statistics dimension
+    :type group_by: str
+    :param percentiles: Percentiles between 0 and 100
+    :type percentiles: Sequence[int]
+    :param user_id: ID of the user whose brews to summarize
+    :type user_id: int
+    """
+    key = STATS_DIMENSIONS[group_by]
+    for name, metric in STATS_METRICS.items():
+        ranked = (
+            select(
+                key.label("key"),
+                metric.label("value"),
+                func.row_number()
+                .over(partition_by=key, order_by=metric)
+                .label("position"),
+                func.count().over(partition_by=key).label("size"),
+            )
+            .where(
+                Brew.user_id == user_id, Brew.deleted_at.is_(None), metric.isnot(None)
+            )
+            .subquery()
+        )
+        positions = [
+            (ranked.c.size * percentile + 99) // 100 if percentile else 1
+            for percentile in percentiles
+        ]
+        statement = select(
+            ranked.c.key, ranked.c.value, ranked.c.position, ranked.c.size
+        ).where(or_(*(ranked.c.position == position for position in positions)))
+        for group, value, position, size in db.execute(statement):
+            if group not in groups:
+                continue
+            for percentile in percentiles:
+                if _percentile_rank(size, percentile) == position:
+                    groups[group][name]["percentiles"][percentile] = value
+
+
+def get_brew_stats(
+    db: Session,
+    group_by: str = "brew_type",
+    percentiles: Sequence[int] = (),
+    user_id: int = DEFAULT_USER_ID,
+) -> List[dict]:
+    """Summarize a user's brews per group.
+
+    :param db: Database session
+    :type db: Session
+    :param group_by: Statistics dimension: "brew_type", "bean_type" or "day"
+    :type group_by: str
+    :param percentiles: Percentiles between 0 and 100 to compute per metric
+    :type percentiles: Sequence[int]
+    :param user_id: ID of the user whose brews to summarize
+    :type user_id: int
+    :return: Count, and mean and percentiles of each metric, per group,
+        ordered by group key
+    :rtype: List[dict]
+    """
+    groups = _means(db, group_by, user_id)
+    if percentiles and groups:
+        _add_percentiles(db, groups, group_by, percentiles, user_id)
+    return list(groups.values())
@@ -1,39 +1,140 @@
 """FastAPI application entry point for the BrewLog API.
 
-This module initializes and configures the FastAPI application, including:
-    - Database initialization
+This module builds and configures the FastAPI application, including:
+    - Database migrations at startup
     - CORS configuration
+    - Response compression
+    - Request metrics and profiling
     - API route registration
 
+Importing it neither reads the settings nor touches the database:
+:func:`create_app` reads the settings, and the database schema is brought
+up to date when the application starts serving. The ``app`` attribute,
+used by ``uvicorn app.main:app``, is built on first access.
+
 The application provides a RESTful API for managing coffee brewing records.
 """
 
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Any, AsyncIterator, Callable
+
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.api.v1.endpoints import brews
+from app.api import metrics as metrics_api
+from app.api.v1.endpoints import brews, sync
+from app.core import ingest, maintenance
+from app.core.compression import CompressionMiddleware
 from app.core.config import settings
-from app.core.database import engine
-from app.models import brew as brew_model
-
-# Initialize database tables if they don't exist
-brew_model.Base.metadata.create_all(bind=engine)
-
-# Initialize FastAPI application with metadata
-app = FastAPI(
-    title="Coffee Brewing API",
-    description="API for tracking coffee brewing parameters and recipes",
-    version="1.0.0",
-)
-
-# Configure CORS middleware to allow frontend communication
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000"],  # React frontend default port
-    allow_credentials=True,
-    allow_methods=["*"],  # Allow all HTTP methods
-    allow_headers=["*"],  # Allow all headers
-)
-
-# Register API routes with version prefix
-app.include_router(brews.router, prefix=settings.API_V1_STR)
+from app.core.database import get_engines
+from app.core.metrics import MetricsMiddleware
+from app.core.migrations import run_migrations
+from app.core.users import UserVaryMiddleware
+
+
+def _lifespan(migrate: bool) -> Callable[[FastAPI], Any]:
+    """Build the lifespan handler of the application.
+
+    The ingestion writer and the maintenance worker, when enabled, run
+    while the application serves.
+
+    :param migrate: Whether to migrate the databases at startup
+    :type migrate: bool
+    :return: Lifespan context manager factory
+    :rtype: Callable[[FastAPI], Any]
+    """
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+        if migrate:
+            # The engines are blocking, so keep them off the event loop
+            for engine in get_engines():
+                await run_in_threadpool(run_migrations, engine)
+        writer = ingest.start_writer() if settings.INGEST_ENABLED else None
+        worker = None
+        if settings.MAINTENANCE_ENABLED:
+            worker = maintenance.start_worker()
+        yield
+        if writer is not None:
+            await run_in_threadpool(writer.stop)
+        if worker is not None:
+            await run_in_threadpool(worker.stop)
+
+    return lifespan
+
+
+def create_app(migrate: bool = True) -> FastAPI:
+    """Create and configure the FastAPI application.
+
+    :param migrate: Whether to bring the database schema up to date at
+        startup; tests that provide their own database pass False so the
+        application never opens the configured one
+    :type migrate: bool
+    :return: Configured application
+    :rtype: FastAPI
+    """
+    app = FastAPI(
+        title="Coffee Brewing API",
+        description="API for tracking coffee brewing parameters and recipes",
+        version="1.0.0",
+        lifespan=_lifespan(migrate),
+    )
+
+    # Configure CORS middleware to allow frontend communication
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:3000"],  # React frontend default port
+        allow_credentials=True,
+        allow_methods=["*"],  # Allow all HTTP methods
+        allow_headers=["*"],  # Allow all headers
+        # Let the frontend read pagination cursors and entity tags
+        expose_headers=["X-Next-Cursor", "ETag"],
+    )
+
+    # Compress responses the cache has not already compressed
+    app.add_middleware(CompressionMiddleware)
+
+    # Keep shared caches from serving one user's responses to another
+    app.add_middleware(UserVaryMiddleware)
+
+    # Time every request, including CORS handling, and serve the metrics
+    if settings.METRICS_ENABLED:
+        app.add_middleware(MetricsMiddleware)
+        app.include_router(metrics_api.router)
+
+    # Register API routes with version prefix. The async router shadows the
+    # core sync brew routes, so it must be registered first. It is only
+    # imported when enabled.
+    if settings.USE_ASYNC_DB:
+        from app.api.v1.endpoints import brews_async
+
+        app.include_router(brews_async.router, prefix=settings.API_V1_STR)
+    app.include_router(brews.router, prefix=settings.API_V1_STR)
+    app.include_router(sync.router, prefix=settings.API_V1_STR)
+    return app
+
+
+@lru_cache()
+def get_app() -> FastAPI:
+    """Create the application served by ``uvicorn app.main:app``.
+
+    :return: Configured application
+    :rtype: FastAPI
+    """
+    return create_app()
+
+
+def __getattr__(name: str) -> Any:
+    """Resolve ``app`` lazily, so importing reads no settings.
+
+    :param name: Module attribute name
+    :type name: str
+    :return: Attribute value
+    :rtype: Any
+    :raises AttributeError: If the attribute does not exist
+    """
+    if name == "app":
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
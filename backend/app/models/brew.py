@@ -5,9 +5,77 @@ This module defines the database schema for storing brew information including
 parameters, timing, and optional details.
 """
 
-from sqlalchemy import Column, DateTime, Float, Integer, String, func
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    Float,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    column,
+    func,
+    table,
+    text,
+)
+from sqlalchemy.orm import validates
 
 from app.core.database import Base
+from app.core.users import DEFAULT_USER_ID
+
+
+def _utcnow() -> datetime:
+    """Return the current UTC time as a naive datetime.
+
+    Timestamps are set client-side so they carry microseconds and share the
+    storage format of bound parameters, which keyset cursors compare against.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def brew_time_seconds(brew_time: Optional[str]) -> Optional[int]:
+    """Convert a ``"mm:ss"`` brew time to a number of seconds.
+
+    :param brew_time: Brew time in ``"mm:ss"`` format
+    :type brew_time: Optional[str]
+    :return: Total seconds, or None if the brew time is missing or malformed
+    :rtype: Optional[int]
+    """
+    if brew_time is None:
+        return None
+    minutes, separator, seconds = brew_time.strip().partition(":")
+    if not separator:
+        return None
+    try:
+        return int(minutes) * 60 + int(seconds)
+    except ValueError:
+        return None
+
+
+#: Condition selecting the brews that are not deleted, over ``brews`` columns
+LIVE_SQL = "deleted_at IS NULL"
+
+
+def _live_index(name: str, *expressions: Any) -> Index:
+    """Build a partial index over the brews that are not deleted.
+
+    Deleted brews wait in ``brews`` until they are purged. Leaving them out
+    of the listing indexes keeps those indexes as small as if they were
+    gone, and queries use them by filtering on ``deleted_at IS NULL``.
+
+    :param name: Index name
+    :type name: str
+    :param expressions: Indexed columns or expressions
+    :type expressions: Any
+    :return: Partial index
+    :rtype: Index
+    """
+    where = text(LIVE_SQL)
+    return Index(name, *expressions, sqlite_where=where, postgresql_where=where)
 
 
 class Brew(Base):
@@ -19,6 +87,8 @@ class Brew(Base):
 
     :ivar id: Primary key for the brew record
     :type id: int
+    :ivar user_id: ID of the user who recorded the brew
+    :type user_id: int
     :ivar bean_type: Type/origin of coffee beans used
     :type bean_type: str
     :ivar brew_type: Method of brewing (e.g., V60, Espresso)
@@ -31,29 +101,287 @@ class Brew(Base):
     :type weight_out: float
     :ivar brew_time: Total brewing time in "mm:ss" format
     :type brew_time: str
+    :ivar brew_seconds: Total brewing time in seconds, derived from brew_time
+    :type brew_seconds: int or None
     :ivar bloom_time: Coffee bloom time in seconds (optional)
     :type bloom_time: int or None
     :ivar details: Additional brewing notes (optional)
     :type details: str or None
-    :ivar image_url: URL or base64 of brew image (optional)
+    :ivar image_url: URL of brew image (optional)
     :type image_url: str or None
+    :ivar image_hash: SHA-256 digest of the uploaded image in the blob store
+    :type image_hash: str or None
+    :ivar image_content_type: Media type of the uploaded image
+    :type image_content_type: str or None
     :ivar created_at: Timestamp of record creation
     :type created_at: datetime
     :ivar updated_at: Timestamp of last update (optional)
     :type updated_at: datetime or None
+    :ivar deleted_at: Timestamp of deletion, until the brew is purged; None
+        for brews that are not deleted
+    :type deleted_at: datetime or None
     """
 
     __tablename__ = "brews"
+    __table_args__ = (
+        # Serves a user's ORDER BY created_at DESC, id DESC and keyset cursors
+        _live_index("ix_brews_live_user_created_at_id", "user_id", "created_at", "id"),
+        # Serve the range filters and sort orders of a user's brew listings
+        _live_index("ix_brews_live_user_brew_seconds", "user_id", "brew_seconds"),
+        _live_index("ix_brews_live_user_water_temp", "user_id", "water_temp"),
+        _live_index("ix_brews_live_user_brew_type", "user_id", "brew_type"),
+        # Serves the selection of brews old enough to be archived
+        _live_index("ix_brews_live_created_at", "created_at"),
+        # Serves the purge of deleted brews, and is empty when there are none
+        Index(
+            "ix_brews_deleted_at",
+            "deleted_at",
+            sqlite_where=text("deleted_at IS NOT NULL"),
+            postgresql_where=text("deleted_at IS NOT NULL"),
+        ),
+        # Never reuse the IDs of purged or archived brews, which image URLs,
+        # the archive and synced clients still refer to
+        {"sqlite_autoincrement": True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(
+        Integer,
+        nullable=False,
+        default=DEFAULT_USER_ID,
+        server_default=str(DEFAULT_USER_ID),
+    )
     bean_type = Column(String)
     brew_type = Column(String)
     water_temp = Column(Float)
     weight_in = Column(Float)
     weight_out = Column(Float)
     brew_time = Column(String)  # Format: "mm:ss"
+    brew_seconds = Column(Integer, nullable=True)
     bloom_time = Column(Integer, nullable=True)  # In seconds
     details = Column(String, nullable=True)
     image_url = Column(String, nullable=True)
-    created_at = Column(DateTime, server_default=func.now())
-    updated_at = Column(DateTime, nullable=True, onupdate=func.now())
+    image_hash = Column(String(64), nullable=True)
+    image_content_type = Column(String, nullable=True)
+    created_at = Column(DateTime, default=_utcnow, server_default=func.now())
+    updated_at = Column(DateTime, nullable=True, onupdate=_utcnow)
+    # Incremented by every update, for optimistic concurrency control
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    deleted_at = Column(DateTime, nullable=True)
+
+    @validates("brew_time")
+    def _set_brew_seconds(self, key: str, brew_time: Optional[str]) -> Optional[str]:
+        """Keep ``brew_seconds`` in step with ``brew_time``."""
+        self.brew_seconds = brew_time_seconds(brew_time)
+        return brew_time
+
+
+#: Brew ratio, output over input weight. Indexed as an expression, so
+#: queries must use this exact expression to benefit from the index.
+brew_ratio = Brew.weight_out / Brew.weight_in
+
+_live_index("ix_brews_live_user_ratio", Brew.user_id, brew_ratio)
+
+
+class BrewRollup(Base):
+    """Running totals of brew metrics for one group of brews.
+
+    Rows are kept up to date by database triggers on every write to
+    ``brews``, so aggregate statistics are read in time proportional to the
+    number of groups rather than the number of brews. Each metric has a sum
+    and a count of the brews where it is known, from which its mean follows.
+
+    :ivar user_id: ID of the user whose brews are grouped
+    :type user_id: int
+    :ivar dimension: Grouping dimension: "brew_type", "bean_type" or "day"
+    :type dimension: str
+    :ivar key: Value of the dimension shared by the group's brews
+    :type key: str
+    :ivar count: Number of brews in the group
+    :type count: int
+    """
+
+    __tablename__ = "brew_rollups"
+
+    user_id = Column(Integer, primary_key=True, default=DEFAULT_USER_ID)
+    dimension = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    water_temp_sum = Column(Float, nullable=False, default=0)
+    water_temp_count = Column(Integer, nullable=False, default=0)
+    ratio_sum = Column(Float, nullable=False, default=0)
+    ratio_count = Column(Integer, nullable=False, default=0)
+    bloom_time_sum = Column(Float, nullable=False, default=0)
+    bloom_time_count = Column(Integer, nullable=False, default=0)
+    brew_seconds_sum = Column(Float, nullable=False, default=0)
+    brew_seconds_count = Column(Integer, nullable=False, default=0)
+
+
+class BrewChange(Base):
+    """An entry of the append-only log of writes to brews.
+
+    Rows are appended by database triggers on every insert, delete and
+    version-changing update of ``brews``, in commit order, so clients can
+    fetch the changes after the last one they have seen. Setting a brew's
+    tombstone is logged as a delete, and removing it as a create.
+
+    :ivar id: Position of the change in the log
+    :type id: int
+    :ivar brew_id: ID of the brew written
+    :type brew_id: int
+    :ivar user_id: ID of the user owning the brew
+    :type user_id: int
+    :ivar op: Kind of write: "create", "update", "delete" or "archive"
+    :type op: str
+    :ivar version: Version of the brew after the write, or before it when
+        the brew was removed from ``brews``
+    :type version: int
+    :ivar changed_at: Timestamp of the write
+    :type changed_at: datetime
+    """
+
+    __tablename__ = "brew_changes"
+    __table_args__ = (
+        # Serves the changes of one user after a given one
+        Index("ix_brew_changes_user_id_id", "user_id", "id"),
+        # Never reuse the IDs of pruned changes, which clients resume from
+        {"sqlite_autoincrement": True},
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    brew_id = Column(Integer, nullable=False)
+    user_id = Column(
+        Integer,
+        nullable=False,
+        default=DEFAULT_USER_ID,
+        server_default=str(DEFAULT_USER_ID),
+    )
+    op = Column(String, nullable=False)
+    version = Column(Integer, nullable=False)
+    changed_at = Column(DateTime, nullable=False, default=_utcnow)
+
+
+class BrewSync(Base):
+    """The sync version of a brew, stamped on its latest write.
+
+    Where the change log keeps every write, this table keeps one row per
+    brew. Database triggers give the row a new version from an increasing
+    counter on every insert, delete and version-changing update of
+    ``brews``, so offline clients fetch the brews written after the last
+    version they have seen in one row per brew, however often each was
+    written. Rows of deleted brews are kept, so deletions still reach
+    clients after the brew is purged or archived.
+
+    :ivar brew_id: ID of the brew
+    :type brew_id: int
+    :ivar user_id: ID of the user owning the brew
+    :type user_id: int
+    :ivar version: Sync version of the latest write, unique across brews
+    :type version: int
+    :ivar deleted: Whether the latest write deleted the brew
+    :type deleted: bool
+    """
+
+    __tablename__ = "brew_sync"
+    __table_args__ = (
+        # Serves the brews of one user written after a given version
+        Index("ix_brew_sync_user_version", "user_id", "version"),
+    )
+
+    brew_id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, nullable=False, default=DEFAULT_USER_ID)
+    # Unique, and indexed to draw the next version from the current maximum
+    version = Column(Integer, nullable=False, unique=True)
+    deleted = Column(Boolean, nullable=False, default=False)
+
+
+class BrewSyncCreate(Base):
+    """A brew created by an offline client's sync, by the client's random ID.
+
+    Written in the transaction creating the brew, so a queue of offline
+    writes sent again after its response was lost creates each brew once.
+    Client IDs are only unique per user, and apart from the provisional IDs
+    of the ingestion queue. Rows are kept for ``SYNC_CLIENT_RETENTION_DAYS``,
+    long enough for a client to come back online.
+
+    :ivar user_id: ID of the user who created the brew
+    :type user_id: int
+    :ivar client_id: Random ID the client gave the brew
+    :type client_id: str
+    :ivar brew_id: ID of the created brew
+    :type brew_id: int
+    :ivar created_at: Timestamp of the creation
+    :type created_at: datetime
+    """
+
+    __tablename__ = "brew_sync_creates"
+
+    user_id = Column(Integer, primary_key=True)
+    client_id = Column(String(32), primary_key=True)
+    brew_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=_utcnow, index=True)
+
+
+class BrewIngest(Base):
+    """A brew created from the ingestion queue, by provisional ID.
+
+    Written in the transaction creating the brew, so a queue entry whose
+    brew was committed is recognized if the queue was not updated before a
+    crash. Rows are pruned after the retention period of the queue.
+
+    :ivar token: Provisional ID of the queue entry
+    :type token: str
+    :ivar brew_id: ID of the created brew
+    :type brew_id: int
+    :ivar ingested_at: Timestamp of the creation
+    :type ingested_at: datetime
+    """
+
+    __tablename__ = "brew_ingests"
+
+    token = Column(String(32), primary_key=True)
+    brew_id = Column(Integer, nullable=False)
+    ingested_at = Column(DateTime, nullable=False, default=_utcnow, index=True)
+
+
+class ArchivedBrew(Base):
+    """A brew moved out of ``brews`` once older than the archive age.
+
+    The whole brew row is kept as compressed JSON, so old brews take a
+    fraction of their space and no longer weigh on the listing indexes,
+    statistics or similarity searches, while staying readable by owner and
+    creation date.
+
+    :ivar id: Position of the brew in the archive
+    :type id: int
+    :ivar brew_id: ID the brew had in ``brews``
+    :type brew_id: int
+    :ivar user_id: ID of the user who recorded the brew
+    :type user_id: int
+    :ivar created_at: Timestamp of the brew's creation
+    :type created_at: datetime
+    :ivar archived_at: Timestamp of the archival
+    :type archived_at: datetime
+    :ivar data: zlib-compressed JSON object of the brew's columns
+    :type data: bytes
+    """
+
+    __tablename__ = "brew_archive"
+    __table_args__ = (
+        # Serves a user's archived brews, newest first, and keyset cursors
+        Index("ix_brew_archive_user_created_at_id", "user_id", "created_at", "id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    # Not unique: brews archived while brew IDs were still reused can share one
+    brew_id = Column(Integer, nullable=False, index=True)
+    user_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    archived_at = Column(DateTime, nullable=False, default=_utcnow)
+    data = Column(LargeBinary, nullable=False)
+
+
+#: FTS5 index over ``bean_type``, ``brew_type`` and ``details``, keyed by
+#: brew ID. Created by the migrations rather than ``create_all``, since it is
+#: a SQLite virtual table.
+brews_fts = table("brews_fts", column("rowid"), column("rank"))
@@ -1,7 +1,8 @@
 from datetime import datetime
-from typing import Optional
+from functools import lru_cache
+from typing import Any, Dict, List, Literal, Optional, Tuple, Type
 
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, create_model, model_validator
 
 
 class BrewBase(BaseModel):
@@ -16,13 +17,137 @@ class BrewBase(BaseModel):
     image_url: Optional[str] = None
 
 
+class BrewFilter(BaseModel):
+    brew_type: Optional[str] = None
+    created_after: Optional[datetime] = None  # Inclusive
+    created_before: Optional[datetime] = None  # Exclusive
+    min_brew_seconds: Optional[int] = Field(None, ge=0)  # Bounds are inclusive
+    max_brew_seconds: Optional[int] = Field(None, ge=0)
+    min_water_temp: Optional[float] = None
+    max_water_temp: Optional[float] = None
+    min_ratio: Optional[float] = None  # weight_out / weight_in
+    max_ratio: Optional[float] = None
+
+
 class BrewCreate(BrewBase):
     pass
 
 
+class BrewPatch(BaseModel):
+    # Fields left out are unchanged; required fields cannot be cleared
+    bean_type: str = None
+    brew_type: str = None
+    water_temp: float = Field(None, gt=0)
+    weight_in: float = Field(None, gt=0)
+    weight_out: float = Field(None, gt=0)
+    brew_time: str = None  # Format: "mm:ss"
+    bloom_time: Optional[int] = Field(None, ge=0)  # In seconds
+    details: Optional[str] = None
+    image_url: Optional[str] = None
+
+
+class BrewUpsert(BrewCreate):
+    id: Optional[int] = None
+
+
 class Brew(BrewBase):
     id: int
+    brew_seconds: Optional[int] = None  # brew_time in seconds
     created_at: datetime
     updated_at: Optional[datetime] = None
+    version: int = 1  # Incremented by every update, sent as the ETag
 
     model_config = ConfigDict(from_attributes=True)
+
+
+@lru_cache(maxsize=256)
+def brew_fields_schema(fields: Tuple[str, ...]) -> Type[BaseModel]:
+    """Build a brew response schema narrowed to some fields.
+
+    :param fields: Names of ``Brew`` fields, in schema order
+    :type fields: Tuple[str, ...]
+    :return: ``Brew`` itself when every field is requested, otherwise a
+        model with only the requested fields
+    :rtype: Type[BaseModel]
+    """
+    if fields == tuple(Brew.model_fields):
+        return Brew
+    return create_model(
+        "BrewFields",
+        __config__=ConfigDict(from_attributes=True),
+        **{
+            name: (Brew.model_fields[name].annotation, Brew.model_fields[name])
+            for name in fields
+        },
+    )
+
+
+class BrewChange(BaseModel):
+    id: int  # Position in the change log, passed back as ``since``
+    brew_id: int
+    op: Literal["create", "update", "delete", "archive"]
+    version: int  # Brew version after the write, or before it for removals
+    changed_at: datetime
+
+
+class SyncChanges(BaseModel):
+    version: int  # Sync version reached, passed back as ``since``
+    brews: List[Brew] = []  # Brews created or updated since ``since``
+    deleted: List[int] = []  # IDs of brews deleted since ``since``
+    has_more: bool = False  # Whether later changes remain past ``version``
+
+
+class SyncWrite(BaseModel):
+    op: Literal["create", "update", "delete"]
+    id: Optional[int] = None  # Brew to update or delete
+    base_version: Optional[int] = None  # Version written over; None for any
+    brew: Optional[BrewCreate] = None  # Brew data to create or update with
+    client_id: Optional[str] = Field(None, max_length=32)  # Replays create once
+
+    @model_validator(mode="after")
+    def check_operands(self) -> "SyncWrite":
+        """Require the brew ID and data the operation needs."""
+        if self.op != "create" and self.id is None:
+            raise ValueError(f"{self.op} requires an id")
+        if self.op != "delete" and self.brew is None:
+            raise ValueError(f"{self.op} requires a brew")
+        return self
+
+
+class SyncWriteResult(BaseModel):
+    index: int  # Position of the write in the request body
+    status: Literal["applied", "conflict", "not_found", "invalid"]
+    id: Optional[int] = None  # Brew written, including the ID of created brews
+    brew: Optional[Brew] = None  # Current brew, on conflicts
+    detail: Any = None  # Set if invalid
+
+
+class IngestStatus(BaseModel):
+    provisional_id: str  # Returned by a queued POST /brews/
+    status: Literal["pending", "created", "failed"]
+    brew_id: Optional[int] = None  # Set once created
+    detail: Optional[str] = None  # Set if failed
+
+
+class BulkItemError(BaseModel):
+    index: int  # Position of the item in the request body
+    detail: Any
+
+
+class BulkResult(BaseModel):
+    ids: List[int] = []
+    errors: List[BulkItemError] = []
+
+
+class MetricStats(BaseModel):
+    mean: Optional[float] = None
+    percentiles: Dict[int, float] = {}  # Keyed by percentile, 0 to 100
+
+
+class BrewStats(BaseModel):
+    key: str  # Brew type, bean type or ISO date of the group
+    count: int
+    water_temp: MetricStats
+    ratio: MetricStats  # weight_out / weight_in
+    bloom_time: MetricStats
+    brew_seconds: MetricStats  # brew_time in seconds
@@ -0,0 +1,9 @@
+"""Benchmark suite for the BrewLog API.
+
+Seeds SQLite databases with synthetic brews, then measures endpoint latency
+in-process through ASGI, throughput under concurrent load against a local
+server, and the cost of the CRUD functions and response serialization.
+Results are written as JSON and can be compared against a stored baseline.
+
+Run ``python -m benchmarks --help`` from the ``backend`` directory.
+"""
@@ -0,0 +1,265 @@
+"""Command line entry point of the benchmark suite.
+
+``python -m benchmarks`` runs every dataset size in a separate process, so
+that each one imports the application configured for its own database, and
+collects the results into one JSON document::
+
+    python -m benchmarks --sizes 10000 100000 --output results.json
+    python -m benchmarks --baseline results.json --tolerance 0.25
+
+With ``--baseline``, the exit status is 1 when any latency grew, or any
+throughput dropped, by more than the tolerance.
+
+The load run serves the application with ``python -m app serve``, once per
+worker count given to ``--workers``, to show how throughput scales with
+the cores in use::
+
+    python -m benchmarks --sizes 100000 --workers 1 2 4 8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.timing import compare
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+
+def _free_port() -> int:
+    """Return a TCP port that is free on the loopback interface."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_server(base_url: str, timeout: float = 60) -> None:
+    """Wait until a server answers requests.
+
+    :param base_url: URL of the server
+    :type base_url: str
+    :param timeout: Seconds to wait before giving up
+    :type timeout: float
+    :raises RuntimeError: If the server does not answer in time
+    """
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"{base_url}/api/v1/brews/?limit=1").raise_for_status()
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not start")
+
+
+def run_size(args: argparse.Namespace) -> dict:
+    """Seed one database and run every benchmark against it.
+
+    Runs in a child process whose environment points the application at the
+    database of this size.
+
+    :param args: Parsed command line arguments
+    :type args: argparse.Namespace
+    :return: Results for this size
+    :rtype: dict
+    """
+    from app.core.database import get_engine, get_sessionmaker
+    from app.core.migrations import run_migrations
+    from app.main import create_app
+    from benchmarks import scenarios
+    from benchmarks.seed import discard_written_brews, seed_database, seeded_count
+
+    results = {}
+    engine = get_engine()
+    run_migrations(engine)
+    app = create_app(migrate=False)
+    present = seeded_count(engine, args.count)
+    if present not in (0, args.count):
+        raise RuntimeError("Partially seeded database; delete it and retry")
+    if present == 0:
+        started = time.perf_counter()
+        seed_database(engine, args.count, image_ratio=args.image_ratio)
+        results["seed_seconds"] = round(time.perf_counter() - started, 1)
+    else:
+        discard_written_brews(engine, args.count)
+
+    with get_sessionmaker()() as db:
+        cases = scenarios.build_scenarios(db, args.count)
+        results["serialization"] = scenarios.run_serialization(db, args.iterations)
+        results["crud"] = scenarios.run_crud(db, args.count, args.iterations)
+        results["compression"] = scenarios.run_compression(db, args.iterations)
+    results["asgi"] = asyncio.run(scenarios.run_asgi(app, cases, args.iterations))
+
+    if args.concurrency:
+        results["load"] = {
+            str(workers): run_load(cases, args, workers) for workers in args.workers
+        }
+    return results
+
+
+def run_load(cases: list, args: argparse.Namespace, workers: int) -> dict:
+    """Run the load scenarios against a server with some worker processes.
+
+    :param cases: Scenarios built for the seeded database
+    :type cases: list
+    :param args: Parsed command line arguments
+    :type args: argparse.Namespace
+    :param workers: Number of worker processes of the server
+    :type workers: int
+    :return: Latency and throughput summary per scenario
+    :rtype: dict
+    """
+    from benchmarks import scenarios
+
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "app",
+            "serve",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--log-level",
+            "warning",
+        ]
+    )
+    try:
+        _wait_for_server(base_url)
+        # As many load generating processes as workers, so that the client
+        # side scales along with the server
+        return scenarios.run_load(
+            base_url, cases, args.concurrency, args.duration, processes=workers
+        )
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def run(args: argparse.Namespace) -> int:
+    """Run the suite for every size, write the results and check the baseline.
+
+    :param args: Parsed command line arguments
+    :type args: argparse.Namespace
+    :return: Process exit status
+    :rtype: int
+    """
+    workdir = os.path.abspath(args.workdir)
+    os.makedirs(workdir, exist_ok=True)
+    document = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "iterations": args.iterations,
+            "concurrency": args.concurrency,
+            "workers": args.workers,
+            "duration": args.duration,
+            "cache": args.cache,
+        },
+        "results": {},
+    }
+    for count in args.sizes:
+        database = os.path.join(workdir, f"brews-{count}.db")
+        env = {
+            **os.environ,
+            "SQLALCHEMY_DATABASE_URL": f"sqlite:///{database}",
+            "BLOB_STORE_DIR": os.path.join(workdir, "blobs"),
+            "CACHE_BACKEND": "memory" if args.cache else "none",
+        }
+        with tempfile.NamedTemporaryFile(suffix=".json") as output:
+            command = [
+                sys.executable,
+                "-m",
+                "benchmarks",
+                "--count",
+                str(count),
+                "--child-output",
+                output.name,
+                "--iterations",
+                str(args.iterations),
+                "--concurrency",
+                str(args.concurrency),
+                "--duration",
+                str(args.duration),
+                "--image-ratio",
+                str(args.image_ratio),
+                "--workers",
+                *map(str, args.workers),
+            ]
+            print(f"Benchmarking {count} brews...", file=sys.stderr)
+            subprocess.run(command, env=env, check=True)
+            with open(output.name) as result:
+                document["results"][str(count)] = json.load(result)
+
+    with open(args.output, "w") as output:
+        json.dump(document, output, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(
+                document, json.load(baseline), args.tolerance, args.min_delta_ms
+            )
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--workdir", default=".benchmarks")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", help="Results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--min-delta-ms", type=float, default=1.0)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=16,
+        help="Concurrent clients of the load run; 0 skips it",
+    )
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[1],
+        help="Worker processes of the server in each load run",
+    )
+    parser.add_argument("--image-ratio", type=float, default=0.01)
+    parser.add_argument(
+        "--cache", action="store_true", help="Keep the response cache enabled"
+    )
+    parser.add_argument("--count", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--child-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_output:
+        results = run_size(args)
+        with open(args.child_output, "w") as output:
+            json.dump(results, output)
+        return 0
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,438 @@
+"""Benchmark scenarios.
+
+Each scenario is a request against the API, parameterized by the seeded
+dataset so it exercises realistic positions: pages deep into the listing,
+random brews, brews with an image. The same scenarios are run in-process
+through ASGI, one request at a time, and by the concurrent load driver
+against a real server.
+"""
+
+import asyncio
+import base64
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import httpx
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.api.v1.endpoints.brews import _serialize_brew_rows, _serialize_brews
+from app.core import compression, similarity
+from app.crud import brew as crud
+from app.crud import stats as crud_stats
+from app.models.brew import Brew
+from app.schemas.brew import Brew as BrewSchema
+from app.schemas.brew import BrewCreate
+from benchmarks.seed import synthetic_image
+from benchmarks.timing import summarize, time_calls
+
+API = "/api/v1"
+
+
+class Scenario(NamedTuple):
+    """A request measured by the benchmarks.
+
+    :ivar name: Scenario name used in the results
+    :ivar method: HTTP method
+    :ivar urls: URLs requested in turn, relative to the server
+    :ivar body: JSON request body, for writes
+    :ivar read_only: Whether the scenario is included in load runs
+    """
+
+    name: str
+    method: str
+    urls: Sequence[str]
+    body: Optional[dict] = None
+    read_only: bool = True
+
+
+def _brew_payload(image: Optional[bytes] = None) -> dict:
+    """Build the JSON body of a brew creation request.
+
+    :param image: Image to send inline as a base64 data URL
+    :type image: Optional[bytes]
+    :return: Request body
+    :rtype: dict
+    """
+    payload = {
+        "bean_type": "Benchmark Blend",
+        "brew_type": "V60",
+        "water_temp": 94.0,
+        "weight_in": 18,
+        "weight_out": 270,
+        "brew_time": "03:00",
+        "bloom_time": 30,
+        "details": "fruity floral benchmark",
+    }
+    if image is not None:
+        payload["image_url"] = "data:image/png;base64," + base64.b64encode(
+            image
+        ).decode("ascii")
+    return payload
+
+
+def build_scenarios(db: Session, count: int, seed: int = 7) -> List[Scenario]:
+    """Build the scenarios for a seeded database.
+
+    :param db: Session on the benchmark database
+    :type db: Session
+    :param count: Number of seeded brews
+    :type count: int
+    :param seed: Seed of the random brew IDs requested
+    :type seed: int
+    :return: Scenarios, reads first
+    :rtype: List[Scenario]
+    """
+    rng = random.Random(seed)
+    ids = [rng.randint(1, count) for _ in range(100)]
+    middle = crud.get_brews(db, skip=count // 2, limit=1)
+    cursor = crud.encode_brew_cursor(middle[0]) if middle else None
+    image_id = db.scalar(
+        select(Brew.id).where(Brew.image_hash.isnot(None)).order_by(Brew.id).limit(1)
+    )
+    first_day = db.scalar(select(Brew.created_at).order_by(Brew.id).limit(1))
+    scenarios = [
+        Scenario("list_first_page", "GET", [f"{API}/brews/?limit=50"]),
+        Scenario("list_page_1000", "GET", [f"{API}/brews/?limit=1000"]),
+        Scenario(
+            "list_deep_offset", "GET", [f"{API}/brews/?skip={count // 2}&limit=50"]
+        ),
+        Scenario(
+            "list_filtered_sorted",
+            "GET",
+            [
+                f"{API}/brews/?brew_type=V60&max_brew_seconds=180"
+                "&sort=brew_seconds&limit=50"
+            ],
+        ),
+        Scenario("search", "GET", [f"{API}/brews/search?q=fruity+jas&limit=50"]),
+        Scenario("get_brew", "GET", [f"{API}/brews/{brew_id}" for brew_id in ids]),
+        Scenario("stats", "GET", [f"{API}/brews/stats?group_by=bean_type"]),
+        Scenario(
+            "stats_percentiles",
+            "GET",
+            [f"{API}/brews/stats?group_by=brew_type&percentiles=50&percentiles=90"],
+        ),
+        Scenario(
+            "create_brew", "POST", [f"{API}/brews/"], _brew_payload(), read_only=False
+        ),
+        Scenario(
+            "create_brew_with_image",
+            "POST",
+            [f"{API}/brews/"],
+            _brew_payload(synthetic_image(rng, 256 * 1024)),
+            read_only=False,
+        ),
+        Scenario(
+            "update_brew",
+            "PUT",
+            [f"{API}/brews/{brew_id}" for brew_id in ids],
+            _brew_payload(),
+            read_only=False,
+        ),
+    ]
+    if cursor is not None:
+        scenarios.insert(
+            2,
+            Scenario(
+                "list_deep_cursor", "GET", [f"{API}/brews/?cursor={cursor}&limit=50"]
+            ),
+        )
+    if image_id is not None:
+        scenarios.append(Scenario("image", "GET", [f"{API}/brews/{image_id}/image"]))
+    if similarity.np is not None:
+        scenarios.append(
+            Scenario(
+                "similar",
+                "GET",
+                [f"{API}/brews/{brew_id}/similar?k=10" for brew_id in ids],
+            )
+        )
+    if first_day is not None:
+        day = first_day.date()
+        scenarios.append(
+            Scenario(
+                "export_one_day",
+                "GET",
+                [
+                    f"{API}/brews/export?created_after={day}"
+                    f"&created_before={day}T23:59:59"
+                ],
+            )
+        )
+    return scenarios
+
+
+async def _measure(client: httpx.AsyncClient, scenario: Scenario, i: int) -> float:
+    """Send one scenario request and return its latency.
+
+    :param client: HTTP client
+    :type client: httpx.AsyncClient
+    :param scenario: Scenario to run
+    :type scenario: Scenario
+    :param i: Iteration number, selecting the URL
+    :type i: int
+    :return: Latency in seconds
+    :rtype: float
+    :raises httpx.HTTPStatusError: If the response is an error
+    """
+    url = scenario.urls[i % len(scenario.urls)]
+    started = time.perf_counter()
+    response = await client.request(scenario.method, url, json=scenario.body)
+    await response.aread()
+    latency = time.perf_counter() - started
+    response.raise_for_status()
+    return latency
+
+
+async def run_asgi(
+    app, scenarios: Sequence[Scenario], iterations: int, warmup: int = 3
+) -> Dict[str, dict]:
+    """Measure scenarios one request at a time through the ASGI interface.
+
+    No network or server is involved, so this isolates the cost of the
+    application itself: routing, validation, queries and serialization.
+
+    :param app: ASGI application
+    :param scenarios: Scenarios to run
+    :type scenarios: Sequence[Scenario]
+    :param iterations: Timed requests per scenario
+    :type iterations: int
+    :param warmup: Untimed requests per scenario
+    :type warmup: int
+    :return: Latency summary per scenario
+    :rtype: Dict[str, dict]
+    """
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        for scenario in scenarios:
+            for i in range(warmup):
+                await _measure(client, scenario, i)
+            latencies = []
+            started = time.perf_counter()
+            for i in range(iterations):
+                latencies.append(await _measure(client, scenario, i))
+            results[scenario.name] = summarize(latencies, time.perf_counter() - started)
+    return results
+
+
+async def _drive(
+    base_url: str, scenario: Scenario, offsets: range, duration: float
+) -> Tuple[List[float], int, float]:
+    """Send a scenario back to back from concurrent clients of this process.
+
+    :param base_url: URL of the running server
+    :type base_url: str
+    :param scenario: Scenario to run
+    :type scenario: Scenario
+    :param offsets: First iteration number of each client; the step of the
+        range is the number of clients over all processes
+    :type offsets: range
+    :param duration: Seconds to run for
+    :type duration: float
+    :return: Latencies, number of errors and elapsed seconds
+    :rtype: Tuple[List[float], int, float]
+    """
+    latencies: List[float] = []
+    errors = 0
+    limits = httpx.Limits(max_connections=len(offsets))
+    async with httpx.AsyncClient(
+        base_url=base_url, limits=limits, timeout=60
+    ) as client:
+        deadline = time.perf_counter() + duration
+
+        async def worker(offset: int) -> None:
+            nonlocal errors
+            i = offset
+            while time.perf_counter() < deadline:
+                try:
+                    latencies.append(await _measure(client, scenario, i))
+                except httpx.HTTPError:
+                    errors += 1
+                i += offsets.step
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(offset) for offset in offsets))
+    return latencies, errors, time.perf_counter() - started
+
+
+def _drive_process(
+    base_url: str, scenario: Scenario, offsets: range, duration: float
+) -> Tuple[List[float], int, float]:
+    """Run :func:`_drive` in a load generating process."""
+    return asyncio.run(_drive(base_url, scenario, offsets, duration))
+
+
+def run_load(
+    base_url: str,
+    scenarios: Sequence[Scenario],
+    concurrency: int,
+    duration: float,
+    processes: int = 1,
+) -> Dict[str, dict]:
+    """Measure read scenarios under concurrent load against a server.
+
+    ``concurrency`` clients send requests back to back for ``duration``
+    seconds per scenario, each over its own connection. The clients are
+    spread over ``processes`` load generating processes, so that a single
+    client process does not cap the throughput of a multi-process server.
+
+    :param base_url: URL of the running server
+    :type base_url: str
+    :param scenarios: Scenarios to run; writes are skipped
+    :type scenarios: Sequence[Scenario]
+    :param concurrency: Number of concurrent clients
+    :type concurrency: int
+    :param duration: Seconds each scenario runs for
+    :type duration: float
+    :param processes: Number of load generating processes
+    :type processes: int
+    :return: Latency and throughput summary per scenario
+    :rtype: Dict[str, dict]
+    """
+    results = {}
+    processes = max(1, min(processes, concurrency))
+    with ProcessPoolExecutor(processes) as pool:
+        for scenario in scenarios:
+            if not scenario.read_only:
+                continue
+            futures = [
+                pool.submit(
+                    _drive_process,
+                    base_url,
+                    scenario,
+                    range(first, concurrency, processes),
+                    duration,
+                )
+                for first in range(processes)
+            ]
+            latencies: List[float] = []
+            errors = 0
+            elapsed = 0.0
+            for future in futures:
+                process_latencies, process_errors, process_elapsed = future.result()
+                latencies.extend(process_latencies)
+                errors += process_errors
+                elapsed = max(elapsed, process_elapsed)
+            results[scenario.name] = summarize(latencies, elapsed, errors)
+    return results
+
+
+def run_crud(db: Session, count: int, iterations: int) -> Dict[str, dict]:
+    """Time the CRUD functions directly on a session.
+
+    :param db: Session on the benchmark database
+    :type db: Session
+    :param count: Number of seeded brews
+    :type count: int
+    :param iterations: Timed calls per function
+    :type iterations: int
+    :return: Latency summary per function
+    :rtype: Dict[str, dict]
+    """
+    rng = random.Random(11)
+    ids = [rng.randint(1, count) for _ in range(iterations + 3)]
+    middle = crud.get_brews(db, skip=count // 2, limit=1)
+    after = (middle[0].created_at, middle[0].id) if middle else None
+    brew = BrewCreate(**_brew_payload())
+
+    def expunged(fn):
+        def call(i):
+            fn(i)
+            db.expunge_all()
+
+        return call
+
+    return {
+        "get_brews": time_calls(
+            expunged(lambda i: crud.get_brews(db, limit=50)), iterations
+        ),
+        "get_brews_offset": time_calls(
+            expunged(lambda i: crud.get_brews(db, skip=count // 2, limit=50)),
+            iterations,
+        ),
+        "get_brews_cursor": time_calls(
+            expunged(lambda i: crud.get_brews(db, limit=50, after=after)), iterations
+        ),
+        "get_brew": time_calls(
+            expunged(lambda i: crud.get_brew(db, brew_id=ids[i])), iterations
+        ),
+        "search_brews": time_calls(
+            expunged(lambda i: crud.search_brews(db, query="fruity", limit=50)),
+            iterations,
+        ),
+        "get_brew_stats": time_calls(
+            lambda i: crud_stats.get_brew_stats(db, group_by="bean_type"), iterations
+        ),
+        "create_brew": time_calls(
+            expunged(lambda i: crud.create_brew(db, brew=brew)), iterations
+        ),
+    }
+
+
+def run_serialization(db: Session, iterations: int) -> Dict[str, dict]:
+    """Time the serialization of ``Brew`` responses.
+
+    Lists are serialized both from ORM records through the schema and from
+    rows of the response columns through the fast path of the listing.
+
+    :param db: Session on the benchmark database
+    :type db: Session
+    :param iterations: Timed serializations per case
+    :type iterations: int
+    :return: Latency summary per case
+    :rtype: Dict[str, dict]
+    """
+    brews = crud.get_brews(db, limit=1000)
+    rows = crud.get_brews(db, limit=1000, columns=crud.RESPONSE_COLUMNS)
+    results = {
+        "brew_item": time_calls(
+            lambda i: BrewSchema.model_validate(brews[i % len(brews)])
+            .model_dump_json()
+            .encode(),
+            iterations,
+        )
+    }
+    for size in (100, 1000):
+        results[f"brew_list_{size}"] = time_calls(
+            lambda i: _serialize_brews(brews[:size]), iterations
+        )
+        results[f"brew_rows_{size}"] = time_calls(
+            lambda i: _serialize_brew_rows(rows[:size]), iterations
+        )
+    return results
+
+
+def run_compression(db: Session, iterations: int) -> Dict[str, dict]:
+    """Measure the bytes on the wire and CPU time of compressing listings.
+
+    Pages of the listing are compressed with every available content
+    coding at the level used for responses.
+
+    :param db: Session on the benchmark database
+    :type db: Session
+    :param iterations: Timed compressions per case
+    :type iterations: int
+    :return: Latency summary, compressed size and ratio per case
+    :rtype: Dict[str, dict]
+    """
+    rows = crud.get_brews(db, limit=1000, columns=crud.RESPONSE_COLUMNS)
+    results = {}
+    for size in (50, 1000):
+        body = _serialize_brew_rows(rows[:size])
+        results[f"brew_rows_{size}_identity"] = {"bytes": len(body)}
+        for encoding in compression.available_encodings():
+            compressed = compression.compress(body, encoding)
+            results[f"brew_rows_{size}_{encoding}"] = {
+                **time_calls(
+                    lambda i: compression.compress(body, encoding), iterations
+                ),
+                "bytes": len(compressed),
+                "ratio": round(len(body) / len(compressed), 2),
+            }
+    return results
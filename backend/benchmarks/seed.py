@@ -0,0 +1,159 @@
+"""Synthetic brew data for benchmarks.
+
+Brews are generated deterministically from a seed and written with
+multi-row INSERTs, bypassing the API so that even a million rows can be
+seeded in reasonable time. A small share of brews carry a large image,
+stored in the blob store as the API would after an inline upload.
+"""
+
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.engine import Engine
+
+from app.core import blobs
+from app.models.brew import Brew
+
+BEAN_TYPES = [
+    "Ethiopian Yirgacheffe",
+    "Kenyan AA",
+    "Colombian Supremo",
+    "Brazilian Santos",
+    "Guatemalan Antigua",
+    "Sumatra Mandheling",
+    "Costa Rican Tarrazu",
+    "Panama Geisha",
+]
+
+BREW_TYPES = ["V60", "Espresso", "French Press", "AeroPress", "Chemex", "Moka Pot"]
+
+WORDS = [
+    "fruity",
+    "floral",
+    "bright",
+    "chocolate",
+    "nutty",
+    "caramel",
+    "bitter",
+    "sour",
+    "balanced",
+    "jasmine",
+    "berry",
+    "citrus",
+    "fine",
+    "coarse",
+    "grind",
+    "bloom",
+    "pour",
+    "slow",
+    "fast",
+    "sweet",
+]
+
+#: Signature prefixed to synthetic images so they look like PNG files
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def synthetic_image(rng: random.Random, size: int) -> bytes:
+    """Generate incompressible bytes standing in for an uploaded photo.
+
+    :param rng: Random number generator
+    :type rng: random.Random
+    :param size: Image size in bytes
+    :type size: int
+    :return: Image bytes
+    :rtype: bytes
+    """
+    return PNG_SIGNATURE + rng.randbytes(size - len(PNG_SIGNATURE))
+
+
+def seeded_count(engine: Engine, count: int) -> int:
+    """Count the seeded brews present in a database.
+
+    Brews created by write benchmarks get IDs above the seeded range and
+    are not counted.
+
+    :param engine: Engine bound to the benchmark database
+    :type engine: Engine
+    :param count: Number of brews the database should hold
+    :type count: int
+    :return: Number of brews with an ID in the seeded range
+    :rtype: int
+    """
+    with engine.connect() as conn:
+        return conn.execute(
+            select(func.count()).select_from(Brew).where(Brew.id <= count)
+        ).scalar_one()
+
+
+def discard_written_brews(engine: Engine, count: int) -> None:
+    """Delete the brews created by earlier write benchmarks.
+
+    Restores the seeded dataset, so that results of successive runs stay
+    comparable.
+
+    :param engine: Engine bound to the benchmark database
+    :type engine: Engine
+    :param count: Number of seeded brews
+    :type count: int
+    """
+    with engine.begin() as conn:
+        conn.execute(delete(Brew).where(Brew.id > count))
+
+
+def seed_database(
+    engine: Engine,
+    count: int,
+    image_ratio: float = 0.01,
+    image_size: int = 256 * 1024,
+    seed: int = 42,
+    chunk_size: int = 5000,
+) -> None:
+    """Fill an empty benchmark database with synthetic brews.
+
+    :param engine: Engine bound to a migrated, empty database
+    :type engine: Engine
+    :param count: Number of brews to create
+    :type count: int
+    :param image_ratio: Share of brews with an image
+    :type image_ratio: float
+    :param image_size: Size of each image in bytes
+    :type image_size: int
+    :param seed: Seed of the random data
+    :type seed: int
+    :param chunk_size: Rows written per INSERT statement
+    :type chunk_size: int
+    """
+    rng = random.Random(seed)
+    images = [blobs.blob_store.put(synthetic_image(rng, image_size)) for _ in range(4)]
+    start = datetime(2023, 1, 1)
+    step = timedelta(days=730) / max(count, 1)
+    with engine.begin() as conn:
+        for first_id in range(1, count + 1, chunk_size):
+            rows = []
+            for brew_id in range(first_id, min(first_id + chunk_size, count + 1)):
+                seconds = rng.randint(20, 300)
+                weight_in = round(rng.uniform(14, 22), 1)
+                has_image = rng.random() < image_ratio
+                rows.append(
+                    {
+                        "id": brew_id,
+                        "bean_type": rng.choice(BEAN_TYPES),
+                        "brew_type": rng.choice(BREW_TYPES),
+                        "water_temp": round(rng.uniform(85, 96), 1),
+                        "weight_in": weight_in,
+                        "weight_out": round(weight_in * rng.uniform(2, 17), 1),
+                        "brew_time": f"{seconds // 60:02d}:{seconds % 60:02d}",
+                        "brew_seconds": seconds,
+                        "bloom_time": rng.choice([None, 30, 45]),
+                        "details": " ".join(rng.choices(WORDS, k=rng.randint(3, 25))),
+                        "image_url": (
+                            blobs.image_url_for(brew_id) if has_image else None
+                        ),
+                        "image_hash": rng.choice(images) if has_image else None,
+                        "image_content_type": "image/png" if has_image else None,
+                        "created_at": start + step * brew_id,
+                    }
+                )
+            conn.execute(insert(Brew), rows)
@@ -0,0 +1,133 @@
+"""Latency summaries and baseline comparison."""
+
+import time
+from typing import Callable, Dict, List, Sequence
+
+#: Metrics compared against the baseline, with whether higher is better
+COMPARED_METRICS = {"p50_ms": False, "p95_ms": False, "rps": True}
+
+
+def percentile(sorted_values: Sequence[float], pct: float) -> float:
+    """Return the nearest-rank percentile of sorted values.
+
+    :param sorted_values: Values in ascending order, at least one
+    :type sorted_values: Sequence[float]
+    :param pct: Percentile between 0 and 100
+    :type pct: float
+    :return: Percentile value
+    :rtype: float
+    """
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(latencies: Sequence[float], elapsed: float, errors: int = 0) -> dict:
+    """Summarize request latencies.
+
+    :param latencies: Latency of each request, in seconds
+    :type latencies: Sequence[float]
+    :param elapsed: Wall time of the whole run, in seconds
+    :type elapsed: float
+    :param errors: Number of failed requests
+    :type errors: int
+    :return: Count, errors, mean, percentiles and maximum in milliseconds,
+        and requests per second
+    :rtype: dict
+    """
+    values = sorted(latencies)
+    if not values:
+        return {"count": 0, "errors": errors}
+    return {
+        "count": len(values),
+        "errors": errors,
+        "mean_ms": round(sum(values) / len(values) * 1000, 3),
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3),
+        "rps": round(len(values) / elapsed, 1) if elapsed else None,
+    }
+
+
+def time_calls(fn: Callable[[int], object], iterations: int, warmup: int = 3) -> dict:
+    """Time repeated calls of a function.
+
+    :param fn: Function called with the iteration number
+    :type fn: Callable[[int], object]
+    :param iterations: Number of timed calls
+    :type iterations: int
+    :param warmup: Number of untimed calls made first
+    :type warmup: int
+    :return: Latency summary
+    :rtype: dict
+    """
+    for i in range(warmup):
+        fn(i)
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        call_started = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - call_started)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def flatten(results: dict, prefix: str = "") -> Dict[str, float]:
+    """Flatten nested results into ``path/to/metric`` keys.
+
+    :param results: Nested benchmark results
+    :type results: dict
+    :param prefix: Path of ``results`` within the whole document
+    :type prefix: str
+    :return: Numeric metrics keyed by path
+    :rtype: Dict[str, float]
+    """
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}/{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            flat.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare(
+    results: dict, baseline: dict, tolerance: float, min_delta_ms: float = 1.0
+) -> List[str]:
+    """Find metrics that regressed against a baseline.
+
+    Latencies regress when they grow by more than ``tolerance``, and
+    throughput when it drops by more than ``tolerance``. Either must also
+    cost more than ``min_delta_ms`` per request, so that jitter in
+    sub-millisecond timings is not reported. Metrics missing from either
+    side are ignored.
+
+    :param results: Results of the current run
+    :type results: dict
+    :param baseline: Results of the baseline run
+    :type baseline: dict
+    :param tolerance: Allowed relative change, e.g. 0.2 for 20%
+    :type tolerance: float
+    :param min_delta_ms: Smallest latency increase reported, in milliseconds
+    :type min_delta_ms: float
+    :return: One description per regressed metric
+    :rtype: List[str]
+    """
+    current = flatten(results.get("results", {}))
+    reference = flatten(baseline.get("results", {}))
+    regressions = []
+    for path, before in sorted(reference.items()):
+        metric = path.rsplit("/", 1)[-1]
+        if metric not in COMPARED_METRICS or path not in current or not before:
+            continue
+        after = current[path]
+        change = (after - before) / before
+        if COMPARED_METRICS[metric]:
+            slower_ms = 1000 / after - 1000 / before if after else float("inf")
+            regressed = change < -tolerance and slower_ms > min_delta_ms
+        else:
+            regressed = change > tolerance and after - before > min_delta_ms
+        if regressed:
+            regressions.append(f"{path}: {before} -> {after} ({change:+.0%})")
+    return regressions
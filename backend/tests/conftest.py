@@ -1,14 +1,34 @@
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 from unittest.mock import MagicMock
 
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
-from app.core.database import get_db
-from app.main import app
+from app.core import blobs, cache, images
+from app.core.database import get_db, get_session_opener
+from app.core.metrics import instrument_engine
+from app.core.migrations import run_migrations
+from app.main import create_app
 from app.models.brew import Brew
 
 
+def brew_payload(**fields):
+    """Build the JSON body of a valid brew, with some fields overridden"""
+    return {
+        "bean_type": "Kenyan",
+        "brew_type": "V60",
+        "water_temp": 94.0,
+        "weight_in": 18,
+        "weight_out": 270,
+        "brew_time": "03:00",
+        **fields,
+    }
+
+
 @pytest.fixture
 def mock_db():
     """Creates a mock database session"""
@@ -19,13 +39,20 @@ def mock_db():
         if isinstance(x, Brew):
             x.id = 1
             x.created_at = datetime.now(timezone.utc)
+            x.version = 1
 
     mock.refresh.side_effect = refresh_mock
     return mock
 
 
 @pytest.fixture
-def client(mock_db):
+def app():
+    """Application that leaves the configured database untouched"""
+    return create_app(migrate=False)
+
+
+@pytest.fixture
+def client(app, mock_db):
     """Test client with mocked database"""
 
     def override_get_db():
@@ -35,5 +62,61 @@ def client(mock_db):
 
     with TestClient(app) as c:
         yield c
-    # Clean up
-    app.dependency_overrides.clear()
+
+
+@pytest.fixture(autouse=True)
+def blob_store(tmp_path, monkeypatch):
+    """Points the image blob store at a temporary directory"""
+    store = blobs.BlobStore(str(tmp_path / "blobs"))
+    monkeypatch.setattr(blobs, "blob_store", store)
+    return store
+
+
+@pytest.fixture(autouse=True)
+def variant_pool(monkeypatch):
+    """Renders image variants inline instead of in worker processes"""
+    pool = images.VariantPool(workers=0, queue_size=8)
+    monkeypatch.setattr(images, "get_variant_pool", lambda: pool)
+    return pool
+
+
+@pytest.fixture(autouse=True)
+def response_cache(monkeypatch):
+    """Gives every test an empty in-memory response cache"""
+    fresh = cache.ResponseCache(cache.MemoryCache())
+    monkeypatch.setattr(cache, "response_cache", fresh)
+    return fresh
+
+
+@pytest.fixture
+def db_session():
+    """Creates a session on a fresh in-memory SQLite database"""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    instrument_engine(engine)
+    run_migrations(engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def db_client(app, db_session):
+    """Test client backed by a real in-memory database"""
+
+    def override_get_db():
+        yield db_session
+
+    @asynccontextmanager
+    async def open_session(read_only=False, shard=None):
+        yield db_session
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_session_opener] = lambda: open_session
+
+    with TestClient(app) as c:
+        yield c
@@ -0,0 +1,58 @@
+import asyncio
+
+from benchmarks import scenarios
+from benchmarks.seed import seed_database, seeded_count
+from benchmarks.timing import compare, summarize
+
+
+def test_compare_reports_regressions_beyond_tolerance():
+    baseline = {
+        "results": {
+            "10": {
+                "asgi": {
+                    "list": {"p50_ms": 10.0, "p95_ms": 20.0, "rps": 100.0},
+                    "get": {"p50_ms": 0.2, "rps": 5000.0},
+                }
+            }
+        }
+    }
+    current = {
+        "results": {
+            "10": {
+                "asgi": {
+                    "list": {"p50_ms": 11.0, "p95_ms": 30.0, "rps": 70.0},
+                    "get": {"p50_ms": 0.4, "rps": 2500.0},
+                }
+            }
+        }
+    }
+
+    assert compare(current, baseline, tolerance=0.2) == [
+        "10/asgi/list/p95_ms: 20.0 -> 30.0 (+50%)",
+        "10/asgi/list/rps: 100.0 -> 70.0 (-30%)",
+    ]
+    assert compare(current, baseline, tolerance=0.6) == []
+
+
+def test_summarize_latencies():
+    summary = summarize([0.001 * n for n in range(1, 101)], elapsed=2.0)
+
+    assert summary["count"] == 100
+    assert summary["p50_ms"] == 50.0
+    assert summary["p99_ms"] == 99.0
+    assert summary["rps"] == 50.0
+
+
+def test_scenarios_run_against_seeded_database(app, db_client, db_session):
+    seed_database(db_session.get_bind(), 60, image_ratio=0.2, image_size=1024)
+    assert seeded_count(db_session.get_bind(), 60) == 60
+
+    cases = scenarios.build_scenarios(db_session, 60)
+    results = asyncio.run(scenarios.run_asgi(app, cases, iterations=2, warmup=0))
+
+    assert set(results) == {case.name for case in cases}
+    assert "image" in results and "list_deep_cursor" in results
+    assert all(result["count"] == 2 for result in results.values())
+    assert scenarios.run_crud(db_session, 60, iterations=2)["get_brew"]["count"] == 2
+    sizes = scenarios.run_compression(db_session, iterations=2)
+    assert sizes["brew_rows_50_gzip"]["bytes"] < sizes["brew_rows_50_identity"]["bytes"]
@@ -1,8 +1,17 @@
+import base64
+import io
+import json
 from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
 
 import pytest
+from conftest import brew_payload
 from fastapi.testclient import TestClient
+from sqlalchemy import event
 
+from app.api.v1.endpoints.brews import _serialize_brew_rows, _serialize_brews
+from app.core.config import settings
+from app.crud import brew as crud
 from app.models.brew import Brew
 
 
@@ -87,12 +96,15 @@ def test_read_brews(client: TestClient, mock_db):
             created_at=datetime.now(timezone.utc),
         ),
     ]
-    # Mock the chained query methods
+    # Mock the chained query methods, which select the response columns
     mock_query = mock_db.query.return_value
+    mock_query.filter.return_value = mock_query
     mock_query.order_by.return_value = mock_query
     mock_query.offset.return_value = mock_query
     mock_query.limit.return_value = mock_query
-    mock_query.all.return_value = brews
+    mock_query.all.return_value = [
+        tuple(getattr(brew, field) for field in crud.RESPONSE_FIELDS) for brew in brews
+    ]
 
     response = client.get("/api/v1/brews/")
     assert response.status_code == 200
@@ -131,11 +143,13 @@ def test_read_brew(client: TestClient, mock_db):
         bloom_time=0,
         details="Fine grind",
         created_at=datetime.now(timezone.utc),
+        version=3,
     )
     mock_db.query.return_value.filter.return_value.first.return_value = brew
 
     response = client.get("/api/v1/brews/1")
     assert response.status_code == 200
+    assert response.headers["ETag"] == '"3"'
     data = response.json()
 
     assert data["bean_type"] == brew.bean_type
@@ -169,7 +183,19 @@ def test_update_brew(client: TestClient, mock_db):
         details="Fine grind",
         created_at=datetime.now(timezone.utc),
     )
-    mock_db.query.return_value.filter.return_value.first.return_value = existing_brew
+
+    def mock_execute(statement):
+        # Emulate UPDATE ... RETURNING on the existing brew
+        assert statement.is_update
+        for column, value in statement.compile().params.items():
+            if hasattr(existing_brew, column) and column != "version":
+                setattr(existing_brew, column, value)
+        existing_brew.version = 2
+        result = MagicMock()
+        result.first.return_value = existing_brew
+        return result
+
+    mock_db.execute.side_effect = mock_execute
 
     update_data = {
         "bean_type": "Ethiopian",
@@ -195,19 +221,24 @@ def test_update_brew(client: TestClient, mock_db):
     assert data["weight_out"] == existing_brew.weight_out
     assert data["brew_time"] == existing_brew.brew_time
     assert data["bloom_time"] == existing_brew.bloom_time
+    assert data["version"] == 2
+    assert response.headers["ETag"] == '"2"'
 
+    # Written in one statement, without reading the brew first
+    mock_db.query.assert_not_called()
     mock_db.commit.assert_called_once()
 
 
 def test_delete_brew(client: TestClient, mock_db):
-    existing_brew = Brew(id=1, created_at=datetime.now(timezone.utc))
-    mock_db.query.return_value.filter.return_value.first.return_value = existing_brew
+    mock_db.execute.return_value.rowcount = 1
 
     response = client.delete("/api/v1/brews/1")
     assert response.status_code == 200
     assert response.json() == {"message": "Brew deleted successfully"}
 
-    mock_db.delete.assert_called_once_with(existing_brew)
+    # Deleted softly, by setting the tombstone in one statement
+    assert mock_db.execute.call_args.args[0].is_update
+    mock_db.query.assert_not_called()
     mock_db.commit.assert_called_once()
 
 
@@ -228,3 +259,478 @@ def test_create_brew_invalid_data(client: TestClient, mock_db):
 
     mock_db.add.assert_not_called()
     mock_db.commit.assert_not_called()
+
+
+def _seed_brews(db_session, count, **fields):
+    brews = [
+        Brew(
+            **{
+                "bean_type": f"Bean {i}",
+                "brew_type": "V60",
+                "water_temp": 94.0,
+                "weight_in": 18,
+                "weight_out": 270,
+                "brew_time": "03:00",
+                **fields,
+            }
+        )
+        for i in range(count)
+    ]
+    db_session.add_all(brews)
+    db_session.commit()
+    return brews
+
+
+def test_read_brews_cursor_pagination(db_client: TestClient, db_session):
+    # Identical timestamps force the id tie-breaker to do the work
+    _seed_brews(db_session, 5, created_at=datetime(2024, 1, 1, 8, 0, 0))
+    _seed_brews(db_session, 2)
+
+    seen = []
+    response = db_client.get("/api/v1/brews/", params={"limit": 3})
+    while True:
+        assert response.status_code == 200
+        seen.extend(brew["id"] for brew in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        response = db_client.get(
+            "/api/v1/brews/", params={"limit": 3, "cursor": cursor}
+        )
+
+    offset_ids = [brew["id"] for brew in db_client.get("/api/v1/brews/").json()]
+    assert seen == offset_ids
+    assert seen == [7, 6, 5, 4, 3, 2, 1]
+
+
+def test_read_brews_invalid_cursor(db_client: TestClient):
+    response = db_client.get("/api/v1/brews/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+    response = db_client.get("/api/v1/brews/", params={"cursor": "W10", "skip": 1})
+    assert response.status_code == 400
+
+
+def test_read_brews_row_serialization_matches_schema(db_session):
+    _seed_brews(db_session, 1, created_at=datetime(2024, 1, 1, 8, 0, 0, 123456))
+    _seed_brews(
+        db_session,
+        1,
+        bean_type='Café "Olé"\n',
+        water_temp=92.25,
+        weight_in=18.3,
+        bloom_time=45,
+        details="☕ fruity",
+        image_url="/api/v1/brews/2/image",
+        created_at=datetime(2024, 1, 2),
+        updated_at=datetime(2024, 1, 3, 9, 30),
+    )
+    rows = crud.get_brews(db_session, columns=crud.RESPONSE_COLUMNS)
+    db_session.expunge_all()
+    brews = crud.get_brews(db_session)
+
+    assert _serialize_brew_rows(rows) == _serialize_brews(brews)
+
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4
+PNG_DATA_URL = "data:image/png;base64," + base64.b64encode(PNG_BYTES).decode()
+
+
+def test_create_brew_stores_image_in_blob_store(
+    db_client: TestClient, db_session, blob_store
+):
+    response = db_client.post(
+        "/api/v1/brews/", json=brew_payload(image_url=PNG_DATA_URL)
+    )
+    assert response.status_code == 200
+    brew = response.json()
+    assert brew["image_url"] == f"/api/v1/brews/{brew['id']}/image"
+
+    # Identical uploads share one blob
+    db_client.post("/api/v1/brews/", json=brew_payload(image_url=PNG_DATA_URL))
+    stored = db_session.query(Brew.image_hash).distinct().all()
+    assert len(stored) == 1
+    assert blob_store.path(stored[0].image_hash).read_bytes() == PNG_BYTES
+
+    listed = db_client.get("/api/v1/brews/").json()
+    assert all(not row["image_url"].startswith("data:") for row in listed)
+
+
+def test_update_brew_keeps_stored_image(db_client: TestClient):
+    brew = db_client.post(
+        "/api/v1/brews/", json=brew_payload(image_url=PNG_DATA_URL)
+    ).json()
+
+    response = db_client.put(
+        f"/api/v1/brews/{brew['id']}",
+        json=brew_payload(image_url=brew["image_url"], details="Sweeter"),
+    )
+    assert response.status_code == 200
+    assert response.json()["image_url"] == brew["image_url"]
+    assert db_client.get(brew["image_url"]).content == PNG_BYTES
+
+
+def test_patch_brew_with_if_match(db_client: TestClient):
+    brew = db_client.post(
+        "/api/v1/brews/", json=brew_payload(image_url=PNG_DATA_URL)
+    ).json()
+    url = f"/api/v1/brews/{brew['id']}"
+    etag = db_client.get(url).headers["ETag"]
+    assert etag == '"1"'
+    assert db_client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    response = db_client.patch(url, json={"details": "Sweeter"})
+    assert response.status_code == 200
+    patched = response.json()
+    assert response.headers["ETag"] == '"2"'
+    assert patched["details"] == "Sweeter"
+    assert patched["version"] == 2
+    # Updates are timestamped as precisely as creations, so never before them
+    assert datetime.fromisoformat(patched["updated_at"]) > datetime.fromisoformat(
+        brew["created_at"]
+    )
+    unchanged = {key: value for key, value in brew.items() if key != "details"}
+    assert {key: patched[key] for key in unchanged} == {
+        **unchanged,
+        "version": 2,
+        "updated_at": patched["updated_at"],
+    }
+    assert db_client.get(url).headers["ETag"] == '"2"'
+
+    response = db_client.patch(
+        url, json={"brew_time": "02:30"}, headers={"If-Match": etag}
+    )
+    assert response.status_code == 412
+    response = db_client.put(
+        url, json=brew_payload(), headers={"If-Match": f'{etag}, "2"'}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"3"'
+    assert db_client.patch(url, json={"bean_type": None}).status_code == 422
+
+    assert db_client.delete(url, headers={"If-Match": '"2"'}).status_code == 412
+    assert db_client.delete(url, headers={"If-Match": '"3"'}).status_code == 200
+    assert db_client.delete(url, headers={"If-Match": '"3"'}).status_code == 404
+    assert db_client.patch(url, json={"details": "Gone"}).status_code == 404
+
+
+def test_read_brew_image_conditional_and_range(db_client: TestClient):
+    brew = db_client.post(
+        "/api/v1/brews/", json=brew_payload(image_url=PNG_DATA_URL)
+    ).json()
+
+    response = db_client.get(brew["image_url"])
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+    assert response.content == PNG_BYTES
+    etag = response.headers["etag"]
+
+    response = db_client.get(brew["image_url"], headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    response = db_client.get(brew["image_url"], headers={"Range": "bytes=8-15"})
+    assert response.status_code == 206
+    assert response.content == PNG_BYTES[8:16]
+    assert response.headers["content-range"] == f"bytes 8-15/{len(PNG_BYTES)}"
+
+    response = db_client.get(
+        brew["image_url"], headers={"Range": f"bytes={len(PNG_BYTES)}-"}
+    )
+    assert response.status_code == 416
+
+
+def test_create_brew_invalid_image(db_client: TestClient):
+    response = db_client.post(
+        "/api/v1/brews/", json=brew_payload(image_url="data:image/png;base64,!!")
+    )
+    assert response.status_code == 422
+
+
+def test_search_brews_ranked_and_paginated(db_client: TestClient):
+    for bean, details in [
+        ("Ethiopian Guji", "Floral and bright"),
+        ("Colombian Huila", "Chocolate, bright finish"),
+        ("Ethiopian Sidamo", "Bright bright bright"),
+        ("Brazilian Cerrado", "Nutty"),
+    ]:
+        db_client.post(
+            "/api/v1/brews/", json=brew_payload(bean_type=bean, details=details)
+        )
+
+    response = db_client.get("/api/v1/brews/search", params={"q": "ethiop BRIGHT"})
+    assert response.status_code == 200
+    assert [brew["bean_type"] for brew in response.json()] == [
+        "Ethiopian Sidamo",
+        "Ethiopian Guji",
+    ]
+
+    first = db_client.get("/api/v1/brews/search", params={"q": "bright", "limit": 2})
+    second = db_client.get(
+        "/api/v1/brews/search",
+        params={"q": "bright", "limit": 2, "cursor": first.headers["X-Next-Cursor"]},
+    )
+    assert len(first.json()) == 2
+    assert [brew["id"] for brew in second.json()] == [2]
+    assert "X-Next-Cursor" not in second.headers
+
+
+def test_search_brews_follows_updates_and_deletes(db_client: TestClient):
+    brew = db_client.post(
+        "/api/v1/brews/", json=brew_payload(bean_type="Kenyan AA")
+    ).json()
+
+    db_client.put(f"/api/v1/brews/{brew['id']}", json=brew_payload(bean_type="Rwandan"))
+    search = "/api/v1/brews/search"
+    assert db_client.get(search, params={"q": "kenyan"}).json() == []
+    assert len(db_client.get(search, params={"q": "rwandan"}).json()) == 1
+
+    db_client.delete(f"/api/v1/brews/{brew['id']}")
+    assert db_client.get(search, params={"q": "rwandan"}).json() == []
+    # FTS5 syntax in user input is treated as plain text
+    assert db_client.get(search, params={"q": '"AND (*'}).status_code == 200
+
+
+def test_create_brews_bulk_json_and_ndjson(db_client: TestClient, db_session):
+    response = db_client.post(
+        "/api/v1/brews/bulk",
+        json=[
+            brew_payload(bean_type="A"),
+            brew_payload(water_temp=-1),
+            brew_payload(bean_type="B", image_url=PNG_DATA_URL),
+        ],
+    )
+    assert response.status_code == 200
+    result = response.json()
+    assert result["ids"] == [1, 2]
+    assert [error["index"] for error in result["errors"]] == [1]
+    assert db_client.get("/api/v1/brews/2").json()["image_url"] == (
+        "/api/v1/brews/2/image"
+    )
+
+    lines = [json.dumps(brew_payload(bean_type=f"N{i}")) for i in range(3)]
+    response = db_client.post(
+        "/api/v1/brews/bulk",
+        content="\n".join(lines[:2] + ["{not json"] + lines[2:]),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    result = response.json()
+    assert result["ids"] == [3, 4, 5]
+    assert result["errors"] == [{"index": 2, "detail": "Invalid JSON"}]
+    assert db_session.query(Brew).count() == 5
+
+
+def test_upsert_and_delete_brews_bulk(db_client: TestClient):
+    db_client.post("/api/v1/brews/bulk", json=[brew_payload(bean_type="Old")] * 2)
+
+    response = db_client.put(
+        "/api/v1/brews/bulk",
+        json=[
+            brew_payload(bean_type="New"),
+            {**brew_payload(bean_type="Replaced"), "id": 2},
+        ],
+    )
+    assert response.json() == {"ids": [3, 2], "errors": []}
+    assert db_client.get("/api/v1/brews/2").json()["bean_type"] == "Replaced"
+    assert db_client.get("/api/v1/brews/2").json()["updated_at"] is not None
+
+    response = db_client.request("DELETE", "/api/v1/brews/bulk", json=[1, 3, 42])
+    assert response.json() == {
+        "ids": [1, 3],
+        "errors": [{"index": 2, "detail": "Brew not found"}],
+    }
+    assert [brew["id"] for brew in db_client.get("/api/v1/brews/").json()] == [2]
+    search = db_client.get("/api/v1/brews/search", params={"q": "new"}).json()
+    assert search == []
+
+
+def test_read_brews_served_from_cache_with_etag(db_client: TestClient, db_session):
+    _seed_brews(db_session, 3)
+
+    first = db_client.get("/api/v1/brews/", params={"limit": 2})
+    etag = first.headers["etag"]
+    assert first.headers["x-next-cursor"]
+
+    db_session.query(Brew).filter(Brew.id == 3).update({"bean_type": "Changed"})
+    db_session.commit()
+    cached = db_client.get("/api/v1/brews/", params={"limit": 2})
+    assert cached.json() == first.json()
+    assert cached.headers["x-next-cursor"] == first.headers["x-next-cursor"]
+
+    response = db_client.get(
+        "/api/v1/brews/", params={"limit": 2}, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+def test_writes_invalidate_cached_responses(db_client: TestClient):
+    brew_id = db_client.post("/api/v1/brews/", json=brew_payload()).json()["id"]
+    listing = db_client.get("/api/v1/brews/")
+    item = db_client.get(f"/api/v1/brews/{brew_id}")
+
+    db_client.put(f"/api/v1/brews/{brew_id}", json=brew_payload(bean_type="Sumatra"))
+    response = db_client.get(
+        f"/api/v1/brews/{brew_id}", headers={"If-None-Match": item.headers["etag"]}
+    )
+    assert response.status_code == 200
+    assert response.json()["bean_type"] == "Sumatra"
+
+    db_client.post("/api/v1/brews/", json=brew_payload())
+    response = db_client.get(
+        "/api/v1/brews/", headers={"If-None-Match": listing.headers["etag"]}
+    )
+    assert len(response.json()) == 2
+
+    db_client.delete(f"/api/v1/brews/{brew_id}")
+    assert db_client.get(f"/api/v1/brews/{brew_id}").status_code == 404
+
+
+def test_export_brews_as_ndjson(db_client: TestClient, db_session):
+    _seed_brews(db_session, 3, details="Notes")
+
+    response = db_client.get("/api/v1/brews/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert "brews.ndjson" in response.headers["content-disposition"]
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["id"] for row in rows] == [1, 2, 3]
+    assert rows[0]["details"] == "Notes"
+    assert rows[0].keys() == db_client.get("/api/v1/brews/1").json().keys()
+
+
+def test_export_brews_as_csv_with_filters(db_client: TestClient, db_session):
+    _seed_brews(db_session, 2, brew_type="V60")
+    _seed_brews(db_session, 2, brew_type="Espresso")
+    _seed_brews(
+        db_session, 1, brew_type="V60", created_at=datetime(2020, 1, 1, 12, 0, 0)
+    )
+
+    response = db_client.get(
+        "/api/v1/brews/export",
+        params={
+            "format": "csv",
+            "brew_type": "V60",
+            "created_after": "2021-01-01T00:00:00",
+            "exclude_heavy": True,
+        },
+    )
+    lines = response.text.splitlines()
+    assert response.headers["content-type"].startswith("text/csv")
+    assert lines[0].split(",") == [
+        "id",
+        "bean_type",
+        "brew_type",
+        "water_temp",
+        "weight_in",
+        "weight_out",
+        "brew_time",
+        "brew_seconds",
+        "bloom_time",
+        "created_at",
+        "updated_at",
+        "version",
+    ]
+    assert [line.split(",")[0] for line in lines[1:]] == ["1", "2"]
+
+
+def test_export_brews_streams_in_batches(db_client: TestClient, db_session):
+    pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+    _seed_brews(db_session, 5)
+
+    with patch.object(settings, "EXPORT_BATCH_SIZE", 2):
+        response = db_client.get("/api/v1/brews/export", params={"format": "parquet"})
+    table = pyarrow_parquet.read_table(io.BytesIO(response.content))
+    assert table.num_rows == 5
+    assert pyarrow_parquet.ParquetFile(io.BytesIO(response.content)).num_row_groups == 3
+    assert table.column("id").to_pylist() == [1, 2, 3, 4, 5]
+
+
+def test_read_brews_filtered_and_sorted_by_metric(db_client: TestClient, db_session):
+    for brew_time, water_temp, weight_out in [
+        ("02:30", 92.0, 250),
+        ("03:10", 94.0, 300),
+        ("01:45", 96.0, 40),
+        ("04:00", 90.0, 320),
+        ("02:30", 93.0, 270),
+    ]:
+        _seed_brews(
+            db_session,
+            1,
+            brew_time=brew_time,
+            water_temp=water_temp,
+            weight_out=weight_out,
+        )
+
+    response = db_client.get(
+        "/api/v1/brews/",
+        params={"max_brew_seconds": 200, "sort": "brew_seconds", "order": "asc"},
+    )
+    assert [brew["id"] for brew in response.json()] == [3, 1, 5, 2]
+    assert response.json()[0]["brew_seconds"] == 105
+    assert response.json()[0]["brew_time"] == "01:45"
+
+    pages = []
+    cursor = None
+    while True:
+        params = {"sort": "brew_seconds", "limit": 2, "min_water_temp": 91}
+        response = db_client.get(
+            "/api/v1/brews/", params={**params, "cursor": cursor} if cursor else params
+        )
+        pages.append([brew["id"] for brew in response.json()])
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            break
+    assert pages == [[2, 5], [1, 3], []]
+
+    response = db_client.get(
+        "/api/v1/brews/", params={"min_ratio": 13, "max_ratio": 16, "sort": "ratio"}
+    )
+    assert [brew["id"] for brew in response.json()] == [5, 1]
+
+
+def test_read_brews_rejects_cursor_of_another_sort(db_client: TestClient, db_session):
+    _seed_brews(db_session, 2)
+    cursor = db_client.get("/api/v1/brews/", params={"limit": 1}).headers[
+        "x-next-cursor"
+    ]
+
+    response = db_client.get(
+        "/api/v1/brews/", params={"cursor": cursor, "sort": "water_temp"}
+    )
+    assert response.status_code == 400
+
+
+def test_read_brews_sparse_fieldsets(db_client: TestClient, db_session):
+    for weight_out in (300, 250, 280):
+        _seed_brews(db_session, 1, weight_out=weight_out, details="long notes")
+    statements = []
+    event.listen(
+        db_session.get_bind(),
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement),
+    )
+
+    pages = []
+    params = {"fields": "bean_type, id", "sort": "ratio", "limit": 2}
+    response = db_client.get("/api/v1/brews/", params=params)
+    while True:
+        assert response.status_code == 200
+        pages.append(response.json())
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            break
+        response = db_client.get("/api/v1/brews/", params={**params, "cursor": cursor})
+    assert pages == [
+        [{"bean_type": "Bean 0", "id": 1}, {"bean_type": "Bean 0", "id": 3}],
+        [{"bean_type": "Bean 0", "id": 2}],
+    ]
+    assert statements and not any("details" in sql for sql in statements)
+
+    response = db_client.get("/api/v1/brews/2", params={"fields": "details,id"})
+    assert response.json() == {"id": 2, "details": "long notes"}
+    assert "details" in statements[-1] and "bean_type" not in statements[-1]
+
+    for fields in ("id,colour", ",", "image_hash"):
+        response = db_client.get("/api/v1/brews/", params={"fields": fields})
+        assert response.status_code == 400
+    assert db_client.get("/api/v1/brews/1", params={"fields": "x"}).status_code == 400
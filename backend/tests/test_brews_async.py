@@ -0,0 +1,102 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.api.v1.endpoints import brews, brews_async
+from app.core.database import get_async_db, get_db
+from app.core.migrations import run_migrations
+
+BREW = {
+    "bean_type": "Ethiopian Guji",
+    "brew_type": "V60",
+    "water_temp": 94.0,
+    "weight_in": 18,
+    "weight_out": 270,
+    "brew_time": "03:00",
+}
+
+
+@pytest.fixture
+def async_client(tmp_path):
+    """Test client serving the async router on a temporary database file"""
+    url = f"sqlite:///{tmp_path / 'async.db'}"
+    engine = create_engine(url)
+    run_migrations(engine)
+    SyncSession = sessionmaker(bind=engine)
+    AsyncSession = async_sessionmaker(
+        create_async_engine(
+            url.replace("sqlite", "sqlite+aiosqlite"), poolclass=NullPool
+        ),
+        expire_on_commit=False,
+    )
+
+    async def override_get_async_db():
+        async with AsyncSession() as db:
+            yield db
+
+    def override_get_db():
+        with SyncSession() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(brews_async.router)
+    app.include_router(brews.router)
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_db] = override_get_db
+    with TestClient(app) as c:
+        yield c
+    engine.dispose()
+
+
+def test_async_crud_roundtrip(async_client: TestClient):
+    created = async_client.post("/brews/", json=BREW)
+    assert created.status_code == 200
+    brew_id = created.json()["id"]
+
+    response = async_client.put(f"/brews/{brew_id}", json={**BREW, "details": "Sweet"})
+    assert response.json()["details"] == "Sweet"
+    assert async_client.get(f"/brews/{brew_id}").json()["details"] == "Sweet"
+    assert [brew["id"] for brew in async_client.get("/brews/").json()] == [brew_id]
+    assert len(async_client.get("/brews/search", params={"q": "guji"}).json()) == 1
+
+    assert async_client.delete(f"/brews/{brew_id}").status_code == 200
+    assert async_client.get(f"/brews/{brew_id}").status_code == 404
+
+
+def test_async_patch_with_if_match(async_client: TestClient):
+    brew_id = async_client.post("/brews/", json=BREW).json()["id"]
+
+    response = async_client.patch(
+        f"/brews/{brew_id}", json={"details": "Sweet"}, headers={"If-Match": '"1"'}
+    )
+    assert response.json()["details"] == "Sweet"
+    assert response.json()["bean_type"] == BREW["bean_type"]
+    assert response.headers["ETag"] == '"2"'
+    assert async_client.get(f"/brews/{brew_id}").headers["ETag"] == '"2"'
+    response = async_client.delete(f"/brews/{brew_id}", headers={"If-Match": '"1"'})
+    assert response.status_code == 412
+
+
+def test_async_router_leaves_other_routes_to_sync_router(async_client: TestClient):
+    response = async_client.post("/brews/bulk", json=[BREW, BREW])
+    assert response.json()["ids"] == [1, 2]
+
+    response = async_client.get("/brews/", params={"limit": 1})
+    next_page = async_client.get(
+        "/brews/", params={"limit": 1, "cursor": response.headers["X-Next-Cursor"]}
+    )
+    assert [brew["id"] for brew in next_page.json()] == [1]
+
+
+def test_async_sparse_fieldsets(async_client: TestClient):
+    brew_id = async_client.post("/brews/", json=BREW).json()["id"]
+
+    response = async_client.get("/brews/", params={"fields": "id,brew_type"})
+    assert response.json() == [{"id": brew_id, "brew_type": "V60"}]
+    response = async_client.get(f"/brews/{brew_id}", params={"fields": "water_temp"})
+    assert response.json() == {"water_temp": 94.0}
+    assert async_client.get("/brews/", params={"fields": "nope"}).status_code == 400
@@ -0,0 +1,103 @@
+import time
+
+from app.core.cache import (
+    MemoryCache,
+    NullCache,
+    RedisCache,
+    ResponseCache,
+    create_backend,
+)
+from app.core.config import settings
+
+
+class FakeRedis:
+    """In-memory stand-in for the subset of ``redis.Redis`` the cache uses"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1).encode()
+        return int(self.data[key])
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, match):
+        prefix = match.rstrip("*")
+        return [key for key in self.data if key.startswith(prefix)]
+
+
+class FakeRequest:
+    def __init__(self, path, query):
+        self.url = type("URL", (), {"path": path})()
+        self.query_params = type("Params", (), {"multi_items": lambda _: query})()
+
+
+def test_memory_cache_evicts_least_recently_used():
+    backend = MemoryCache(max_entries=2)
+    backend.set("a", b"1")
+    backend.set("b", b"2")
+    backend.get("a")
+    backend.set("c", b"3")
+
+    assert backend.get("a") == b"1"
+    assert backend.get("b") is None
+    assert backend.get("c") == b"3"
+
+
+def test_memory_cache_expires_entries(monkeypatch):
+    backend = MemoryCache()
+    backend.set("a", b"1", ttl=10)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+
+    assert backend.get("a") is None
+
+
+def test_response_cache_invalidates_namespace():
+    response_cache = ResponseCache(MemoryCache())
+    request = FakeRequest("/brews/", [("limit", "2"), ("cursor", "x")])
+    key = response_cache.key("brews:list", request)
+    assert key == "brews:list:v0:/brews/?cursor=x&limit=2"
+    response_cache.put(key, b"[]", {"X-Next-Cursor": "abc"})
+
+    cached = response_cache.get(key)
+    assert cached.body == b"[]"
+    assert cached.headers == {"X-Next-Cursor": "abc"}
+
+    response_cache.invalidate("brews:list")
+    assert response_cache.get(response_cache.key("brews:list", request)) is None
+
+
+def test_redis_cache_shares_entries_between_instances():
+    client = FakeRedis()
+    first = ResponseCache(RedisCache(client))
+    second = ResponseCache(RedisCache(client))
+    request = FakeRequest("/brews/1", [])
+
+    first.put(first.key("brews:1", request), b"{}")
+    assert second.get(second.key("brews:1", request)).body == b"{}"
+
+    second.invalidate("brews:1")
+    assert first.get(first.key("brews:1", request)) is None
+
+    RedisCache(client).clear()
+    assert client.data == {}
+
+
+def test_reads_from_a_replica_are_not_cached(monkeypatch):
+    monkeypatch.setattr(settings, "CACHE_BACKEND", "memory")
+    monkeypatch.setattr(settings, "READ_DATABASE_URL", "sqlite:///replica.db")
+    assert isinstance(create_backend(), NullCache)
+
+    # Shards have no replicas, so their reads are cached
+    monkeypatch.setattr(settings, "DATABASE_SHARDS", ["sqlite:///a.db"])
+    assert isinstance(create_backend(), MemoryCache)
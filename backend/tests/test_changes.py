@@ -0,0 +1,93 @@
+import asyncio
+
+from conftest import brew_payload
+from fastapi.testclient import TestClient
+
+from app.core import changes
+from app.core.config import settings
+
+IMAGE_DATA_URL = "data:image/png;base64,iVBORw0KGgo="
+
+
+def _events(body: str):
+    return [
+        dict(line.split(": ", 1) for line in block.splitlines())
+        for block in body.split("\n\n")
+        if block.startswith("id: ")
+    ]
+
+
+def test_changes_logged_for_every_write(db_client: TestClient):
+    created = db_client.post(
+        "/api/v1/brews/", json=brew_payload(image_url=IMAGE_DATA_URL)
+    ).json()
+    db_client.patch(f"/api/v1/brews/{created['id']}", json={"details": "Sweeter"})
+    db_client.post("/api/v1/brews/bulk", json=[brew_payload()])
+    db_client.put(
+        "/api/v1/brews/bulk", json=[brew_payload(id=created["id"]), brew_payload()]
+    )
+    db_client.request("DELETE", "/api/v1/brews/bulk", json=[created["id"]])
+
+    response = db_client.get("/api/v1/brews/changes")
+    assert response.status_code == 200
+    logged = [
+        (change["brew_id"], change["op"], change["version"])
+        for change in response.json()
+    ]
+    # Linking the new brew to its stored image is not a change, and setting
+    # the tombstone increments the version
+    assert logged == [
+        (1, "create", 1),
+        (1, "update", 2),
+        (2, "create", 1),
+        (1, "update", 3),
+        (3, "create", 1),
+        (1, "delete", 4),
+    ]
+    ids = [change["id"] for change in response.json()]
+    assert ids == sorted(ids)
+
+    response = db_client.get("/api/v1/brews/changes", params={"since": ids[3]})
+    assert [change["id"] for change in response.json()] == ids[4:]
+    response = db_client.get(
+        "/api/v1/brews/changes", params={"since": ids[0], "limit": 2}
+    )
+    assert [change["id"] for change in response.json()] == ids[1:3]
+
+
+def test_change_stream_resumes_after_last_event(db_client: TestClient, monkeypatch):
+    monkeypatch.setattr(settings, "CHANGES_STREAM_SECONDS", 0.2)
+    monkeypatch.setattr(settings, "CHANGES_POLL_SECONDS", 0.05)
+    for _ in range(3):
+        db_client.post("/api/v1/brews/", json=brew_payload())
+    headers = {"Accept": "text/event-stream"}
+
+    response = db_client.get(
+        "/api/v1/brews/changes", params={"since": 0}, headers=headers
+    )
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text.startswith("retry: ")
+    events = _events(response.text)
+    assert [event["id"] for event in events] == ["1", "2", "3"]
+    assert '"op":"create"' in events[0]["data"]
+    assert ": keep-alive" in response.text
+
+    response = db_client.get(
+        "/api/v1/brews/changes", headers={**headers, "Last-Event-ID": "2"}
+    )
+    assert [event["id"] for event in _events(response.text)] == ["3"]
+    # Without a position, only changes made while connected are streamed
+    response = db_client.get("/api/v1/brews/changes", headers=headers)
+    assert _events(response.text) == []
+
+
+def test_change_feed_wakes_subscribers_on_publish():
+    feed = changes.ChangeFeed(changes.LocalBroker())
+
+    async def wait_for_publish():
+        with feed.subscribe() as written:
+            await asyncio.get_running_loop().run_in_executor(None, feed.publish)
+            await asyncio.wait_for(written.wait(), 1)
+        assert not feed._subscribers
+
+    asyncio.run(wait_for_publish())
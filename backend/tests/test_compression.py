@@ -0,0 +1,101 @@
+import gzip
+import zlib
+
+from conftest import brew_payload
+from fastapi.testclient import TestClient
+
+from app.core import compression
+from app.core.config import settings
+
+DETAILS = "Bright and juicy, with blackcurrant and a long finish"
+
+
+def test_negotiate_encoding_honours_quality_values():
+    assert compression.negotiate_encoding(None) is None
+    assert compression.negotiate_encoding("identity") is None
+    assert compression.negotiate_encoding("gzip, deflate") == "gzip"
+    assert compression.negotiate_encoding("gzip;q=0") is None
+    assert compression.negotiate_encoding("br;q=0.5, gzip") == "gzip"
+    assert compression.negotiate_encoding("*") == compression.available_encodings()[0]
+
+
+def test_compressor_streams_valid_gzip():
+    stream = compression.compressor("gzip")
+    data = stream.compress(b"a" * 5000) + stream.compress(b"b" * 5000) + stream.flush()
+
+    assert gzip.decompress(data) == b"a" * 5000 + b"b" * 5000
+
+
+def test_large_listing_compressed_and_small_item_not(db_client: TestClient):
+    db_client.post(
+        "/api/v1/brews/bulk", json=[brew_payload(details=DETAILS) for _ in range(30)]
+    )
+    headers = {"Accept-Encoding": "gzip"}
+
+    response = db_client.get("/api/v1/brews/", headers=headers)
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert len(response.json()) == 30
+    assert response.num_bytes_downloaded < len(response.content) / 3
+
+    response = db_client.get("/api/v1/brews/1", headers=headers)
+    assert "content-encoding" not in response.headers
+    assert response.json()["id"] == 1
+
+    response = db_client.get("/api/v1/brews/", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert len(response.json()) == 30
+
+
+def test_cached_listing_compressed_once(db_client: TestClient, monkeypatch):
+    db_client.post(
+        "/api/v1/brews/bulk", json=[brew_payload(details=DETAILS) for _ in range(30)]
+    )
+    calls = []
+    compress = compression.compress
+    monkeypatch.setattr(
+        compression,
+        "compress",
+        lambda data, encoding: calls.append(encoding) or compress(data, encoding),
+    )
+
+    first = db_client.get("/api/v1/brews/", headers={"Accept-Encoding": "gzip"})
+    second = db_client.get("/api/v1/brews/", headers={"Accept-Encoding": "gzip"})
+
+    assert calls == ["gzip"]
+    assert second.json() == first.json()
+    assert second.headers["etag"] == first.headers["etag"]
+    not_modified = db_client.get(
+        "/api/v1/brews/",
+        headers={"Accept-Encoding": "gzip", "If-None-Match": first.headers["etag"]},
+    )
+    assert not_modified.status_code == 304
+
+
+def test_streamed_export_compressed_incrementally(db_client: TestClient, monkeypatch):
+    monkeypatch.setattr(settings, "EXPORT_BATCH_SIZE", 5)
+    db_client.post(
+        "/api/v1/brews/bulk", json=[brew_payload(details=DETAILS) for _ in range(30)]
+    )
+
+    with db_client.stream(
+        "GET", "/api/v1/brews/export", headers={"Accept-Encoding": "gzip"}
+    ) as response:
+        raw = b"".join(response.iter_raw())
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    lines = zlib.decompress(raw, 16 + zlib.MAX_WBITS).splitlines()
+    assert len(lines) == 30
+
+
+def test_compression_disabled(db_client: TestClient, monkeypatch):
+    monkeypatch.setattr(settings, "COMPRESSION_ENABLED", False)
+    db_client.post(
+        "/api/v1/brews/bulk", json=[brew_payload(details=DETAILS) for _ in range(30)]
+    )
+
+    response = db_client.get("/api/v1/brews/", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert len(response.json()) == 30
@@ -0,0 +1,83 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from starlette.requests import Request
+
+from app.core import database
+from app.core.database import create_database_engine, get_db
+
+
+def test_sqlite_pragmas_applied_per_connection(tmp_path):
+    engine = create_database_engine(f"sqlite:///{tmp_path / 'pragmas.db'}")
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+    assert engine.pool.size() == 5
+    engine.dispose()
+
+
+def test_read_only_engine_rejects_writes(tmp_path):
+    url = f"sqlite:///{tmp_path / 'replica.db'}"
+    writer = create_database_engine(url)
+    with writer.begin() as conn:
+        conn.execute(text("CREATE TABLE t (x INTEGER)"))
+    reader = create_database_engine(url, read_only=True)
+    with reader.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM t")).scalar() == 0
+        with pytest.raises(OperationalError):
+            conn.execute(text("INSERT INTO t VALUES (1)"))
+    writer.dispose()
+    reader.dispose()
+
+
+@pytest.mark.parametrize("method", ["GET", "HEAD", "POST", "DELETE"])
+def test_get_db_routes_reads_to_read_sessions(monkeypatch, method):
+    write_factory, read_factory = MagicMock(), MagicMock()
+    monkeypatch.setattr(
+        database,
+        "get_sessionmaker",
+        lambda read_only=False, shard=None: (
+            read_factory if read_only else write_factory
+        ),
+    )
+    monkeypatch.setattr(database, "_slots_for", lambda db_engine: None)
+    request = Request({"type": "http", "method": method, "headers": []})
+
+    async def use_session():
+        dependency = get_db(request, 1)
+        db = await dependency.__anext__()
+        await dependency.aclose()
+        return db
+
+    db = asyncio.run(use_session())
+    expected = read_factory if method in ("GET", "HEAD") else write_factory
+    assert db is expected.return_value
+    db.close.assert_called_once()
+
+
+def test_sessions_are_admitted_on_each_event_loop(tmp_path, monkeypatch):
+    monkeypatch.setattr(database.settings, "DB_POOL_SIZE", 1)
+    monkeypatch.setattr(database.settings, "DB_MAX_OVERFLOW", 0)
+    monkeypatch.setattr(database, "_session_slots", {})
+    engine = create_database_engine(f"sqlite:///{tmp_path / 'loops.db'}")
+    factory = MagicMock(kw={"bind": engine})
+    monkeypatch.setattr(
+        database, "get_sessionmaker", lambda read_only=False, shard=None: factory
+    )
+
+    async def use_session():
+        async with database.admit_session():
+            await asyncio.sleep(0)
+
+    async def contend():
+        # The second session waits on the first, binding the semaphore
+        await asyncio.gather(use_session(), use_session())
+
+    asyncio.run(contend())
+    asyncio.run(contend())
+    assert len(database._session_slots) == 1
+    engine.dispose()
@@ -0,0 +1,98 @@
+import base64
+import io
+
+import pytest
+from conftest import brew_payload
+from fastapi.testclient import TestClient
+
+from app.core import images
+from app.models.brew import Brew
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _jpeg_data_url(width: int, height: int) -> str:
+    image = Image.new("RGB", (width, height), (180, 120, 60))
+    exif = Image.Exif()
+    exif[0x010F] = "Phone maker"  # Make
+    exif[0x0112] = 6  # Orientation: rotated 90 degrees
+    output = io.BytesIO()
+    image.save(output, format="JPEG", exif=exif)
+    return "data:image/jpeg;base64," + base64.b64encode(output.getvalue()).decode()
+
+
+def test_upload_renders_upright_variants_without_exif(
+    db_client: TestClient, db_session, blob_store
+):
+    db_client.post(
+        "/api/v1/brews/", json=brew_payload(image_url=_jpeg_data_url(1200, 800))
+    )
+    digest = db_session.query(Brew.image_hash).scalar()
+
+    for size, edge in images.VARIANT_SIZES.items():
+        for fmt in images.supported_formats():
+            path = blob_store.path(digest, images.variant_name(size, fmt))
+            with Image.open(path) as variant:
+                assert variant.format == fmt.upper()
+                # The EXIF orientation is applied, then dropped
+                assert variant.height > variant.width
+                assert max(variant.size) == min(edge, 1200)
+                assert not variant.getexif()
+
+
+def test_rejected_updates_store_no_image(db_client: TestClient, blob_store):
+    brew_id = db_client.post("/api/v1/brews/", json=brew_payload()).json()["id"]
+    url = f"/api/v1/brews/{brew_id}"
+    payload = brew_payload(image_url=_jpeg_data_url(40, 30))
+
+    response = db_client.put(url, json=payload, headers={"If-Match": '"2"'})
+    assert response.status_code == 412
+    assert db_client.put("/api/v1/brews/999", json=payload).status_code == 404
+    assert not any(path.is_file() for path in blob_store.root.rglob("*"))
+
+    assert db_client.put(url, json=payload).status_code == 200
+    assert any(path.is_file() for path in blob_store.root.rglob("*"))
+
+
+def test_read_brew_image_variant(db_client: TestClient, blob_store):
+    brew = db_client.post(
+        "/api/v1/brews/", json=brew_payload(image_url=_jpeg_data_url(1200, 800))
+    ).json()
+    url = brew["image_url"]
+    headers = {"Accept": "image/webp,image/*"}
+
+    response = db_client.get(url, params={"size": "thumb", "v": 1}, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    assert "Accept" in response.headers["vary"]
+    assert response.headers["cache-control"].startswith("private")
+    assert "immutable" in response.headers["cache-control"]
+    with Image.open(io.BytesIO(response.content)) as thumb:
+        assert max(thumb.size) == images.VARIANT_SIZES["thumb"]
+    etag = response.headers["etag"]
+    response = db_client.get(
+        url, params={"size": "thumb"}, headers={**headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.headers["cache-control"] == "no-cache"
+
+    # Clients accepting no variant format get the original
+    response = db_client.get(url, params={"size": "thumb"})
+    assert response.headers["content-type"] == "image/jpeg"
+    assert db_client.get(url, params={"size": "huge"}).status_code == 422
+
+    # Variants missing from the store are rendered again on request
+    for path in blob_store.root.rglob("*.thumb.*"):
+        path.unlink()
+    response = db_client.get(url, params={"size": "thumb"}, headers=headers)
+    assert response.headers["content-type"] == "image/jpeg"
+    response = db_client.get(url, params={"size": "thumb"}, headers=headers)
+    assert response.headers["content-type"] == "image/webp"
+
+
+def test_variant_pool_drops_jobs_when_full(blob_store):
+    pool = images.VariantPool(workers=0, queue_size=1)
+    assert pool._slots.acquire(blocking=False)
+    assert pool.submit("0" * 64) is None
+    pool._slots.release()
+    assert pool.submit("0" * 64).result() == []
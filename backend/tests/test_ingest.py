@@ -0,0 +1,127 @@
+from contextlib import nullcontext
+
+import pytest
+from conftest import brew_payload
+from fastapi.testclient import TestClient
+
+from app.core import ingest
+from app.core.config import settings
+from app.crud import brew as crud
+from app.models.brew import Brew
+from app.schemas.brew import BrewCreate
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return ingest.IngestQueue(str(tmp_path / "ingest.db"), max_pending=3)
+
+
+def _put(queue, **fields):
+    return queue.put(ingest.encode_entry(BrewCreate(**brew_payload(**fields)), 1))
+
+
+def test_queue_keeps_entries_until_completed(queue):
+    first, second = _put(queue), _put(queue, bean_type="Ethiopian")
+
+    assert [token for token, _ in queue.take(10)] == [first, second]
+    assert queue.status(first) == (None, None, False)
+
+    queue.complete({first: 7}, {second: "Invalid"})
+
+    assert queue.take(10) == []
+    assert queue.status(first) == (7, None, True)
+    assert queue.status(second) == (None, "Invalid", True)
+    assert queue.status("unknown") is None
+
+
+def test_queue_refuses_entries_beyond_max_pending(queue):
+    tokens = [_put(queue) for _ in range(3)]
+
+    with pytest.raises(ingest.QueueFullError):
+        _put(queue)
+
+    queue.complete({tokens[0]: 1})
+    _put(queue)
+    assert queue.pending() == 3
+
+
+def test_writer_creates_queued_brews(queue, db_session):
+    tokens = [_put(queue), _put(queue, bean_type="Ethiopian")]
+    writer = ingest.IngestWriter(queue, lambda shard: nullcontext(db_session))
+
+    assert writer.flush() == 2
+
+    brews = db_session.query(Brew).order_by(Brew.id).all()
+    assert [brew.bean_type for brew in brews] == ["Kenyan", "Ethiopian"]
+    assert [queue.status(token) for token in tokens] == [
+        (brews[0].id, None, True),
+        (brews[1].id, None, True),
+    ]
+    assert writer.flush() == 0
+
+
+def test_replayed_batch_creates_no_duplicates(db_session):
+    items = [("a" * 32, 1, BrewCreate(**brew_payload()))]
+    created, failed = crud.ingest_brews(db_session, items)
+
+    # As after a crash between the commit and marking the entries written
+    items.append(("b" * 32, 1, BrewCreate(**brew_payload(bean_type="Ethiopian"))))
+    replayed, failed = crud.ingest_brews(db_session, items)
+
+    assert failed == {}
+    assert replayed["a" * 32] == created["a" * 32]
+    assert db_session.query(Brew).count() == 2
+
+
+def test_post_queues_brew_when_async_preferred(
+    db_client: TestClient, queue, monkeypatch
+):
+    monkeypatch.setattr(settings, "INGEST_ENABLED", True)
+    monkeypatch.setattr(ingest, "get_ingest_queue", lambda: queue)
+
+    response = db_client.post(
+        "/api/v1/brews/", json=brew_payload(), headers={"Prefer": "respond-async"}
+    )
+
+    assert response.status_code == 202
+    assert response.headers["Preference-Applied"] == "respond-async"
+    token = response.json()["provisional_id"]
+    assert response.json()["status"] == "pending"
+    status_url = response.headers["Location"]
+    assert status_url == f"/api/v1/brews/ingest/{token}"
+    assert db_client.get(status_url).json()["status"] == "pending"
+
+    queue.complete({token: 5})
+
+    assert db_client.get(status_url).json() == {
+        "provisional_id": token,
+        "status": "created",
+        "brew_id": 5,
+        "detail": None,
+    }
+    assert db_client.get("/api/v1/brews/ingest/unknown").status_code == 404
+
+
+def test_post_rejects_brews_beyond_queue_capacity(
+    db_client: TestClient, queue, monkeypatch
+):
+    monkeypatch.setattr(settings, "INGEST_ENABLED", True)
+    monkeypatch.setattr(ingest, "get_ingest_queue", lambda: queue)
+    for _ in range(3):
+        _put(queue)
+
+    response = db_client.post(
+        "/api/v1/brews/", json=brew_payload(), headers={"Prefer": "respond-async"}
+    )
+
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+
+
+def test_post_creates_brew_when_ingestion_disabled(db_client: TestClient):
+    response = db_client.post(
+        "/api/v1/brews/", json=brew_payload(), headers={"Prefer": "respond-async"}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["id"] == 1
@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+from app import main
+from app.core.migrations import pending_migrations
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+
+def test_import_reads_no_settings_and_opens_no_database(tmp_path):
+    script = (
+        "import app.main\n"
+        "from app.core import config, database\n"
+        "assert config.get_settings.cache_info().currsize == 0\n"
+        "assert database.get_engine.cache_info().currsize == 0\n"
+        "app.main.create_app(migrate=False)\n"
+        "assert database.get_engine.cache_info().currsize == 0\n"
+    )
+    env = {**os.environ, "PYTHONPATH": str(BACKEND_DIR)}
+    subprocess.run([sys.executable, "-c", script], cwd=tmp_path, env=env, check=True)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_startup_migrates_database(monkeypatch):
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    monkeypatch.setattr(main, "get_engines", lambda: [engine])
+
+    app = main.create_app()
+    with engine.connect() as conn:
+        assert pending_migrations(conn)
+    with TestClient(app):
+        pass
+    with engine.connect() as conn:
+        assert pending_migrations(conn) == []
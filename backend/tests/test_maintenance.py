@@ -0,0 +1,136 @@
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+
+from conftest import brew_payload
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app.core import maintenance
+from app.core.config import settings
+from app.core.migrations import run_migrations
+from app.models.brew import ArchivedBrew, Brew
+
+IMAGE_DATA_URL = "data:image/png;base64,iVBORw0KGgo="
+
+
+def _stats_count(db_client: TestClient):
+    return sum(group["count"] for group in db_client.get("/api/v1/brews/stats").json())
+
+
+def test_deleted_brews_can_be_restored(db_client: TestClient):
+    ids = [db_client.post("/api/v1/brews/", json=brew_payload()).json()["id"]]
+    ids.append(db_client.post("/api/v1/brews/", json=brew_payload()).json()["id"])
+    db_client.delete(f"/api/v1/brews/{ids[0]}")
+    db_client.request("DELETE", "/api/v1/brews/bulk", json=[ids[1]])
+
+    assert db_client.get(f"/api/v1/brews/{ids[0]}").status_code == 404
+    assert db_client.get("/api/v1/brews/").json() == []
+    assert db_client.get("/api/v1/brews/search", params={"q": "Kenyan"}).json() == []
+    assert _stats_count(db_client) == 0
+    assert db_client.delete(f"/api/v1/brews/{ids[0]}").status_code == 404
+
+    response = db_client.post("/api/v1/brews/undelete", json=[ids[0], 999])
+    assert response.json() == {
+        "ids": [ids[0]],
+        "errors": [{"index": 1, "detail": "Deleted brew not found"}],
+    }
+    brew = db_client.get(f"/api/v1/brews/{ids[0]}").json()
+    assert brew["version"] == 3
+    assert _stats_count(db_client) == 1
+    changes = db_client.get("/api/v1/brews/changes").json()
+    assert [change["op"] for change in changes[2:]] == ["delete", "delete", "create"]
+
+    # Replacing a deleted brew restores it too
+    db_client.put("/api/v1/brews/bulk", json=[brew_payload(id=ids[1])])
+    assert len(db_client.get("/api/v1/brews/").json()) == 2
+
+
+def test_listings_use_partial_index(db_session):
+    plan = db_session.execute(
+        text(
+            "EXPLAIN QUERY PLAN SELECT id FROM brews "
+            "WHERE user_id = 1 AND deleted_at IS NULL "
+            "ORDER BY created_at DESC, id DESC LIMIT 10"
+        )
+    ).all()
+    assert "ix_brews_live_user_created_at_id" in plan[0].detail
+
+
+def test_maintenance_purges_and_archives(
+    db_client: TestClient, db_session, monkeypatch
+):
+    monkeypatch.setattr(settings, "ARCHIVE_AFTER_MONTHS", 12)
+    monkeypatch.setattr(settings, "MAINTENANCE_BATCH_SIZE", 2)
+    now = datetime(2025, 3, 31, 12)
+    db_session.add_all(
+        [
+            Brew(bean_type="Purged", deleted_at=now - timedelta(days=31)),
+            Brew(bean_type="Restorable", deleted_at=now - timedelta(days=1)),
+            *(Brew(bean_type="Old", created_at=datetime(2023, 1, n)) for n in (1, 2)),
+            Brew(bean_type="Recent", created_at=datetime(2025, 1, 1)),
+        ]
+    )
+    db_session.commit()
+    old = db_client.post(
+        "/api/v1/brews/",
+        json=brew_payload(bean_type="Pictured", image_url=IMAGE_DATA_URL),
+    ).json()
+    db_session.query(Brew).filter(Brew.id == old["id"]).update(
+        {"created_at": datetime(2022, 6, 1)}
+    )
+    db_session.commit()
+
+    purged, archived = maintenance.maintain(
+        lambda: nullcontext(db_session), db_session.get_bind(), now
+    )
+
+    assert (purged, archived) == (1, 3)
+    remaining = db_session.query(Brew.bean_type).order_by(Brew.id).all()
+    assert [row.bean_type for row in remaining] == ["Restorable", "Recent"]
+    assert db_session.query(ArchivedBrew).count() == 3
+    listed = db_client.get("/api/v1/brews/").json()
+    assert [brew["bean_type"] for brew in listed] == ["Recent"]
+    assert _stats_count(db_client) == 1
+
+    response = db_client.get("/api/v1/brews/archive", params={"limit": 2})
+    page = response.json()
+    assert [brew["bean_type"] for brew in page] == ["Old", "Old"]
+    assert page[0]["created_at"] == "2023-01-02T00:00:00"
+    cursor = response.headers["X-Next-Cursor"]
+    response = db_client.get("/api/v1/brews/archive", params={"cursor": cursor})
+    assert [brew["id"] for brew in response.json()] == [old["id"]]
+    image = db_client.get(response.json()[0]["image_url"])
+    assert image.status_code == 200
+
+    # The archived brew had the highest ID, which new brews never get again
+    created = db_client.post("/api/v1/brews/", json=brew_payload()).json()
+    assert created["id"] > old["id"]
+
+
+def test_months_before_clamps_to_month_end():
+    assert maintenance.months_before(datetime(2024, 3, 31), 1) == datetime(2024, 2, 29)
+    assert maintenance.months_before(datetime(2024, 1, 15), 13) == datetime(
+        2022, 12, 15
+    )
+
+
+def test_compact_returns_free_pages(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'compact.db'}")
+    run_migrations(engine)
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n "
+                "WHERE i < 2000) INSERT INTO brews (details) "
+                "SELECT hex(randomblob(500)) FROM n"
+            )
+        )
+        conn.execute(text("DELETE FROM brews"))
+
+    maintenance.compact(engine)
+
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA auto_vacuum")).scalar() == 2
+        assert conn.execute(text("PRAGMA freelist_count")).scalar() == 0
+        assert conn.execute(text("SELECT count(*) FROM sqlite_stat1")).scalar()
+    engine.dispose()
@@ -0,0 +1,103 @@
+import logging
+import threading
+import time
+
+import pytest
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.profiling import SamplingProfiler
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Gives the test an empty metrics registry"""
+    fresh = metrics.MetricsRegistry()
+    monkeypatch.setattr(metrics, "registry", fresh)
+    return fresh
+
+
+def test_server_timing_counts_queries(db_client):
+    response = db_client.get("/api/v1/brews/")
+    assert response.status_code == 200
+    db, total = response.headers["Server-Timing"].split(", ")
+    assert db.startswith("db;dur=")
+    assert int(db.split('desc="')[1].split(" ")[0]) >= 1
+    assert total.startswith("total;dur=")
+
+
+def test_metrics_aggregate_per_route(db_client, registry):
+    db_client.get("/api/v1/brews/1")
+    db_client.get("/api/v1/brews/2")
+    db_client.get("/no/such/path")
+
+    response = db_client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+    labels = 'method="GET",route="/api/v1/brews/{brew_id}"'
+    assert f'brewlog_http_requests_total{{{labels},status="404"}} 2' in body
+    assert 'route="unmatched",status="404"} 1' in body
+    assert f"brewlog_http_request_duration_seconds_count{{{labels}}} 2" in body
+    assert f'brewlog_db_queries_per_request_bucket{{{labels},le="0.0"}} 0' in body
+    assert f"brewlog_db_queries_per_request_count{{{labels}}} 2" in body
+    assert f'brewlog_http_response_size_bytes_bucket{{{labels},le="+Inf"}} 2' in body
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram((1, 5))
+    for value in (0, 1, 3, 7):
+        histogram.observe(value)
+    assert histogram.cumulative() == [("1.0", 2), ("5.0", 3), ("+Inf", 4)]
+    assert histogram.sum == 11
+
+
+def test_slow_query_log(db_client, monkeypatch, caplog):
+    monkeypatch.setattr(settings, "SLOW_QUERY_MS", 0.0)
+    with caplog.at_level(logging.WARNING, logger="app.sql.slow"):
+        db_client.get("/api/v1/brews/7")
+    messages = [record.getMessage() for record in caplog.records]
+    assert any("FROM brews" in message and "(7," in message for message in messages)
+
+    caplog.clear()
+    monkeypatch.setattr(settings, "SLOW_QUERY_MS", None)
+    with caplog.at_level(logging.WARNING, logger="app.sql.slow"):
+        db_client.get("/api/v1/brews/7")
+    assert not caplog.records
+
+
+def test_profile_requested_by_header(db_client, monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "PROFILE_DIR", str(tmp_path))
+    assert (
+        "X-Profile-Id"
+        not in db_client.get("/api/v1/brews/", headers={"X-Profile": "1"}).headers
+    )
+
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", True)
+    response = db_client.get("/api/v1/brews/", headers={"X-Profile": "1"})
+    assert response.status_code == 200
+    assert (tmp_path / f"{response.headers['X-Profile-Id']}.folded").exists()
+    assert "X-Profile-Id" not in db_client.get("/api/v1/brews/").headers
+
+
+def _spin(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_sampling_profiler_collapses_busy_stacks(tmp_path):
+    profiler = SamplingProfiler(interval=0.001)
+    worker = threading.Thread(target=_spin, args=(0.2,))
+    profiler.start()
+    worker.start()
+    worker.join()
+    profiler.stop()
+
+    path = tmp_path / "profile.folded"
+    profiler.write(str(path))
+    lines = path.read_text().splitlines()
+    busy = [line for line in lines if "_spin (" in line]
+    assert busy
+    stack, count = busy[0].rsplit(" ", 1)
+    assert stack.split(";")[-1].startswith("_spin (") and int(count) > 0
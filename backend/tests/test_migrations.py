@@ -0,0 +1,103 @@
+import base64
+
+from sqlalchemy import create_engine, event, text
+
+from app.core.migrations import run_migrations
+
+
+def test_migrations_upgrade_legacy_schema(tmp_path, blob_store):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    image = b"legacy image bytes"
+    with engine.begin() as conn:
+        # Schema as created by the first release
+        conn.execute(
+            text(
+                "CREATE TABLE brews (id INTEGER PRIMARY KEY, bean_type VARCHAR, "
+                "brew_type VARCHAR, water_temp FLOAT, weight_in FLOAT, "
+                "weight_out FLOAT, brew_time VARCHAR, bloom_time INTEGER, "
+                "details VARCHAR, image_url VARCHAR, "
+                "created_at DATETIME DEFAULT (CURRENT_TIMESTAMP), updated_at DATETIME)"
+            )
+        )
+        conn.execute(
+            text(
+                "INSERT INTO brews (id, image_url, brew_time) "
+                "VALUES (1, :url, '03:15'), (2, :link, 'soon')"
+            ),
+            {
+                "url": "data:image/jpeg;base64," + base64.b64encode(image).decode(),
+                "link": "https://example.com/brew.jpg",
+            },
+        )
+
+    run_migrations(engine)
+    run_migrations(engine)
+
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                "SELECT id, image_url, image_hash, image_content_type, created_at, "
+                "brew_seconds, version, user_id FROM brews ORDER BY id"
+            )
+        ).all()
+    assert rows[0].image_url == "/api/v1/brews/1/image"
+    assert rows[0].image_content_type == "image/jpeg"
+    assert blob_store.path(rows[0].image_hash).read_bytes() == image
+    assert rows[1].image_url == "https://example.com/brew.jpg"
+    assert rows[1].image_hash is None
+    assert len(rows[0].created_at) == len("2024-01-01 00:00:00.000000")
+    assert rows[0].brew_seconds == 195
+    assert rows[1].brew_seconds is None
+    assert [row.version for row in rows] == [1, 1]
+    assert [row.user_id for row in rows] == [1, 1]
+
+
+def test_migrated_brews_never_reuse_ids(tmp_path, blob_store):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE brews (id INTEGER PRIMARY KEY, bean_type VARCHAR, "
+                "brew_type VARCHAR, water_temp FLOAT, weight_in FLOAT, "
+                "weight_out FLOAT, brew_time VARCHAR, bloom_time INTEGER, "
+                "details VARCHAR, image_url VARCHAR, "
+                "created_at DATETIME DEFAULT (CURRENT_TIMESTAMP), updated_at DATETIME)"
+            )
+        )
+        conn.execute(
+            text(
+                "INSERT INTO brews (id, bean_type, brew_time) "
+                "VALUES (1, 'Kenyan', '03:00'), (2, 'Ethiopian', '03:00')"
+            )
+        )
+
+    run_migrations(engine)
+
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM brews WHERE id = 2"))
+        conn.execute(text("INSERT INTO brews (bean_type) VALUES ('Colombian')"))
+        ids = conn.execute(text("SELECT id FROM brews ORDER BY id")).scalars().all()
+        matches = conn.execute(
+            text("SELECT rowid FROM brews_fts WHERE brews_fts MATCH 'colombian'")
+        ).scalars()
+        synced = conn.execute(
+            text("SELECT brew_id, deleted FROM brew_sync ORDER BY version")
+        ).all()
+    assert ids == [1, 3]
+    assert list(matches) == [3]
+    assert synced[-2:] == [(2, 1), (3, 0)]
+
+
+def test_current_database_is_checked_without_writing(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'current.db'}")
+    run_migrations(engine)
+    statements = []
+    event.listen(
+        engine,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement),
+    )
+
+    run_migrations(engine)
+    assert statements
+    assert all(s.lstrip().upper().startswith(("SELECT", "PRAGMA")) for s in statements)
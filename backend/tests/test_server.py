@@ -0,0 +1,81 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+from app.core import server as app_server
+from app.core.config import settings
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start(tmp_path, *args):
+    port = _free_port()
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(BACKEND_DIR),
+        "SQLALCHEMY_DATABASE_URL": f"sqlite:///{tmp_path / 'serve.db'}",
+        "BLOB_STORE_DIR": str(tmp_path / "blobs"),
+    }
+    command = [sys.executable, "-m", "app", "serve", "--port", str(port), *args]
+    process = subprocess.Popen(command, cwd=tmp_path, env=env)
+    url = f"http://127.0.0.1:{port}/api/v1/brews/"
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            httpx.get(url)
+            return process, url
+        except httpx.HTTPError:
+            assert time.monotonic() < deadline
+            time.sleep(0.1)
+
+
+def test_serve_recycles_workers_and_shuts_down_gracefully(tmp_path):
+    command = ["--workers", "2", "--max-requests", "3", "--log-level", "warning"]
+    server, url = _start(tmp_path, *command)
+    try:
+        # More requests than the workers serve before they are replaced
+        statuses = [httpx.get(url).status_code for _ in range(12)]
+        assert statuses == [200] * 12
+    finally:
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=30) == 0
+
+
+def test_workers_do_not_serve_lists_cached_before_a_write(tmp_path):
+    server, url = _start(tmp_path, "--workers", "2", "--log-level", "warning")
+    try:
+        # New connections are spread over both workers
+        assert all(httpx.get(url).json() == [] for _ in range(20))
+        brew = {
+            "bean_type": "Kenyan",
+            "brew_type": "V60",
+            "water_temp": 94.0,
+            "weight_in": 18,
+            "weight_out": 270,
+            "brew_time": "03:00",
+        }
+        assert httpx.post(url, json=brew).status_code == 200
+        assert all(len(httpx.get(url).json()) == 1 for _ in range(20))
+    finally:
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=30) == 0
+
+
+def test_memory_cache_is_only_kept_by_a_single_worker(monkeypatch):
+    monkeypatch.setattr(settings, "CACHE_BACKEND", "memory")
+    assert app_server.shared_cache_backend(1) == "memory"
+    assert app_server.shared_cache_backend(2) == "none"
+    monkeypatch.setattr(settings, "CACHE_BACKEND", "redis")
+    assert app_server.shared_cache_backend(2) == "redis"
@@ -0,0 +1,78 @@
+import pytest
+from conftest import brew_payload
+from fastapi.testclient import TestClient
+
+from app.core import similarity
+from app.core.config import settings
+
+pytest.importorskip("numpy")
+
+
+@pytest.fixture
+def index(monkeypatch):
+    fresh = similarity.SimilarityIndex()
+    monkeypatch.setattr(similarity, "get_similarity_index", lambda shard=None: fresh)
+    return fresh
+
+
+def _similar(client, brew_id, **params):
+    response = client.get(f"/api/v1/brews/{brew_id}/similar", params=params)
+    assert response.status_code == 200
+    return [brew["id"] for brew in response.json()]
+
+
+def test_similar_brews_closest_first(db_client: TestClient, index):
+    db_client.post(
+        "/api/v1/brews/bulk",
+        json=[
+            brew_payload(water_temp=94.0, brew_time="03:00"),  # 1, the target
+            brew_payload(water_temp=80.0, brew_time="06:00"),  # 2, far
+            brew_payload(water_temp=94.5, brew_time="03:05"),  # 3, closest
+            brew_payload(water_temp=93.0, brew_time="03:10", brew_type="Chemex"),
+            brew_payload(water_temp=90.0, brew_time="04:00"),  # 5
+        ],
+    )
+
+    ids = _similar(db_client, 1)
+    assert ids[0] == 3 and ids[-1] == 2 and sorted(ids) == [2, 3, 4, 5]
+    assert _similar(db_client, 1, k=2) == ids[:2]
+    assert _similar(db_client, 1, brew_type="Chemex") == [4]
+    assert _similar(db_client, 1, min_water_temp=91) == [3, 4]
+    response = db_client.get("/api/v1/brews/1/similar", params={"fields": "id"})
+    assert response.json()[0] == {"id": 3}
+    assert db_client.get("/api/v1/brews/99/similar").status_code == 404
+
+
+def test_similar_brews_follow_writes(db_client: TestClient, index):
+    db_client.post(
+        "/api/v1/brews/bulk",
+        json=[
+            brew_payload(water_temp=94.0),
+            brew_payload(water_temp=90.0),
+            brew_payload(water_temp=80.0),
+        ],
+    )
+    assert _similar(db_client, 1) == [2, 3]
+    built_at = index.built_at
+
+    db_client.patch("/api/v1/brews/3", json={"water_temp": 93.5})
+    db_client.post("/api/v1/brews/", json=brew_payload(water_temp=94.2))
+    assert _similar(db_client, 1) == [4, 3, 2]
+
+    db_client.delete("/api/v1/brews/4")
+    assert _similar(db_client, 1) == [3, 2]
+    assert db_client.get("/api/v1/brews/4/similar").status_code == 404
+    # Applied from the change log, without rebuilding
+    assert index.built_at == built_at
+
+
+def test_index_rebuilt_after_many_changes(db_client: TestClient, index, monkeypatch):
+    monkeypatch.setattr(settings, "SIMILARITY_REBUILD_CHANGES", 2)
+    db_client.post("/api/v1/brews/bulk", json=[brew_payload()] * 2)
+    assert _similar(db_client, 1) == [2]
+    built_at = index.built_at
+
+    db_client.post("/api/v1/brews/bulk", json=[brew_payload()] * 3)
+
+    assert _similar(db_client, 1) == [2, 3, 4, 5]
+    assert index.built_at > built_at
@@ -0,0 +1,97 @@
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.crud import brew as crud
+from app.crud import stats as crud_stats
+from app.models.brew import Brew
+
+
+def _brew(**fields):
+    return Brew(
+        **{
+            "bean_type": "Kenyan",
+            "brew_type": "V60",
+            "water_temp": 94.0,
+            "weight_in": 20,
+            "weight_out": 300,
+            "brew_time": "03:00",
+            **fields,
+        }
+    )
+
+
+def test_stats_are_maintained_on_write(db_client: TestClient, db_session):
+    db_session.add_all(
+        [
+            _brew(water_temp=90.0, bloom_time=30),
+            _brew(water_temp=96.0, brew_time="02:30"),
+            _brew(brew_type="Espresso", weight_in=18, weight_out=36),
+        ]
+    )
+    db_session.commit()
+
+    stats = db_client.get("/api/v1/brews/stats").json()
+    assert [group["key"] for group in stats] == ["Espresso", "V60"]
+    v60 = stats[1]
+    assert v60["count"] == 2
+    assert v60["water_temp"]["mean"] == 93.0
+    assert v60["ratio"]["mean"] == 15.0
+    assert v60["bloom_time"]["mean"] == 30.0
+    assert v60["brew_seconds"]["mean"] == 165.0
+    assert stats[0]["ratio"]["mean"] == 2.0
+
+    espresso = db_session.query(Brew).filter(Brew.brew_type == "Espresso").one()
+    espresso.brew_type = "V60"
+    db_session.delete(db_session.get(Brew, 1))
+    db_session.commit()
+    crud.invalidate_cache()
+
+    stats = db_client.get("/api/v1/brews/stats").json()
+    assert [(group["key"], group["count"]) for group in stats] == [("V60", 2)]
+    assert stats[0]["water_temp"]["mean"] == 95.0
+    assert stats[0]["bloom_time"]["mean"] is None
+    rollups = db_session.execute(text("SELECT count(*) FROM brew_rollups")).scalar()
+    assert rollups == 3  # One group per dimension
+
+
+def test_stats_percentiles_and_grouping(db_client: TestClient, db_session):
+    db_session.add_all(
+        [
+            _brew(water_temp=float(temp), created_at=datetime(2024, 5, day, 8))
+            for temp, day in [(88, 1), (90, 1), (92, 1), (94, 2), (96, 2)]
+        ]
+    )
+    db_session.commit()
+
+    stats = db_client.get(
+        "/api/v1/brews/stats",
+        params={"group_by": "day", "percentiles": [0, 50, 90]},
+    ).json()
+    assert [(group["key"], group["count"]) for group in stats] == [
+        ("2024-05-01", 3),
+        ("2024-05-02", 2),
+    ]
+    assert stats[0]["water_temp"]["percentiles"] == {
+        "0": 88.0,
+        "50": 90.0,
+        "90": 92.0,
+    }
+    assert stats[1]["water_temp"]["percentiles"] == {
+        "0": 94.0,
+        "50": 94.0,
+        "90": 96.0,
+    }
+    assert stats[0]["bloom_time"]["percentiles"] == {}
+
+
+def test_stats_rollups_match_live_aggregates(db_session, monkeypatch):
+    db_session.add_all(
+        [_brew(bean_type=f"Bean {i % 3}", water_temp=85.0 + i) for i in range(10)]
+    )
+    db_session.commit()
+    from_rollups = crud_stats.get_brew_stats(db_session, group_by="bean_type")
+
+    monkeypatch.setattr(db_session.get_bind().dialect, "name", "postgresql")
+    assert crud_stats.get_brew_stats(db_session, group_by="bean_type") == from_rollups
@@ -0,0 +1,133 @@
+from datetime import datetime
+
+from conftest import brew_payload
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.crud import brew as crud
+from app.models.brew import Brew, BrewIngest
+
+ALICE = {"X-User-Id": "2"}
+
+
+def _sync(db_client: TestClient, since: int = 0, **params):
+    response = db_client.get("/api/v1/sync", params={"since": since, **params})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_sync_returns_each_changed_brew_once(db_client: TestClient):
+    ids = [
+        db_client.post("/api/v1/brews/", json=brew_payload(bean_type=name)).json()["id"]
+        for name in ("Kenyan", "Ethiopian", "Colombian")
+    ]
+    db_client.post("/api/v1/brews/", json=brew_payload(), headers=ALICE)
+    db_client.delete(f"/api/v1/brews/{ids[2]}")
+
+    snapshot = _sync(db_client)
+    assert [brew["id"] for brew in snapshot["brews"]] == ids[:2]
+    assert snapshot["deleted"] == []
+    assert snapshot["has_more"] is False
+    assert _sync(db_client, snapshot["version"])["brews"] == []
+
+    for temp in (90.0, 91.0, 92.0):
+        db_client.put(f"/api/v1/brews/{ids[0]}", json=brew_payload(water_temp=temp))
+    db_client.delete(f"/api/v1/brews/{ids[1]}")
+    delta = _sync(db_client, snapshot["version"])
+    assert [(brew["id"], brew["water_temp"]) for brew in delta["brews"]] == [
+        (ids[0], 92.0)
+    ]
+    assert delta["deleted"] == [ids[1]]
+    assert delta["version"] > snapshot["version"]
+
+
+def test_sync_pages_by_version(db_client: TestClient):
+    for _ in range(3):
+        db_client.post("/api/v1/brews/", json=brew_payload())
+
+    first = _sync(db_client, limit=2)
+    assert (len(first["brews"]), first["has_more"]) == (2, True)
+    rest = _sync(db_client, first["version"], limit=2)
+    assert (len(rest["brews"]), rest["has_more"]) == (1, False)
+
+
+def test_sync_reports_purged_brews_as_deleted(db_client: TestClient, db_session):
+    brew_id = db_client.post("/api/v1/brews/", json=brew_payload()).json()["id"]
+    version = _sync(db_client)["version"]
+    db_client.delete(f"/api/v1/brews/{brew_id}")
+    db_session.query(Brew).filter(Brew.id == brew_id).delete()
+    db_session.commit()
+
+    assert _sync(db_client, version)["deleted"] == [brew_id]
+
+
+def test_sync_keeps_archived_brews(db_client: TestClient, db_session):
+    brew_id = db_client.post("/api/v1/brews/", json=brew_payload()).json()["id"]
+    version = _sync(db_client)["version"]
+
+    assert crud.archive_brews(db_session, before=datetime(9999, 1, 1)) == 1
+
+    assert _sync(db_client, version)["deleted"] == []
+    changes = db_client.get("/api/v1/brews/changes").json()
+    assert [(c["brew_id"], c["op"]) for c in changes][-1] == (brew_id, "archive")
+
+
+def test_sync_applies_queued_writes(db_client: TestClient):
+    brew = db_client.post("/api/v1/brews/", json=brew_payload()).json()
+    other = db_client.post("/api/v1/brews/", json=brew_payload()).json()
+    db_client.put(f"/api/v1/brews/{other['id']}", json=brew_payload(water_temp=90))
+    writes = [
+        {"op": "create", "brew": brew_payload(bean_type="New"), "client_id": "a1"},
+        {
+            "op": "update",
+            "id": brew["id"],
+            "base_version": 1,
+            "brew": brew_payload(water_temp=96),
+        },
+        {"op": "delete", "id": other["id"], "base_version": 1},
+        {"op": "delete", "id": 999},
+        {"op": "update", "id": brew["id"]},
+    ]
+
+    results = db_client.post("/api/v1/sync", json=writes).json()
+
+    assert [result["status"] for result in results] == [
+        "applied",
+        "applied",
+        "conflict",
+        "not_found",
+        "invalid",
+    ]
+    assert results[2]["brew"]["water_temp"] == 90
+    created = results[0]["id"]
+    assert db_client.get(f"/api/v1/brews/{created}").json()["bean_type"] == "New"
+    assert db_client.get(f"/api/v1/brews/{brew['id']}").json()["version"] == 2
+
+    # Sending the batch again after a lost response creates nothing new
+    replayed = db_client.post("/api/v1/sync", json=writes[:1]).json()
+    assert replayed[0]["id"] == created
+    assert len(db_client.get("/api/v1/brews/").json()) == 3
+
+
+def test_sync_creates_are_deduplicated_per_user(db_client: TestClient, db_session):
+    ingested = db_client.post("/api/v1/brews/", json=brew_payload()).json()
+    db_session.add(BrewIngest(token="shared", brew_id=ingested["id"]))
+    db_session.commit()
+    create = [{"op": "create", "brew": brew_payload(), "client_id": "shared"}]
+
+    mine = db_client.post("/api/v1/sync", json=create).json()[0]
+    theirs = db_client.post("/api/v1/sync", json=create, headers=ALICE).json()[0]
+
+    # Neither the ingest token nor the other user's client ID is matched
+    assert len({ingested["id"], mine["id"], theirs["id"]}) == 3
+    assert db_client.get(f"/api/v1/brews/{theirs['id']}", headers=ALICE).is_success
+
+
+def test_sync_creates_outlive_ingest_retention(db_client: TestClient, monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_RETENTION_SECONDS", 0)
+    create = [{"op": "create", "brew": brew_payload(), "client_id": "offline"}]
+
+    created = db_client.post("/api/v1/sync", json=create).json()[0]["id"]
+    db_client.post("/api/v1/brews/", json=brew_payload())
+    assert db_client.post("/api/v1/sync", json=create).json()[0]["id"] == created
+    assert len(db_client.get("/api/v1/brews/").json()) == 2
@@ -0,0 +1,67 @@
+from conftest import brew_payload
+from fastapi.testclient import TestClient
+
+from app.core import database
+from app.core.config import settings
+
+ALICE = {"X-User-Id": "2"}
+BOB = {"X-User-Id": "3"}
+
+
+def test_users_only_see_their_own_brews(db_client: TestClient):
+    created = db_client.post("/api/v1/brews/", json=brew_payload(), headers=ALICE)
+    brew_id = created.json()["id"]
+    db_client.post(
+        "/api/v1/brews/", json=brew_payload(brew_type="Espresso"), headers=BOB
+    )
+
+    listed = db_client.get("/api/v1/brews/", headers=ALICE).json()
+    assert [brew["id"] for brew in listed] == [brew_id]
+    stats = db_client.get("/api/v1/brews/stats", headers=BOB).json()
+    assert [(group["key"], group["count"]) for group in stats] == [("Espresso", 1)]
+    assert db_client.get("/api/v1/brews/").json() == []
+
+    assert db_client.get(f"/api/v1/brews/{brew_id}", headers=BOB).status_code == 404
+    response = db_client.delete(f"/api/v1/brews/{brew_id}", headers=BOB)
+    assert response.status_code == 404
+    response = db_client.put(
+        "/api/v1/brews/bulk", json=[brew_payload(id=brew_id)], headers=BOB
+    )
+    assert response.json()["errors"][0]["detail"] == "Brew ID is not available"
+    assert db_client.get(f"/api/v1/brews/{brew_id}", headers=ALICE).status_code == 200
+
+
+def test_user_scoped_responses_vary_on_user(db_client: TestClient):
+    brew = db_client.post("/api/v1/brews/", json=brew_payload(), headers=ALICE)
+    assert "X-User-Id" in brew.headers["vary"]
+    url = f"/api/v1/brews/{brew.json()['id']}"
+
+    for path in (
+        url,
+        "/api/v1/brews/",
+        "/api/v1/brews/search?q=Kenyan",
+        "/api/v1/brews/stats",
+        "/api/v1/sync",
+    ):
+        response = db_client.get(path, headers=ALICE)
+        assert response.status_code == 200
+        assert "X-User-Id" in response.headers["vary"]
+
+    etag = db_client.get(url, headers=ALICE).headers["etag"]
+    response = db_client.get(url, headers={**ALICE, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert "X-User-Id" in response.headers["vary"]
+
+
+def test_users_spread_across_shards(tmp_path, monkeypatch):
+    urls = [f"sqlite:///{tmp_path / f'shard{n}.db'}" for n in range(2)]
+    monkeypatch.setattr(settings, "DATABASE_SHARDS", urls)
+    database.get_engine.cache_clear()
+    try:
+        assert database.all_shards() == [0, 1]
+        assert [database.shard_for(user_id) for user_id in (2, 3, 4)] == [0, 1, 0]
+        engines = database.get_engines()
+        assert [str(engine.url) for engine in engines] == urls
+        assert database.get_engine(read_only=True, shard=1) is engines[1]
+    finally:
+        database.get_engine.cache_clear()
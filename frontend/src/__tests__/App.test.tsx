@@ -64,16 +64,26 @@ jest.mock("../components/BrewItem", () => {
 });
 
 describe("App", () => {
-  const mockSuccessResponse = {
+  /**
+   * Builds the response of the sync endpoint listing some brews.
+   * @param brews - Brews created since the last sync
+   */
+  const mockSyncResponse = (brews: any[]) => ({
     ok: true,
-    json: () => Promise.resolve([]),
-  };
+    json: () =>
+      Promise.resolve({
+        version: brews.length,
+        brews,
+        deleted: [],
+        has_more: false,
+      }),
+  });
 
   beforeEach(() => {
     // Mock fetch globally before each test with a default success response
     global.fetch = jest
       .fn()
-      .mockImplementation(() => Promise.resolve(mockSuccessResponse));
+      .mockImplementation(() => Promise.resolve(mockSyncResponse([])));
   });
 
   afterEach(() => {
@@ -129,6 +139,9 @@ describe("App", () => {
     let brews: any[] = [];
 
     (global.fetch as jest.Mock).mockImplementation(async (url, options) => {
+      if (url.toString().includes("/sync?")) {
+        return Promise.resolve(mockSyncResponse(brews));
+      }
       if (url.toString().endsWith("/brews/")) {
         if (options?.method === "POST") {
           brews.push(mockBrew);
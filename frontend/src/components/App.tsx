@@ -1,10 +1,19 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useCallback, useRef } from "react";
 import BrewList from "./BrewList";
 import AddBrewForm from "./AddBrewForm";
 import SearchBar from "./SearchBar";
-import { api, type Brew, type NewBrew } from "../services/api";
+import {
+  api,
+  type Brew,
+  type NewBrew,
+  type PendingWrite,
+} from "../services/api";
+import { applyDelta } from "../services/brewCache";
 import styles from "./App.module.css";
 
+/** Delay after the last keystroke before searching, in milliseconds */
+const SEARCH_DEBOUNCE_MS = 250;
+
 /**
  * Main application component for BrewLog.
  * Manages the state of coffee brews and provides functionality for CRUD operations.
@@ -15,25 +24,111 @@ const App: React.FC = () => {
   const [error, setError] = useState<string | null>(null);
   const [isLoading, setIsLoading] = useState(true);
   const [searchQuery, setSearchQuery] = useState("");
+  const [searchResults, setSearchResults] = useState<Brew[] | null>(null);
+  const [rejected, setRejected] = useState<PendingWrite[]>([]);
+  /** Query of the search whose results are shown, or "" for none */
+  const activeQuery = useRef("");
+
+  /**
+   * Syncs the local copy of the brews with the server and applies the
+   * changes to the local state, along with the offline writes it refused.
+   */
+  const syncBrews = useCallback(async () => {
+    const delta = await api.sync();
+    setBrews((current) => applyDelta(current, delta));
+    setRejected(await api.rejectedWrites());
+  }, []);
+
+  /** Discards the refused offline writes the user has seen */
+  const handleDismissRejected = async () => {
+    await api.dismissRejectedWrites();
+    setRejected(await api.rejectedWrites());
+  };
 
   useEffect(() => {
+    /**
+     * Shows the brews stored locally at once, then syncs with the server.
+     * Once the local copy is shown, failing to sync is only logged, since
+     * the app keeps working offline.
+     */
+    const loadBrews = async () => {
+      let cached: Brew[] = [];
+      try {
+        cached = await api.loadLocalBrews();
+        if (cached.length) {
+          setBrews(cached);
+          setIsLoading(false);
+        }
+        await syncBrews();
+        setError(null);
+      } catch (err) {
+        if (!cached.length) {
+          setError("Failed to load brews. Please try again later.");
+        }
+        console.error("Error loading brews:", err);
+      } finally {
+        setIsLoading(false);
+      }
+    };
     loadBrews();
-  }, []);
+  }, [syncBrews]);
+
+  /**
+   * Syncs when the server reports a change made by any client, and when
+   * the browser comes back online, so queued writes are sent.
+   */
+  useEffect(() => {
+    const handleChange = () => {
+      syncBrews().catch((err) => console.error("Error syncing brews:", err));
+    };
+    window.addEventListener("online", handleChange);
+    const unsubscribe = api.subscribeToChanges(handleChange);
+    return () => {
+      window.removeEventListener("online", handleChange);
+      unsubscribe();
+    };
+  }, [syncBrews]);
 
   /**
-   * Fetches all brews from the API and updates the local state.
-   * Handles errors by setting an error message in state.
+   * Searches the brews on the server and shows the results, unless the
+   * query has changed by the time they arrive.
+   * @param query - Trimmed search query
    */
-  const loadBrews = async () => {
+  const runSearch = useCallback(async (query: string) => {
     try {
-      const fetchedBrews = await api.getBrews();
-      setBrews(fetchedBrews);
-      setError(null);
+      const results = await api.searchBrews(query);
+      if (activeQuery.current === query) {
+        setSearchResults(results);
+        setError(null);
+      }
     } catch (err) {
-      setError("Failed to load brews. Please try again later.");
-      console.error("Error loading brews:", err);
-    } finally {
-      setIsLoading(false);
+      if (activeQuery.current === query) {
+        setError("Failed to search brews. Please try again.");
+      }
+      console.error("Error searching brews:", err);
+    }
+  }, []);
+
+  /**
+   * Runs the search on the server once the user stops typing.
+   * An empty query shows the full list again. Changes to the brews do not
+   * search again: local writes refresh the results themselves.
+   */
+  useEffect(() => {
+    const query = searchQuery.trim();
+    activeQuery.current = query;
+    if (!query) {
+      setSearchResults(null);
+      return;
+    }
+    const timer = setTimeout(() => runSearch(query), SEARCH_DEBOUNCE_MS);
+    return () => clearTimeout(timer);
+  }, [searchQuery, runSearch]);
+
+  /** Searches again after a local write, if a search is shown */
+  const refreshSearch = () => {
+    if (activeQuery.current) {
+      runSearch(activeQuery.current);
     }
   };
 
@@ -49,15 +144,29 @@ const App: React.FC = () => {
 
   /**
    * Creates a new brew entry via the API and updates the local state.
+   * While offline, the brew is queued and sent on the next sync.
    * @param newBrew - The new brew data to be created
    */
   const handleAddBrew = async (newBrew: NewBrew) => {
     try {
       setIsLoading(true);
-      const createdBrew = await api.createBrew(newBrew);
-      setBrews([createdBrew, ...brews]);
+      let createdBrew: Brew;
+      try {
+        createdBrew = await api.createBrew(newBrew);
+      } catch (err) {
+        if (!api.isOffline(err)) {
+          throw err;
+        }
+        createdBrew = await api.queueCreate(newBrew);
+      }
+      // A sync may already have added it
+      setBrews((current) => [
+        createdBrew,
+        ...current.filter((brew) => brew.id !== createdBrew.id),
+      ]);
       setShowForm(false);
       setError(null);
+      refreshSearch();
     } catch (err) {
       setError("Failed to add brew. Please try again.");
       console.error("Error adding brew:", err);
@@ -68,36 +177,52 @@ const App: React.FC = () => {
 
   /**
    * Deletes a brew entry by ID and updates the local state.
+   * While offline, or for brews not yet sent, the deletion is queued.
    * @param id - The ID of the brew to delete
    */
   const handleDeleteBrew = async (id: number) => {
+    const version = brews.find((brew) => brew.id === id)?.version;
     try {
-      await api.deleteBrew(id);
-      setBrews(brews.filter((brew) => brew.id !== id));
+      if (id < 0) {
+        // Created offline, so only its queued creation needs cancelling
+        await api.queueDelete(id);
+        setRejected(await api.rejectedWrites());
+      } else {
+        try {
+          await api.deleteBrew(id);
+        } catch (err) {
+          if (!api.isOffline(err)) {
+            throw err;
+          }
+          await api.queueDelete(id, version);
+        }
+      }
+      setBrews((current) => current.filter((brew) => brew.id !== id));
       setError(null);
+      refreshSearch();
     } catch (err) {
       setError("Failed to delete brew. Please try again.");
       console.error("Error deleting brew:", err);
     }
   };
 
-  /**
-   * Filters brews based on the search query.
-   * Matches against bean type, brew type, and details.
-   */
-  const filteredBrews = brews.filter((brew) => {
-    const searchLower = searchQuery.toLowerCase();
-    return (
-      brew.beanType.toLowerCase().includes(searchLower) ||
-      brew.brewType.toLowerCase().includes(searchLower) ||
-      (brew.details?.toLowerCase().includes(searchLower) ?? false)
-    );
-  });
+  /** Brews to display: server-side search results, or the full list */
+  const filteredBrews = searchResults ?? brews;
 
   return (
     <div className={styles.container}>
       <h1 className={styles.appTitle}>BrewLog: Your Coffee Journey</h1>
       {error && <div className={styles.errorMessage}>{error}</div>}
+      {rejected.length > 0 && (
+        <div className={styles.errorMessage}>
+          <span>
+            {rejected.length} change(s) made offline could not be saved:{" "}
+            {rejected.map((write) => write.rejected).join("; ")}. Brews added
+            offline stay on this device until you delete them.
+          </span>
+          <button onClick={handleDismissRejected}>Dismiss</button>
+        </div>
+      )}
       <SearchBar 
         value={searchQuery}
         onChange={setSearchQuery}
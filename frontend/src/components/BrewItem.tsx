@@ -15,6 +15,7 @@ import DeleteConfirmation from "./DeleteConfirmation";
  * @property {string} brewTime - Total brewing time
  * @property {number} bloomTime - Coffee bloom time in seconds
  * @property {string} [details] - Optional additional brewing notes
+ * @property {number} [version] - Revision of the brew, used to cache its thumbnail
  * @property {Function} onDelete - Callback function for brew deletion
  */
 interface BrewItemProps {
@@ -28,6 +29,7 @@ interface BrewItemProps {
   brewTime: string;
   bloomTime: number;
   details?: string;
+  version?: number;
   onDelete: (id: number) => void;
 }
 
@@ -79,6 +81,7 @@ const BrewItem: React.FC<BrewItemProps> = ({
   brewTime,
   bloomTime,
   details,
+  version,
   onDelete,
 }) => {
   const [startX, setStartX] = useState<number | null>(null);
@@ -172,10 +175,14 @@ const BrewItem: React.FC<BrewItemProps> = ({
 
   /**
    * Selects appropriate image based on bean type or provided URL
+   * Uploaded images are requested as thumbnails, versioned so they can be cached
    * Falls back to default image if no matches found
    * @returns URL of the selected image
    */
   const getImage = () => {
+    if (imageUrl && imageUrl.endsWith(`/brews/${id}/image`)) {
+      return `${imageUrl}?size=thumb&v=${version}`;
+    }
     if (imageUrl && !imageUrl.includes("placeholder")) {
       return imageUrl;
     }
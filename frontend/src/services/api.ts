@@ -1,5 +1,20 @@
+import { brewCache, type BrewDelta, type PendingWrite } from "./brewCache";
+
+/** Origin of the backend server */
+const API_ORIGIN = "http://localhost:8000";
+
 /** Base URL for the API endpoints */
-const API_BASE_URL = "http://localhost:8000/api/v1";
+const API_BASE_URL = `${API_ORIGIN}/api/v1`;
+
+/**
+ * Resolves an image URL returned by the API.
+ * Uploaded images are served by the backend under a server-relative path.
+ * @param {string | null} url - Image URL from the API
+ * @returns {string | null} Absolute image URL
+ */
+function resolveImageUrl(url: string | null): string | null {
+  return url && url.startsWith("/") ? `${API_ORIGIN}${url}` : url;
+}
 
 /**
  * Interface representing a coffee brew record.
@@ -14,6 +29,8 @@ const API_BASE_URL = "http://localhost:8000/api/v1";
  * @property {string} brewTime - Total brewing time in "mm:ss" format
  * @property {number} bloomTime - Coffee bloom time in seconds
  * @property {string} [details] - Optional additional brewing notes
+ * @property {number} [version] - Revision of the brew, set by the API
+ * @property {string} [createdAt] - ISO timestamp of record creation
  */
 interface Brew {
   id: number;
@@ -26,6 +43,8 @@ interface Brew {
   brewTime: string;
   bloomTime: number;
   details?: string;
+  version?: number;
+  createdAt?: string;
 }
 
 /**
@@ -44,6 +63,22 @@ interface BrewResponse extends Brew {
 /** Type for creating new brews, excluding the ID field */
 type NewBrew = Omit<Brew, "id">;
 
+/**
+ * Interface representing an entry of the brew change log.
+ * @interface BrewChange
+ * @property {number} id - Position of the change in the log
+ * @property {number} brewId - ID of the brew written
+ * @property {string} op - Kind of write: "create", "update", "delete" or
+ * "archive"
+ * @property {number} version - Version of the brew after the write
+ */
+interface BrewChange {
+  id: number;
+  brewId: number;
+  op: "create" | "update" | "delete" | "archive";
+  version: number;
+}
+
 /**
  * Transforms API response from snake_case to camelCase.
  * @param {any} brew - Raw brew data from API
@@ -53,14 +88,16 @@ function transformBrewResponse(brew: any): Brew {
   return {
     id: brew.id,
     beanType: brew.bean_type,
-    imageUrl: brew.image_url,
+    imageUrl: resolveImageUrl(brew.image_url),
     brewType: brew.brew_type,
     waterTemp: brew.water_temp,
     weightIn: brew.weight_in,
     weightOut: brew.weight_out,
     brewTime: brew.brew_time,
     bloomTime: brew.bloom_time,
+    version: brew.version,
     details: brew.details,
+    createdAt: brew.created_at,
   };
 }
 
@@ -72,7 +109,9 @@ function transformBrewResponse(brew: any): Brew {
 function transformBrewRequest(brew: NewBrew): any {
   return {
     bean_type: brew.beanType,
-    image_url: brew.imageUrl,
+    image_url: brew.imageUrl?.startsWith(API_ORIGIN)
+      ? brew.imageUrl.slice(API_ORIGIN.length)
+      : brew.imageUrl,
     brew_type: brew.brewType,
     water_temp: brew.waterTemp,
     weight_in: brew.weightIn,
@@ -83,6 +122,119 @@ function transformBrewRequest(brew: NewBrew): any {
   };
 }
 
+/**
+ * Transforms a queued write to the format of the sync endpoint.
+ * @param {PendingWrite} write - Write made offline
+ * @returns {any} Transformed data for API request
+ */
+function transformWriteRequest(write: PendingWrite): any {
+  return {
+    op: write.op,
+    id: write.op === "create" ? undefined : write.id,
+    base_version: write.baseVersion,
+    brew: write.brew && transformBrewRequest(write.brew),
+    client_id: write.clientId,
+  };
+}
+
+/**
+ * Generates the random ID the server recognizes a queued brew creation by.
+ * @returns {string} 32 hexadecimal digits
+ */
+function newClientId(): string {
+  const bytes = crypto.getRandomValues(new Uint8Array(16));
+  return Array.from(bytes, (byte) => byte.toString(16).padStart(2, "0")).join(
+    "",
+  );
+}
+
+/**
+ * Sends the writes queued offline, then fetches the brews written on the
+ * server since the last sync, storing both in the local copy.
+ * Conflicting writes are dropped in favor of the server's brew. Writes the
+ * server refuses are kept, with the reason, and brews created by them stay
+ * in the local copy, so no brew is lost before the user has seen why.
+ * @returns {Promise<BrewDelta>} Changes made to the local copy
+ * @throws {Error} If the API request fails
+ */
+async function runSync(): Promise<BrewDelta> {
+  const changed = new Map<number, Brew>();
+  const deleted = new Set<number>();
+  const writes = (await brewCache.pendingWrites()).filter(
+    (write) => !write.rejected,
+  );
+  if (writes.length) {
+    const response = await fetch(`${API_BASE_URL}/sync`, {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+      },
+      body: JSON.stringify(writes.map(transformWriteRequest)),
+    });
+    if (!response.ok) {
+      throw new Error("Failed to send queued brews");
+    }
+    const results: any[] = await response.json();
+    const done: PendingWrite[] = [];
+    const rejected: PendingWrite[] = [];
+    results.forEach((result) => {
+      const write = writes[result.index];
+      if (
+        result.status === "applied" ||
+        (result.status === "conflict" && result.brew)
+      ) {
+        done.push(write);
+      } else {
+        rejected.push({ ...write, rejected: result.detail ?? result.status });
+      }
+    });
+    // Brews created offline come back from the server with their real ID
+    const placeholders = done
+      .filter((write) => write.op === "create")
+      .map((write) => write.id);
+    await brewCache.removeWrites(
+      done.map((write) => write.seq!),
+      placeholders,
+    );
+    await brewCache.rejectWrites(rejected);
+    placeholders.forEach((id) => deleted.add(id));
+  }
+  let since = await brewCache.loadVersion();
+  let hasMore = true;
+  while (hasMore) {
+    const response = await fetch(`${API_BASE_URL}/sync?since=${since}`);
+    if (!response.ok) {
+      throw new Error("Failed to sync brews");
+    }
+    const page = await response.json();
+    const brews: Brew[] = page.brews.map(transformBrewResponse);
+    await brewCache.applyChanges(
+      { brews, deleted: page.deleted },
+      page.version,
+    );
+    brews.forEach((brew) => {
+      changed.set(brew.id, brew);
+      deleted.delete(brew.id);
+    });
+    page.deleted.forEach((id: number) => {
+      changed.delete(id);
+      deleted.add(id);
+    });
+    since = page.version;
+    hasMore = page.has_more;
+  }
+  return {
+    brews: Array.from(changed.values()),
+    deleted: Array.from(deleted),
+  };
+}
+
+/** Sync in progress, if any */
+let runningSync: Promise<BrewDelta> | null = null;
+
+/** Sync queued after the one in progress, shared by all who ask meanwhile */
+let nextSync: Promise<BrewDelta> | null = null;
+
 /**
  * API client for interacting with the brewing records backend.
  * Provides CRUD operations for brew records with automatic case transformation.
@@ -102,6 +254,60 @@ export const api = {
     return data.map(transformBrewResponse);
   },
 
+  /**
+   * Fetches a single brew record.
+   * @param {number} id - ID of the brew to fetch
+   * @returns {Promise<Brew>} Brew record
+   * @throws {Error} If the API request fails
+   */
+  async getBrew(id: number): Promise<Brew> {
+    const response = await fetch(`${API_BASE_URL}/brews/${id}`);
+    if (!response.ok) {
+      throw new Error("Failed to fetch brew");
+    }
+    const data = await response.json();
+    return transformBrewResponse(data);
+  },
+
+  /**
+   * Subscribes to the changes made to brews, by this or any other client.
+   * The browser reconnects by itself and resumes after the last change seen.
+   * @param {(change: BrewChange) => void} onChange - Called for each change
+   * @returns {() => void} Function closing the subscription
+   */
+  subscribeToChanges(onChange: (change: BrewChange) => void): () => void {
+    if (typeof EventSource === "undefined") {
+      return () => {};
+    }
+    const source = new EventSource(`${API_BASE_URL}/brews/changes`);
+    source.onmessage = (event) => {
+      const change = JSON.parse(event.data);
+      onChange({
+        id: change.id,
+        brewId: change.brew_id,
+        op: change.op,
+        version: change.version,
+      });
+    };
+    return () => source.close();
+  },
+
+  /**
+   * Searches brew records on the server by bean type, brew type and details.
+   * @param {string} query - Free-text search query
+   * @returns {Promise<Brew[]>} Matching brew records, most relevant first
+   * @throws {Error} If the API request fails
+   */
+  async searchBrews(query: string): Promise<Brew[]> {
+    const params = new URLSearchParams({ q: query });
+    const response = await fetch(`${API_BASE_URL}/brews/search?${params}`);
+    if (!response.ok) {
+      throw new Error("Failed to search brews");
+    }
+    const data = await response.json();
+    return data.map(transformBrewResponse);
+  },
+
   /**
    * Creates a new brew record.
    * @param {NewBrew} brew - New brew data
@@ -120,7 +326,9 @@ export const api = {
       throw new Error("Failed to create brew");
     }
     const data = await response.json();
-    return transformBrewResponse(data);
+    const created = transformBrewResponse(data);
+    await brewCache.applyChanges({ brews: [created], deleted: [] });
+    return created;
   },
 
   /**
@@ -142,7 +350,9 @@ export const api = {
       throw new Error("Failed to update brew");
     }
     const data = await response.json();
-    return transformBrewResponse(data);
+    const updated = transformBrewResponse(data);
+    await brewCache.applyChanges({ brews: [updated], deleted: [] });
+    return updated;
   },
 
   /**
@@ -157,7 +367,121 @@ export const api = {
     if (!response.ok) {
       throw new Error("Failed to delete brew");
     }
+    await brewCache.applyChanges({ brews: [], deleted: [id] });
+  },
+
+  /**
+   * Tells whether a failed request failed because the server is unreachable.
+   * @param {unknown} err - Error thrown by an API method
+   * @returns {boolean} True when offline or the network request failed
+   */
+  isOffline(err: unknown): boolean {
+    return !navigator.onLine || err instanceof TypeError;
+  },
+
+  /**
+   * Loads the brews stored locally by earlier syncs, without any request.
+   * @returns {Promise<Brew[]>} Stored brews, newest first
+   */
+  loadLocalBrews(): Promise<Brew[]> {
+    return brewCache.loadBrews();
+  },
+
+  /**
+   * Brings the local copy of the brews up to date with the server.
+   * Writes queued offline are sent first. Only the brews written since the
+   * last sync are fetched. Concurrent calls share the sync in progress, or
+   * the one queued after it.
+   * @returns {Promise<BrewDelta>} Changes made to the local copy
+   * @throws {Error} If the API request fails
+   */
+  sync(): Promise<BrewDelta> {
+    if (nextSync !== null) {
+      return nextSync;
+    }
+    const start = () => {
+      nextSync = null;
+      runningSync = runSync().finally(() => {
+        runningSync = null;
+      });
+      return runningSync;
+    };
+    if (runningSync === null) {
+      return start();
+    }
+    nextSync = runningSync.catch(() => undefined).then(start);
+    return nextSync;
+  },
+
+  /**
+   * Lists the writes made offline that the server refused.
+   * @returns {Promise<PendingWrite[]>} Refused writes, with the reason in
+   * `rejected`
+   */
+  async rejectedWrites(): Promise<PendingWrite[]> {
+    const writes = await brewCache.pendingWrites();
+    return writes.filter((write) => write.rejected);
+  },
+
+  /**
+   * Discards the refused updates and deletions. Refused creations stay
+   * until their brew is deleted, so the brew is not lost.
+   */
+  async dismissRejectedWrites(): Promise<void> {
+    const writes = await brewCache.pendingWrites();
+    await brewCache.removeWrites(
+      writes
+        .filter((write) => write.rejected && write.op !== "create")
+        .map((write) => write.seq!),
+    );
+  },
+
+  /**
+   * Creates a brew locally, to be sent to the server on the next sync.
+   * @param {NewBrew} brew - New brew data
+   * @returns {Promise<Brew>} Local brew, with a negative placeholder ID
+   */
+  async queueCreate(brew: NewBrew): Promise<Brew> {
+    const created = {
+      ...brew,
+      id: -Date.now(),
+      createdAt: new Date().toISOString(),
+    };
+    await brewCache.queueWrite(
+      { op: "create", id: created.id, brew, clientId: newClientId() },
+      { brews: [created], deleted: [] },
+    );
+    return created;
+  },
+
+  /**
+   * Deletes a brew locally, to be deleted on the server on the next sync.
+   * Deleting a brew created offline only cancels its creation.
+   * @param {number} id - ID of the brew to delete
+   * @param {number} [baseVersion] - Version of the brew seen by the user
+   */
+  async queueDelete(id: number, baseVersion?: number): Promise<void> {
+    if (id < 0) {
+      const writes = await brewCache.pendingWrites();
+      const creates = writes.filter((write) => write.id === id);
+      await brewCache.removeWrites(
+        creates.map((write) => write.seq!),
+        [id],
+      );
+      return;
+    }
+    await brewCache.queueWrite(
+      { op: "delete", id, baseVersion },
+      { brews: [], deleted: [id] },
+    );
   },
 };
 
-export type { Brew, BrewResponse, NewBrew };
+export type {
+  Brew,
+  BrewChange,
+  BrewDelta,
+  BrewResponse,
+  NewBrew,
+  PendingWrite,
+};
@@ -0,0 +1,287 @@
+import type { Brew, NewBrew } from "./api";
+
+/** Name of the IndexedDB database holding the local copy of the brews */
+const DB_NAME = "brewlog";
+
+/** Schema version of the IndexedDB database */
+const DB_VERSION = 1;
+
+/** Object store of the brews, keyed by ID */
+const BREWS = "brews";
+
+/** Object store of single values, such as the sync version */
+const META = "meta";
+
+/** Object store of the writes waiting to be sent, in the order made */
+const OUTBOX = "outbox";
+
+/** Key of the sync version in the meta store */
+const VERSION_KEY = "version";
+
+/**
+ * Interface representing a write made while offline, waiting to be sent.
+ * @interface PendingWrite
+ * @property {number} [seq] - Position in the outbox, assigned when queued
+ * @property {string} op - Kind of write: "create", "update" or "delete"
+ * @property {number} id - ID of the brew, negative for brews created offline
+ * @property {number} [baseVersion] - Version of the brew the write was made on
+ * @property {NewBrew} [brew] - Brew data to create or update with
+ * @property {string} [clientId] - Random ID the server creates the brew once by
+ * @property {string} [rejected] - Why the server refused the write, which is
+ * then kept, and not sent again, until the user discards it
+ */
+interface PendingWrite {
+  seq?: number;
+  op: "create" | "update" | "delete";
+  id: number;
+  baseVersion?: number;
+  brew?: NewBrew;
+  clientId?: string;
+  rejected?: string;
+}
+
+/**
+ * Interface representing changes to apply to a list of brews.
+ * @interface BrewDelta
+ * @property {Brew[]} brews - Brews created or updated
+ * @property {number[]} deleted - IDs of the brews deleted
+ */
+interface BrewDelta {
+  brews: Brew[];
+  deleted: number[];
+}
+
+/** Stand-in for the database where IndexedDB is unavailable, kept in memory */
+const memory = {
+  brews: new Map<number, Brew>(),
+  version: 0,
+  outbox: [] as PendingWrite[],
+  nextSeq: 1,
+};
+
+let database: Promise<IDBDatabase | null> | null = null;
+
+/**
+ * Stores changes to the brews in the in-memory stand-in.
+ * @param {BrewDelta} delta - Brews created, updated or deleted
+ */
+function applyToMemory(delta: BrewDelta): void {
+  delta.brews.forEach((brew) => memory.brews.set(brew.id, brew));
+  delta.deleted.forEach((id) => memory.brews.delete(id));
+}
+
+/**
+ * Waits for an IndexedDB request to complete.
+ * @param {IDBRequest<T>} request - Pending request
+ * @returns {Promise<T>} Result of the request
+ */
+function requestResult<T>(request: IDBRequest<T>): Promise<T> {
+  return new Promise((resolve, reject) => {
+    request.onsuccess = () => resolve(request.result);
+    request.onerror = () => reject(request.error);
+  });
+}
+
+/**
+ * Waits for an IndexedDB transaction to commit.
+ * @param {IDBTransaction} transaction - Open transaction
+ * @returns {Promise<void>} Resolved once committed
+ */
+function committed(transaction: IDBTransaction): Promise<void> {
+  return new Promise((resolve, reject) => {
+    transaction.oncomplete = () => resolve();
+    transaction.onerror = () => reject(transaction.error);
+    transaction.onabort = () => reject(transaction.error);
+  });
+}
+
+/**
+ * Opens the local database, creating its stores on first use.
+ * @returns {Promise<IDBDatabase | null>} Database, or null if the browser
+ * provides no IndexedDB or refuses storage, as in private browsing
+ */
+function openDatabase(): Promise<IDBDatabase | null> {
+  if (database === null) {
+    database = new Promise((resolve) => {
+      if (typeof indexedDB === "undefined") {
+        resolve(null);
+        return;
+      }
+      const request = indexedDB.open(DB_NAME, DB_VERSION);
+      request.onupgradeneeded = () => {
+        const db = request.result;
+        db.createObjectStore(BREWS, { keyPath: "id" });
+        db.createObjectStore(META);
+        db.createObjectStore(OUTBOX, { keyPath: "seq", autoIncrement: true });
+      };
+      request.onsuccess = () => resolve(request.result);
+      request.onerror = () => resolve(null);
+    });
+  }
+  return database;
+}
+
+/**
+ * Orders brews newest first, as the API lists them.
+ * @param {Brew[]} brews - Brews in any order
+ * @returns {Brew[]} Sorted copy
+ */
+function newestFirst(brews: Brew[]): Brew[] {
+  return [...brews].sort(
+    (a, b) =>
+      (b.createdAt ?? "").localeCompare(a.createdAt ?? "") || b.id - a.id,
+  );
+}
+
+/**
+ * Applies changes to a list of brews.
+ * @param {Brew[]} brews - Current brews
+ * @param {BrewDelta} delta - Brews created, updated or deleted
+ * @returns {Brew[]} Updated brews, newest first
+ */
+function applyDelta(brews: Brew[], delta: BrewDelta): Brew[] {
+  if (!delta.brews.length && !delta.deleted.length) {
+    return brews;
+  }
+  const removed = new Set([
+    ...delta.deleted,
+    ...delta.brews.map((brew) => brew.id),
+  ]);
+  return newestFirst([
+    ...delta.brews,
+    ...brews.filter((brew) => !removed.has(brew.id)),
+  ]);
+}
+
+export const brewCache = {
+  /**
+   * Loads the local copy of the brews.
+   * @returns {Promise<Brew[]>} Stored brews, newest first
+   */
+  async loadBrews(): Promise<Brew[]> {
+    const db = await openDatabase();
+    if (db === null) {
+      return newestFirst(Array.from(memory.brews.values()));
+    }
+    const store = db.transaction(BREWS).objectStore(BREWS);
+    return newestFirst(await requestResult(store.getAll()));
+  },
+
+  /**
+   * Reads the sync version the local copy reflects.
+   * @returns {Promise<number>} Sync version, or 0 before the first sync
+   */
+  async loadVersion(): Promise<number> {
+    const db = await openDatabase();
+    if (db === null) {
+      return memory.version;
+    }
+    const store = db.transaction(META).objectStore(META);
+    return (await requestResult(store.get(VERSION_KEY))) ?? 0;
+  },
+
+  /**
+   * Stores changes to the brews in one transaction.
+   * @param {BrewDelta} delta - Brews created, updated or deleted
+   * @param {number} [version] - Sync version the changes bring the copy to,
+   * if they come from the server's sync endpoint
+   */
+  async applyChanges(delta: BrewDelta, version?: number): Promise<void> {
+    const db = await openDatabase();
+    if (db === null) {
+      applyToMemory(delta);
+      memory.version = version ?? memory.version;
+      return;
+    }
+    const transaction = db.transaction([BREWS, META], "readwrite");
+    const brews = transaction.objectStore(BREWS);
+    delta.brews.forEach((brew) => brews.put(brew));
+    delta.deleted.forEach((id) => brews.delete(id));
+    if (version !== undefined) {
+      transaction.objectStore(META).put(version, VERSION_KEY);
+    }
+    await committed(transaction);
+  },
+
+  /**
+   * Queues a write to send on the next sync, and applies it to the local copy.
+   * @param {PendingWrite} write - Write made offline
+   * @param {BrewDelta} delta - Its effect on the local copy
+   */
+  async queueWrite(write: PendingWrite, delta: BrewDelta): Promise<void> {
+    const db = await openDatabase();
+    if (db === null) {
+      memory.outbox.push({ ...write, seq: memory.nextSeq++ });
+      applyToMemory(delta);
+      return;
+    }
+    const transaction = db.transaction([BREWS, OUTBOX], "readwrite");
+    transaction.objectStore(OUTBOX).add(write);
+    const brews = transaction.objectStore(BREWS);
+    delta.brews.forEach((brew) => brews.put(brew));
+    delta.deleted.forEach((id) => brews.delete(id));
+    await committed(transaction);
+  },
+
+  /**
+   * Lists the writes waiting to be sent.
+   * @returns {Promise<PendingWrite[]>} Queued writes, oldest first
+   */
+  async pendingWrites(): Promise<PendingWrite[]> {
+    const db = await openDatabase();
+    if (db === null) {
+      return [...memory.outbox];
+    }
+    const store = db.transaction(OUTBOX).objectStore(OUTBOX);
+    return requestResult(store.getAll());
+  },
+
+  /**
+   * Marks writes in the outbox as refused by the server.
+   * @param {PendingWrite[]} writes - Queued writes, with the reason each was
+   * refused in `rejected`
+   */
+  async rejectWrites(writes: PendingWrite[]): Promise<void> {
+    const db = await openDatabase();
+    if (db === null) {
+      const reasons = new Map(
+        writes.map((write) => [write.seq!, write.rejected]),
+      );
+      memory.outbox = memory.outbox.map((write) =>
+        reasons.has(write.seq!)
+          ? { ...write, rejected: reasons.get(write.seq!) }
+          : write,
+      );
+      return;
+    }
+    const transaction = db.transaction(OUTBOX, "readwrite");
+    const outbox = transaction.objectStore(OUTBOX);
+    writes.forEach((write) => outbox.put(write));
+    await committed(transaction);
+  },
+
+  /**
+   * Removes writes from the outbox, and brews from the local copy, at once.
+   * @param {number[]} seqs - Positions of the writes in the outbox
+   * @param {number[]} [brewIds] - IDs of the brews to remove
+   */
+  async removeWrites(seqs: number[], brewIds: number[] = []): Promise<void> {
+    const db = await openDatabase();
+    if (db === null) {
+      memory.outbox = memory.outbox.filter(
+        (write) => !seqs.includes(write.seq!),
+      );
+      brewIds.forEach((id) => memory.brews.delete(id));
+      return;
+    }
+    const transaction = db.transaction([BREWS, OUTBOX], "readwrite");
+    const outbox = transaction.objectStore(OUTBOX);
+    seqs.forEach((seq) => outbox.delete(seq));
+    const brews = transaction.objectStore(BREWS);
+    brewIds.forEach((id) => brews.delete(id));
+    await committed(transaction);
+  },
+};
+
+export { applyDelta };
+export type { BrewDelta, PendingWrite };